@@ -19,19 +19,120 @@ References
 
 # Import only standard libraries.
 from __future__ import absolute_import, division, print_function
+import io
 import os
+import re
+import bz2
 import sys
+import json
 import time
+import zlib
+import fcntl
+import errno
+import signal
+import socket
+import sqlite3
+import atexit
+import shutil
+import struct
+import random
+import resource
+import tempfile
+import binascii
+import bisect
 import hashlib
+import itertools
 import logging
 import argparse
 import datetime
 import subprocess
+import threading
+import collections
+import multiprocessing
+import multiprocessing.pool
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+try:
+    import configparser
+except ImportError:
+    import ConfigParser as configparser
+try:
+    from itertools import accumulate as _accumulate
+except ImportError:
+    def _accumulate(iterable):
+        """Semi-private method for running totals of `iterable` like ``itertools.accumulate`` of Python 3."""
+        total = 0
+        for value in iterable:
+            total += value
+            yield total
+# Import optional standard libraries.
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
 
 
 # Define logger to work for imports and as __main__.
 logger = logging.getLogger(__name__)
 
+# Define icommand that writes stdin to a data object for streaming (de)compression.
+# NOTE: iput cannot read from stdin, so streaming uses `istream write` (iRODS >= 4.2.9) in its place.
+ISTREAM_WRITE = ['istream', 'write']
+ISTREAM_READ = ['istream', 'read']
+
+# Define default local path to UNIX socket of `iplant.py --action serve`. See `iplant_client.py`.
+SOCKET_PATH = '/tmp/iplant/iplant.sock'
+
+# Define default file name of the compression queue within `tmp_iplant`. See `enqueue`.
+QUEUE_FILENAME = 'iplant_queue.sqlite'
+
+# Define default file name of the checkpoint of `bulk` within `tmp_iplant`. `key` is from the hash of the collection path.
+BULK_CHECKPOINT_FILENAME = 'iplant_bulk_{action}_{key}.jsonl'
+
+# Define default directory name of the decompressed file cache within `tmp_iplant`. See `_cache_connect`.
+CACHE_DIRNAME = 'cache'
+
+# Define modes to verify decompressed files against 'UNCOMPRESSED_HASH'. See `decompress`.
+VERIFY_MODES = ['full', 'trailer', 'sampled', 'deferred']
+
+# Cache thread pools by number of workers so that codecs reuse them.
+_thread_pools = {}
+_thread_pools_lock = threading.Lock()
+
+# Keep the `_CpuMeter` of the calling thread so that tasks it gives to thread pools are counted. See `_metered`.
+_cpu_meters = threading.local()
+
+# Register codecs by compression method name. See `register_codec`.
+_codecs = collections.OrderedDict()
+
+# Define constants for the blocked gzip format BGZF and its block index. See `_bgzf_compress`.
+BGZF_BLOCKSIZE = 0xff00
+_BGZF_EOF = binascii.unhexlify(b'1f8b08040000000000ff0600424302001b0003000000000000000000')
+_BLOCK_INDEX_MAGIC = b'BGZI\x01'
+BLOCK_INDEX_EXTENSION = '.index'
+
+# Define constants for tree hashes 'TREE_ALGORITHM:CHUNKSIZE' and their chunk digests. See `_TreeHasher`.
+TREE_HASH_CHUNKSIZE = 2**22
+_CHUNK_HASHES_MAGIC = b'IPCH\x01'
+CHUNK_HASHES_EXTENSION = '.hashes'
+
+# Define attributes of data objects kept beside the compressed parent in `itmp_iplant`, by imeta attribute.
+SIDECAR_ATTRS = ['BLOCK_INDEX', 'CHUNK_HASHES']
+
+# Define constants for the FASTQ-aware 'FQZ' format. See `_fqz_compress`.
+_FQZ_MAGIC = b'FQZ\x01'
+_FQZ_TOKEN_RE = re.compile(b'[0-9]+|[^0-9]+')
+_FQZ_EXCEPTION_RE = re.compile(b'[^ACGT]+')
+_FQZ_BASE_DIGITS = bytes(bytearray([{ord('A'): ord('0'), ord('C'): ord('1'), ord('G'): ord('2'), ord('T'): ord('3')}.get(idx, ord('0'))
+                                     for idx in range(256)]))
+# NOTE: One `bytes.translate` table per 2-bit field of a packed byte, from the high bits to the low bits.
+_FQZ_SHIFT_BASES = [bytes(bytearray([ord('ACGT'[(byte >> shift) & 3]) for byte in range(256)])) for shift in (6, 4, 2, 0)]
+
 
 def _value_as_units_type(value, units):
     """Semi-private method to convert string values from 'imeta ls' command
@@ -53,6 +154,7 @@ def _value_as_units_type(value, units):
         'BOOL', 'Bool', 'bool'    : 'TRUE', 'True', 'true'    : ``True``
         'BOOL', 'Bool', 'bool'    : 'FALSE', 'False', 'false' : ``False``
         'BYTES', 'Bytes', 'bytes' : '12345'                   : 12345
+        'COUNT', 'Count', 'count' : '3'                       : 3
 
     See Also
     --------
@@ -64,7 +166,8 @@ def _value_as_units_type(value, units):
     units_lower = units.lower()
     units_to_typed_value = {'none': (lambda x: None if x == 'none' else x),
                             'bool': (lambda x: True if x.lower() == 'true' else False),
-                            'bytes': (lambda x: int(float(x)))}
+                            'bytes': (lambda x: int(float(x))),
+                            'count': (lambda x: int(x))}
     if units_lower in units_to_typed_value.keys():
         typed_value = units_to_typed_value[units_lower](value)
     else:
@@ -91,7 +194,7 @@ def _imeta_to_dict(imeta_stdout):
     --------
     CALLS : {_value_as_units_type}
     CALLED_BY : {compress, decompress}
-    RELATED : {}
+    RELATED : {_imeta_set}
     
     References
     ----------
@@ -109,7 +212,7 @@ def _imeta_to_dict(imeta_stdout):
     # Once a metadata field is found, skip remaining if-elif-else statements.
     for line in lines:
         if catch_attribute and line.startswith('attribute'):
-            (field, attr_name) = [elt.strip() for elt in line.split(':')]
+            (field, attr_name) = [elt.strip() for elt in line.split(':', 1)]
             if field != 'attribute':
                 raise AssertionError(("Program error. Parsed metadata field should be 'attribute'. Actual metadata:\n" +
                                       "line = {line}\n" +
@@ -119,7 +222,7 @@ def _imeta_to_dict(imeta_stdout):
             catch_value = True
             continue
         elif catch_value and line.startswith('value'):
-            (field, attr_value) = [elt.strip() for elt in line.split(':')]
+            (field, attr_value) = [elt.strip() for elt in line.split(':', 1)]
             if field != 'value':
                 raise AssertionError(("Program error. Parsed metadata field should be 'value'. Actual metadata:\n" +
                                       "line = {line}\n" +
@@ -129,7 +232,7 @@ def _imeta_to_dict(imeta_stdout):
             catch_units = True
             continue
         elif catch_units and line.startswith('units'):
-            (field, attr_units) = [elt.strip() for elt in line.split(':')]
+            (field, attr_units) = [elt.strip() for elt in line.split(':', 1)]
             if field != 'units':
                 raise AssertionError(("Program error. Parsed metadata field should be 'units'. Actual metadata:\n" +
                                       "line = {line}\n" +
@@ -153,6 +256,312 @@ def _imeta_to_dict(imeta_stdout):
     return imeta_dict
 
 
+def _imeta_quote(arg):
+    """Semi-private method to quote an argument for a command line of interactive `imeta`.
+
+    Parameters
+    ----------
+    arg : string
+        Argument for a command line of interactive `imeta`, e.g. an attribute value.
+
+    Returns
+    -------
+    quoted : {None}, string
+        `arg` enclosed in double quotes if needed. ``None`` if `arg` cannot be quoted on one line.
+
+    See Also
+    --------
+    CALLS : {}
+    CALLED_BY : {_imeta_set}
+    RELATED : {}
+
+    Notes
+    -----
+    - Interactive `imeta` splits command lines on whitespace and strips one pair of enclosing quotes.
+      Single quotes within `arg` are kept by enclosing `arg` in double quotes.
+
+    """
+    if ('"' in arg) or ('\n' in arg) or ('\r' in arg):
+        quoted = None
+    elif (arg == '') or any(char in arg for char in " \t'"):
+        quoted = '"'+arg+'"'
+    else:
+        quoted = arg
+    return quoted
+
+
+def _imeta_set(ipath, imeta_triplets):
+    """Semi-private method to set metadata of a data object in one `imeta` session.
+    
+    Parameters
+    ----------
+    ipath : string
+        iRODS path to data object.
+    imeta_triplets : list
+        ``list`` of (attribute name, value, units) triplets of strings.
+
+    Returns
+    -------
+    None
+
+    See Also
+    --------
+    CALLS : {_imeta_quote}
+    CALLED_BY : {compress, decompress}
+    RELATED : {_imeta_to_dict}
+
+    Notes
+    -----
+    - All 'set' commands are written to the stdin of one interactive `imeta` process, [1]_.
+      This replaces one `imeta set` process and connection per attribute.
+    - Each 'set' is still committed by the catalog on its own; `imeta` has no multi-AVU transaction.
+    - Triplets that cannot be quoted on one command line (e.g. values with double quotes), or all triplets if the
+      session reports an error, are set with one `imeta set` process per attribute.
+    
+    References
+    ----------
+    .. [1] https://wiki.irods.org/index.php/imeta
+    
+    """
+    commands = []
+    unquotable_triplets = []
+    for triplet in imeta_triplets:
+        args = [_imeta_quote(arg) for arg in [ipath]+list(triplet)]
+        if None in args:
+            unquotable_triplets.append(triplet)
+        else:
+            commands.append(' '.join(['set', '-d']+args))
+    retry_triplets = unquotable_triplets
+    if len(commands) > 0:
+        commands.append('quit')
+        stdin = ('\n'.join(commands)+'\n').encode('utf-8')
+        logger.debug(("_imeta_set: imeta <<EOF\n" +
+                      "{stdin}EOF").format(stdin=stdin.decode('utf-8')))
+        imeta_proc = subprocess.Popen(["imeta"], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        (stdout, stderr) = imeta_proc.communicate(stdin)
+        (stdout, stderr) = (stdout.decode('utf-8', 'replace'), stderr.decode('utf-8', 'replace'))
+        # NOTE: Interactive `imeta` reports errors of commands but can exit with status 0.
+        if (imeta_proc.returncode != 0) or ('ERROR' in stdout) or ('ERROR' in stderr):
+            logger.warning(("_imeta_set: imeta session reported an error. Setting attributes one at a time.\n" +
+                            "returncode = {rc}\n" +
+                            "stdout = {stdout}\n" +
+                            "stderr = {stderr}").format(rc=imeta_proc.returncode, stdout=stdout, stderr=stderr))
+            retry_triplets = imeta_triplets
+    for (attr_name, attr_value, attr_units) in retry_triplets:
+        logger.debug("_imeta_set: imeta set -d {ipath} {an} {av} {au}".format(ipath=ipath, an=attr_name, av=attr_value, au=attr_units))
+        subprocess.check_output(["imeta", "set", "-d", ipath, attr_name, attr_value, attr_units])
+    return None
+
+
+def _parse_hash_method(hash_method):
+    """Semi-private method to parse a hash method into a `hashlib` algorithm name and a tree hash chunk size.
+
+    Parameters
+    ----------
+    hash_method : string
+        'ALGORITHM' for a hash of the whole file, e.g. 'SHA1', or 'TREE_ALGORITHM' or 'TREE_ALGORITHM:CHUNKSIZE'
+        for a tree hash of chunks of `CHUNKSIZE` bytes, e.g. 'TREE_SHA1:4194304'. Not case-sensitive.
+
+    Returns
+    -------
+    algorithm : string
+        `hashlib` algorithm name in lower case.
+    chunksize : {None}, int
+        Chunk size of a tree hash. ``None`` for a hash of the whole file.
+
+    Raises
+    ------
+    IOError
+        If the algorithm is not in `hashlib` or the chunk size is not a positive integer.
+
+    See Also
+    --------
+    CALLS : {}
+    CALLED_BY : {_new_hasher, _hash_method_type, compress}
+    RELATED : {_parse_compression_method}
+
+    """
+    (algorithm, _, chunksize) = str(hash_method).lower().partition(':')
+    if algorithm.startswith('tree_'):
+        algorithm = algorithm[len('tree_'):]
+        chunksize = int(chunksize) if chunksize.isdigit() else (TREE_HASH_CHUNKSIZE if chunksize == '' else 0)
+    elif chunksize != '':
+        chunksize = 0
+    else:
+        chunksize = None
+    valid_algorithms = getattr(hashlib, 'algorithms', None) or hashlib.algorithms_guaranteed
+    if (algorithm not in valid_algorithms) or (chunksize == 0):
+        raise IOError(("Hash method not valid.\n" +
+                       "hash_method = {hm}\n" +
+                       "valid_algorithms = {valgs}").format(hm=hash_method, valgs=valid_algorithms))
+    return (algorithm, chunksize)
+
+
+def _new_hasher(algorithm='sha1', workers=None):
+    """Semi-private method to create a hash object from a `hashlib` algorithm name or a tree hash method.
+
+    Parameters
+    ----------
+    algorithm : {'sha1'}, string, optional
+        Hashing function. Must be a `hashlib.algorithm` or a tree hash method, e.g. 'TREE_SHA1:4194304'.
+        Not case-sensitive. See `_parse_hash_method`.
+    workers : {None}, int, optional
+        Number of worker threads for a tree hash. Default: number of CPUs.
+
+    Returns
+    -------
+    hasher : {hashlib hash object, _TreeHasher}
+        Hash object with `update` and `hexdigest` methods.
+
+    See Also
+    --------
+    CALLS : {_parse_hash_method, _TreeHasher}
+    CALLED_BY : {_compute_hash, _HashingReader, _HashingWriter}
+    RELATED : {}
+
+    """
+    (algorithm, chunksize) = _parse_hash_method(algorithm)
+    if chunksize is None:
+        hasher = getattr(hashlib, algorithm)()
+    else:
+        hasher = _TreeHasher(algorithm=algorithm, chunksize=chunksize, workers=workers)
+    return hasher
+
+
+def _tree_leaf(algorithm, chunk):
+    """Semi-private method to hash one chunk of a tree hash. The prefix distinguishes leaves from nodes."""
+    hasher = getattr(hashlib, algorithm)(b'\x00')
+    hasher.update(chunk)
+    return hasher.digest()
+
+
+def _tree_root(algorithm, leaves):
+    """Semi-private method to combine the chunk digests of a tree hash into the root digest.
+
+    Pairs of digests are hashed with a prefix into the next level until one remains. An odd digest at the end of
+    a level is carried to the next level, so the tree of ``n`` chunks is the same however the file was read.
+
+    """
+    level = list(leaves)
+    while len(level) > 1:
+        level = [(getattr(hashlib, algorithm)(b'\x01'+level[idx]+level[idx+1]).digest() if idx+1 < len(level) else level[idx])
+                 for idx in range(0, len(level), 2)]
+    return level[0]
+
+
+class _TreeHasher(object):
+    """Semi-private class for a tree (Merkle) hash of fixed-size chunks hashed in parallel.
+
+    Parameters
+    ----------
+    algorithm : {'sha1'}, string, optional
+        `hashlib` algorithm name for chunks and nodes.
+    chunksize : {TREE_HASH_CHUNKSIZE}, int, optional
+        Bytes per chunk. The last chunk may be shorter. An empty file has one empty chunk.
+    workers : {None}, int, optional
+        Number of worker threads. Default: number of CPUs.
+
+    See Also
+    --------
+    CALLS : {_get_thread_pool, _tree_leaf, _tree_root}
+    CALLED_BY : {_new_hasher}
+    RELATED : {_pack_chunk_hashes}
+
+    Notes
+    -----
+    - `hashlib` releases the GIL while hashing large buffers, so chunks are hashed on multiple cores while
+      the caller reads, (de)compresses, and writes.
+    - The chunk digests from `digests` locate corrupted chunks and let a range of the file be verified
+      without reading all of it. See `read_range`.
+    - Tree hashes differ from hashes of the whole file with the same algorithm.
+
+    """
+
+    def __init__(self, algorithm='sha1', chunksize=TREE_HASH_CHUNKSIZE, workers=None):
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        (self.algorithm, self.chunksize) = (algorithm, chunksize)
+        self.pool = _get_thread_pool(workers=workers)
+        self.max_pending = 2*workers
+        self.pending = collections.deque()
+        self.leaves = []
+        (self.bufs, self.buf_size) = ([], 0)
+
+    def update(self, buf):
+        """Add `buf`. Each complete chunk is hashed by the thread pool."""
+        self.bufs.append(buf)
+        self.buf_size += len(buf)
+        if self.buf_size >= self.chunksize:
+            data = b''.join(self.bufs)
+            idx = 0
+            while len(data)-idx >= self.chunksize:
+                self.pending.append(self.pool.apply_async(_metered(_tree_leaf), (self.algorithm, data[idx:idx+self.chunksize])))
+                idx += self.chunksize
+                if len(self.pending) >= self.max_pending:
+                    self.leaves.append(self.pending.popleft().get())
+            (self.bufs, self.buf_size) = ([data[idx:]], len(data)-idx)
+        return None
+
+    def digests(self):
+        """Return the digests of all chunks added so far as a list of ``bytes``, including the last partial chunk."""
+        while len(self.pending) > 0:
+            self.leaves.append(self.pending.popleft().get())
+        leaves = list(self.leaves)
+        if (self.buf_size > 0) or (len(leaves) == 0):
+            leaves.append(_tree_leaf(self.algorithm, b''.join(self.bufs)))
+        return leaves
+
+    def hexdigest(self):
+        """Return the root of the tree of all chunks added so far as a non-binary string."""
+        return binascii.hexlify(_tree_root(self.algorithm, self.digests())).decode('ascii')
+
+
+def _pack_chunk_hashes(chunksize, digests):
+    """Semi-private method to pack the chunk digests of a tree hash from `_TreeHasher.digests`.
+
+    Returns
+    -------
+    chunk_hashes : bytes
+        `_CHUNK_HASHES_MAGIC`, `chunksize` and the number of chunks as little-endian 64-bit integers,
+        then the digests, e.g. 20 bytes per 4 MiB chunk for SHA1.
+
+    See Also
+    --------
+    CALLS : {}
+    CALLED_BY : {_compress_encode}
+    RELATED : {_unpack_chunk_hashes}
+
+    """
+    return _CHUNK_HASHES_MAGIC + struct.pack('<QQ', chunksize, len(digests)) + b''.join(digests)
+
+
+def _unpack_chunk_hashes(chunk_hashes):
+    """Semi-private method to unpack chunk digests from `_pack_chunk_hashes`.
+
+    Returns
+    -------
+    chunksize : int
+        Bytes per chunk.
+    digests : list
+        Digest of each chunk as ``bytes``.
+
+    Raises
+    ------
+    ValueError
+        If `chunk_hashes` are not chunk digests or are truncated.
+
+    """
+    header_size = len(_CHUNK_HASHES_MAGIC)+16
+    if chunk_hashes[:len(_CHUNK_HASHES_MAGIC)] != _CHUNK_HASHES_MAGIC or len(chunk_hashes) < header_size:
+        raise ValueError("Chunk hashes not valid.")
+    (chunksize, nchunks) = struct.unpack('<QQ', chunk_hashes[len(_CHUNK_HASHES_MAGIC):header_size])
+    if (nchunks == 0) or ((len(chunk_hashes)-header_size) % nchunks != 0):
+        raise ValueError("Chunk hashes are truncated.")
+    digest_size = (len(chunk_hashes)-header_size)//nchunks
+    digests = [chunk_hashes[header_size+idx*digest_size:header_size+(idx+1)*digest_size] for idx in range(nchunks)]
+    return (chunksize, digests)
+
+
 def _compute_hash(fpath, algorithm='sha1', blocksize=2**16):
     """Semi-private method to compute hash of file.
 
@@ -164,7 +573,7 @@ def _compute_hash(fpath, algorithm='sha1', blocksize=2**16):
     fpath : string
         Path to local file.
     algorithm : {'sha1'}, hashlib.algorithm, optional
-        Hashing function. Must be a `hashlib.algorithm`. Not case-sensitive.
+        Hashing function. Must be a `hashlib.algorithm` or a tree hash method. Not case-sensitive. See `_parse_hash_method`.
     blocksize : {2**16}, int, optional
         Number of bytes to read incrementally.
 
@@ -175,27 +584,21 @@ def _compute_hash(fpath, algorithm='sha1', blocksize=2**16):
 
     See Also
     --------
-    CALLS : {}
-    CALLED_BY : {compress, decompress}
-    RELATED : {}
+    CALLS : {_new_hasher}
+    CALLED_BY : {_compress_dedup, decompress}
+    RELATED : {_HashingReader}
     
     Notes
     -----
     Adapted from [1]_.
-    Typical processing speed is ~4.4 GB/min.
+    Typical processing speed is ~4.4 GB/min with 'sha1'. Tree hash methods hash chunks on all cores. See `_TreeHasher`.
     
     References
     ----------
     .. [1] http://www.pythoncentral.io/hashing-files-with-python/
 
     """
-    # Check input.
-    algorithm = algorithm.lower()
-    if algorithm not in hashlib.algorithms:
-        raise IOError(("Algorithm not valid.\n" + 
-                       "algorithm = {alg}\n" +
-                       "valid_algorithms = {valgs}").format(alg=algorithm, valgs=hashlib.algorithms))
-    hasher = getattr(hashlib, algorithm)()
+    hasher = _new_hasher(algorithm=algorithm)
     # Read big file incrementally to compute hash.
     with open(fpath, 'rb') as fobj:
         buf = fobj.read(blocksize)
@@ -206,21 +609,164 @@ def _compute_hash(fpath, algorithm='sha1', blocksize=2**16):
     return hexdigest
 
 
-def compress(ipath, itmp_iplant, tmp_iplant, delete_itmp_files=False, delete_tmp_files=False):
-    """Replace file in iRODS with compressed version.
-    
+class _HashingReader(object):
+    """Semi-private class to wrap a readable file object and count and hash bytes as they are read.
+
+    Use to compute the size and hash of a file in the same pass that compresses it.
+
     Parameters
     ----------
-    ipath : string
-        iRODS path to .fastq file for compression.
-    itmp_iplant : string
-        iRODS path to temporary directory for moving files during compression.
-    tmp_iplant : string
-        Local path to temporary directory for moving files during compression.
-    delete_itmp_files : {False, True}, bool, optional
-        Delete iRODS temporary files made during compression.
-    delete_tmp_files : {False, True}, bool, optional
-        Delete local temporary files made during compression.
+    fobj : file
+        Readable file object opened in binary mode.
+    algorithm : {'sha1'}, hashlib.algorithm, optional
+        Hashing function. Must be a `hashlib.algorithm` or a tree hash method. Not case-sensitive. See `_parse_hash_method`.
+    workers : {None}, int, optional
+        Number of worker threads for a tree hash. Default: number of CPUs.
+    timed : {False, True}, bool, optional
+        Accumulate the time spent hashing in `hash_seconds`, e.g. for a span from `_span`.
+
+    Attributes
+    ----------
+    size : int
+        Number of bytes read so far.
+    hash_seconds : float
+        Seconds spent hashing so far if `timed`.
+
+    See Also
+    --------
+    CALLS : {_new_hasher}
+    CALLED_BY : {_compress_encode}
+    RELATED : {_compute_hash}
+
+    """
+
+    def __init__(self, fobj, algorithm='sha1', workers=None, timed=False):
+        self.fobj = fobj
+        self.hasher = _new_hasher(algorithm=algorithm, workers=workers)
+        self.size = 0
+        self.timed = timed
+        self.hash_seconds = 0.0
+
+    def read(self, size=-1):
+        """Read up to `size` bytes, then update the byte count and hash from the same buffer."""
+        buf = self.fobj.read(size)
+        if self.timed:
+            time_start = time.time()
+            self.hasher.update(buf)
+            self.hash_seconds += time.time() - time_start
+        else:
+            self.hasher.update(buf)
+        self.size += len(buf)
+        return buf
+
+    def hexdigest(self):
+        """Return the hash of all bytes read so far as a non-binary string."""
+        return self.hasher.hexdigest()
+
+
+class _HashingWriter(object):
+    """Semi-private class to wrap a writable file object and count and hash bytes as they are written.
+
+    Use to compute the size and hash of a file in the same pass that decompresses it.
+
+    Parameters
+    ----------
+    fobj : file
+        Writable file object opened in binary mode.
+    algorithm : {'sha1'}, hashlib.algorithm, optional
+        Hashing function. Must be a `hashlib.algorithm` or a tree hash method. Not case-sensitive. See `_parse_hash_method`.
+    workers : {None}, int, optional
+        Number of worker threads for a tree hash. Default: number of CPUs.
+    timed : {False, True}, bool, optional
+        Accumulate the time spent hashing in `hash_seconds`, e.g. for a span from `_span`.
+
+    Attributes
+    ----------
+    size : int
+        Number of bytes written so far.
+    hash_seconds : float
+        Seconds spent hashing so far if `timed`.
+
+    See Also
+    --------
+    CALLS : {_new_hasher}
+    CALLED_BY : {decompress}
+    RELATED : {_HashingReader}
+
+    """
+
+    def __init__(self, fobj, algorithm='sha1', workers=None, timed=False):
+        self.fobj = fobj
+        self.hasher = _new_hasher(algorithm=algorithm, workers=workers)
+        self.size = 0
+        self.timed = timed
+        self.hash_seconds = 0.0
+
+    def write(self, buf):
+        """Write `buf`, then update the byte count and hash from the same buffer."""
+        self.fobj.write(buf)
+        if self.timed:
+            time_start = time.time()
+            self.hasher.update(buf)
+            self.hash_seconds += time.time() - time_start
+        else:
+            self.hasher.update(buf)
+        self.size += len(buf)
+        return None
+
+    def hexdigest(self):
+        """Return the hash of all bytes written so far as a non-binary string."""
+        return self.hasher.hexdigest()
+
+
+class _TeeWriter(object):
+    """Semi-private class for a writable file object that writes the same bytes to several file objects.
+
+    Use to keep a copy of a stream in the decompressed file cache while it is written to `ISTREAM_WRITE`.
+
+    Parameters
+    ----------
+    fobjs : list
+        Writable file objects opened in binary mode.
+
+    See Also
+    --------
+    CALLS : {}
+    CALLED_BY : {decompress}
+    RELATED : {_HashingWriter}
+
+    """
+
+    def __init__(self, fobjs):
+        self.fobjs = fobjs
+
+    def write(self, buf):
+        """Write `buf` to each file object in order."""
+        for fobj in self.fobjs:
+            fobj.write(buf)
+        return None
+
+
+def _gzip_compress(fsrc, fdst, fname='', mtime=0, level=1, blocksize=2**16):
+    """Semi-private method to compress a file object into a single-member gzip file object.
+
+    The gzip header matches that of ``gzip --fast``: the original file name and modification time
+    are stored, and the extra flags and operating system fields are set as by GNU gzip on Unix.
+
+    Parameters
+    ----------
+    fsrc : file
+        Readable file object of uncompressed data, e.g. a `_HashingReader`.
+    fdst : file
+        Writable file object for compressed data.
+    fname : {''}, string, optional
+        Original file name to store in the gzip header. Not stored if empty.
+    mtime : {0}, number, optional
+        Modification time of original file, in seconds since the epoch, to store in the gzip header.
+    level : {1}, int, optional
+        Compression level from 1 (fastest) to 9 (best). ``gzip --fast`` is level 1.
+    blocksize : {2**16}, int, optional
+        Number of bytes to read incrementally.
 
     Returns
     -------
@@ -229,120 +775,50 @@ def compress(ipath, itmp_iplant, tmp_iplant, delete_itmp_files=False, delete_tmp
     See Also
     --------
     CALLS : {}
-    CALLED_BY : {main}
-    RELATED : {decompress}
+    CALLED_BY : {compress}
+    RELATED : {_HashingReader}
+
+    References
+    ----------
+    .. [1] http://www.gzip.org/zlib/rfc-gzip.html
 
-    Notes
-    -----
-    - Compressing a file creates a compressed copy and an uncompressed copy in both
-      the iRODS `itmp_iplant`/ directory and the local `tmp_iplant`/ directory.
-    
     """
-    # NOTE: Input checking is handled by "if __name__ == '__main__'" section.
-    # Determine if data is compressed from imeta.
-    logger.debug("compress: imeta ls -d {ipath}".format(ipath=ipath))
-    imeta_stdout = subprocess.check_output(["imeta", "ls", "-d", ipath])
-    logger.debug(("compress: imeta_stdout =\n" +
-                  "{imeta_stdout}").format(imeta_stdout=imeta_stdout))
-    imeta_dict = _imeta_to_dict(imeta_stdout=imeta_stdout)
-    logger.debug(("compress: _imeta_to_dict(imeta_stdout) =\n" +
-                  "{imeta_dict}").format(imeta_dict=imeta_dict))
-    do_compress = None
-    if 'IS_COMPRESSED' in imeta_dict.keys():
-        if imeta_dict['IS_COMPRESSED']['value']:
-            do_compress = False
-        else:
-            do_compress = True
-    else:
-        do_compress = True
-    if do_compress is None:
-        raise AssertionError(("Program error. 'do_compress' flag not set:\n" +
-                              "do_compress = {tf}").format(tf=do_compress))
-    # Compress data...
-    if do_compress:
-        # TODO: get isysmeta
-        logger.debug("compress: do_compress = {tf}".format(tf=do_compress))
-        # Define temporary file paths.
-        timestamp = datetime.datetime.now().isoformat().replace('-', '').replace(':', '')
-        basename = os.path.basename(ipath)
-        tmpname = timestamp+'_'+basename
-        itmp_path = os.path.join(itmp_iplant, tmpname)
-        tmp_path = os.path.join(tmp_iplant, tmpname)
-        tmpname_gz = tmpname+'.gz'
-        itmp_path_gz = itmp_path+'.gz'
-        tmp_path_gz = tmp_path+'.gz'
-        # Move data to temporary files, record metadata on uncompressed version, then compress.
-        # NOTE: Use imv instead of icp to move data from/to `ipath` since icp will invoke acPreprocForDataObjOpen/acPostProcForCopy.
-        # NOTE: Copy compressed file within `itmp_path` to leave trace of files for debugging.
-        # TODO: Accommodate other compression methods and add flag option to arguments.
-        # TODO: Remove "copy compressed file" step for optimization when robustly tested.
-        # TODO: Check space to move to tmp local, delete oldest files that sum to size.
-        logger.debug("compress: imv {src} {dst}".format(src=ipath, dst=itmp_path))
-        subprocess.check_output(["imv", ipath, itmp_path])
-        logger.debug("compress: iget -f -T {src} {dst}".format(src=itmp_path, dst=tmp_path))
-        subprocess.check_output(["iget", "-f", "-T", itmp_path, tmp_path])
-        logger.debug("compress: uncompressed_size = os.path.getsize({tmp_path})".format(tmp_path=tmp_path))
-        uncompressed_size = os.path.getsize(tmp_path)
-        logger.debug("compress: uncompressed_size = {usize}".format(usize=uncompressed_size))
-        hash_method = 'SHA1'
-        logger.debug(("compress: uncompressed_hash = _compute_hash(fpath={tmp_path}, " +
-                      "algorithm={hm})").format(tmp_path=tmp_path, hm=hash_method))
-        uncompressed_hash = _compute_hash(fpath=tmp_path, algorithm=hash_method)
-        logger.debug("compress: uncompressed_hash = {uhash}".format(uhash=uncompressed_hash))
-        logger.debug("compress: gzip --fast --force --keep {tmp_path}".format(tmp_path=tmp_path))
-        subprocess.check_output(["gzip", "--fast", "--force", "--keep", tmp_path])
-        logger.debug("compress: iput -T {src} {dst}".format(src=tmp_path_gz, dst=itmp_path_gz))
-        subprocess.check_output(["iput", "-T", tmp_path_gz, itmp_path_gz])
-        itmp_path_gz_copy = itmp_path_gz+'_copy'
-        logger.debug("compress: icp {src} {dst}".format(src=itmp_path_gz, dst=itmp_path_gz_copy))
-        subprocess.check_output(["icp", itmp_path_gz, itmp_path_gz_copy])
-        logger.debug("compress: imv {src} {dst}".format(src=itmp_path_gz_copy, dst=ipath))
-        subprocess.check_output(["imv", itmp_path_gz_copy, ipath])
-        # Set metadata describing compression state. Metadata must be converted to strings.
-        comments = "'This file is registered under the extension .fastq but is stored internally to iRODS with compression as .fastq.gz. This file will be decompressed upon retrieval (e.g. with iget).'"
-        imeta_triplets = [('IS_COMPRESSED', 'TRUE', 'BOOL'),
-                          ('COMPRESSION_METHOD', 'GZIP', 'NONE'),
-                          ('UNCOMPRESSED_SIZE', uncompressed_size, 'BYTES'),
-                          ('UNCOMPRESSED_HASH', uncompressed_hash, 'NONE'),
-                          ('HASH_METHOD', hash_method, 'NONE'),
-                          ('PARENT_FILE', itmp_path, 'NONE'),
-                          ('COMMENTS', comments, 'NONE')]
-        imeta_triplets = [[str(elt) for elt in triplet] for triplet in imeta_triplets]
-        for (attr_name, attr_value, attr_units) in imeta_triplets:
-            logger.debug("compress: imeta set -d {ipath} {an} {av} {au}".format(ipath=ipath, an=attr_name, av=attr_value, au=attr_units))
-            subprocess.check_output(["imeta", "set", "-d", ipath, attr_name, attr_value, attr_units])
-        # Delete temporary files if requested.
-        if delete_itmp_files:
-            logger.debug("compress: delete_itmp_files = {tf}".format(tf=delete_itmp_files))
-            for itmp in [itmp_path, itmp_path_gz]:
-                logger.debug("compress: irm -f {itmp}".format(itmp=itmp))
-                subprocess.check_output(["irm", "-f", itmp])
-        if delete_tmp_files:
-            logger.debug("compress: delete_tmp_files = {tf}".format(tf=delete_tmp_files))
-            for tmp in [tmp_path, tmp_path_gz]:
-                logger.debug("compress: os.remove({tmp})".format(tmp=tmp))
-                os.remove(tmp)
-    # ...otherwise do nothing.
-    else:
-        logger.debug("compress: do_compress = {tf}".format(tf=do_compress))
+    # Write header: magic, deflate method, flags, mtime, extra flags, OS (3 = Unix).
+    if not isinstance(fname, bytes):
+        fname = fname.encode('latin-1')
+    flags = 0x08 if fname else 0x00
+    xfl = {1: 4, 9: 2}.get(level, 0)
+    fdst.write(b'\x1f\x8b\x08' + struct.pack('<BIBB', flags, int(mtime) & 0xffffffff, xfl, 3))
+    if fname:
+        fdst.write(fname + b'\x00')
+    # Write raw deflate stream from each block read, then trailer: CRC32 and size modulo 2**32.
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    crc = 0
+    size = 0
+    buf = fsrc.read(blocksize)
+    while len(buf) > 0:
+        crc = zlib.crc32(buf, crc)
+        size += len(buf)
+        fdst.write(compressor.compress(buf))
+        buf = fsrc.read(blocksize)
+    fdst.write(compressor.flush())
+    fdst.write(struct.pack('<II', crc & 0xffffffff, size & 0xffffffff))
     return None
 
 
-def decompress(ipath, itmp_iplant, tmp_iplant, delete_itmp_files=False, delete_tmp_files=False):
-    """Replace file in iRODS with decompressed version.
-    
+def _gzip_decompress(fsrc, fdst, blocksize=2**16):
+    """Semi-private method to decompress a gzip file object that may have multiple members.
+
+    The CRC32 and size from each member's trailer are checked by `zlib` during decompression.
+
     Parameters
     ----------
-    ipath : string
-        iRODS path to .fastq file for compression.
-    itmp_iplant : string
-        iRODS path to temporary directory for moving files during compression.
-    tmp_iplant : string
-        Local path to temporary directory for moving files during compression.
-    delete_itmp_files : {False, True}, bool, optional
-        Delete iRODS temporary files made during decompression.
-    delete_tmp_files : {False, True}, bool, optional
-        Delete local temporary files made during decompression.
+    fsrc : file
+        Readable file object of gzip-compressed data.
+    fdst : file
+        Writable file object for uncompressed data, e.g. a `_HashingWriter`.
+    blocksize : {2**16}, int, optional
+        Number of bytes to read incrementally.
 
     Returns
     -------
@@ -351,168 +827,8026 @@ def decompress(ipath, itmp_iplant, tmp_iplant, delete_itmp_files=False, delete_t
     See Also
     --------
     CALLS : {}
-    CALLED_BY : {main}
-    RELATED : {compress}
-    
+    CALLED_BY : {decompress}
+    RELATED : {_gzip_compress}
+
     """
-    # NOTE: Input checking is handled by "if __name__ == '__main__'" section and main() function.
-    # Determine if data is decompressed from imeta.
-    logger.debug("decompress: imeta ls -d {ipath}".format(ipath=ipath))
-    imeta_stdout = subprocess.check_output(["imeta", "ls", "-d", ipath])
-    logger.debug(("decompress: imeta_stdout =\n" +
-                  "{imeta_stdout}").format(imeta_stdout=imeta_stdout))
-    imeta_dict = _imeta_to_dict(imeta_stdout=imeta_stdout)
-    logger.debug(("decompress: _imeta_to_dict(imeta_stdout) =\n" +
-                  "{imeta_dict}").format(imeta_dict=imeta_dict))
-    do_decompress = None
-    if 'IS_COMPRESSED' in imeta_dict.keys():
-        if imeta_dict['IS_COMPRESSED']['value']:
-            do_decompress = True
-        else:
-            do_decompress = False
-    else:
-        do_decompress = False
-    if do_decompress is None:
-        raise AssertionError(("Program error. 'do_decompress' flag not set:\n" +
-                              "do_decompress = {tf}").format(tf=do_decompress))
-    # Decompress data...
-    if do_decompress:
-        logger.debug("decompress: do_decompress = {tf}".format(tf=do_decompress))
-        # Define temporary file paths.
-        timestamp = datetime.datetime.now().isoformat().replace('-', '').replace(':', '')
-        basename = os.path.basename(ipath)
-        tmpname = timestamp+'_'+basename
-        itmp_path = os.path.join(itmp_iplant, tmpname)
-        tmp_path = os.path.join(tmp_iplant, tmpname)
-        compression_method_imeta = imeta_dict['COMPRESSION_METHOD']['value']
-        valid_compression_methods = ['GZIP']
-        # Move data to temporary files then decompress.
-        # NOTE: Use imv instead of icp to move data from/to `ipath` since icp will invoke acPreprocForDataObjOpen/acPostProcForCopy.
-        # NOTE: Copy compressed file within `itmp_path` to leave trace of files for debugging.
-        # NOTE: File is already compressed, so rename with compressed extension (e.g. '.gz') when moving to temporary location.
-        # TODO: Remove "copy compressed file" step for optimization when robustly tested.
-        # TODO: Check space to move to tmp local, delete oldest files that sum to size.
-        if compression_method_imeta == 'GZIP':
-            tmpname_gz = tmpname+'.gz'
-            itmp_path_gz = itmp_path+'.gz'
-            tmp_path_gz = tmp_path+'.gz'
-            logger.debug("decompress: imv {src} {dst}".format(src=ipath, dst=itmp_path_gz))
-            subprocess.check_output(["imv", ipath, itmp_path_gz])
-            logger.debug("decompress: iget -f -T {src} {dst}".format(src=itmp_path_gz, dst=tmp_path_gz))
-            subprocess.check_output(["iget", "-f", "-T", itmp_path_gz, tmp_path_gz])
-            logger.debug("decompress: gunzip --force --keep {tmp_path_gz}".format(tmp_path_gz=tmp_path_gz))
-            subprocess.check_output(["gunzip", "--force", "--keep", tmp_path_gz])
-        elif compression_method_imeta not in valid_compression_methods:
-            logger.error(("decompress: 'COMPRESSION_METHOD' not valid. Skipping decompression.\n" +
-                          "COMPRESSION_METHOD = {cm}\n" +
-                          "valid_compression_methods = {vcm}").format(cm=compression_method_imeta, vcm=valid_compression_methods))
-        # If file was successfully decompressed, check metadata against uncompressed version then move to ipath..
-        if os.path.isfile(tmp_path):
-            logger.debug("decompress: uncompressed_size = os.path.getsize({tmp_path})".format(tmp_path=tmp_path))
-            uncompressed_size = os.path.getsize(tmp_path)
-            logger.debug("decompress: uncompressed_size = {usize}".format(usize=uncompressed_size))
-            uncompressed_size_imeta = imeta_dict['UNCOMPRESSED_SIZE']['value']
-            if uncompressed_size == uncompressed_size_imeta:
-                logger.debug("decompress: Uncompressed file size matches 'UNCOMPRESSED_SIZE' from imeta.")
-            else:
-                logger.error(("decompress: Uncompressed file size does not match 'UNCOMPRESSED_SIZE' from imeta.\n" +
-                              "uncompressed_size from file  (bytes) = {usize}\n" +
-                              "UNCOMPRESSED_SIZE from imeta (bytes) = {usize_im}").format(usize=uncompressed_size,
-                                                                                          usize_im=uncompressed_size_imeta))
-            hash_method_imeta = imeta_dict['HASH_METHOD']['value']
-            logger.debug(("decompress: uncompressed_hash = _compute_hash(fpath={tmp_path}, " +
-                          "algorithm={hmi})").format(tmp_path=tmp_path, hmi=hash_method_imeta))
-            uncompressed_hash = _compute_hash(fpath=tmp_path, algorithm=hash_method_imeta)
-            logger.debug("decompress: uncompressed_hash = {uhash}".format(uhash=uncompressed_hash))
-            uncompressed_hash_imeta = imeta_dict['UNCOMPRESSED_HASH']['value']
-            if uncompressed_hash == uncompressed_hash_imeta:
-                logger.debug("decompress: Uncompressed hash matches 'UNCOMPRESSED_HASH' from imeta.")
-            else:
-                logger.error(("decompress: Uncompressed hash does not match 'UNCOMPRESSED_HASH' from imeta.\n" +
-                              "HASH_METHOD from file and imeta = {hmeth_im}\n" +
-                              "uncompressed_hash from file     = {uhash}\n" +
-                              "UNCOMPRESSED_HASH from imeta    = {uhash_im}").format(hmeth_im=hash_method_imeta,
-                                                                                     uhash=uncompressed_hash,
-                                                                                     uhash_im=uncompressed_hash_imeta))
-            logger.debug("decompress: iput -T {src} {dst}".format(src=tmp_path, dst=itmp_path))
-            subprocess.check_output(["iput", "-T", tmp_path, itmp_path])
-            itmp_path_copy = itmp_path+'_copy'
-            logger.debug("decompress: icp {src} {dst}".format(src=itmp_path, dst=itmp_path_copy))
-            subprocess.check_output(["icp", itmp_path, itmp_path_copy])
-            logger.debug("decompress: imv {src} {dst}".format(src=itmp_path_copy, dst=ipath))
-            subprocess.check_output(["imv", itmp_path_copy, ipath])
-            # Set metadata describing compression state. Metadata must be converted to strings.
-            comments = "'This file is registered under the extension .fastq and is stored internally to iRODS without compression as .fastq.'"
-            imeta_triplets = [('IS_COMPRESSED', 'FALSE', 'BOOL'),
-                              ('COMPRESSION_METHOD', 'NONE', 'NONE'),
-                              ('UNCOMPRESSED_SIZE', uncompressed_size, 'BYTES'),
-                              ('UNCOMPRESSED_HASH', uncompressed_hash, 'NONE'),
-                              ('HASH_METHOD', hash_method_imeta, 'NONE'),
-                              ('PARENT_FILE', itmp_path_gz, 'NONE'),
-                              ('COMMENTS', comments, 'NONE')]
-            imeta_triplets = [[str(elt) for elt in triplet] for triplet in imeta_triplets]
-            for (attr_name, attr_value, attr_units) in imeta_triplets:
-                logger.debug("decompress: imeta set -d {ipath} {an} {av} {au}".format(ipath=ipath, an=attr_name, av=attr_value, au=attr_units))
-                subprocess.check_output(["imeta", "set", "-d", ipath, attr_name, attr_value, attr_units])
-            # Delete temporary files if requested.
-            if delete_itmp_files:
-                logger.debug("decompress: delete_itmp_files = {tf}".format(tf=delete_itmp_files))
-                for itmp in [itmp_path, itmp_path_gz]:
-                    logger.debug("decompress: irm -f {itmp}".format(itmp=itmp))
-                    subprocess.check_output(["irm", "-f", itmp])
-            if delete_tmp_files:
-                logger.debug("decompress: delete_tmp_files = {tf}".format(tf=delete_tmp_files))
-                for tmp in [tmp_path, tmp_path_gz]:
-                    logger.debug("decompress: os.remove({tmp})".format(tmp=tmp))
-                    os.remove(tmp)
-        else:
-            logger.error(("decompress: File was not decompressed.\n" +
-                          "tmp_path = {tmp_path}\n").format(tmp_path=tmp_path))
-    # ...otherwise do nothing.
-    else:
-        logger.debug("decompress: do_decompress = {tf}".format(tf=do_decompress))
+    decompressor = zlib.decompressobj(16+zlib.MAX_WBITS)
+    buf = fsrc.read(blocksize)
+    while len(buf) > 0:
+        fdst.write(decompressor.decompress(buf))
+        # Data after the end of a member begins the next member.
+        while len(decompressor.unused_data) > 0:
+            buf = decompressor.unused_data
+            decompressor = zlib.decompressobj(16+zlib.MAX_WBITS)
+            fdst.write(decompressor.decompress(buf))
+        buf = fsrc.read(blocksize)
+    fdst.write(decompressor.flush())
+    if not getattr(decompressor, 'eof', True):
+        raise IOError("Compressed data ended before the end of the gzip member was reached.")
     return None
 
 
-def main(ipath, action, itmp_iplant, tmp_iplant,
-         delete_itmp_files=False, delete_tmp_files=False,
-         logging_level='INFO', log_file=None):
-    """Top-level function for iPlant iRODS operations.
+def _get_thread_pool(workers=None):
+    """Semi-private method to get a cached thread pool for block-parallel codecs.
+
+    `zlib` and `hashlib` release the GIL while processing large buffers, so threads use multiple cores.
 
     Parameters
     ----------
-    ipath : string
-        iRODS path to .fastq file for (de)compression.
-    action : {'compress', 'decompress'}, string
-        Action to take on file from `ipath`.
-    itmp_iplant : string
-        iRODS path to temporary directory for moving files during (de)compression.
+    workers : {None}, int, optional
+        Number of worker threads. Default: number of CPUs.
+
+    Returns
+    -------
+    pool : multiprocessing.pool.ThreadPool
+        Thread pool with `workers` threads. Pools are closed when the interpreter exits.
+
+    See Also
+    --------
+    CALLS : {}
+    CALLED_BY : {_pgzip_compress, _pgzip_decompress}
+    RELATED : {}
+
+    """
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    # NOTE: Jobs from `serve` share the cache from multiple threads.
+    with _thread_pools_lock:
+        if workers not in _thread_pools:
+            _thread_pools[workers] = multiprocessing.pool.ThreadPool(processes=workers)
+        pool = _thread_pools[workers]
+    return pool
+
+
+def _thread_cpu_time():
+    """Semi-private method to get the user plus system time in seconds of the calling thread.
+    ``None`` if neither `time.thread_time` (Python >= 3.7) nor `resource.RUSAGE_THREAD` (Linux) is available."""
+    if hasattr(time, 'thread_time'):
+        return time.thread_time()
+    if hasattr(resource, 'RUSAGE_THREAD'):
+        usage = resource.getrusage(resource.RUSAGE_THREAD)
+        return usage.ru_utime + usage.ru_stime
+    return None
+
+
+class _CpuMeter(object):
+    """Semi-private class to measure the CPU time of work done by the calling thread and by the thread pool tasks
+    it submits through `_metered`. Use as a context manager.
+
+    Attributes
+    ----------
+    cpu_time : float
+        User plus system time in seconds. Set when the ``with`` block exits.
+    per_thread : bool
+        ``True`` if time is counted per thread. ``False`` if the platform cannot, in which case `cpu_time` is the
+        time of the whole process from `os.times` and includes other threads, e.g. other jobs of `serve`.
+
+    """
+
+    def __init__(self):
+        self.per_thread = _thread_cpu_time() is not None
+        self.cpu_time = 0.0
+        self.lock = threading.Lock()
+
+    def _now(self):
+        if self.per_thread:
+            return _thread_cpu_time()
+        times = os.times()
+        return times[0] + times[1]
+
+    def add(self, seconds):
+        """Add `seconds` of CPU time from a pool task."""
+        with self.lock:
+            self.cpu_time += seconds
+        return None
+
+    def __enter__(self):
+        (self.outer, _cpu_meters.meter) = (getattr(_cpu_meters, 'meter', None), self)
+        self.cpu_start = self._now()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.add(self._now() - self.cpu_start)
+        _cpu_meters.meter = self.outer
+        return False
+
+
+def _metered(func):
+    """Semi-private method to wrap `func` before submitting it to a thread pool so that its CPU time is added to
+    the `_CpuMeter` of the calling thread. Returns `func` unchanged if the calling thread is not metered."""
+    meter = getattr(_cpu_meters, 'meter', None)
+    if (meter is None) or (not meter.per_thread):
+        return func
+    def _wrapper(*args):
+        cpu_start = _thread_cpu_time()
+        try:
+            return func(*args)
+        finally:
+            meter.add(_thread_cpu_time() - cpu_start)
+    return _wrapper
+
+
+@atexit.register
+def _close_thread_pools():
+    """Semi-private method to close cached thread pools when the interpreter exits."""
+    for pool in _thread_pools.values():
+        pool.close()
+        pool.join()
+    _thread_pools.clear()
+    return None
+
+
+def _read_exact(fobj, size):
+    """Semi-private method to read exactly `size` bytes from a file object unless at end of file.
+
+    Parameters
+    ----------
+    fobj : file
+        Readable file object, e.g. a pipe that may return fewer bytes than requested.
+    size : int
+        Number of bytes to read.
+
+    Returns
+    -------
+    buf : bytes
+        Bytes read. Fewer than `size` bytes only at end of file.
+
+    See Also
+    --------
+    CALLS : {}
+    CALLED_BY : {_pgzip_decompress}
+    RELATED : {}
+
+    """
+    bufs = []
+    remaining = size
+    while remaining > 0:
+        buf = fobj.read(remaining)
+        if len(buf) == 0:
+            break
+        bufs.append(buf)
+        remaining -= len(buf)
+    return b''.join(bufs)
+
+
+def _pgzip_member(buf, level=1, fname=b'', mtime=0):
+    """Semi-private method to compress a block into an independent gzip member.
+
+    The member header has an extra field with subfield ID 'IP' that stores the total member size
+    in bytes as a little-endian 32-bit integer so that members can be split without decompressing.
+
+    Parameters
+    ----------
+    buf : bytes
+        Uncompressed block.
+    level : {1}, int, optional
+        Compression level from 1 (fastest) to 9 (best).
+    fname : {b''}, bytes, optional
+        Original file name to store in the gzip header. Not stored if empty.
+    mtime : {0}, number, optional
+        Modification time of original file, in seconds since the epoch, to store in the gzip header.
+
+    Returns
+    -------
+    member : bytes
+        Complete gzip member.
+
+    See Also
+    --------
+    CALLS : {}
+    CALLED_BY : {_pgzip_compress}
+    RELATED : {_gzip_compress, _pgzip_inflate}
+
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    deflated = compressor.compress(buf) + compressor.flush()
+    flags = 0x04 | (0x08 if fname else 0x00)
+    xfl = {1: 4, 9: 2}.get(level, 0)
+    fname_field = fname + b'\x00' if fname else b''
+    member_size = 10 + 2 + 8 + len(fname_field) + len(deflated) + 8
+    header = (b'\x1f\x8b\x08' + struct.pack('<BIBB', flags, int(mtime) & 0xffffffff, xfl, 3) +
+              struct.pack('<H', 8) + b'IP' + struct.pack('<HI', 4, member_size) + fname_field)
+    trailer = struct.pack('<II', zlib.crc32(buf) & 0xffffffff, len(buf) & 0xffffffff)
+    return header + deflated + trailer
+
+
+def _pgzip_compress(fsrc, fdst, fname='', mtime=0, level=1, workers=None, blocksize=2**20):
+    """Semi-private method to compress a file object into a multi-member gzip file object using multiple cores.
+
+    Each block of `blocksize` bytes is compressed into an independent gzip member by a thread pool.
+    The output is a standard multi-member gzip stream that ``gunzip`` and `_gzip_decompress` read.
+
+    Parameters
+    ----------
+    fsrc : file
+        Readable file object of uncompressed data, e.g. a `_HashingReader`.
+    fdst : file
+        Writable file object for compressed data.
+    fname : {''}, string, optional
+        Original file name to store in the header of the first member. Not stored if empty.
+    mtime : {0}, number, optional
+        Modification time of original file, in seconds since the epoch, to store in the gzip headers.
+    level : {1}, int, optional
+        Compression level from 1 (fastest) to 9 (best).
+    workers : {None}, int, optional
+        Number of worker threads. Default: number of CPUs.
+    blocksize : {2**20}, int, optional
+        Number of uncompressed bytes per gzip member.
+
+    Returns
+    -------
+    None
+
+    See Also
+    --------
+    CALLS : {_get_thread_pool, _pgzip_member}
+    CALLED_BY : {compress}
+    RELATED : {_gzip_compress, _pgzip_decompress}
+
+    Notes
+    -----
+    - At most ``2*workers`` blocks are held in memory at once. Members are written in order.
+
+    """
+    if not isinstance(fname, bytes):
+        fname = fname.encode('latin-1')
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    pool = _get_thread_pool(workers=workers)
+    max_pending = 2*workers
+    pending = collections.deque()
+    buf = fsrc.read(blocksize)
+    # Always write at least one member so that an empty file is a valid gzip stream.
+    is_first = True
+    while len(buf) > 0 or is_first:
+        pending.append(pool.apply_async(_metered(_pgzip_member), (buf, level, fname if is_first else b'', mtime)))
+        is_first = False
+        if len(pending) >= max_pending:
+            fdst.write(pending.popleft().get())
+        buf = fsrc.read(blocksize)
+    while len(pending) > 0:
+        fdst.write(pending.popleft().get())
+    return None
+
+
+def _pgzip_inflate(member):
+    """Semi-private method to decompress one complete gzip member, checking its CRC32 and size.
+
+    Parameters
+    ----------
+    member : bytes
+        Complete gzip member.
+
+    Returns
+    -------
+    buf : bytes
+        Uncompressed block.
+
+    See Also
+    --------
+    CALLS : {}
+    CALLED_BY : {_pgzip_inflate_batch}
+    RELATED : {_pgzip_member}
+
+    """
+    decompressor = zlib.decompressobj(16+zlib.MAX_WBITS)
+    buf = decompressor.decompress(member) + decompressor.flush()
+    if len(decompressor.unused_data) > 0 or not getattr(decompressor, 'eof', True):
+        raise IOError("gzip member size from header extra field does not match member.")
+    return buf
+
+
+def _pgzip_inflate_batch(members):
+    """Semi-private method to decompress a list of complete gzip members with `_pgzip_inflate` into one buffer."""
+    return b''.join(_pgzip_inflate(member) for member in members)
+
+
+def _pgzip_decompress(fsrc, fdst, workers=None, batchsize=2**20):
+    """Semi-private method to decompress a multi-member gzip file object using multiple cores.
+
+    Members with the 'IP' size subfield from `_pgzip_member` or the 'BC' size subfield of BGZF from `_bgzf_block`
+    are split without decompressing and decompressed in parallel by a thread pool. At the first member without
+    a size subfield, the remaining stream is decompressed sequentially by `_gzip_decompress`.
+
+    Parameters
+    ----------
+    fsrc : file
+        Readable file object of gzip-compressed data.
+    fdst : file
+        Writable file object for uncompressed data, e.g. a `_HashingWriter`.
+    workers : {None}, int, optional
+        Number of worker threads. Default: number of CPUs.
+    batchsize : {2**20}, int, optional
+        Members are decompressed by one thread until their total compressed size reaches `batchsize` bytes,
+        so that small members, e.g. 64 KiB BGZF blocks, are not one task each.
+
+    Returns
+    -------
+    None
+
+    See Also
+    --------
+    CALLS : {_get_thread_pool, _read_exact, _pgzip_inflate_batch, _gzip_decompress}
+    CALLED_BY : {decompress, read_range}
+    RELATED : {_pgzip_compress, _bgzf_compress}
+
+    """
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    pool = _get_thread_pool(workers=workers)
+    max_pending = 2*workers
+    pending = collections.deque()
+    (batch, batch_bytes) = ([], 0)
+    remainder = b''
+    while True:
+        header = _read_exact(fsrc, 10)
+        member_size = None
+        if len(header) == 10 and header[:3] == b'\x1f\x8b\x08' and (ord(header[3:4]) & 0x04):
+            xlen_bytes = _read_exact(fsrc, 2)
+            header += xlen_bytes
+            if len(xlen_bytes) == 2:
+                extra = _read_exact(fsrc, struct.unpack('<H', xlen_bytes)[0])
+                header += extra
+                # Find the 'IP' subfield among the extra subfields.
+                idx = 0
+                while idx+4 <= len(extra):
+                    (subfield_id, subfield_len) = (extra[idx:idx+2], struct.unpack('<H', extra[idx+2:idx+4])[0])
+                    if subfield_id == b'IP' and subfield_len == 4:
+                        member_size = struct.unpack('<I', extra[idx+4:idx+8])[0]
+                        break
+                    elif subfield_id == b'BC' and subfield_len == 2:
+                        member_size = struct.unpack('<H', extra[idx+4:idx+6])[0] + 1
+                        break
+                    idx += 4+subfield_len
+        if member_size is None or member_size < len(header):
+            remainder = header
+            break
+        batch.append(header + _read_exact(fsrc, member_size-len(header)))
+        batch_bytes += member_size
+        if batch_bytes >= batchsize:
+            pending.append(pool.apply_async(_metered(_pgzip_inflate_batch), (batch,)))
+            (batch, batch_bytes) = ([], 0)
+        if len(pending) >= max_pending:
+            fdst.write(pending.popleft().get())
+    if len(batch) > 0:
+        pending.append(pool.apply_async(_metered(_pgzip_inflate_batch), (batch,)))
+    while len(pending) > 0:
+        fdst.write(pending.popleft().get())
+    # Decompress any members without the size subfield sequentially.
+    if len(remainder) > 0:
+        _gzip_decompress(fsrc=_PrefixedReader(prefix=remainder, fobj=fsrc), fdst=fdst)
+    return None
+
+
+class _PrefixedReader(object):
+    """Semi-private class to read bytes that were already read from a file object, then the rest of the file object.
+
+    Parameters
+    ----------
+    prefix : bytes
+        Bytes to return before reading from `fobj`.
+    fobj : file
+        Readable file object.
+
+    See Also
+    --------
+    CALLS : {}
+    CALLED_BY : {_pgzip_decompress}
+    RELATED : {}
+
+    """
+
+    def __init__(self, prefix, fobj):
+        self.prefix = prefix
+        self.fobj = fobj
+
+    def read(self, size=-1):
+        """Read up to `size` bytes from the prefix, then from the file object."""
+        if len(self.prefix) > 0:
+            if size < 0:
+                (buf, self.prefix) = (self.prefix + self.fobj.read(), b'')
+            else:
+                (buf, self.prefix) = (self.prefix[:size], self.prefix[size:])
+            return buf
+        return self.fobj.read(size)
+
+
+def _bgzf_block(buf, level=6):
+    """Semi-private method to compress at most `BGZF_BLOCKSIZE` bytes into one BGZF block.
+
+    A BGZF block is a gzip member with an extra field with subfield ID 'BC' that stores the total block size
+    minus 1 as a little-endian 16-bit integer, as read by htslib (e.g. ``samtools``, ``tabix``), see [1]_.
+
+    Parameters
+    ----------
+    buf : bytes
+        Uncompressed block of at most `BGZF_BLOCKSIZE` bytes.
+    level : {6}, int, optional
+        Compression level from 1 (fastest) to 9 (best).
+
+    Returns
+    -------
+    block : bytes
+        Complete BGZF block of at most 65536 bytes.
+
+    See Also
+    --------
+    CALLS : {}
+    CALLED_BY : {_bgzf_blocks}
+    RELATED : {_pgzip_member}
+
+    References
+    ----------
+    .. [1] https://samtools.github.io/hts-specs/SAMv1.pdf, section 4.1
+
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    deflated = compressor.compress(buf) + compressor.flush()
+    if len(deflated) > 2**16 - 26:
+        # NOTE: Incompressible data may expand. Level 0 stores `buf` in one deflate block of 5 + len(buf) bytes.
+        compressor = zlib.compressobj(0, zlib.DEFLATED, -zlib.MAX_WBITS)
+        deflated = compressor.compress(buf) + compressor.flush()
+    header = b'\x1f\x8b\x08\x04' + struct.pack('<IBBH', 0, 0, 255, 6) + b'BC' + struct.pack('<HH', 2, 18 + len(deflated) + 8 - 1)
+    trailer = struct.pack('<II', zlib.crc32(buf) & 0xffffffff, len(buf))
+    return header + deflated + trailer
+
+
+def _bgzf_blocks(buf, level=6):
+    """Semi-private method to compress consecutive blocks of `BGZF_BLOCKSIZE` bytes for a thread of `_bgzf_compress`.
+
+    Returns
+    -------
+    blocks : bytes
+        Concatenated BGZF blocks.
+    block_sizes : list
+        Size of each BGZF block in bytes.
+    line_counts : list
+        Number of newlines in each uncompressed block.
+
+    See Also
+    --------
+    CALLS : {_bgzf_block}
+    CALLED_BY : {_bgzf_compress}
+    RELATED : {}
+
+    """
+    blocks = []
+    line_counts = []
+    for idx in range(0, len(buf), BGZF_BLOCKSIZE):
+        chunk = buf[idx:idx+BGZF_BLOCKSIZE]
+        blocks.append(_bgzf_block(buf=chunk, level=level))
+        line_counts.append(chunk.count(b'\n'))
+    return (b''.join(blocks), [len(block) for block in blocks], line_counts)
+
+
+def _bgzf_compress(fsrc, fdst, level=6, workers=None, batch_blocks=16):
+    """Semi-private method to compress a file object into BGZF using multiple cores and return its block index.
+
+    BGZF is a multi-member gzip file of independent blocks of `BGZF_BLOCKSIZE` uncompressed bytes followed by
+    an empty end-of-file block. It is read by ``gunzip``, `_gzip_decompress`, and `_pgzip_decompress`, and
+    any block can be decompressed alone given its offset from the block index.
+
+    Parameters
+    ----------
+    fsrc : file
+        Readable file object of uncompressed data, e.g. a `_HashingReader`.
+    fdst : file
+        Writable file object for compressed data.
+    level : {6}, int, optional
+        Compression level from 1 (fastest) to 9 (best).
+    workers : {None}, int, optional
+        Number of worker threads. Default: number of CPUs.
+    batch_blocks : {16}, int, optional
+        Number of blocks compressed by one thread at a time.
+
+    Returns
+    -------
+    block_index : bytes
+        Block index from `_pack_block_index`.
+
+    See Also
+    --------
+    CALLS : {_get_thread_pool, _bgzf_blocks, _pack_block_index}
+    CALLED_BY : {compress}
+    RELATED : {_pgzip_compress, _pgzip_decompress, read_range}
+
+    Notes
+    -----
+    - Unlike 'PGZIP', the file name and modification time are not stored since BGZF headers are fixed.
+
+    """
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    pool = _get_thread_pool(workers=workers)
+    max_pending = 2*workers
+    pending = collections.deque()
+    (block_offsets, line_offsets) = ([0], [0])
+    def _write(result):
+        (blocks, block_sizes, line_counts) = result
+        fdst.write(blocks)
+        for (block_size, line_count) in zip(block_sizes, line_counts):
+            block_offsets.append(block_offsets[-1] + block_size)
+            line_offsets.append(line_offsets[-1] + line_count)
+        return None
+    buf = fsrc.read(BGZF_BLOCKSIZE*batch_blocks)
+    while len(buf) > 0:
+        pending.append(pool.apply_async(_metered(_bgzf_blocks), (buf, level)))
+        if len(pending) >= max_pending:
+            _write(pending.popleft().get())
+        buf = fsrc.read(BGZF_BLOCKSIZE*batch_blocks)
+    while len(pending) > 0:
+        _write(pending.popleft().get())
+    fdst.write(_BGZF_EOF)
+    return _pack_block_index(block_offsets=block_offsets, line_offsets=line_offsets)
+
+
+def _pack_block_index(block_offsets, line_offsets, blocksize=BGZF_BLOCKSIZE):
+    """Semi-private method to pack the block index of a BGZF file.
+
+    Parameters
+    ----------
+    block_offsets : list
+        Offset of each block in the compressed file, then the offset of the end-of-file block.
+    line_offsets : list
+        Number of newlines in the uncompressed file before each block, then the total number of newlines.
+    blocksize : {BGZF_BLOCKSIZE}, int, optional
+        Uncompressed bytes per block. Block ``i`` starts at uncompressed offset ``i*blocksize``.
+
+    Returns
+    -------
+    block_index : bytes
+        `_BLOCK_INDEX_MAGIC`, `blocksize` and the number of blocks ``n`` as little-endian 32-bit and 64-bit
+        integers, then ``n+1`` block offsets and ``n+1`` line offsets as little-endian 64-bit integers,
+        i.e. 16 bytes per 64 KiB of uncompressed data.
+
+    See Also
+    --------
+    CALLS : {}
+    CALLED_BY : {_bgzf_compress}
+    RELATED : {_unpack_block_index}
+
+    """
+    nblocks = len(block_offsets)-1
+    return (_BLOCK_INDEX_MAGIC + struct.pack('<IQ', blocksize, nblocks) +
+            struct.pack('<{n}Q'.format(n=nblocks+1), *block_offsets) + struct.pack('<{n}Q'.format(n=nblocks+1), *line_offsets))
+
+
+def _unpack_block_index(block_index):
+    """Semi-private method to unpack a block index from `_pack_block_index`.
+
+    Returns
+    -------
+    blocksize : int
+        Uncompressed bytes per block.
+    block_offsets : tuple
+        Offsets of blocks in the compressed file.
+    line_offsets : tuple
+        Number of newlines in the uncompressed file before each block.
+
+    Raises
+    ------
+    ValueError
+        If `block_index` is not a block index or is truncated.
+
+    """
+    header_size = len(_BLOCK_INDEX_MAGIC)+12
+    if block_index[:len(_BLOCK_INDEX_MAGIC)] != _BLOCK_INDEX_MAGIC or len(block_index) < header_size:
+        raise ValueError("Block index not valid.")
+    (blocksize, nblocks) = struct.unpack('<IQ', block_index[len(_BLOCK_INDEX_MAGIC):header_size])
+    if len(block_index) != header_size + 16*(nblocks+1):
+        raise ValueError("Block index is truncated.")
+    offsets = struct.unpack('<{n}Q'.format(n=2*(nblocks+1)), block_index[header_size:])
+    return (blocksize, offsets[:nblocks+1], offsets[nblocks+1:])
+
+
+def _varint_append(buf, value):
+    """Semi-private method to append a non-negative integer to a bytearray as a little-endian base-128 varint.
+
+    Parameters
+    ----------
+    buf : bytearray
+        Buffer to append to.
+    value : int
+        Non-negative integer.
+
+    Returns
+    -------
+    None
+
+    See Also
+    --------
+    CALLS : {}
+    CALLED_BY : {_fqz_encode_records, _fqz_compress}
+    RELATED : {_varint_decode}
+
+    """
+    while value >= 0x80:
+        buf.append((value & 0x7f) | 0x80)
+        value >>= 7
+    buf.append(value)
+    return None
+
+
+def _varint_decode(buf, pos):
+    """Semi-private method to decode a little-endian base-128 varint from a bytearray.
+
+    Parameters
+    ----------
+    buf : bytearray
+        Buffer to decode from.
+    pos : int
+        Index of the first byte of the varint.
+
+    Returns
+    -------
+    value : int
+        Decoded non-negative integer.
+    pos : int
+        Index of the byte after the varint.
+
+    See Also
+    --------
+    CALLS : {}
+    CALLED_BY : {_fqz_decode_records}
+    RELATED : {_varint_append}
+
+    """
+    value = 0
+    shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return (value, pos)
+        shift += 7
+
+
+def _fqz_encode_records(lines, final_newline=True, level=6):
+    """Semi-private method to encode complete FASTQ records into separate header, length, base, exception,
+    and quality streams.
+
+    Parameters
+    ----------
+    lines : list
+        Lines of FASTQ records without newline characters. Four lines per record.
+    final_newline : {True, False}, bool, optional
+        Whether the last line was followed by a newline character.
+    level : {6}, int, optional
+        `zlib` compression level for the header, length, exception, and quality streams.
+
+    Returns
+    -------
+    payload : bytes or None
+        Encoded records. ``None`` if `lines` are not FASTQ records that can be reproduced exactly
+        from the streams, e.g. if a '+' line is neither '+' nor a repeat of the header.
+
+    See Also
+    --------
+    CALLS : {_varint_append}
+    CALLED_BY : {_fqz_compress}
+    RELATED : {_fqz_decode_records}
+
+    Notes
+    -----
+    - Headers are split into numeric and non-numeric tokens. If all headers have the same number of tokens,
+      each column of tokens is encoded as a constant, as numeric deltas, or as literals. Otherwise, each token
+      is encoded relative to the token at the same index in the previous header as unchanged,
+      as a numeric delta, or as a literal.
+    - Bases are packed 2 bits per base as A=0, C=1, G=2, T=3. Runs of other characters (e.g. N) are
+      recorded in an exception list and packed as A.
+
+    """
+    if len(lines) == 0 or len(lines) % 4 != 0:
+        return None
+    (headers, seqs, pluses, quals) = (lines[0::4], lines[1::4], lines[2::4], lines[3::4])
+    num_records = len(headers)
+    # Check that all records can be reproduced exactly.
+    plus_repeats_header = (pluses[0] != b'+')
+    if [header[:1] for header in headers].count(b'@') != num_records:
+        return None
+    if list(map(len, seqs)) != list(map(len, quals)):
+        return None
+    if plus_repeats_header:
+        if pluses != [b'+'+header[1:] for header in headers]:
+            return None
+    elif pluses.count(b'+') != num_records:
+        return None
+    # Encode header tokens by column if all headers have the same number of tokens,
+    # otherwise relative to the previous header.
+    token_lists = [_FQZ_TOKEN_RE.findall(header, 1) for header in headers]
+    num_tokens = len(token_lists[0])
+    header_ops = bytearray()
+    if [len(tokens) for tokens in token_lists].count(num_tokens) == num_records:
+        header_ops.append(0)
+        _varint_append(header_ops, num_tokens)
+        for column in zip(*token_lists):
+            if column.count(column[0]) == num_records:
+                (kind, text) = (0, column[0])
+            elif b''.join(column).isdigit():
+                values = list(map(int, column))
+                text = ','.join(map(str, values)).encode('ascii')
+                if text == b','.join(column):
+                    deltas = [values[0]] + [value-prev_value for (prev_value, value) in zip(values[:-1], values[1:])]
+                    (kind, text) = (1, ','.join(map(str, deltas)).encode('ascii'))
+                else:
+                    (kind, text) = (2, b'\n'.join(column))
+            else:
+                (kind, text) = (2, b'\n'.join(column))
+            header_ops.append(kind)
+            _varint_append(header_ops, len(text))
+            header_ops.extend(text)
+    else:
+        header_ops.append(1)
+        prev_tokens = []
+        for tokens in token_lists:
+            _varint_append(header_ops, len(tokens))
+            for (idx, token) in enumerate(tokens):
+                prev_token = prev_tokens[idx] if idx < len(prev_tokens) else None
+                if token == prev_token:
+                    header_ops.append(0)
+                elif (prev_token is not None and token.isdigit() and prev_token.isdigit() and
+                      (token[:1] != b'0' or token == b'0') and (prev_token[:1] != b'0' or prev_token == b'0')):
+                    delta = int(token) - int(prev_token)
+                    header_ops.append(1)
+                    _varint_append(header_ops, 2*delta if delta >= 0 else -2*delta-1)
+                else:
+                    header_ops.append(2)
+                    _varint_append(header_ops, len(token))
+                    header_ops.extend(token)
+            prev_tokens = tokens
+    lengths = bytearray()
+    for seq in seqs:
+        _varint_append(lengths, len(seq))
+    # Record runs of bases other than ACGT, then pack all bases 4 per byte.
+    all_seqs = b''.join(seqs)
+    exceptions = bytearray()
+    prev_end = 0
+    for match in _FQZ_EXCEPTION_RE.finditer(all_seqs):
+        _varint_append(exceptions, match.start()-prev_end)
+        _varint_append(exceptions, match.end()-match.start())
+        exceptions.extend(match.group())
+        prev_end = match.end()
+    digits = all_seqs.translate(_FQZ_BASE_DIGITS)
+    digits += b'0'*(-len(digits) % 4)
+    # NOTE: Convert base-4 digits to bytes with a leading '1' digit to keep leading zeros.
+    packed = binascii.unhexlify(('%x' % int(b'1'+digits, 4))[1:]) if len(digits) > 0 else b''
+    flags = (0x01 if plus_repeats_header else 0x00) | (0x00 if final_newline else 0x02)
+    payload = bytearray()
+    _varint_append(payload, num_records)
+    payload.append(flags)
+    for stream in [zlib.compress(bytes(header_ops), level), zlib.compress(bytes(lengths), level), packed,
+                   zlib.compress(bytes(exceptions), level), zlib.compress(b''.join(quals), level)]:
+        _varint_append(payload, len(stream))
+        payload.extend(stream)
+    return bytes(payload)
+
+
+def _fqz_decode_records(payload):
+    """Semi-private method to decode FASTQ records from streams encoded by `_fqz_encode_records`.
+
+    Parameters
+    ----------
+    payload : bytes
+        Encoded records.
+
+    Returns
+    -------
+    data : bytes
+        FASTQ records exactly as they were encoded.
+
+    See Also
+    --------
+    CALLS : {_varint_decode}
+    CALLED_BY : {_fqz_decompress}
+    RELATED : {_fqz_encode_records}
+
+    Notes
+    -----
+    - Work is done per chunk rather than per record where possible: bases are unpacked with one
+      `bytes.translate` per 2-bit field, and records are assembled by filling each field of all records
+      with list slice assignment, then joining once.
+
+    """
+    payload = bytearray(payload)
+    (num_records, pos) = _varint_decode(payload, 0)
+    flags = payload[pos]
+    pos += 1
+    streams = []
+    for _ in range(5):
+        (stream_len, pos) = _varint_decode(payload, pos)
+        streams.append(bytes(payload[pos:pos+stream_len]))
+        pos += stream_len
+    (header_ops, lengths, packed, exceptions, all_quals) = streams
+    # Decode headers into columns of tokens. A constant column is kept as one token.
+    header_ops = bytearray(zlib.decompress(header_ops))
+    if header_ops[0] == 0:
+        (num_tokens, pos) = _varint_decode(header_ops, 1)
+        columns = []
+        for _ in range(num_tokens):
+            kind = header_ops[pos]
+            (text_len, pos) = _varint_decode(header_ops, pos+1)
+            text = bytes(header_ops[pos:pos+text_len])
+            pos += text_len
+            if kind == 0:
+                columns.append(text)
+            elif kind == 1:
+                values = list(_accumulate(map(int, text.split(b','))))
+                columns.append(','.join(map(str, values)).encode('ascii').split(b','))
+            else:
+                columns.append(text.split(b'\n'))
+    else:
+        headers = []
+        prev_tokens = []
+        pos = 1
+        for _ in range(num_records):
+            (num_tokens, pos) = _varint_decode(header_ops, pos)
+            tokens = []
+            for idx in range(num_tokens):
+                op = header_ops[pos]
+                pos += 1
+                if op == 0:
+                    tokens.append(prev_tokens[idx])
+                elif op == 1:
+                    (zigzag, pos) = _varint_decode(header_ops, pos)
+                    delta = zigzag//2 if zigzag % 2 == 0 else -(zigzag+1)//2
+                    tokens.append(('%d' % (int(prev_tokens[idx]) + delta)).encode('ascii'))
+                else:
+                    (token_len, pos) = _varint_decode(header_ops, pos)
+                    tokens.append(bytes(header_ops[pos:pos+token_len]))
+                    pos += token_len
+            headers.append(b''.join(tokens))
+            prev_tokens = tokens
+        columns = [headers]
+    # Decode lengths, then unpack bases and restore exceptions.
+    lengths = bytearray(zlib.decompress(lengths))
+    if max(lengths) < 0x80:
+        seq_lengths = list(lengths)
+    else:
+        seq_lengths = []
+        (value, shift) = (0, 0)
+        for byte in lengths:
+            value |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                seq_lengths.append(value)
+                (value, shift) = (0, 0)
+            else:
+                shift += 7
+    all_seqs = bytearray(4*len(packed))
+    for (idx, table) in enumerate(_FQZ_SHIFT_BASES):
+        all_seqs[idx::4] = packed.translate(table)
+    del all_seqs[sum(seq_lengths):]
+    exceptions = bytearray(zlib.decompress(exceptions))
+    (pos, seq_pos) = (0, 0)
+    while pos < len(exceptions):
+        (gap, pos) = _varint_decode(exceptions, pos)
+        (run_len, pos) = _varint_decode(exceptions, pos)
+        seq_pos += gap
+        all_seqs[seq_pos:seq_pos+run_len] = exceptions[pos:pos+run_len]
+        (pos, seq_pos) = (pos+run_len, seq_pos+run_len)
+    all_seqs = bytes(all_seqs)
+    all_quals = zlib.decompress(all_quals)
+    # Cut sequences and qualities at record boundaries.
+    ends = list(_accumulate(seq_lengths))
+    starts = [0] + ends[:-1]
+    seqs = [all_seqs[start:end] for (start, end) in zip(starts, ends)]
+    quals = [all_quals[start:end] for (start, end) in zip(starts, ends)]
+    # Reassemble records by filling each field of all records at once, then joining once:
+    # '@', header columns, '\n', sequence, '\n+', [header columns,] '\n', qualities, '\n'.
+    # Neighboring constant fields are merged, e.g. '\n+\n' and constant header columns.
+    fields = [b'@'] + columns + [b'\n', seqs, b'\n+'] + (columns if flags & 0x01 else []) + [b'\n', quals, b'\n']
+    merged = [fields[0]]
+    for field in fields[1:]:
+        if isinstance(field, bytes) and isinstance(merged[-1], bytes):
+            merged[-1] += field
+        else:
+            merged.append(field)
+    parts = [b'']*(len(merged)*num_records)
+    for (idx, field) in enumerate(merged):
+        parts[idx::len(merged)] = [field]*num_records if isinstance(field, bytes) else field
+    data = b''.join(parts)
+    if flags & 0x02:
+        data = data[:-1]
+    return data
+
+
+def _fqz_compress(fsrc, fdst, level=6, blocksize=2**22):
+    """Semi-private method to compress a FASTQ file object into the FASTQ-aware 'FQZ' format.
+
+    Parameters
+    ----------
+    fsrc : file
+        Readable file object of uncompressed FASTQ data, e.g. a `_HashingReader`.
+    fdst : file
+        Writable file object for compressed data.
+    level : {6}, int, optional
+        `zlib` compression level for each stream.
+    blocksize : {2**22}, int, optional
+        Approximate number of uncompressed bytes per chunk. Chunks end at record boundaries.
+
+    Returns
+    -------
+    None
+
+    See Also
+    --------
+    CALLS : {_fqz_encode_records, _varint_append}
+    CALLED_BY : {compress}
+    RELATED : {_fqz_decompress}
+
+    Notes
+    -----
+    - Format: magic bytes ``b'FQZ\\x01'``, then chunks, then ``b'E'``. Each chunk is a type byte, a varint
+      payload length, and the payload. Type ``b'F'`` is records encoded by `_fqz_encode_records`.
+      Type ``b'R'`` is `zlib`-compressed raw bytes for data that are not FASTQ records.
+    - Chunks are independent, so memory is bounded by the chunk size and the longest record.
+
+    """
+    fdst.write(_FQZ_MAGIC)
+    def _write_chunk(lines, final_newline):
+        payload = _fqz_encode_records(lines=lines, final_newline=final_newline, level=level)
+        if payload is None:
+            (chunk_type, payload) = (b'R', zlib.compress(b'\n'.join(lines) + (b'\n' if final_newline else b''), level))
+        else:
+            chunk_type = b'F'
+        chunk_header = bytearray()
+        _varint_append(chunk_header, len(payload))
+        fdst.write(chunk_type + bytes(chunk_header))
+        fdst.write(payload)
+    # Split data into chunks of complete records. Carry incomplete records to the next chunk.
+    leftover = b''
+    while True:
+        buf = fsrc.read(blocksize)
+        data = leftover + buf
+        if len(buf) == 0:
+            if len(data) > 0:
+                lines = data.split(b'\n')
+                final_newline = data.endswith(b'\n')
+                _write_chunk(lines=(lines[:-1] if final_newline else lines), final_newline=final_newline)
+            break
+        lines = data.split(b'\n')
+        num_lines = (len(lines)-1)//4*4
+        if num_lines == 0:
+            leftover = data
+            continue
+        leftover = b'\n'.join(lines[num_lines:])
+        _write_chunk(lines=lines[:num_lines], final_newline=True)
+    fdst.write(b'E')
+    return None
+
+
+def _fqz_decompress(fsrc, fdst):
+    """Semi-private method to decompress a file object in the FASTQ-aware 'FQZ' format.
+
+    Parameters
+    ----------
+    fsrc : file
+        Readable file object of 'FQZ' data.
+    fdst : file
+        Writable file object for uncompressed data, e.g. a `_HashingWriter`.
+
+    Returns
+    -------
+    None
+
+    Raises
+    ------
+    IOError
+        If the data are not in 'FQZ' format or are truncated.
+
+    See Also
+    --------
+    CALLS : {_read_exact, _fqz_decode_records}
+    CALLED_BY : {decompress}
+    RELATED : {_fqz_compress}
+
+    """
+    magic = _read_exact(fsrc, len(_FQZ_MAGIC))
+    if magic != _FQZ_MAGIC:
+        raise IOError(("Data are not in 'FQZ' format.\n" +
+                       "magic = {magic}").format(magic=repr(magic)))
+    while True:
+        chunk_type = _read_exact(fsrc, 1)
+        if chunk_type == b'E':
+            break
+        # Read varint payload length byte by byte.
+        (payload_len, shift, byte) = (0, 0, 0x80)
+        while byte >= 0x80:
+            buf = _read_exact(fsrc, 1)
+            if len(buf) == 0:
+                break
+            byte = ord(buf)
+            payload_len |= (byte & 0x7f) << shift
+            shift += 7
+        payload = _read_exact(fsrc, payload_len)
+        if chunk_type not in [b'F', b'R'] or len(payload) != payload_len:
+            raise IOError(("'FQZ' data are truncated or corrupted.\n" +
+                           "chunk_type = {ctype}").format(ctype=repr(chunk_type)))
+        if chunk_type == b'F':
+            fdst.write(_fqz_decode_records(payload))
+        else:
+            fdst.write(zlib.decompress(payload))
+    return None
+
+
+def _zlib_compress(fsrc, fdst, level=6, blocksize=2**16):
+    """Semi-private method to compress a file object into a zlib-format file object.
+
+    Parameters
+    ----------
+    fsrc : file
+        Readable file object of uncompressed data, e.g. a `_HashingReader`.
+    fdst : file
+        Writable file object for compressed data.
+    level : {6}, int, optional
+        Compression level from 1 (fastest) to 9 (best).
+    blocksize : {2**16}, int, optional
+        Number of bytes to read incrementally.
+
+    Returns
+    -------
+    None
+
+    See Also
+    --------
+    CALLS : {}
+    CALLED_BY : {compress, _select_codec}
+    RELATED : {_zlib_decompress}
+
+    """
+    compressor = zlib.compressobj(level)
+    buf = fsrc.read(blocksize)
+    while len(buf) > 0:
+        fdst.write(compressor.compress(buf))
+        buf = fsrc.read(blocksize)
+    fdst.write(compressor.flush())
+    return None
+
+
+def _zlib_decompress(fsrc, fdst, blocksize=2**16):
+    """Semi-private method to decompress a zlib-format file object.
+
+    Parameters
+    ----------
+    fsrc : file
+        Readable file object of zlib-format data.
+    fdst : file
+        Writable file object for uncompressed data, e.g. a `_HashingWriter`.
+    blocksize : {2**16}, int, optional
+        Number of bytes to read incrementally.
+
+    Returns
+    -------
+    None
+
+    See Also
+    --------
+    CALLS : {}
+    CALLED_BY : {decompress}
+    RELATED : {_zlib_compress}
+
+    """
+    decompressor = zlib.decompressobj()
+    buf = fsrc.read(blocksize)
+    while len(buf) > 0:
+        fdst.write(decompressor.decompress(buf))
+        buf = fsrc.read(blocksize)
+    fdst.write(decompressor.flush())
+    if not getattr(decompressor, 'eof', True):
+        raise IOError("Compressed data ended before the end of the zlib stream was reached.")
+    return None
+
+
+def _bz2_compress(fsrc, fdst, level=9, blocksize=2**16):
+    """Semi-private method to compress a file object into a bzip2-format file object.
+
+    Parameters
+    ----------
+    fsrc : file
+        Readable file object of uncompressed data, e.g. a `_HashingReader`.
+    fdst : file
+        Writable file object for compressed data.
+    level : {9}, int, optional
+        Compression level from 1 (fastest) to 9 (best).
+    blocksize : {2**16}, int, optional
+        Number of bytes to read incrementally.
+
+    Returns
+    -------
+    None
+
+    See Also
+    --------
+    CALLS : {}
+    CALLED_BY : {compress, _select_codec}
+    RELATED : {_bz2_decompress}
+
+    """
+    compressor = bz2.BZ2Compressor(level)
+    buf = fsrc.read(blocksize)
+    while len(buf) > 0:
+        fdst.write(compressor.compress(buf))
+        buf = fsrc.read(blocksize)
+    fdst.write(compressor.flush())
+    return None
+
+
+def _bz2_decompress(fsrc, fdst, blocksize=2**16):
+    """Semi-private method to decompress a bzip2-format file object that may have multiple streams.
+
+    Parameters
+    ----------
+    fsrc : file
+        Readable file object of bzip2-format data.
+    fdst : file
+        Writable file object for uncompressed data, e.g. a `_HashingWriter`.
+    blocksize : {2**16}, int, optional
+        Number of bytes to read incrementally.
+
+    Returns
+    -------
+    None
+
+    See Also
+    --------
+    CALLS : {}
+    CALLED_BY : {decompress}
+    RELATED : {_bz2_compress}
+
+    """
+    decompressor = bz2.BZ2Decompressor()
+    buf = fsrc.read(blocksize)
+    while len(buf) > 0:
+        fdst.write(decompressor.decompress(buf))
+        # Data after the end of a stream begins the next stream.
+        while len(decompressor.unused_data) > 0:
+            buf = decompressor.unused_data
+            decompressor = bz2.BZ2Decompressor()
+            fdst.write(decompressor.decompress(buf))
+        buf = fsrc.read(blocksize)
+    if not getattr(decompressor, 'eof', True):
+        raise IOError("Compressed data ended before the end of the bzip2 stream was reached.")
+    return None
+
+
+def _lzma_compress(fsrc, fdst, level=6, blocksize=2**16):
+    """Semi-private method to compress a file object into an xz-format file object.
+
+    Parameters
+    ----------
+    fsrc : file
+        Readable file object of uncompressed data, e.g. a `_HashingReader`.
+    fdst : file
+        Writable file object for compressed data.
+    level : {6}, int, optional
+        Compression preset from 0 (fastest) to 9 (best).
+    blocksize : {2**16}, int, optional
+        Number of bytes to read incrementally.
+
+    Returns
+    -------
+    None
+
+    See Also
+    --------
+    CALLS : {}
+    CALLED_BY : {compress, _select_codec}
+    RELATED : {_lzma_decompress}
+
+    Notes
+    -----
+    - Requires `lzma` from Python 3 or `backports.lzma` for Python 2.
+
+    """
+    compressor = lzma.LZMACompressor(preset=level)
+    buf = fsrc.read(blocksize)
+    while len(buf) > 0:
+        fdst.write(compressor.compress(buf))
+        buf = fsrc.read(blocksize)
+    fdst.write(compressor.flush())
+    return None
+
+
+def _lzma_decompress(fsrc, fdst, blocksize=2**16):
+    """Semi-private method to decompress an xz-format file object that may have multiple streams.
+
+    Parameters
+    ----------
+    fsrc : file
+        Readable file object of xz-format data.
+    fdst : file
+        Writable file object for uncompressed data, e.g. a `_HashingWriter`.
+    blocksize : {2**16}, int, optional
+        Number of bytes to read incrementally.
+
+    Returns
+    -------
+    None
+
+    See Also
+    --------
+    CALLS : {}
+    CALLED_BY : {decompress}
+    RELATED : {_lzma_compress}
+
+    """
+    decompressor = lzma.LZMADecompressor()
+    buf = fsrc.read(blocksize)
+    while len(buf) > 0:
+        fdst.write(decompressor.decompress(buf))
+        # Data after the end of a stream begins the next stream.
+        while len(decompressor.unused_data) > 0:
+            buf = decompressor.unused_data
+            decompressor = lzma.LZMADecompressor()
+            fdst.write(decompressor.decompress(buf))
+        buf = fsrc.read(blocksize)
+    if not decompressor.eof:
+        raise IOError("Compressed data ended before the end of the xz stream was reached.")
+    return None
+
+
+def register_codec(name, compress_func, decompress_func, levels, default_level, extension, checksum=False, appendable=False,
+                   fast_decode=True):
+    """Register a codec so that `compress` and `decompress` can use it as a compression method.
+
+    Use to add third-party codecs. Codecs are recorded in imeta as 'COMPRESSION_METHOD' = 'NAME:LEVEL'.
+
+    Parameters
+    ----------
+    name : string
+        Name of compression method. Not case-sensitive; stored as upper case. Must not contain ':'.
+    compress_func : function
+        Function called as ``compress_func(fsrc, fdst, level, workers, fname, mtime)`` to compress
+        readable file object `fsrc` into writable file object `fdst`. `workers` is the number of threads the
+        codec may use. `fname` and `mtime` are the original file name and modification time, if the format stores them.
+        May return a block index as ``bytes`` (see `_pack_block_index`), which `compress` stores beside the
+        compressed file for `read_range`. Otherwise returns ``None``.
+    decompress_func : function
+        Function called as ``decompress_func(fsrc, fdst, workers)`` to decompress readable file object `fsrc`
+        into writable file object `fdst`. Must raise an exception if the compressed data are corrupted or truncated.
+    levels : list
+        Valid compression levels as ``int``.
+    default_level : int
+        Compression level to use if none is given. Must be in `levels`.
+    extension : string
+        File extension for temporary compressed files, e.g. '.gz'.
+    checksum : {False, True}, bool, optional
+        ``True`` if `decompress_func` raises an exception when a checksum of the uncompressed data stored in the
+        format does not match, e.g. the CRC32 and size from the trailer of each gzip member. Only then does
+        `decompress` skip the hash with ``verify='trailer'``.
+    appendable : {False, True}, bool, optional
+        ``True`` if compressed files can be concatenated and `decompress_func` decompresses the concatenation to the
+        concatenated data, e.g. gzip members. Then `compress` compresses only the data appended to a file since it was
+        decompressed. `compress_func` must not return a block index.
+    fast_decode : {True, False}, bool, optional
+        ``False`` if `decompress_func` is markedly slower than 'GZIP', e.g. a codec that trades decode speed for ratio.
+        Then 'auto' does not select the codec for hot files (see `compress`).
+
+    Returns
+    -------
+    None
+
+    See Also
+    --------
+    CALLS : {}
+    CALLED_BY : {}
+    RELATED : {_parse_compression_method}
+
+    Notes
+    -----
+    - On import, `iplant.py` calls ``iplant_codecs.register(register_codec)`` if an optional module `iplant_codecs`
+      is importable, e.g. from the same directory as `iplant.py`.
+
+    """
+    name = name.upper()
+    if ':' in name or default_level not in levels:
+        raise ValueError(("Codec name must not contain ':' and `default_level` must be in `levels`.\n" +
+                          "name = {name}\n" +
+                          "levels = {levels}\n" +
+                          "default_level = {dlevel}").format(name=name, levels=levels, dlevel=default_level))
+    _codecs[name] = {'compress': compress_func, 'decompress': decompress_func,
+                     'levels': list(levels), 'default_level': default_level, 'extension': extension,
+                     'checksum': checksum, 'appendable': appendable, 'fast_decode': fast_decode}
+    return None
+
+
+def _parse_compression_method(compression_method):
+    """Semi-private method to parse a compression method into a registered codec name and level.
+
+    Parameters
+    ----------
+    compression_method : string
+        Compression method as 'NAME' or 'NAME:LEVEL', e.g. 'GZIP', 'GZIP:6'. Not case-sensitive.
+        'NAME' without a level is the codec's default level.
+
+    Returns
+    -------
+    name : string
+        Registered codec name.
+    level : int
+        Compression level.
+
+    Raises
+    ------
+    ValueError
+        If the codec is not registered or the level is not valid for the codec.
+
+    See Also
+    --------
+    CALLS : {}
+    CALLED_BY : {compress, _compress_encode, decompress, _select_codec, __main__}
+    RELATED : {register_codec}
+
+    """
+    (name, _, level) = compression_method.upper().partition(':')
+    if name not in _codecs:
+        raise ValueError(("Compression method not valid.\n" +
+                          "compression_method = {cm}\n" +
+                          "valid_compression_methods = {vcm}").format(cm=compression_method, vcm=list(_codecs.keys())))
+    codec = _codecs[name]
+    try:
+        level = int(level) if level != '' else codec['default_level']
+    except ValueError:
+        level = None
+    if level not in codec['levels']:
+        raise ValueError(("Compression level not valid.\n" +
+                          "compression_method = {cm}\n" +
+                          "valid_levels = {vl}").format(cm=compression_method, vl=codec['levels']))
+    return (name, level)
+
+
+class _CountingWriter(object):
+    """Semi-private class for a writable file object that counts bytes, then discards them or passes them on.
+
+    Parameters
+    ----------
+    fobj : {None}, file, optional
+        Writable file object to pass bytes to. Bytes are discarded if ``None``.
+
+    Attributes
+    ----------
+    size : int
+        Number of bytes written so far.
+
+    See Also
+    --------
+    CALLS : {}
+    CALLED_BY : {_select_codec, _compress_encode}
+    RELATED : {_HashingWriter}
+
+    """
+
+    def __init__(self, fobj=None):
+        self.fobj = fobj
+        self.size = 0
+
+    def write(self, buf):
+        """Count bytes from `buf`, then write them to `fobj` if given."""
+        if self.fobj is not None:
+            self.fobj.write(buf)
+        self.size += len(buf)
+        return None
+
+
+class _CountingReader(object):
+    """Semi-private class for a readable file object that counts the bytes read from another.
+
+    Parameters
+    ----------
+    fobj : file
+        Readable file object. Closed by `close`.
+
+    Attributes
+    ----------
+    size : int
+        Number of bytes read so far.
+
+    See Also
+    --------
+    CALLS : {}
+    CALLED_BY : {read_range}
+    RELATED : {_CountingWriter, _HashingReader}
+
+    """
+
+    def __init__(self, fobj):
+        self.fobj = fobj
+        self.size = 0
+
+    def read(self, size=-1):
+        """Read up to `size` bytes, or to the end if `size` is negative."""
+        buf = self.fobj.read(size)
+        self.size += len(buf)
+        return buf
+
+    def close(self):
+        """Close the underlying file object."""
+        self.fobj.close()
+        return None
+
+
+def _auto_candidates():
+    """Semi-private method to list the default candidates of `compression_method` 'auto' among registered codecs."""
+    return [name for name in ['GZIP:1', 'GZIP:6', 'PGZIP:1', 'BZ2:9', 'LZMA:6', 'FQZ:6'] if name.split(':')[0] in _codecs]
+
+
+def _measure_codec(sample, compression_method, workers=None):
+    """Semi-private method to compress a sample in memory and measure the compressed size and CPU time.
+
+    Parameters
+    ----------
+    sample : bytes
+        Sample of uncompressed data.
+    compression_method : string
+        Compression method as 'NAME:LEVEL'.
+    workers : {None}, int, optional
+        Number of worker threads for codecs that use them. Default: number of CPUs.
+
+    Returns
+    -------
+    compressed_size : int
+        Bytes of compressed sample.
+    cpu_time : float
+        User plus system time in seconds of the calling thread and the codec's thread pool tasks. See `_CpuMeter`.
+    wall_time : float
+        Elapsed time in seconds.
+
+    See Also
+    --------
+    CALLS : {_parse_compression_method, _CountingWriter, _CpuMeter}
+    CALLED_BY : {_select_codec, sweep}
+    RELATED : {}
+
+    Notes
+    -----
+    - CPU time is counted per thread, so jobs running concurrently in the same process, e.g. under `serve` or
+      `drain`, are not charged to the candidate. Without per-thread times, e.g. Python 2 on other platforms than
+      Linux, it falls back to the time of the whole process from `os.times`, which is accurate only for a process
+      that runs one job at a time.
+
+    """
+    (name, level) = _parse_compression_method(compression_method)
+    sink = _CountingWriter()
+    wall_start = time.time()
+    with _CpuMeter() as meter:
+        _codecs[name]['compress'](io.BytesIO(sample), sink, level, workers, '', 0)
+    wall_stop = time.time()
+    return (sink.size, meter.cpu_time, wall_stop - wall_start)
+
+
+def _select_codec(sample, candidates, cpu_budget=60.0, workers=None):
+    """Semi-private method to select a compression method by compressing a sample of the file with each candidate.
+
+    Parameters
+    ----------
+    sample : bytes
+        Sample of uncompressed data, e.g. the first few MB of the file.
+    candidates : list
+        Candidate compression methods as 'NAME:LEVEL'.
+    cpu_budget : {60.0}, float, optional
+        Maximum CPU time in seconds to compress 1 GiB of uncompressed data.
+    workers : {None}, int, optional
+        Number of worker threads for codecs that use them. Default: number of CPUs.
+
+    Returns
+    -------
+    compression_method : string
+        Compression method as 'NAME:LEVEL' with the best compression ratio within `cpu_budget`.
+        If no candidate is within `cpu_budget`, the candidate that used the least CPU time.
+        If `sample` is empty, the first candidate.
+
+    See Also
+    --------
+    CALLS : {_parse_compression_method, _measure_codec}
+    CALLED_BY : {_compress_encode, sweep}
+    RELATED : {}
+
+    Notes
+    -----
+    - CPU time is user plus system time of this job's threads, including the codec's thread pool tasks.
+      See `_measure_codec`.
+
+    """
+    candidates = ['{name}:{level}'.format(name=name, level=level)
+                  for (name, level) in [_parse_compression_method(cm) for cm in candidates]]
+    if len(sample) == 0:
+        return candidates[0]
+    results = []
+    for compression_method in candidates:
+        (compressed_size, cpu_time, wall_time) = _measure_codec(sample=sample, compression_method=compression_method, workers=workers)
+        cpu_per_gib = cpu_time * 2**30 / len(sample)
+        ratio = len(sample) / max(compressed_size, 1)
+        throughput = len(sample) / max(wall_time, 1e-6) / 2**20
+        logger.debug(("_select_codec: compression_method = {cm}, ratio = {ratio:.3f}, cpu_per_gib (s) = {cpu:.1f}, " +
+                      "throughput (MiB/s) = {tput:.1f}").format(cm=compression_method, ratio=ratio, cpu=cpu_per_gib, tput=throughput))
+        results.append((compression_method, ratio, cpu_per_gib))
+    within_budget = [result for result in results if result[2] <= cpu_budget]
+    if len(within_budget) > 0:
+        compression_method = max(within_budget, key=lambda result: result[1])[0]
+    else:
+        compression_method = min(results, key=lambda result: result[2])[0]
+    return compression_method
+
+
+# Register standard codecs, then optional codecs.
+register_codec(name='GZIP', levels=range(1, 10), default_level=1, extension='.gz', checksum=True, appendable=True,
+               compress_func=(lambda fsrc, fdst, level, workers, fname, mtime:
+                              _gzip_compress(fsrc=fsrc, fdst=fdst, fname=fname, mtime=mtime, level=level)),
+               decompress_func=(lambda fsrc, fdst, workers: _gzip_decompress(fsrc=fsrc, fdst=fdst)))
+register_codec(name='PGZIP', levels=range(1, 10), default_level=1, extension='.gz', checksum=True, appendable=True,
+               compress_func=(lambda fsrc, fdst, level, workers, fname, mtime:
+                              _pgzip_compress(fsrc=fsrc, fdst=fdst, fname=fname, mtime=mtime, level=level, workers=workers)),
+               decompress_func=(lambda fsrc, fdst, workers: _pgzip_decompress(fsrc=fsrc, fdst=fdst, workers=workers)))
+register_codec(name='BGZF', levels=range(1, 10), default_level=6, extension='.gz', checksum=True,
+               compress_func=(lambda fsrc, fdst, level, workers, fname, mtime:
+                              _bgzf_compress(fsrc=fsrc, fdst=fdst, level=level, workers=workers)),
+               decompress_func=(lambda fsrc, fdst, workers: _pgzip_decompress(fsrc=fsrc, fdst=fdst, workers=workers)))
+register_codec(name='ZLIB', levels=range(1, 10), default_level=6, extension='.zz', checksum=True,
+               compress_func=(lambda fsrc, fdst, level, workers, fname, mtime: _zlib_compress(fsrc=fsrc, fdst=fdst, level=level)),
+               decompress_func=(lambda fsrc, fdst, workers: _zlib_decompress(fsrc=fsrc, fdst=fdst)))
+register_codec(name='BZ2', levels=range(1, 10), default_level=9, extension='.bz2', checksum=True, appendable=True,
+               compress_func=(lambda fsrc, fdst, level, workers, fname, mtime: _bz2_compress(fsrc=fsrc, fdst=fdst, level=level)),
+               decompress_func=(lambda fsrc, fdst, workers: _bz2_decompress(fsrc=fsrc, fdst=fdst)))
+if lzma is not None:
+    register_codec(name='LZMA', levels=range(0, 10), default_level=6, extension='.xz', checksum=True, appendable=True,
+                   compress_func=(lambda fsrc, fdst, level, workers, fname, mtime: _lzma_compress(fsrc=fsrc, fdst=fdst, level=level)),
+                   decompress_func=(lambda fsrc, fdst, workers: _lzma_decompress(fsrc=fsrc, fdst=fdst)))
+# NOTE: 'FQZ' decodes in Python, 1.5 to 2 times slower than 'GZIP', e.g. 0.6 s vs 0.4 s for 50 MB of synthetic FASTQ.
+register_codec(name='FQZ', levels=range(1, 10), default_level=6, extension='.fqz', fast_decode=False,
+               compress_func=(lambda fsrc, fdst, level, workers, fname, mtime: _fqz_compress(fsrc=fsrc, fdst=fdst, level=level)),
+               decompress_func=(lambda fsrc, fdst, workers: _fqz_decompress(fsrc=fsrc, fdst=fdst)))
+try:
+    import iplant_codecs
+except ImportError:
+    iplant_codecs = None
+if iplant_codecs is not None:
+    iplant_codecs.register(register_codec)
+
+
+class Transport(object):
+    """Interface to iRODS for the catalog and data operations of `compress`, `decompress`, and `bulk`.
+
+    Select the transport for the module with `set_transport`. Subclasses implement all methods.
+
+    See Also
+    --------
+    CALLS : {}
+    CALLED_BY : {_get_transport}
+    RELATED : {IcommandsTransport, SessionTransport, FakeTransport}
+
+    Notes
+    -----
+    - Paths are absolute iRODS paths. Errors are raised as exceptions of the backend, e.g.
+      ``subprocess.CalledProcessError`` from `IcommandsTransport`.
+    - Metadata are returned as from `_imeta_to_dict` and set as (attribute name, value, units) triplets of strings.
+    - File objects from `open_read` and `open_write` must be closed. Closing a writer commits the data object.
+      File objects may also have an ``abort`` method that stops the transfer without committing, as used by
+      `_abort_stream`.
+
+    """
+
+    def meta_get(self, ipath):
+        """Return metadata of data object `ipath` as a ``dict`` like `_imeta_to_dict`."""
+        raise NotImplementedError
+
+    def meta_set(self, ipath, imeta_triplets):
+        """Set (attribute name, value, units) triplets on data object `ipath`, replacing existing values."""
+        raise NotImplementedError
+
+    def exists(self, ipath):
+        """Return ``True`` if `ipath` is a data object or a collection."""
+        raise NotImplementedError
+
+    def size(self, ipath):
+        """Return size of data object `ipath` in bytes, or ``None`` if not known."""
+        raise NotImplementedError
+
+    def mkdir(self, ipath):
+        """Create collection `ipath` and its parents."""
+        raise NotImplementedError
+
+    def move(self, isrc, idst):
+        """Move data object `isrc` to `idst` with its metadata. `idst` must not exist."""
+        raise NotImplementedError
+
+    def copy(self, isrc, idst):
+        """Copy data object `isrc` to `idst` without its metadata. `idst` must not exist."""
+        raise NotImplementedError
+
+    def remove(self, ipath):
+        """Remove data object `ipath` without moving it to the trash."""
+        raise NotImplementedError
+
+    def link(self, isrc, idst):
+        """Register new data object `idst` to the physical file of data object `isrc` without copying data or metadata."""
+        raise NotImplementedError
+
+    def unlink(self, ipath):
+        """Unregister data object `ipath` and its metadata without removing its physical file."""
+        raise NotImplementedError
+
+    def get(self, ipath, path):
+        """Copy data object `ipath` to local file `path`, overwriting it."""
+        raise NotImplementedError
+
+    def put(self, path, ipath):
+        """Copy local file `path` to new data object `ipath`."""
+        raise NotImplementedError
+
+    def open_read(self, ipath, offset=0, length=None):
+        """Return a readable binary file object of data object `ipath`.
+        If `offset` or `length` is given, only `length` bytes from byte `offset` are read, or to the end if ``None``."""
+        raise NotImplementedError
+
+    def open_write(self, ipath):
+        """Return a writable binary file object that creates or replaces data object `ipath` when closed."""
+        raise NotImplementedError
+
+    def list_data_objects(self, icollection, attr_name=None, attr_value=None):
+        """Return (iRODS path, size) of data objects within `icollection` and its subcollections, one per path.
+        If `attr_name` is given, only data objects with metadata `attr_name` = `attr_value` are listed."""
+        raise NotImplementedError
+
+    def list_metadata(self, icollection, attr_names):
+        """Return metadata of data objects within `icollection` and its subcollections as a ``dict`` of iRODS path to
+        ``dict`` like `_imeta_to_dict`, restricted to `attr_names`. Data objects without these attributes are not included."""
+        raise NotImplementedError
+
+    def close(self):
+        """Release connections. The transport is not used afterward."""
+        return None
+
+
+class _PipeReader(object):
+    """Semi-private class for a readable file object from stdout of an icommand.
+
+    Parameters
+    ----------
+    args : list
+        Command line of the icommand, e.g. ``["iget", "-f", ipath, "-"]``.
+
+    See Also
+    --------
+    CALLS : {}
+    CALLED_BY : {IcommandsTransport}
+    RELATED : {_PipeWriter}
+
+    Notes
+    -----
+    - The return code is checked by `close` only if stdout was read to the end. Closing early stops the
+      icommand, e.g. to read the first bytes of a data object, and its broken pipe error is discarded.
+
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.stderr = tempfile.TemporaryFile()
+        self.proc = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=self.stderr)
+        self.eof = False
+
+    def read(self, size=-1):
+        """Read up to `size` bytes, or to the end if `size` is negative."""
+        buf = self.proc.stdout.read(size) if size >= 0 else self.proc.stdout.read()
+        if (size < 0) or ((size > 0) and (len(buf) == 0)):
+            self.eof = True
+        return buf
+
+    def close(self):
+        """Close stdout and wait for the icommand. Raise ``subprocess.CalledProcessError`` if it failed."""
+        self.proc.stdout.close()
+        returncode = self.proc.wait()
+        self.stderr.seek(0)
+        stderr = self.stderr.read().decode('utf-8', 'replace')
+        self.stderr.close()
+        if self.eof and (returncode != 0):
+            logger.error("_PipeReader: {args} failed:\n{stderr}".format(args=self.args, stderr=stderr))
+            raise subprocess.CalledProcessError(returncode, self.args)
+        return None
+
+
+class _PipeWriter(object):
+    """Semi-private class for a writable file object to stdin of an icommand.
+
+    Parameters
+    ----------
+    args : list
+        Command line of the icommand, e.g. ``ISTREAM_WRITE + [ipath]``.
+
+    See Also
+    --------
+    CALLS : {}
+    CALLED_BY : {IcommandsTransport}
+    RELATED : {_PipeReader}
+
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.proc = subprocess.Popen(args, stdin=subprocess.PIPE)
+
+    def write(self, buf):
+        """Write `buf` to stdin of the icommand."""
+        self.proc.stdin.write(buf)
+        return None
+
+    def close(self):
+        """Close stdin and wait for the icommand. Raise ``subprocess.CalledProcessError`` if it failed."""
+        self.proc.stdin.close()
+        returncode = self.proc.wait()
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, self.args)
+        return None
+
+    def abort(self):
+        """Kill the icommand before closing stdin so that it does not commit the data written so far, then wait."""
+        if self.proc.poll() is None:
+            self.proc.kill()
+        try:
+            self.proc.stdin.close()
+        except (IOError, OSError):
+            # NOTE: Flushing to a killed icommand raises a broken pipe error.
+            pass
+        self.proc.wait()
+        return None
+
+
+class _LimitedReader(object):
+    """Semi-private class for a readable file object that reads at most `length` bytes from another.
+
+    Parameters
+    ----------
+    fobj : file
+        Readable file object. Closed by `close`.
+    length : int
+        Number of bytes to read at most.
+
+    See Also
+    --------
+    CALLS : {}
+    CALLED_BY : {SessionTransport}
+    RELATED : {_PipeReader}
+
+    """
+
+    def __init__(self, fobj, length):
+        self.fobj = fobj
+        self.remaining = length
+
+    def read(self, size=-1):
+        """Read up to `size` bytes, or to the limit if `size` is negative."""
+        size = self.remaining if (size < 0) else min(size, self.remaining)
+        buf = self.fobj.read(size) if size > 0 else b''
+        self.remaining -= len(buf)
+        return buf
+
+    def close(self):
+        """Close the underlying file object."""
+        self.fobj.close()
+        return None
+
+
+def _as_text(stdout):
+    """Semi-private method to decode stdout of an icommand to ``str`` in Python 3. Python 2 ``str`` is returned as is."""
+    if not isinstance(stdout, str):
+        stdout = stdout.decode('utf-8', 'replace')
+    return stdout
+
+
+def _iquest(query, columns):
+    """Semi-private method to run a general query with `iquest` and parse its rows.
+
+    Parameters
+    ----------
+    query : string
+        iRODS general query, e.g. "SELECT COLL_NAME, DATA_NAME WHERE COLL_NAME like '/zone/home/%'".
+    columns : int
+        Number of columns selected by `query`.
+
+    Returns
+    -------
+    rows : list
+        ``list`` of ``tuple`` of strings, one per row. Empty if no rows match.
+
+    Raises
+    ------
+    subprocess.CalledProcessError
+        If `iquest` fails other than for no matching rows.
+
+    See Also
+    --------
+    CALLS : {_as_text}
+    CALLED_BY : {IcommandsTransport}
+    RELATED : {}
+
+    Notes
+    -----
+    - Columns are separated by tabs with `--no-page` so that all rows are returned in one call.
+
+    """
+    iquest_args = ["iquest", "--no-page", '\t'.join(['%s']*columns), query]
+    iquest_proc = subprocess.Popen(iquest_args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    iquest_stdout = _as_text(iquest_proc.communicate()[0])
+    # NOTE: `iquest` exits with a nonzero return code if no rows match.
+    if 'CAT_NO_ROWS_FOUND' in iquest_stdout:
+        return []
+    if iquest_proc.returncode != 0:
+        raise subprocess.CalledProcessError(iquest_proc.returncode, iquest_args, output=iquest_stdout)
+    rows = [tuple(line.split('\t')) for line in iquest_stdout.splitlines() if line.count('\t') == columns-1]
+    return rows
+
+
+class IcommandsTransport(Transport):
+    """Transport that runs one iRODS icommand process per operation.
+
+    See Also
+    --------
+    CALLS : {_imeta_to_dict, _imeta_set, _iquest, _PipeReader, _PipeWriter}
+    CALLED_BY : {_get_transport}
+    RELATED : {SessionTransport, FakeTransport}
+
+    Notes
+    -----
+    - Each icommand authenticates with the iRODS server again, so an operation costs a process and a connection.
+      Use `SessionTransport` to reuse connections.
+    - Streams are read with `iget` to stdout and written with `ISTREAM_WRITE` from stdin.
+      Ranges of data objects are read with `ISTREAM_READ`, which requires iRODS 4.2.9 or later.
+
+    """
+
+    def meta_get(self, ipath):
+        """Return metadata of data object `ipath` from `imeta ls -d`."""
+        return _imeta_to_dict(imeta_stdout=_as_text(subprocess.check_output(["imeta", "ls", "-d", ipath])))
+
+    def meta_set(self, ipath, imeta_triplets):
+        """Set metadata of data object `ipath` in one `imeta` session. See `_imeta_set`."""
+        _imeta_set(ipath=ipath, imeta_triplets=imeta_triplets)
+        return None
+
+    def exists(self, ipath):
+        """Return ``True`` if `ils` lists `ipath`."""
+        with open(os.devnull, 'wb') as devnull:
+            returncode = subprocess.call(["ils", ipath], stdout=devnull, stderr=devnull)
+        return returncode == 0
+
+    def size(self, ipath):
+        """Return size of data object `ipath` from `ils -l`.
+        Lines of `ils -l` are '  OWNER REPLICA_NUMBER RESOURCE SIZE DATE & NAME'. The first replica is used."""
+        size = None
+        for line in _as_text(subprocess.check_output(["ils", "-l", ipath])).splitlines():
+            fields = line.split()
+            if len(fields) >= 4 and fields[3].isdigit():
+                size = int(fields[3])
+                break
+        return size
+
+    def mkdir(self, ipath):
+        """Create collection `ipath` with `imkdir -p`."""
+        subprocess.check_output(["imkdir", "-p", ipath])
+        return None
+
+    def move(self, isrc, idst):
+        """Move data object with `imv`."""
+        subprocess.check_output(["imv", isrc, idst])
+        return None
+
+    def copy(self, isrc, idst):
+        """Copy data object with `icp`."""
+        subprocess.check_output(["icp", isrc, idst])
+        return None
+
+    def remove(self, ipath):
+        """Remove data object with `irm -f`."""
+        subprocess.check_output(["irm", "-f", ipath])
+        return None
+
+    def link(self, isrc, idst):
+        """Register data object with `ireg` to the physical path and resource of `isrc` from one `iquest` general query.
+        The first replica is used."""
+        query = "SELECT DATA_PATH, RESC_NAME WHERE COLL_NAME = '{coll}' AND DATA_NAME = '{name}'".format(coll=os.path.dirname(isrc),
+                                                                                                      name=os.path.basename(isrc))
+        rows = _iquest(query=query, columns=2)
+        if len(rows) == 0:
+            raise IOError("Data object does not exist or user lacks access permission: {ipath}".format(ipath=isrc))
+        (path, resc_name) = rows[0]
+        subprocess.check_output(["ireg", "-R", resc_name, path, idst])
+        return None
+
+    def unlink(self, ipath):
+        """Unregister data object with `irm -U`."""
+        subprocess.check_output(["irm", "-U", ipath])
+        return None
+
+    def get(self, ipath, path):
+        """Copy data object to local file with `iget -f -T`."""
+        subprocess.check_output(["iget", "-f", "-T", ipath, path])
+        return None
+
+    def put(self, path, ipath):
+        """Copy local file to data object with `iput -T`."""
+        subprocess.check_output(["iput", "-T", path, ipath])
+        return None
+
+    def open_read(self, ipath, offset=0, length=None):
+        """Return stdout of `iget -f ipath -`, or of `ISTREAM_READ` for a range."""
+        if (offset == 0) and (length is None):
+            args = ["iget", "-f", ipath, "-"]
+        else:
+            args = ISTREAM_READ + ["--offset", str(offset)]
+            if length is not None:
+                args += ["--count", str(length)]
+            args += [ipath]
+        return _PipeReader(args=args)
+
+    def open_write(self, ipath):
+        """Return stdin of `ISTREAM_WRITE ipath`."""
+        return _PipeWriter(args=ISTREAM_WRITE+[ipath])
+
+    def list_data_objects(self, icollection, attr_name=None, attr_value=None):
+        """List data objects with one `iquest` general query.
+        "COLL_NAME like '/a/b%'" also matches '/a/bc', so rows are filtered to `icollection` and its subcollections.
+        Quotes in `icollection` cannot be escaped in a general query, so `_check_args` rejects them."""
+        query = "SELECT COLL_NAME, DATA_NAME, DATA_SIZE WHERE COLL_NAME like '{coll}%'".format(coll=icollection)
+        if attr_name is not None:
+            query += " AND META_DATA_ATTR_NAME = '{an}' AND META_DATA_ATTR_VALUE = '{av}'".format(an=attr_name, av=attr_value)
+        objects = collections.OrderedDict()
+        for (coll_name, data_name, data_size) in _iquest(query=query, columns=3):
+            if (coll_name == icollection) or coll_name.startswith(icollection.rstrip('/')+'/'):
+                objects.setdefault(coll_name.rstrip('/')+'/'+data_name, int(data_size))
+        return list(objects.items())
+
+    def list_metadata(self, icollection, attr_names):
+        """List metadata with one `iquest` general query. Rows are filtered as by `list_data_objects`."""
+        query = ("SELECT COLL_NAME, DATA_NAME, META_DATA_ATTR_NAME, META_DATA_ATTR_VALUE, META_DATA_ATTR_UNITS " +
+                 "WHERE COLL_NAME like '{coll}%' AND META_DATA_ATTR_NAME in ({ans})").format(coll=icollection,
+                                                                                       ans=', '.join("'{an}'".format(an=an) for an in attr_names))
+        imeta_dicts = {}
+        for (coll_name, data_name, attr_name, attr_value, attr_units) in _iquest(query=query, columns=5):
+            if (coll_name == icollection) or coll_name.startswith(icollection.rstrip('/')+'/'):
+                imeta_dicts.setdefault(coll_name.rstrip('/')+'/'+data_name, {})[attr_name] = {
+                    'value': _value_as_units_type(value=attr_value, units=attr_units), 'units': attr_units}
+        return imeta_dicts
+
+
+class SessionTransport(Transport):
+    """Transport that reuses one authenticated connection pool of python-irodsclient per process.
+
+    Parameters
+    ----------
+    irods_env_file : {None}, string, optional
+        Local path to iRODS environment file for `irods.session.iRODSSession`.
+        Default: environment variable 'IRODS_ENVIRONMENT_FILE', otherwise '~/.irods/irods_environment.json'.
+
+    See Also
+    --------
+    CALLS : {_value_as_units_type}
+    CALLED_BY : {_get_transport}
+    RELATED : {IcommandsTransport, FakeTransport}
+
+    Notes
+    -----
+    - Requires the optional package python-irodsclient, [1]_. It is imported when the transport is created.
+    - The session lends a connection from its pool to each operation, so threads of `serve` and `drain` share one
+      session. Processes of `bulk` each create their own session since connections cannot be shared across `fork`.
+    - Metadata are set with one request per attribute on the same connection.
+
+    References
+    ----------
+    .. [1] https://github.com/irods/python-irodsclient
+
+    """
+
+    def __init__(self, irods_env_file=None):
+        try:
+            import irods.column
+            import irods.keywords
+            import irods.meta
+            import irods.models
+            import irods.session
+        except ImportError:
+            raise ImportError("SessionTransport requires python-irodsclient: pip install python-irodsclient")
+        self._irods = irods
+        if irods_env_file is None:
+            irods_env_file = os.environ.get('IRODS_ENVIRONMENT_FILE', os.path.expanduser('~/.irods/irods_environment.json'))
+        logger.debug("SessionTransport: iRODSSession(irods_env_file={ief})".format(ief=irods_env_file))
+        self.session = irods.session.iRODSSession(irods_env_file=irods_env_file)
+
+    def meta_get(self, ipath):
+        """Return metadata of data object `ipath` from the catalog."""
+        imeta_dict = {}
+        for avu in self.session.metadata.get(self._irods.models.DataObject, ipath):
+            units = avu.units if avu.units is not None else ''
+            imeta_dict[avu.name] = {'value': _value_as_units_type(value=avu.value, units=units), 'units': units}
+        return imeta_dict
+
+    def meta_set(self, ipath, imeta_triplets):
+        """Set metadata of data object `ipath` on the session connection."""
+        for (attr_name, attr_value, attr_units) in imeta_triplets:
+            self.session.metadata.set(self._irods.models.DataObject, ipath,
+                                      self._irods.meta.iRODSMeta(attr_name, attr_value, attr_units))
+        return None
+
+    def exists(self, ipath):
+        """Return ``True`` if `ipath` is a data object or a collection."""
+        return self.session.data_objects.exists(ipath) or self.session.collections.exists(ipath)
+
+    def size(self, ipath):
+        """Return size of data object `ipath` from the catalog."""
+        return int(self.session.data_objects.get(ipath).size)
+
+    def mkdir(self, ipath):
+        """Create collection `ipath` and its parents."""
+        self.session.collections.create(ipath, recurse=True)
+        return None
+
+    def move(self, isrc, idst):
+        """Move data object on the server."""
+        self.session.data_objects.move(isrc, idst)
+        return None
+
+    def copy(self, isrc, idst):
+        """Copy data object on the server."""
+        self.session.data_objects.copy(isrc, idst)
+        return None
+
+    def remove(self, ipath):
+        """Remove data object without moving it to the trash."""
+        self.session.data_objects.unlink(ipath, force=True)
+        return None
+
+    def link(self, isrc, idst):
+        """Register data object to the physical path and resource of the first replica of `isrc`."""
+        replica = self.session.data_objects.get(isrc).replicas[0]
+        self.session.data_objects.register(replica.path, idst, **{self._irods.keywords.DEST_RESC_NAME_KW: replica.resource_name})
+        return None
+
+    def unlink(self, ipath):
+        """Unregister data object."""
+        self.session.data_objects.unregister(ipath)
+        return None
+
+    def get(self, ipath, path):
+        """Copy data object to local file through the session connection."""
+        fsrc = self.open_read(ipath)
+        try:
+            with open(path, 'wb') as fdst:
+                shutil.copyfileobj(fsrc, fdst, 2**20)
+        finally:
+            fsrc.close()
+        return None
+
+    def put(self, path, ipath):
+        """Copy local file to data object through the session connection."""
+        self.session.data_objects.put(path, ipath)
+        return None
+
+    def open_read(self, ipath, offset=0, length=None):
+        """Return a readable file object of data object `ipath`, from byte `offset` and limited to `length` bytes."""
+        fobj = self.session.data_objects.open(ipath, 'r')
+        if offset > 0:
+            fobj.seek(offset)
+        if length is not None:
+            fobj = _LimitedReader(fobj=fobj, length=length)
+        return fobj
+
+    def open_write(self, ipath):
+        """Return a writable file object of data object `ipath`, creating it if needed."""
+        if not self.session.data_objects.exists(ipath):
+            self.session.data_objects.create(ipath)
+        return self.session.data_objects.open(ipath, 'w')
+
+    def list_data_objects(self, icollection, attr_name=None, attr_value=None):
+        """List data objects with one general query."""
+        models = self._irods.models
+        query = self.session.query(models.Collection.name, models.DataObject.name, models.DataObject.size)
+        query = query.filter(self._irods.column.Like(models.Collection.name, icollection+'%'))
+        if attr_name is not None:
+            query = query.filter(models.DataObjectMeta.name == attr_name).filter(models.DataObjectMeta.value == attr_value)
+        objects = collections.OrderedDict()
+        for row in query.get_results():
+            coll_name = row[models.Collection.name]
+            if (coll_name == icollection) or coll_name.startswith(icollection.rstrip('/')+'/'):
+                objects.setdefault(coll_name.rstrip('/')+'/'+row[models.DataObject.name], int(row[models.DataObject.size]))
+        return list(objects.items())
+
+    def list_metadata(self, icollection, attr_names):
+        """List metadata with one general query."""
+        models = self._irods.models
+        query = self.session.query(models.Collection.name, models.DataObject.name, models.DataObjectMeta.name,
+                                   models.DataObjectMeta.value, models.DataObjectMeta.units)
+        query = query.filter(self._irods.column.Like(models.Collection.name, icollection+'%'))
+        query = query.filter(self._irods.column.In(models.DataObjectMeta.name, list(attr_names)))
+        imeta_dicts = {}
+        for row in query.get_results():
+            coll_name = row[models.Collection.name]
+            if (coll_name == icollection) or coll_name.startswith(icollection.rstrip('/')+'/'):
+                units = row[models.DataObjectMeta.units] if row[models.DataObjectMeta.units] is not None else ''
+                imeta_dicts.setdefault(coll_name.rstrip('/')+'/'+row[models.DataObject.name], {})[row[models.DataObjectMeta.name]] = {
+                    'value': _value_as_units_type(value=row[models.DataObjectMeta.value], units=units), 'units': units}
+        return imeta_dicts
+
+    def close(self):
+        """Close the connections of the session."""
+        self.session.cleanup()
+        return None
+
+
+class _FakeWriter(io.BytesIO):
+    """Semi-private class for a writable file object that stores a data object in `FakeTransport` when closed."""
+
+    def __init__(self, transport, ipath):
+        io.BytesIO.__init__(self)
+        self.transport = transport
+        self.ipath = ipath
+
+    def close(self):
+        """Store the bytes written as the data object, then close."""
+        if not self.closed:
+            with self.transport.lock:
+                self.transport._check_parent(self.ipath)
+                self.transport.objects[self.ipath] = self.getvalue()
+        io.BytesIO.close(self)
+        return None
+
+    def abort(self):
+        """Close without storing the data object."""
+        io.BytesIO.close(self)
+        return None
+
+
+class FakeTransport(Transport):
+    """Transport that keeps data objects, collections, and metadata in memory, to test and benchmark without iRODS.
+
+    Attributes
+    ----------
+    objects : dict
+        Bytes of each data object by iRODS path.
+    collections : set
+        iRODS paths of collections. Parents of data objects must exist, as in iRODS.
+    metadata : dict
+        ``dict`` of attribute name to (value, units) strings by iRODS path of data object.
+    calls : collections.Counter
+        Number of calls of each method, e.g. to count catalog operations per file.
+    opened : collections.Counter
+        Number of times each data object was read or written by `get`, `put`, `open_read`, or `open_write`, which in
+        iRODS would call the rules for opening or putting it, e.g. to check that files within `iplant` are only moved.
+
+    See Also
+    --------
+    CALLS : {_value_as_units_type}
+    CALLED_BY : {set_transport}
+    RELATED : {IcommandsTransport, SessionTransport}
+
+    Notes
+    -----
+    - Select with ``set_transport(FakeTransport())``. The same instance is used by threads. Processes of `bulk`
+      each modify their own copy after `fork`, so use `bulk_workers` = 1 or call `compress` directly.
+    - Errors are raised as ``IOError``.
+
+    """
+
+    def __init__(self):
+        self.objects = {}
+        self.collections = set(['/'])
+        self.metadata = {}
+        self.calls = collections.Counter()
+        self.opened = collections.Counter()
+        self.lock = threading.RLock()
+
+    def _check_object(self, ipath):
+        """Raise ``IOError`` if data object `ipath` does not exist."""
+        if ipath not in self.objects:
+            raise IOError("FakeTransport: data object does not exist: {ipath}".format(ipath=ipath))
+        return None
+
+    def _check_parent(self, ipath):
+        """Raise ``IOError`` if the collection of `ipath` does not exist."""
+        if os.path.dirname(ipath) not in self.collections:
+            raise IOError("FakeTransport: collection does not exist: {coll}".format(coll=os.path.dirname(ipath)))
+        return None
+
+    def _check_new(self, ipath):
+        """Raise ``IOError`` if `ipath` exists or its collection does not exist."""
+        if (ipath in self.objects) or (ipath in self.collections):
+            raise IOError("FakeTransport: path already exists: {ipath}".format(ipath=ipath))
+        self._check_parent(ipath)
+        return None
+
+    def add(self, ipath, data, imeta_triplets=()):
+        """Add data object `ipath` with bytes `data` and metadata triplets, creating its collections."""
+        with self.lock:
+            self.mkdir(os.path.dirname(ipath))
+            self.objects[ipath] = bytes(data)
+            self.metadata[ipath] = dict((name, (value, units)) for (name, value, units) in imeta_triplets)
+        return None
+
+    def meta_get(self, ipath):
+        """Return metadata of data object `ipath`."""
+        with self.lock:
+            self.calls['meta_get'] += 1
+            self._check_object(ipath)
+            return dict((name, {'value': _value_as_units_type(value=value, units=units), 'units': units})
+                        for (name, (value, units)) in self.metadata.get(ipath, {}).items())
+
+    def meta_set(self, ipath, imeta_triplets):
+        """Set metadata of data object `ipath`."""
+        with self.lock:
+            self.calls['meta_set'] += 1
+            self._check_object(ipath)
+            for (attr_name, attr_value, attr_units) in imeta_triplets:
+                self.metadata.setdefault(ipath, {})[attr_name] = (attr_value, attr_units)
+        return None
+
+    def exists(self, ipath):
+        """Return ``True`` if `ipath` is a data object or a collection."""
+        with self.lock:
+            self.calls['exists'] += 1
+            return (ipath in self.objects) or (ipath in self.collections)
+
+    def size(self, ipath):
+        """Return size of data object `ipath`."""
+        with self.lock:
+            self.calls['size'] += 1
+            self._check_object(ipath)
+            return len(self.objects[ipath])
+
+    def mkdir(self, ipath):
+        """Create collection `ipath` and its parents."""
+        with self.lock:
+            self.calls['mkdir'] += 1
+            while ipath not in self.collections:
+                self.collections.add(ipath)
+                ipath = os.path.dirname(ipath)
+        return None
+
+    def move(self, isrc, idst):
+        """Move data object with its metadata."""
+        with self.lock:
+            self.calls['move'] += 1
+            self._check_object(isrc)
+            self._check_new(idst)
+            self.objects[idst] = self.objects.pop(isrc)
+            self.metadata[idst] = self.metadata.pop(isrc, {})
+        return None
+
+    def copy(self, isrc, idst):
+        """Copy data object without its metadata."""
+        with self.lock:
+            self.calls['copy'] += 1
+            self._check_object(isrc)
+            self._check_new(idst)
+            self.objects[idst] = self.objects[isrc]
+        return None
+
+    def remove(self, ipath):
+        """Remove data object and its metadata."""
+        with self.lock:
+            self.calls['remove'] += 1
+            self._check_object(ipath)
+            del self.objects[ipath]
+            self.metadata.pop(ipath, None)
+        return None
+
+    def link(self, isrc, idst):
+        """Add data object with the bytes of `isrc` without its metadata."""
+        with self.lock:
+            self.calls['link'] += 1
+            self._check_object(isrc)
+            self._check_new(idst)
+            self.objects[idst] = self.objects[isrc]
+        return None
+
+    def unlink(self, ipath):
+        """Remove data object and its metadata. Other data objects keep their bytes."""
+        with self.lock:
+            self.calls['unlink'] += 1
+            self._check_object(ipath)
+            del self.objects[ipath]
+            self.metadata.pop(ipath, None)
+        return None
+
+    def get(self, ipath, path):
+        """Write data object to local file."""
+        with self.lock:
+            self.calls['get'] += 1
+            self.opened[ipath] += 1
+            self._check_object(ipath)
+            data = self.objects[ipath]
+        with open(path, 'wb') as fdst:
+            fdst.write(data)
+        return None
+
+    def put(self, path, ipath):
+        """Read local file into new data object."""
+        with open(path, 'rb') as fsrc:
+            data = fsrc.read()
+        with self.lock:
+            self.calls['put'] += 1
+            self.opened[ipath] += 1
+            self._check_new(ipath)
+            self.objects[ipath] = data
+        return None
+
+    def open_read(self, ipath, offset=0, length=None):
+        """Return a readable file object of data object `ipath`, from byte `offset` and limited to `length` bytes."""
+        with self.lock:
+            self.calls['open_read'] += 1
+            self.opened[ipath] += 1
+            self._check_object(ipath)
+            data = self.objects[ipath]
+            return io.BytesIO(data[offset:] if length is None else data[offset:offset+length])
+
+    def open_write(self, ipath):
+        """Return a writable file object that stores data object `ipath` when closed."""
+        with self.lock:
+            self.calls['open_write'] += 1
+            self.opened[ipath] += 1
+            self._check_parent(ipath)
+        return _FakeWriter(transport=self, ipath=ipath)
+
+    def list_data_objects(self, icollection, attr_name=None, attr_value=None):
+        """List data objects within `icollection`."""
+        with self.lock:
+            self.calls['list_data_objects'] += 1
+            objects = []
+            for ipath in sorted(self.objects):
+                coll_name = os.path.dirname(ipath)
+                if not ((coll_name == icollection) or coll_name.startswith(icollection.rstrip('/')+'/')):
+                    continue
+                if (attr_name is not None) and (self.metadata.get(ipath, {}).get(attr_name, (None, ))[0] != attr_value):
+                    continue
+                objects.append((ipath, len(self.objects[ipath])))
+        return objects
+
+    def list_metadata(self, icollection, attr_names):
+        """List metadata of data objects within `icollection`."""
+        with self.lock:
+            self.calls['list_metadata'] += 1
+            imeta_dicts = {}
+            for ipath in sorted(self.objects):
+                coll_name = os.path.dirname(ipath)
+                if not ((coll_name == icollection) or coll_name.startswith(icollection.rstrip('/')+'/')):
+                    continue
+                imeta_dict = dict((name, {'value': _value_as_units_type(value=value, units=units), 'units': units})
+                                  for (name, (value, units)) in self.metadata.get(ipath, {}).items() if name in attr_names)
+                if len(imeta_dict) > 0:
+                    imeta_dicts[ipath] = imeta_dict
+        return imeta_dicts
+
+
+# Define transports that can be selected by name. See `set_transport`.
+TRANSPORTS = collections.OrderedDict([('icommands', IcommandsTransport), ('session', SessionTransport)])
+
+# Define the transport of this module. Transports selected by name are created once per process by `_get_transport`.
+_transport = {'factory': IcommandsTransport, 'instance': None, 'pid': None}
+_transport_lock = threading.Lock()
+
+
+def set_transport(transport='icommands'):
+    """Select the transport for iRODS operations of this module.
+
+    Parameters
+    ----------
+    transport : {'icommands', 'session', Transport}, optional
+        Name from `TRANSPORTS`, or an instance of `Transport`, e.g. `FakeTransport` for tests.
+        A transport selected by name is created on first use in each process.
+
+    Returns
+    -------
+    None
+
+    Raises
+    ------
+    ValueError
+        If `transport` is not a name from `TRANSPORTS` or an instance of `Transport`.
+
+    See Also
+    --------
+    CALLS : {_close_transport}
+    CALLED_BY : {__main__}
+    RELATED : {_get_transport}
+
+    """
+    if isinstance(transport, Transport):
+        (factory, instance) = (None, transport)
+    elif transport in TRANSPORTS:
+        (factory, instance) = (TRANSPORTS[transport], None)
+    else:
+        raise ValueError(("`transport` not valid:\n" +
+                          "transport = {tp}\n" +
+                          "valid transports = {vtp}").format(tp=transport, vtp=list(TRANSPORTS.keys())))
+    _close_transport()
+    with _transport_lock:
+        _transport.update(factory=factory, instance=instance, pid=os.getpid())
+    return None
+
+
+def _get_transport():
+    """Semi-private method to get the transport of this module, creating it in this process if needed.
+
+    Returns
+    -------
+    transport : Transport
+        Transport selected by `set_transport`. Default: `IcommandsTransport`.
+
+    See Also
+    --------
+    CALLS : {}
+    CALLED_BY : {compress, decompress, bulk, _check_args}
+    RELATED : {set_transport}
+
+    """
+    with _transport_lock:
+        if (_transport['factory'] is not None) and ((_transport['instance'] is None) or (_transport['pid'] != os.getpid())):
+            _transport.update(instance=_transport['factory'](), pid=os.getpid())
+        return _transport['instance']
+
+
+@atexit.register
+def _close_transport():
+    """Semi-private method to close the transport created by this process, e.g. at exit."""
+    with _transport_lock:
+        if (_transport['factory'] is not None) and (_transport['instance'] is not None) and (_transport['pid'] == os.getpid()):
+            _transport['instance'].close()
+            _transport['instance'] = None
+    return None
+
+
+# Define upper bounds in seconds of the buckets of stage durations in `--prom_file`.
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+
+# Define outputs of stage spans. Spans are recorded only if an output is set by `set_metrics`.
+_metrics = {'metrics_file': None, 'prom_file': None, 'pending': []}
+_metrics_lock = threading.Lock()
+
+
+class _NullSpan(object):
+    """Semi-private class for a span that records nothing, returned by `_span` when metrics are disabled."""
+
+    nbytes = None
+    exclude_seconds = 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span(object):
+    """Semi-private class for a timed stage of an action. Use as a context manager from `_span`.
+
+    Attributes
+    ----------
+    nbytes : {None}, int
+        Number of bytes processed by the stage. Set within the ``with`` block if not known before.
+    exclude_seconds : float
+        Seconds to subtract from the duration, e.g. time spent hashing within the codec pass.
+
+    """
+
+    def __init__(self, action, stage, ipath=None, nbytes=None):
+        self.action = action
+        self.stage = stage
+        self.ipath = ipath
+        self.nbytes = nbytes
+        self.exclude_seconds = 0.0
+
+    def __enter__(self):
+        self.time_start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _record_span(action=self.action, stage=self.stage, ipath=self.ipath,
+                     seconds=time.time()-self.time_start-self.exclude_seconds, nbytes=self.nbytes,
+                     status=('ok' if exc_type is None else 'error'))
+        return False
+
+
+def set_metrics(metrics_file=None, prom_file=None):
+    """Select outputs of per-stage spans of `compress` and `decompress`.
+
+    Parameters
+    ----------
+    metrics_file : {None}, string, optional
+        Local path to append one JSON line per span: 'time', 'pid', 'action', 'stage', 'ipath', 'seconds',
+        'bytes', and 'status' 'ok' or 'error'.
+    prom_file : {None}, string, optional
+        Local path to a Prometheus textfile collector file, e.g. '/var/lib/node_exporter/iplant.prom'.
+        Spans are aggregated across processes into histograms of duration and counters of bytes and errors
+        by action and stage. The aggregate is kept in `prom_file` + '.json'.
+
+    Returns
+    -------
+    None
+
+    See Also
+    --------
+    CALLS : {_flush_metrics}
+    CALLED_BY : {__main__}
+    RELATED : {_span}
+
+    Notes
+    -----
+    - With neither output, `_span` returns a shared no-op span, so instrumentation costs one function call per stage.
+    - Stages are named by the icommand they correspond to, e.g. 'imeta_ls', 'imv', 'iget', 'iput', 'icp',
+      'imeta_set', 'irm', regardless of the transport. 'codec' is one pass through the codec, excluding 'hash';
+      with `stream` it includes reading and writing iRODS. 'total' is the whole action.
+
+    """
+    _flush_metrics()
+    with _metrics_lock:
+        _metrics.update(metrics_file=metrics_file, prom_file=prom_file)
+    return None
+
+
+def _span(action, stage, ipath=None, nbytes=None):
+    """Semi-private method to time a stage of an action as a context manager, e.g.
+    ``with _span('compress', 'iget', ipath) as span: ...``. Returns `_NULL_SPAN` if metrics are disabled."""
+    if (_metrics['metrics_file'] is None) and (_metrics['prom_file'] is None):
+        return _NULL_SPAN
+    return _Span(action=action, stage=stage, ipath=ipath, nbytes=nbytes)
+
+
+def _record_span(action, stage, seconds, ipath=None, nbytes=None, status='ok'):
+    """Semi-private method to record one span to the outputs from `set_metrics`.
+
+    Spans of stage 'total' and failed spans are flushed to `prom_file` at once. See `_flush_metrics`.
+
+    See Also
+    --------
+    CALLS : {_flush_metrics}
+    CALLED_BY : {_Span, compress, decompress}
+    RELATED : {set_metrics}
+
+    """
+    if (_metrics['metrics_file'] is None) and (_metrics['prom_file'] is None):
+        return None
+    span = collections.OrderedDict([('time', datetime.datetime.now().isoformat()), ('pid', os.getpid()),
+                                    ('action', action), ('stage', stage), ('ipath', ipath), ('seconds', seconds),
+                                    ('bytes', nbytes), ('status', status)])
+    with _metrics_lock:
+        if _metrics['metrics_file'] is not None:
+            # NOTE: One write per line in append mode, so lines from concurrent processes are not interleaved.
+            with open(_metrics['metrics_file'], 'a') as fmetrics:
+                fmetrics.write(json.dumps(span)+'\n')
+        if _metrics['prom_file'] is not None:
+            _metrics['pending'].append(span)
+    if (stage == 'total') or (status != 'ok'):
+        _flush_metrics()
+    return None
+
+
+@atexit.register
+def _flush_metrics():
+    """Semi-private method to aggregate pending spans into `prom_file` from `set_metrics`.
+
+    Returns
+    -------
+    None
+
+    See Also
+    --------
+    CALLS : {}
+    CALLED_BY : {_record_span, set_metrics}
+    RELATED : {}
+
+    Notes
+    -----
+    - Processes share the aggregate in `prom_file` + '.json' under an exclusive lock on `prom_file` + '.lock'.
+      Both files are replaced by renaming so that the collector never reads a partial file.
+
+    """
+    with _metrics_lock:
+        (prom_file, spans) = (_metrics['prom_file'], _metrics['pending'])
+        _metrics['pending'] = []
+        if (prom_file is None) or (len(spans) == 0):
+            return None
+        state_file = prom_file+'.json'
+        with open(prom_file+'.lock', 'a') as flock:
+            fcntl.flock(flock, fcntl.LOCK_EX)
+            state = {}
+            if os.path.exists(state_file):
+                with open(state_file) as fstate:
+                    state = json.load(fstate)
+            for span in spans:
+                key = '{action}\t{stage}'.format(action=span['action'], stage=span['stage'])
+                series = state.setdefault(key, {'buckets': [0]*len(METRICS_BUCKETS), 'count': 0, 'sum': 0.0, 'bytes': 0, 'errors': 0})
+                for (idx, bound) in enumerate(METRICS_BUCKETS):
+                    if span['seconds'] <= bound:
+                        series['buckets'][idx] += 1
+                series['count'] += 1
+                series['sum'] += span['seconds']
+                series['bytes'] += span['bytes'] or 0
+                series['errors'] += 1 if span['status'] != 'ok' else 0
+            lines = ["# HELP iplant_stage_duration_seconds Duration of stages of iplant.py actions.",
+                     "# TYPE iplant_stage_duration_seconds histogram"]
+            for key in sorted(state):
+                (action, stage) = key.split('\t')
+                series = state[key]
+                labels = 'action="{action}",stage="{stage}"'.format(action=action, stage=stage)
+                for (bound, count) in zip(METRICS_BUCKETS, series['buckets']):
+                    lines.append('iplant_stage_duration_seconds_bucket{{{labels},le="{le}"}} {count}'.format(labels=labels, le=bound, count=count))
+                lines.append('iplant_stage_duration_seconds_bucket{{{labels},le="+Inf"}} {count}'.format(labels=labels, count=series['count']))
+                lines.append('iplant_stage_duration_seconds_sum{{{labels}}} {sum!r}'.format(labels=labels, sum=series['sum']))
+                lines.append('iplant_stage_duration_seconds_count{{{labels}}} {count}'.format(labels=labels, count=series['count']))
+            for (name, field, text) in [('iplant_stage_bytes_total', 'bytes', "Bytes processed by stages of iplant.py actions."),
+                                        ('iplant_stage_errors_total', 'errors', "Failed stages of iplant.py actions.")]:
+                lines.extend(["# HELP {name} {text}".format(name=name, text=text), "# TYPE {name} counter".format(name=name)])
+                for key in sorted(state):
+                    (action, stage) = key.split('\t')
+                    lines.append('{name}{{action="{action}",stage="{stage}"}} {value}'.format(name=name, action=action, stage=stage,
+                                                                                              value=state[key][field]))
+            for (path, text) in [(state_file, json.dumps(state)), (prom_file, '\n'.join(lines)+'\n')]:
+                with open(path+'.tmp', 'w') as ftmp:
+                    ftmp.write(text)
+                os.rename(path+'.tmp', path)
+    return None
+
+
+def _pipe_data_objects(isrc, idst, func):
+    """Semi-private method to stream a data object through a function into another data object.
+
+    Data are read from `Transport.open_read` and written to `Transport.open_write`. Nothing is written locally.
+
+    Parameters
+    ----------
+    isrc : string
+        iRODS path to data object to read.
+    idst : string
+        iRODS path to data object to write.
+    func : function
+        Function called as ``func(fsrc, fdst)`` with readable and writable file objects.
+
+    Returns
+    -------
+    result : object
+        Return value of ``func(fsrc, fdst)``.
+
+    Raises
+    ------
+    Exception
+        Any exception raised by `func` is re-raised after both streams are stopped and `idst` is removed.
+
+    See Also
+    --------
+    CALLS : {_get_transport, _abort_stream}
+    CALLED_BY : {_compress_encode, decompress}
+    RELATED : {}
+
+    Notes
+    -----
+    - If `func` raises, the writer is aborted rather than closed so that a truncated `idst` is not committed,
+      and any part of `idst` that the backend already stored is removed. The reader is closed, which waits
+      for its icommand.
+
+    """
+    transport = _get_transport()
+    fsrc = transport.open_read(isrc)
+    try:
+        fdst = transport.open_write(idst)
+        try:
+            result = func(fsrc, fdst)
+        except Exception:
+            _abort_stream(fobj=fdst)
+            try:
+                if transport.exists(idst):
+                    transport.remove(idst)
+            except Exception as err:
+                logger.warning("_pipe_data_objects: Could not remove partial {idst}: {err}".format(idst=idst, err=err))
+            raise
+        fdst.close()
+    finally:
+        fsrc.close()
+    return result
+
+
+def _abort_stream(fobj):
+    """Semi-private method to stop a file object from `Transport.open_read` or `Transport.open_write` after an error.
+
+    Calls ``fobj.abort()`` if the file object has it, otherwise ``fobj.close()``. Errors are logged, not raised,
+    so that the caller can re-raise the original error.
+
+    Parameters
+    ----------
+    fobj : file object
+        Readable or writable file object of a data object.
+
+    Returns
+    -------
+    None
+
+    See Also
+    --------
+    CALLS : {}
+    CALLED_BY : {_pipe_data_objects}
+    RELATED : {_PipeWriter, _FakeWriter}
+
+    """
+    try:
+        getattr(fobj, 'abort', fobj.close)()
+    except Exception as err:
+        logger.warning("_abort_stream: {err}".format(err=err))
+    return None
+
+
+def _read_head(ipath, size):
+    """Semi-private method to read the first bytes of a data object without a local file.
+
+    Parameters
+    ----------
+    ipath : string
+        iRODS path to data object to read.
+    size : int
+        Number of bytes to read.
+
+    Returns
+    -------
+    buf : bytes
+        First `size` bytes of the data object, or all bytes if the data object is smaller.
+
+    See Also
+    --------
+    CALLS : {_get_transport, _read_exact}
+    CALLED_BY : {_compress_encode, _sample_head}
+    RELATED : {_pipe_data_objects}
+
+    """
+    fsrc = _get_transport().open_read(ipath)
+    try:
+        buf = _read_exact(fsrc, size)
+    finally:
+        fsrc.close()
+    return buf
+
+
+def _hash_data_object(ipath, algorithm='sha1', blocksize=2**20):
+    """Semi-private method to compute the size and hash of a data object without a local file.
+
+    Parameters
+    ----------
+    ipath : string
+        iRODS path to data object to read.
+    algorithm : {'sha1'}, hashlib.algorithm, optional
+        Hashing function. Must be a `hashlib.algorithm`. Not case-sensitive.
+    blocksize : {2**20}, int, optional
+        Number of bytes to read at a time.
+
+    Returns
+    -------
+    size : int
+        Number of bytes in the data object.
+    hexdigest : string
+        Hash of the data object as a non-binary string.
+
+    See Also
+    --------
+    CALLS : {_get_transport, _HashingWriter, _CountingWriter}
+    CALLED_BY : {_reinstate_parent, _compress_dedup}
+    RELATED : {_compute_hash, _read_head}
+
+    """
+    writer = _HashingWriter(fobj=_CountingWriter(), algorithm=algorithm)
+    fsrc = _get_transport().open_read(ipath)
+    try:
+        for buf in iter(lambda: fsrc.read(blocksize), b''):
+            writer.write(buf)
+    finally:
+        fsrc.close()
+    return (writer.size, writer.hexdigest())
+
+
+def _write_data_object(fsrc, idst, blocksize=2**20):
+    """Semi-private method to write a local file object into a data object.
+
+    Parameters
+    ----------
+    fsrc : file
+        Readable file object.
+    idst : string
+        iRODS path to data object to write.
+    blocksize : {2**20}, int, optional
+        Number of bytes to copy at a time.
+
+    Returns
+    -------
+    size : int
+        Number of bytes written.
+
+    See Also
+    --------
+    CALLS : {_get_transport}
+    CALLED_BY : {_compress_encode, decompress}
+    RELATED : {_pipe_data_objects}
+
+    """
+    fdst = _get_transport().open_write(idst)
+    size = 0
+    try:
+        for buf in iter(lambda: fsrc.read(blocksize), b''):
+            fdst.write(buf)
+            size += len(buf)
+    finally:
+        fdst.close()
+    return size
+
+
+def _cache_key(hash_method, uncompressed_hash):
+    """Semi-private method to make a cache key from 'HASH_METHOD' and 'UNCOMPRESSED_HASH'.
+
+    Parameters
+    ----------
+    hash_method : string
+        Hash method, e.g. 'SHA1' or 'TREE_SHA1:4194304'.
+    uncompressed_hash : string
+        Hexadecimal digest of the uncompressed file.
+
+    Returns
+    -------
+    key : {None}, string
+        Key that is also the file name in the cache, e.g. 'sha1_0123abcd...' or 'tree_sha1-4194304_0123abcd...'.
+        ``None`` if either value is not valid, e.g. 'NONE' from imeta.
+
+    See Also
+    --------
+    CALLS : {}
+    CALLED_BY : {_compress_encode, _compress_dedup, decompress}
+    RELATED : {}
+
+    """
+    # NOTE: ':' of a tree hash method is replaced by '-' to keep the key a portable file name.
+    key = "{hm}_{uh}".format(hm=str(hash_method).lower().replace(':', '-'), uh=str(uncompressed_hash).lower())
+    if re.match(r'^[a-z0-9_]+(-[0-9]+)?_[0-9a-f]+$', key) is None:
+        key = None
+    return key
+
+
+def _cache_connect(cache_dir):
+    """Semi-private method to open the metadata of the decompressed file cache, creating it if needed.
+
+    Parameters
+    ----------
+    cache_dir : string
+        Local path to cache directory, e.g. ``os.path.join(tmp_iplant, CACHE_DIRNAME)``.
+
+    Returns
+    -------
+    conn : sqlite3.Connection
+        Connection in autocommit mode. Transactions are begun explicitly.
+
+    See Also
+    --------
+    CALLS : {}
+    CALLED_BY : {_cache_get, _cache_put, _cache_make_room, cache_status}
+    RELATED : {_queue_connect}
+
+    Notes
+    -----
+    - Files are kept in ``cache_dir/data/<key>``. Table `entries` has one row per file with its size and
+      last access time for LRU eviction. Table `counters` keeps 'hits', 'misses', 'inserts', 'evictions',
+      and 'evicted_bytes' across invocations.
+    - Files are added, linked, and removed only while a write transaction is held, so a file is never removed
+      while another process links it.
+
+    """
+    for dirname in [cache_dir, os.path.join(cache_dir, 'data'), os.path.join(cache_dir, 'tmp')]:
+        if not os.path.exists(dirname):
+            try:
+                os.makedirs(dirname)
+            except OSError:
+                if not os.path.isdir(dirname):
+                    raise
+    conn = sqlite3.connect(os.path.join(cache_dir, 'cache.sqlite'), timeout=60.0, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, size INTEGER NOT NULL, last_access REAL NOT NULL)")
+    conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+    conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+    return conn
+
+
+def _cache_count(conn, name, increment=1):
+    """Semi-private method to add `increment` to a cache counter within the current transaction."""
+    conn.execute("INSERT OR IGNORE INTO counters (name, value) VALUES (?, 0)", (name, ))
+    conn.execute("UPDATE counters SET value = value + ? WHERE name = ?", (increment, name))
+    return None
+
+
+def _cache_evict(conn, cache_dir, max_bytes=None, min_free_bytes=None):
+    """Semi-private method to remove least recently used files from the cache within the current transaction.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+        Connection from `_cache_connect` within a write transaction.
+    cache_dir : string
+        Local path to cache directory.
+    max_bytes : {None}, int, optional
+        Remove files until the cache holds at most `max_bytes`.
+    min_free_bytes : {None}, int, optional
+        Remove files until the file system of `cache_dir` has at least `min_free_bytes` available,
+        or the cache is empty.
+
+    Returns
+    -------
+    evicted : int
+        Number of files removed.
+
+    See Also
+    --------
+    CALLS : {_cache_count}
+    CALLED_BY : {_cache_put, _cache_make_room}
+    RELATED : {}
+
+    """
+    def _free_bytes():
+        stat = os.statvfs(cache_dir)
+        return stat.f_bavail*stat.f_frsize
+    (total, ) = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()
+    evicted = 0
+    for (key, size) in conn.execute("SELECT key, size FROM entries ORDER BY last_access").fetchall():
+        over_bytes = (max_bytes is not None) and (total > max_bytes)
+        under_free = (min_free_bytes is not None) and (_free_bytes() < min_free_bytes)
+        if not (over_bytes or under_free):
+            break
+        path = os.path.join(cache_dir, 'data', key)
+        logger.debug("_cache_evict: os.remove({path}); size = {size}".format(path=path, size=size))
+        if os.path.exists(path):
+            os.remove(path)
+        conn.execute("DELETE FROM entries WHERE key = ?", (key, ))
+        total -= size
+        evicted += 1
+        _cache_count(conn=conn, name='evictions')
+        _cache_count(conn=conn, name='evicted_bytes', increment=size)
+    return evicted
+
+
+def _cache_get(cache_dir, key, dst_path):
+    """Semi-private method to link a decompressed file from the cache to a local path.
+
+    Parameters
+    ----------
+    cache_dir : string
+        Local path to cache directory.
+    key : string
+        Cache key from `_cache_key`.
+    dst_path : string
+        Local path to link the cached file to. The file is copied if `dst_path` is on another file system.
+
+    Returns
+    -------
+    hit : bool
+        ``True`` if the file was in the cache and is now at `dst_path`.
+
+    See Also
+    --------
+    CALLS : {_cache_connect, _cache_count}
+    CALLED_BY : {decompress}
+    RELATED : {_cache_put}
+
+    """
+    path = os.path.join(cache_dir, 'data', key)
+    conn = _cache_connect(cache_dir=cache_dir)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT size FROM entries WHERE key = ?", (key, )).fetchone()
+            if (row is not None) and os.path.isfile(path) and (os.path.getsize(path) == row[0]):
+                try:
+                    os.link(path, dst_path)
+                except OSError:
+                    shutil.copyfile(path, dst_path)
+                conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+                _cache_count(conn=conn, name='hits')
+                hit = True
+            else:
+                # Forget entries whose file is missing or truncated, e.g. removed by hand.
+                if row is not None:
+                    conn.execute("DELETE FROM entries WHERE key = ?", (key, ))
+                _cache_count(conn=conn, name='misses')
+                hit = False
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+    logger.debug("_cache_get: key = {key}; hit = {hit}".format(key=key, hit=hit))
+    return hit
+
+
+def _cache_put(cache_dir, key, src_path, cache_bytes):
+    """Semi-private method to add a decompressed file to the cache, evicting least recently used files.
+
+    Parameters
+    ----------
+    cache_dir : string
+        Local path to cache directory.
+    key : string
+        Cache key from `_cache_key`. The file at `src_path` must already be verified against it.
+    src_path : string
+        Local path to the decompressed file. The file is linked, or copied if on another file system;
+        `src_path` is left in place.
+    cache_bytes : int
+        Maximum total size of files in the cache.
+
+    Returns
+    -------
+    inserted : bool
+        ``True`` if the file was added. ``False`` if it was already cached or is larger than `cache_bytes`.
+
+    See Also
+    --------
+    CALLS : {_cache_connect, _cache_evict, _cache_count}
+    CALLED_BY : {_compress_encode, _compress_dedup, decompress}
+    RELATED : {_cache_get}
+
+    """
+    size = os.path.getsize(src_path)
+    if size > cache_bytes:
+        logger.debug("_cache_put: Not caching {key}; size {size} > cache_bytes {cb}".format(key=key, size=size, cb=cache_bytes))
+        return False
+    path = os.path.join(cache_dir, 'data', key)
+    # NOTE: Connect first to create the directories of the cache if needed.
+    conn = _cache_connect(cache_dir=cache_dir)
+    tmp_path = os.path.join(cache_dir, 'tmp', "{key}.{pid}.{tid}".format(key=key, pid=os.getpid(), tid=threading.current_thread().ident))
+    try:
+        # NOTE: Link or copy outside of the transaction so that other processes are not blocked by a long copy.
+        try:
+            os.link(src_path, tmp_path)
+        except OSError:
+            shutil.copyfile(src_path, tmp_path)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM entries WHERE key = ?", (key, )).fetchone() is not None:
+                inserted = False
+            else:
+                _cache_evict(conn=conn, cache_dir=cache_dir, max_bytes=cache_bytes-size)
+                os.rename(tmp_path, path)
+                conn.execute("INSERT INTO entries (key, size, last_access) VALUES (?, ?, ?)", (key, size, time.time()))
+                _cache_count(conn=conn, name='inserts')
+                inserted = True
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    logger.debug("_cache_put: key = {key}; inserted = {ins}".format(key=key, ins=inserted))
+    return inserted
+
+
+def _cache_make_room(cache_dir, nbytes):
+    """Semi-private method to evict least recently used files until `nbytes` are available for temporary files.
+
+    Parameters
+    ----------
+    cache_dir : string
+        Local path to cache directory. Its file system should hold `tmp_iplant`.
+    nbytes : int
+        Number of bytes needed on the file system of `cache_dir`.
+
+    Returns
+    -------
+    evicted : int
+        Number of files removed.
+
+    See Also
+    --------
+    CALLS : {_cache_connect, _cache_evict}
+    CALLED_BY : {decompress, _scratch_reserve}
+    RELATED : {}
+
+    """
+    conn = _cache_connect(cache_dir=cache_dir)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            evicted = _cache_evict(conn=conn, cache_dir=cache_dir, min_free_bytes=nbytes)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+    if evicted > 0:
+        logger.debug("_cache_make_room: Evicted {ev} files for {nb} bytes.".format(ev=evicted, nb=nbytes))
+    return evicted
+
+
+def cache_status(cache_dir):
+    """Report the size and counters of the decompressed file cache.
+
+    Parameters
+    ----------
+    cache_dir : string
+        Local path to cache directory.
+
+    Returns
+    -------
+    status : collections.OrderedDict
+        Number of files and bytes in the cache, 'hits', 'misses', 'inserts', 'evictions', 'evicted_bytes'
+        since the cache was created, and 'hit_ratio'.
+
+    See Also
+    --------
+    CALLS : {_cache_connect}
+    CALLED_BY : {_run_action, __main__}
+    RELATED : {queue_status}
+
+    """
+    conn = _cache_connect(cache_dir=cache_dir)
+    try:
+        conn.execute("BEGIN")
+        (entries, nbytes) = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+    status = collections.OrderedDict()
+    status['cache_dir'] = cache_dir
+    status['entries'] = entries
+    status['bytes'] = nbytes
+    for name in ['hits', 'misses', 'inserts', 'evictions', 'evicted_bytes']:
+        status[name] = counters.get(name, 0)
+    lookups = status['hits'] + status['misses']
+    status['hit_ratio'] = (status['hits']/lookups) if lookups > 0 else None
+    return status
+
+
+# Define file name of the reservations of scratch volumes within the first directory of `tmp_iplant`. See `_scratch_reserve`.
+SCRATCH_FILENAME = 'iplant_scratch.json'
+
+# Define suffixes of sizes as powers of 1024, e.g. for the largest job of a scratch volume. See `_parse_tmp_iplant`.
+SIZE_SUFFIXES = {'': 1, 'K': 2**10, 'M': 2**20, 'G': 2**30, 'T': 2**40}
+
+
+def _parse_size(size):
+    """Semi-private method to parse a size in bytes with an optional suffix 'K', 'M', 'G', or 'T' (powers of 1024),
+    e.g. '2G'. Raises ``ValueError`` if `size` is not a number of bytes at least 0."""
+    size_str = str(size).strip().upper().rstrip('B')
+    suffix = size_str[-1:] if size_str[-1:] in SIZE_SUFFIXES else ''
+    nbytes = int(float(size_str[:len(size_str)-len(suffix)])*SIZE_SUFFIXES[suffix])
+    if nbytes < 0:
+        raise ValueError("Size must be at least 0: {size}".format(size=size))
+    return nbytes
+
+
+def _parse_tmp_iplant(tmp_iplant):
+    """Semi-private method to split `tmp_iplant` into scratch volumes.
+
+    Parameters
+    ----------
+    tmp_iplant : string
+        Comma-separated local paths to scratch directories as 'DIR' or 'DIR=MAXSIZE', e.g.
+        '/dev/shm/iplant=2G,/scratch/iplant'. MAXSIZE is the most bytes a job may reserve in the directory,
+        with an optional suffix 'K', 'M', 'G', or 'T' (powers of 1024). A single directory is one volume.
+
+    Returns
+    -------
+    volumes : list
+        (path, max_bytes) of each directory in the order given. `max_bytes` is ``None`` if not limited.
+        The first directory also holds the queue, the cache, checkpoints, and the reservations of all volumes.
+
+    Raises
+    ------
+    ValueError
+        If `tmp_iplant` has no directory or a MAXSIZE is not valid.
+
+    See Also
+    --------
+    CALLS : {_parse_size}
+    CALLED_BY : {_scratch_update, compress, decompress, _tmp_iplant_type, _check_args}
+    RELATED : {}
+
+    """
+    volumes = []
+    for spec in tmp_iplant.split(','):
+        if len(spec) == 0:
+            continue
+        (path, sep, size) = spec.partition('=')
+        max_bytes = None
+        if sep:
+            try:
+                max_bytes = _parse_size(size)
+            except ValueError:
+                raise ValueError("MAXSIZE of scratch directory not valid: {spec}".format(spec=spec))
+        volumes.append((path, max_bytes))
+    if len(volumes) == 0:
+        raise ValueError("`tmp_iplant` has no directory: {tip}".format(tip=tmp_iplant))
+    return volumes
+
+
+def _pid_exists(pid):
+    """Semi-private method to check if a local process is running, e.g. the owner of a reservation."""
+    try:
+        os.kill(pid, 0)
+    except OSError as err:
+        return err.errno == errno.EPERM
+    return True
+
+
+def _scratch_state(volumes, reservations):
+    """Semi-private method to compute the space of each scratch volume that is available to a new job.
+
+    Parameters
+    ----------
+    volumes : list
+        (path, max_bytes) from `_parse_tmp_iplant`.
+    reservations : dict
+        Reservations from the ledger by `tmp_path`. See `_scratch_reserve`.
+
+    Returns
+    -------
+    state : list
+        ``dict`` for each volume in order with 'path', 'max_bytes', 'available_bytes' on its file system less
+        'reserved_bytes', the part of reservations on the file system that jobs have not yet written, and 'jobs',
+        the number of reservations in the volume.
+
+    See Also
+    --------
+    CALLS : {}
+    CALLED_BY : {_scratch_reserve, scratch_status}
+    RELATED : {}
+
+    Notes
+    -----
+    - A job writes only files named with its `tmpname`, so the bytes it has written are the sizes of those files.
+      These are already missing from the space of the file system and are not counted again.
+    - Volumes on the same file system share its space and its reservations.
+
+    """
+    reserved_by_dev = collections.defaultdict(int)
+    jobs_by_path = collections.defaultdict(int)
+    names_by_path = {}
+    for reservation in reservations.values():
+        (path, tmpname) = os.path.split(reservation['tmp_path'])
+        if path not in names_by_path:
+            names_by_path[path] = os.listdir(path) if os.path.isdir(path) else []
+        written = 0
+        for name in names_by_path[path]:
+            if name.startswith(tmpname):
+                try:
+                    written += os.path.getsize(os.path.join(path, name))
+                except OSError:
+                    # NOTE: The file was deleted since it was listed.
+                    pass
+        reserved_by_dev[os.stat(path).st_dev if os.path.isdir(path) else None] += max(0, reservation['nbytes']-written)
+        jobs_by_path[path] += 1
+    state = []
+    for (path, max_bytes) in volumes:
+        stat = os.statvfs(path)
+        reserved = reserved_by_dev[os.stat(path).st_dev]
+        state.append({'path': path, 'max_bytes': max_bytes, 'available_bytes': stat.f_bavail*stat.f_frsize - reserved,
+                      'reserved_bytes': reserved, 'jobs': jobs_by_path[path]})
+    return state
+
+
+def _scratch_update(tmp_iplant, func):
+    """Semi-private method to update the reservations of scratch volumes under an exclusive lock.
+
+    Parameters
+    ----------
+    tmp_iplant : string
+        Scratch volumes. See `_parse_tmp_iplant`.
+    func : function
+        Function called as ``func(volumes, reservations)`` with the list from `_parse_tmp_iplant` and the ``dict``
+        of reservations by `tmp_path`, which it may change in place. Reservations of processes that are no longer
+        running are removed first, except reservations handed to `verify_file` by `_scratch_defer` whose copy
+        still exists.
+
+    Returns
+    -------
+    result : object
+        Result of `func`.
+
+    See Also
+    --------
+    CALLS : {_parse_tmp_iplant, _pid_exists}
+    CALLED_BY : {_scratch_reserve, _scratch_release, _scratch_resize, _scratch_defer, scratch_status}
+    RELATED : {_flush_metrics}
+
+    Notes
+    -----
+    - Processes share the reservations in SCRATCH_FILENAME within the first directory under an exclusive lock on
+      SCRATCH_FILENAME + '.lock'. The file is replaced by renaming so that it is never read partially.
+    - Process IDs are only meaningful on one host, so `tmp_iplant` must be local.
+
+    """
+    volumes = _parse_tmp_iplant(tmp_iplant)
+    for (path, _) in volumes:
+        if not os.path.exists(path):
+            os.makedirs(path)
+    ledger_file = os.path.join(volumes[0][0], SCRATCH_FILENAME)
+    with open(ledger_file+'.lock', 'a') as flock:
+        fcntl.flock(flock, fcntl.LOCK_EX)
+        reservations = {}
+        if os.path.exists(ledger_file):
+            with open(ledger_file) as fledger:
+                reservations = json.load(fledger)
+        reservations = dict((tmp_path, reservation) for (tmp_path, reservation) in reservations.items()
+                            if _pid_exists(reservation['pid']) or (reservation.get('deferred') and os.path.exists(tmp_path)))
+        result = func(volumes, reservations)
+        with open(ledger_file+'.tmp', 'w') as ftmp:
+            json.dump(reservations, ftmp)
+        os.rename(ledger_file+'.tmp', ledger_file)
+    return result
+
+
+def _scratch_reserve(tmp_iplant, tmpname, nbytes, cache_dir=None):
+    """Semi-private method to choose a scratch volume for the local files of a job and reserve space on it.
+
+    Parameters
+    ----------
+    tmp_iplant : string
+        Scratch volumes. See `_parse_tmp_iplant`.
+    tmpname : string
+        Name of the job's temporary files. All local files of the job must begin with `tmpname`.
+    nbytes : int
+        Most bytes the job writes, e.g. the sizes of the uncompressed and compressed files.
+    cache_dir : {None}, string, optional
+        Local path to the decompressed file cache. If no volume has room, files are evicted from the cache
+        to make room on its file system.
+
+    Returns
+    -------
+    tmp_path : string
+        Local path for the job's files, ``os.path.join(volume, tmpname)``. Release with `_scratch_release`.
+
+    Raises
+    ------
+    IOError
+        If no volume takes jobs of `nbytes` and has `nbytes` available.
+
+    See Also
+    --------
+    CALLS : {_scratch_update, _scratch_state, _cache_make_room}
+    CALLED_BY : {compress, decompress}
+    RELATED : {_scratch_release, scratch_status}
+
+    Notes
+    -----
+    - Of the volumes that take jobs of `nbytes` and have room, the volume with the fewest jobs is chosen, then
+      the volume given first, so that concurrent jobs are spread across volumes.
+    - Call before the data object is moved so that a job without room fails before changing anything in iRODS.
+
+    """
+    def _reserve(volumes, reservations):
+        state = _scratch_state(volumes=volumes, reservations=reservations)
+        def _candidates():
+            return [(vol['jobs'], idx) for (idx, vol) in enumerate(state)
+                    if ((vol['max_bytes'] is None) or (nbytes <= vol['max_bytes'])) and (nbytes <= vol['available_bytes'])]
+        candidates = _candidates()
+        if (len(candidates) == 0) and (cache_dir is not None) and os.path.isdir(cache_dir):
+            cache_dev = os.stat(cache_dir).st_dev
+            for (idx, vol) in enumerate(state):
+                if ((vol['max_bytes'] is None) or (nbytes <= vol['max_bytes'])) and (os.stat(vol['path']).st_dev == cache_dev):
+                    logger.debug("_scratch_reserve: _cache_make_room(cache_dir={cd}, nbytes={nb})".format(cd=cache_dir,
+                                                                                                        nb=nbytes+vol['reserved_bytes']))
+                    _cache_make_room(cache_dir=cache_dir, nbytes=nbytes+vol['reserved_bytes'])
+                    state = _scratch_state(volumes=volumes, reservations=reservations)
+                    candidates = _candidates()
+                    break
+        if len(candidates) == 0:
+            raise IOError(("No scratch volume of `tmp_iplant` has room for the job:\n" +
+                           "tmpname = {tmpname}\n" +
+                           "nbytes = {nb}\n" +
+                           "volumes = {state}").format(tmpname=tmpname, nb=nbytes, state=state))
+        vol = state[min(candidates)[1]]
+        tmp_path = os.path.join(vol['path'], tmpname)
+        reservations[tmp_path] = {'tmp_path': tmp_path, 'nbytes': nbytes, 'pid': os.getpid(), 'time': time.time()}
+        logger.debug(("_scratch_reserve: Reserved {nb} bytes in {path}; available_bytes = {ab}; " +
+                      "jobs = {jobs}").format(nb=nbytes, path=vol['path'], ab=vol['available_bytes'], jobs=vol['jobs']+1))
+        return tmp_path
+    return _scratch_update(tmp_iplant=tmp_iplant, func=_reserve)
+
+
+def _scratch_release(tmp_iplant, tmp_path):
+    """Semi-private method to release the space reserved by `_scratch_reserve` once a job finished.
+
+    Files of the job that are kept, e.g. with `delete_tmp_files` ``False``, no longer count as reserved
+    but still take their space on the file system.
+
+    See Also
+    --------
+    CALLS : {_scratch_update}
+    CALLED_BY : {compress, decompress, verify_file}
+    RELATED : {_scratch_reserve, _scratch_defer}
+
+    """
+    def _release(volumes, reservations):
+        reservation = reservations.pop(tmp_path, None)
+        logger.debug("_scratch_release: Released {nb} bytes of {tmp_path}".format(nb=(reservation or {}).get('nbytes'), tmp_path=tmp_path))
+        return None
+    return _scratch_update(tmp_iplant=tmp_iplant, func=_release)
+
+
+def _scratch_resize(tmp_iplant, tmp_path, nbytes):
+    """Semi-private method to change the bytes reserved by `_scratch_reserve` for a running job, e.g. once the size of
+    its file is known from the local copy. Room is not checked, since the job already writes to the volume.
+
+    See Also
+    --------
+    CALLS : {_scratch_update}
+    CALLED_BY : {compress}
+    RELATED : {_scratch_reserve, _scratch_release}
+
+    """
+    def _resize(volumes, reservations):
+        if tmp_path in reservations:
+            reservations[tmp_path]['nbytes'] = nbytes
+        logger.debug("_scratch_resize: Reserved {nb} bytes of {tmp_path}".format(nb=nbytes, tmp_path=tmp_path))
+        return None
+    return _scratch_update(tmp_iplant=tmp_iplant, func=_resize)
+
+
+def _scratch_defer(tmp_iplant, tmp_path, nbytes):
+    """Semi-private method to keep the reservation of a job for its local copy of a decompressed file that is hashed
+    later by `verify_file`, e.g. from `drain` in another process.
+
+    The reservation shrinks to the `nbytes` of the copy and is kept after the job's process exits, as long as
+    `tmp_path` exists. `verify_file` releases it with `_scratch_release` once the copy is hashed.
+
+    See Also
+    --------
+    CALLS : {_scratch_update}
+    CALLED_BY : {decompress}
+    RELATED : {_scratch_reserve, _scratch_release}
+
+    """
+    def _defer(volumes, reservations):
+        if tmp_path in reservations:
+            reservations[tmp_path].update(nbytes=nbytes, deferred=True)
+        logger.debug("_scratch_defer: Kept {nb} bytes of {tmp_path} for verify_file".format(nb=nbytes, tmp_path=tmp_path))
+        return None
+    return _scratch_update(tmp_iplant=tmp_iplant, func=_defer)
+
+
+def scratch_status(tmp_iplant):
+    """Report the available space, reserved space, and jobs of each scratch volume of `tmp_iplant`.
+
+    Parameters
+    ----------
+    tmp_iplant : string
+        Scratch volumes. See `_parse_tmp_iplant`.
+
+    Returns
+    -------
+    status : collections.OrderedDict
+        'volumes', a list with 'path', 'max_bytes', 'available_bytes', 'reserved_bytes', and 'jobs' of each volume.
+        See `_scratch_state`.
+
+    See Also
+    --------
+    CALLS : {_scratch_update, _scratch_state}
+    CALLED_BY : {__main__}
+    RELATED : {queue_status, cache_status}
+
+    """
+    state = _scratch_update(tmp_iplant=tmp_iplant, func=(lambda volumes, reservations: _scratch_state(volumes=volumes, reservations=reservations)))
+    status = collections.OrderedDict()
+    status['tmp_iplant'] = tmp_iplant
+    status['volumes'] = [collections.OrderedDict([(key, vol[key]) for key in ['path', 'max_bytes', 'available_bytes', 'reserved_bytes', 'jobs']])
+                         for vol in state]
+    return status
+
+
+# Define directory name of the per-object locks of `compress` and `decompress` within the first directory of `tmp_iplant`,
+# seconds without a heartbeat after which a held lock is stale, seconds between attempts to take a lock,
+# and seconds between heartbeats of a held lock. See `_ObjectLock`.
+LOCKS_DIRNAME = 'iplant_locks'
+LOCK_TIMEOUT = 6*3600
+LOCK_POLL_INTERVAL = 0.2
+LOCK_HEARTBEAT_INTERVAL = 60
+
+
+class _ObjectLock(object):
+    """Semi-private class to run one `compress` or `decompress` of a data object at a time across processes.
+
+    The first caller runs the action. Callers of the same action that wait for it reuse its stats instead of
+    running the action again, i.e. a single flight.
+
+    Parameters
+    ----------
+    tmp_iplant : string
+        Scratch volumes. Locks are kept in LOCKS_DIRNAME within the first directory. See `_parse_tmp_iplant`.
+    ipath : string
+        iRODS path to data object.
+    action : string
+        'compress' or 'decompress'.
+    lock_timeout : {LOCK_TIMEOUT}, float, optional
+        Seconds without a heartbeat after which a lock held by a running process is stale and is broken.
+
+    Attributes
+    ----------
+    stats : {None, dict}
+        Within the ``with`` block, the stats of the caller this one waited for, or ``None`` if this caller must
+        run the action. Set to the stats of the action before leaving the block to share them.
+    readers : list
+        Within the ``with`` block, the start times of the read leases on the object that have not expired, oldest first.
+        Changes are kept in the lock file for the next holder. See `decompress` with `read_lease`.
+
+    See Also
+    --------
+    CALLS : {_parse_tmp_iplant, _record_span}
+    CALLED_BY : {compress, decompress}
+    RELATED : {_scratch_update}
+
+    Notes
+    -----
+    - A lock is ``fcntl.flock`` on a file named by the SHA1 of `ipath`. The kernel releases it when its process
+      exits, so a job that crashed does not block others. Each lock opens its own file, so threads of `serve`
+      also exclude each other.
+    - `compress` and `decompress` of the same object share a lock, so e.g. `iplantPostProcForOpen` does not compress
+      a file while another open decompresses it. Stats are only reused from the same action.
+    - Stats are only reused if the action finished after the caller began to wait, and not if it raised an
+      exception, in which case the next caller runs the action again.
+    - While a caller holds a lock, a thread rewrites the time of its record every LOCK_HEARTBEAT_INTERVAL seconds
+      (at most `lock_timeout` / 4). A lock is broken only if its time is older than `lock_timeout`, i.e. if the
+      heartbeat stopped, e.g. because the process is stopped or hangs outside Python. A long (de)compression
+      keeps its lock however long it runs.
+    - A stale lock is broken by removing its file under a lock of the directory. A caller that took a lock checks
+      that its file is still in place, so only one caller holds the lock of an object. The hung process is not
+      stopped.
+    - Lock files are kept for stats to be reused and are removed once older than `lock_timeout`.
+    - Read leases are kept in the record of the lock file, so they are only changed by the holder of the lock.
+      A lease older than `lock_timeout` expires, so a reader that never returns its lease, e.g. because its
+      open failed, does not keep the file decompressed for longer. A lock broken as stale keeps its leases.
+    - `flock` is not reliable over NFS, so `tmp_iplant` must be local.
+
+    """
+
+    def __init__(self, tmp_iplant, ipath, action, lock_timeout=LOCK_TIMEOUT):
+        self.lock_dir = os.path.join(_parse_tmp_iplant(tmp_iplant)[0][0], LOCKS_DIRNAME)
+        self.lock_file = os.path.join(self.lock_dir, hashlib.sha1(ipath.encode('utf-8')).hexdigest()+'.lock')
+        self.ipath = ipath
+        self.action = action
+        self.lock_timeout = lock_timeout
+        self.stats = None
+        self.readers = []
+        self.fobj = None
+        self.fobj_lock = threading.Lock()
+        self.heartbeat_stop = None
+        self.heartbeat_thread = None
+
+    def _read(self, fobj):
+        """Read the record of the last holder from a lock file, or ``{}`` if it is being written."""
+        fobj.seek(0)
+        try:
+            return json.loads(fobj.read() or '{}')
+        except ValueError:
+            return {}
+
+    def _write(self, record):
+        """Replace the record of the lock file while holding the lock."""
+        with self.fobj_lock:
+            self.fobj.seek(0)
+            self.fobj.truncate()
+            self.fobj.write(json.dumps(record))
+            self.fobj.flush()
+
+    def _heartbeat(self, record):
+        """Refresh the time of the record until `heartbeat_stop` is set, so that the lock is not broken as stale."""
+        interval = min(LOCK_HEARTBEAT_INTERVAL, self.lock_timeout/4.0)
+        while not self.heartbeat_stop.wait(interval):
+            record['time'] = time.time()
+            record['readers'] = list(self.readers)
+            try:
+                self._write(record)
+            except (IOError, OSError, ValueError) as err:
+                # NOTE: The lock is held as long as its file is open. The next heartbeat tries again.
+                logger.warning("_ObjectLock: Failed to refresh lock of {ipath}: {err}".format(ipath=self.ipath, err=err))
+        return None
+
+    def _in_place(self, fobj):
+        """Check that an open lock file was not removed, e.g. as stale."""
+        try:
+            return os.fstat(fobj.fileno()).st_ino == os.stat(self.lock_file).st_ino
+        except OSError:
+            return False
+
+    def _remove_if(self, fobj, test):
+        """Remove an open lock file under the lock of the directory if `test` is true of its record."""
+        with open(os.path.join(self.lock_dir, '.lock'), 'a') as fdir:
+            fcntl.flock(fdir, fcntl.LOCK_EX)
+            record = self._read(fobj)
+            if self._in_place(fobj) and test(record):
+                os.remove(self.lock_file)
+                return record
+        return None
+
+    def _prune(self):
+        """Remove lock files of other objects that are older than `lock_timeout` and not held, at most hourly."""
+        marker = os.path.join(self.lock_dir, '.pruned')
+        if os.path.exists(marker) and (time.time() - os.path.getmtime(marker) < min(3600, self.lock_timeout)):
+            return None
+        with open(marker, 'a'):
+            os.utime(marker, None)
+        for name in os.listdir(self.lock_dir):
+            path = os.path.join(self.lock_dir, name)
+            if (not name.endswith('.lock')) or (path == self.lock_file) or (name.startswith('.')):
+                continue
+            try:
+                if time.time() - os.path.getmtime(path) < self.lock_timeout:
+                    continue
+                with open(path, 'a+') as fobj:
+                    fcntl.flock(fobj, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    with open(os.path.join(self.lock_dir, '.lock'), 'a') as fdir:
+                        fcntl.flock(fdir, fcntl.LOCK_EX)
+                        if os.fstat(fobj.fileno()).st_ino == os.stat(path).st_ino:
+                            os.remove(path)
+            except (IOError, OSError):
+                # NOTE: The lock is held or the file was removed since it was listed.
+                pass
+        return None
+
+    def __enter__(self):
+        if not os.path.exists(self.lock_dir):
+            try:
+                os.makedirs(self.lock_dir)
+            except OSError as err:
+                if err.errno != errno.EEXIST:
+                    raise
+        self._prune()
+        time_start = time.time()
+        waited = False
+        readers = []
+        while True:
+            fobj = open(self.lock_file, 'a+')
+            try:
+                fcntl.flock(fobj, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except (IOError, OSError) as err:
+                if err.errno not in (errno.EAGAIN, errno.EACCES):
+                    fobj.close()
+                    raise
+                if not waited:
+                    logger.debug("_ObjectLock: Waiting for {action} of {ipath}".format(action=self.action, ipath=self.ipath))
+                    waited = True
+                # NOTE: A lock of a process that exited is released by the kernel, so only holders whose heartbeat
+                # stopped are stale.
+                stale = self._remove_if(fobj, lambda record: (('done' not in record) and
+                                                              (time.time() - record.get('time', time.time()) > self.lock_timeout)))
+                fobj.close()
+                if stale is not None:
+                    readers = stale.get('readers', [])
+                    logger.warning(("_ObjectLock: Broke stale lock of {ipath} held by pid {pid} for {action} without " +
+                                    "heartbeat for {secs:.0f} seconds").format(ipath=self.ipath, pid=stale.get('pid'), action=stale.get('action'),
+                                                                 secs=time.time()-stale['time']))
+                else:
+                    time.sleep(LOCK_POLL_INTERVAL)
+                continue
+            if self._in_place(fobj):
+                break
+            fobj.close()
+        self.fobj = fobj
+        record = self._read(fobj)
+        seconds = time.time() - time_start
+        self.readers = sorted(stamp for stamp in (record.get('readers') or readers) if time.time() - stamp < self.lock_timeout)
+        if waited:
+            _record_span(action=self.action, stage='lock_wait', ipath=self.ipath, seconds=seconds)
+            if (record.get('action') == self.action) and (record.get('stats') is not None) and (record.get('done', 0) >= time_start):
+                self.stats = record['stats']
+                logger.info(("_ObjectLock: Reusing stats of {action} of {ipath} by pid {pid} after waiting " +
+                             "{secs:.3f} seconds").format(action=self.action, ipath=self.ipath, pid=record.get('pid'), secs=seconds))
+        record = {'ipath': self.ipath, 'action': self.action, 'pid': os.getpid(), 'time': time.time(), 'readers': self.readers}
+        self._write(record)
+        self.heartbeat_stop = threading.Event()
+        self.heartbeat_thread = threading.Thread(target=self._heartbeat, args=(dict(record),), name="lock-heartbeat")
+        self.heartbeat_thread.daemon = True
+        self.heartbeat_thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self.heartbeat_stop.set()
+            self.heartbeat_thread.join()
+            record = {'ipath': self.ipath, 'action': self.action, 'pid': os.getpid(), 'done': time.time(), 'readers': self.readers}
+            if exc_type is None:
+                record['stats'] = self.stats
+            self._write(record)
+        finally:
+            self.fobj.close()
+            self.fobj = None
+        return False
+
+
+# Define directory name of the operation journals of `compress` and `decompress` within the first directory of `tmp_iplant`.
+# See `_Journal`.
+JOURNAL_DIRNAME = 'iplant_journal'
+
+
+class _Journal(object):
+    """Semi-private class to record the completed stages of a `compress` or `decompress` so that `recover` can finish
+    or undo it after a crash.
+
+    Parameters
+    ----------
+    tmp_iplant : string
+        Scratch volumes. Journals are kept in JOURNAL_DIRNAME within the first directory. See `_parse_tmp_iplant`.
+    ipath : string
+        iRODS path to data object.
+    action : string
+        'compress', 'decompress', 'reinstate', or 'sample'.
+    kwargs : {None}, dict, optional
+        Arguments of the action other than `ipath`, so that `recover` can run it again.
+
+    Attributes
+    ----------
+    record : dict
+        'ipath', 'action', 'pid', 'time', 'kwargs', 'stages' in the order they were completed, and 'artifacts',
+        e.g. paths of temporary files, sizes, and hashes, from all stages.
+
+    See Also
+    --------
+    CALLS : {_parse_tmp_iplant}
+    CALLED_BY : {compress, decompress, _reinstate_parent, _sample_head, _resume_journal, recover}
+    RELATED : {_ObjectLock}
+
+    Notes
+    -----
+    - A journal is a JSON file named by the SHA1 of `ipath`. It is written while the lock of `ipath` is held,
+      so an object has at most one journal. See `_ObjectLock`.
+    - Each stage replaces the file by renaming a synced copy, so the journal is never read partially and records
+      at least the stages that completed before a crash.
+    - The journal is removed once the metadata of `ipath` are set. A journal that is left records an action that
+      did not finish.
+
+    """
+
+    def __init__(self, tmp_iplant, ipath, action, kwargs=None):
+        self.journal_dir = os.path.join(_parse_tmp_iplant(tmp_iplant)[0][0], JOURNAL_DIRNAME)
+        self.journal_file = os.path.join(self.journal_dir, hashlib.sha1(ipath.encode('utf-8')).hexdigest()+'.json')
+        self.tmp_iplant = tmp_iplant
+        self.ipath = ipath
+        self.action = action
+        self.record = {'ipath': ipath, 'action': action, 'pid': os.getpid(), 'time': time.time(),
+                       'kwargs': (kwargs if (kwargs is not None) else {}), 'stages': [], 'artifacts': {}}
+
+    @classmethod
+    def load(cls, tmp_iplant, ipath):
+        """Return the journal of `ipath` left by an action that did not finish, or ``None`` if there is none."""
+        journal = cls(tmp_iplant=tmp_iplant, ipath=ipath, action=None)
+        if not os.path.exists(journal.journal_file):
+            return None
+        with open(journal.journal_file) as fobj:
+            journal.record = json.load(fobj)
+        journal.action = journal.record['action']
+        return journal
+
+    def done(self, stage):
+        """Return ``True`` if `stage` was completed."""
+        return stage in self.record['stages']
+
+    def stage(self, name, **artifacts):
+        """Record that stage `name` completed with `artifacts`."""
+        self.record['stages'].append(name)
+        self.record['artifacts'].update(artifacts)
+        self.record['time'] = time.time()
+        if not os.path.exists(self.journal_dir):
+            try:
+                os.makedirs(self.journal_dir)
+            except OSError as err:
+                if err.errno != errno.EEXIST:
+                    raise
+        with open(self.journal_file+'.tmp', 'w') as ftmp:
+            json.dump(self.record, ftmp)
+            ftmp.flush()
+            os.fsync(ftmp.fileno())
+        os.rename(self.journal_file+'.tmp', self.journal_file)
+        logger.debug("_Journal: {action} of {ipath}: stage {name} completed".format(action=self.action, ipath=self.ipath, name=name))
+        return None
+
+    def remove(self):
+        """Remove the journal once the action finished."""
+        if os.path.exists(self.journal_file):
+            os.remove(self.journal_file)
+        return None
+
+
+# Define attributes of `compress` and `decompress` kept in the local index, with their units. See `set_index`.
+INDEX_ATTRS = collections.OrderedDict([('IS_COMPRESSED', 'BOOL'), ('COMPRESSION_METHOD', 'NONE'), ('UNCOMPRESSED_SIZE', 'BYTES'),
+                                       ('COMPRESSED_SIZE', 'BYTES'), ('UNCOMPRESSED_HASH', 'NONE'), ('HASH_METHOD', 'NONE'),
+                                       ('PARENT_FILE', 'NONE'), ('BLOCK_INDEX', 'NONE'), ('CHUNK_HASHES', 'NONE')])
+
+# Define the local index of compression state. Disabled unless set by `set_index`.
+_index = {'index_file': None}
+
+
+def set_index(index_file=None):
+    """Select the local index of compression state that `decompress` reads before imeta.
+
+    Parameters
+    ----------
+    index_file : {None}, string, optional
+        Local path to SQLite database of the index. If ``None``, the index is not used.
+
+    Returns
+    -------
+    None
+
+    See Also
+    --------
+    CALLS : {}
+    CALLED_BY : {__main__}
+    RELATED : {index_validate, index_rebuild}
+
+    Notes
+    -----
+    - `compress` and `decompress` record the attributes in `INDEX_ATTRS` of each data object that they read from
+      imeta or set. `decompress` reads the index first and only runs `imeta ls` for data objects not in the index,
+      so opening a file that is not compressed makes no catalog query.
+    - `compress` always reads imeta, since a new `iput` to a path replaces its data object without `iplant.py`.
+    - A data object's row is removed before it is moved and recorded again once its metadata are set, so a failed
+      action leaves no row and the next action reads imeta.
+    - The index is only correct if all changes to the metadata of files within `iplant` are made by `iplant.py`
+      with the same `index_file`, e.g. by one server's rules. Check with `index_validate`; repopulate with `index_rebuild`.
+
+    """
+    if index_file is not None:
+        _index_connect(index_file=index_file).close()
+    _index['index_file'] = index_file
+    return None
+
+
+def _index_connect(index_file):
+    """Semi-private method to open the local index of compression state, creating it if needed.
+
+    Parameters
+    ----------
+    index_file : string
+        Local path to SQLite database of the index.
+
+    Returns
+    -------
+    conn : sqlite3.Connection
+        Connection in autocommit mode. Transactions are begun explicitly. Use from one thread only.
+
+    See Also
+    --------
+    CALLS : {}
+    CALLED_BY : {set_index, _index_get, _index_put, _index_forget, index_validate, index_rebuild}
+    RELATED : {_queue_connect}
+
+    Notes
+    -----
+    - One row per data object. Columns are the attributes in `INDEX_ATTRS` in lower case, ``NULL`` if not set.
+      `is_compressed` is ``NULL`` for a data object without 'IS_COMPRESSED', i.e. never compressed.
+    - `updated` is the time the row was written, so that `index_rebuild` keeps rows written while it runs.
+    - Columns missing from an index made by an earlier version are added as ``NULL``.
+
+    """
+    index_dirname = os.path.dirname(index_file)
+    if not os.path.exists(index_dirname):
+        os.makedirs(index_dirname)
+    conn = sqlite3.connect(index_file, timeout=60.0, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(("CREATE TABLE IF NOT EXISTS objects (" +
+                  "ipath TEXT PRIMARY KEY, " +
+                  "is_compressed INTEGER, " +
+                  "compression_method TEXT, " +
+                  "uncompressed_size INTEGER, " +
+                  "compressed_size INTEGER, " +
+                  "uncompressed_hash TEXT, " +
+                  "hash_method TEXT, " +
+                  "parent_file TEXT, " +
+                  "block_index TEXT, " +
+                  "chunk_hashes TEXT, " +
+                  "updated REAL NOT NULL)"))
+    # Add columns of attributes added to `INDEX_ATTRS` since the index was created.
+    columns = set(row[1] for row in conn.execute("PRAGMA table_info(objects)"))
+    for attr in INDEX_ATTRS:
+        if attr.lower() not in columns:
+            conn.execute("ALTER TABLE objects ADD COLUMN {col} {ctype}".format(
+                col=attr.lower(), ctype=('INTEGER' if INDEX_ATTRS[attr] in ['BOOL', 'BYTES'] else 'TEXT')))
+    return conn
+
+
+def _index_row(imeta_dict):
+    """Semi-private method to convert metadata like `_imeta_to_dict` to values of the columns of `INDEX_ATTRS`."""
+    row = []
+    for attr in INDEX_ATTRS:
+        value = imeta_dict.get(attr, {}).get('value')
+        row.append(int(value) if (attr == 'IS_COMPRESSED') and (value is not None) else value)
+    return row
+
+
+def _index_get(ipath):
+    """Semi-private method to get metadata of `ipath` from the index.
+
+    Returns
+    -------
+    imeta_dict : {None}, dict
+        Attributes in `INDEX_ATTRS` like `_imeta_to_dict`. ``None`` if the index is not used or `ipath` is not in it.
+
+    See Also
+    --------
+    CALLS : {_index_connect}
+    CALLED_BY : {decompress}
+    RELATED : {_index_put}
+
+    """
+    if _index['index_file'] is None:
+        return None
+    conn = _index_connect(index_file=_index['index_file'])
+    try:
+        row = conn.execute(("SELECT {cols} FROM objects WHERE ipath = ?").format(cols=', '.join(attr.lower() for attr in INDEX_ATTRS)),
+                           (ipath, )).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        return None
+    imeta_dict = {}
+    for ((attr, units), value) in zip(INDEX_ATTRS.items(), row):
+        if value is not None:
+            imeta_dict[attr] = {'value': (bool(value) if attr == 'IS_COMPRESSED' else value), 'units': units}
+    return imeta_dict
+
+
+def _index_put(ipath, imeta_dict, imeta_triplets=()):
+    """Semi-private method to record metadata of `ipath` in the index, if used.
+
+    Parameters
+    ----------
+    ipath : string
+        iRODS path to data object.
+    imeta_dict : dict
+        Metadata of `ipath` like `_imeta_to_dict`, e.g. as read before `imeta_triplets` were set.
+    imeta_triplets : {()}, list, optional
+        (attribute name, value, units) triplets of strings set on `ipath` after `imeta_dict` was read.
+
+    Returns
+    -------
+    None
+
+    See Also
+    --------
+    CALLS : {_index_connect, _index_row, _value_as_units_type}
+    CALLED_BY : {compress, _compress_publish, decompress}
+    RELATED : {_index_get, _index_forget}
+
+    """
+    if _index['index_file'] is None:
+        return None
+    imeta_dict = dict(imeta_dict)
+    for (attr_name, attr_value, attr_units) in imeta_triplets:
+        imeta_dict[attr_name] = {'value': _value_as_units_type(value=attr_value, units=attr_units), 'units': attr_units}
+    conn = _index_connect(index_file=_index['index_file'])
+    try:
+        conn.execute(("INSERT OR REPLACE INTO objects (ipath, {cols}, updated) VALUES (?, {qms}, ?)").format(
+            cols=', '.join(attr.lower() for attr in INDEX_ATTRS), qms=', '.join(['?']*len(INDEX_ATTRS))),
+            [ipath]+_index_row(imeta_dict=imeta_dict)+[time.time()])
+    finally:
+        conn.close()
+    return None
+
+
+def _index_forget(ipath):
+    """Semi-private method to remove `ipath` from the index, if used, before its data object or metadata change."""
+    if _index['index_file'] is None:
+        return None
+    conn = _index_connect(index_file=_index['index_file'])
+    try:
+        conn.execute("DELETE FROM objects WHERE ipath = ?", (ipath, ))
+    finally:
+        conn.close()
+    return None
+
+
+def _index_catalog(icollection):
+    """Semi-private method to read the state of all data objects within `icollection` from the catalog in two queries.
+
+    Returns
+    -------
+    imeta_dicts : collections.OrderedDict
+        Attributes in `INDEX_ATTRS` like `_imeta_to_dict` by iRODS path, sorted by path. Empty for data objects
+        without these attributes.
+
+    See Also
+    --------
+    CALLS : {_get_transport}
+    CALLED_BY : {index_validate, index_rebuild}
+    RELATED : {_bulk_list}
+
+    """
+    transport = _get_transport()
+    logger.debug("_index_catalog: transport.list_data_objects({ic})".format(ic=icollection))
+    ipaths = sorted(ipath for (ipath, _) in transport.list_data_objects(icollection))
+    logger.debug("_index_catalog: transport.list_metadata({ic})".format(ic=icollection))
+    metadata = transport.list_metadata(icollection, attr_names=list(INDEX_ATTRS.keys()))
+    return collections.OrderedDict((ipath, metadata.get(ipath, {})) for ipath in ipaths)
+
+
+def _index_prefix_where(icollection):
+    """Semi-private method to select rows of the index within `icollection` as (SQL condition, parameters)."""
+    prefix = icollection.rstrip('/')+'/'
+    return ("substr(ipath, 1, ?) = ?", (len(prefix), prefix))
+
+
+def index_validate(index_file, icollection, max_failed=20):
+    """Cross-check the local index of compression state against the catalog.
+
+    Parameters
+    ----------
+    index_file : string
+        Local path to SQLite database of the index. See `set_index`.
+    icollection : string
+        iRODS path to collection. Rows and data objects within the collection and its subcollections are checked.
+    max_failed : {20}, int, optional
+        Maximum number of iRODS paths listed for each kind of mismatch.
+
+    Returns
+    -------
+    report : collections.OrderedDict
+        'indexed' rows, 'listed' data objects, and 'matched' rows. 'mismatched' rows whose attributes differ from
+        imeta, 'missing' rows without a data object, and 'unindexed' data objects without a row, each with up to
+        `max_failed` paths in '<kind>_ipaths'. 'valid' is ``True`` if no rows are mismatched or missing.
+
+    See Also
+    --------
+    CALLS : {_index_catalog, _index_connect, _index_prefix_where}
+    CALLED_BY : {_run_action}
+    RELATED : {index_rebuild, set_index}
+
+    Notes
+    -----
+    - Unindexed data objects are not errors since `decompress` reads imeta for them.
+    - Only values are compared, not units. Rows may change while the catalog is read, e.g. by running jobs,
+      and be reported as mismatched. Validate again before `index_rebuild`.
+
+    """
+    catalog = _index_catalog(icollection=icollection)
+    (where, params) = _index_prefix_where(icollection=icollection)
+    conn = _index_connect(index_file=index_file)
+    try:
+        rows = conn.execute(("SELECT ipath, {cols} FROM objects WHERE {where} ORDER BY ipath").format(
+            cols=', '.join(attr.lower() for attr in INDEX_ATTRS), where=where), params).fetchall()
+    finally:
+        conn.close()
+    report = collections.OrderedDict([('index_file', index_file), ('icollection', icollection), ('indexed', len(rows)),
+                                      ('listed', len(catalog)), ('matched', 0), ('mismatched', 0), ('missing', 0), ('unindexed', 0)])
+    ipaths = collections.OrderedDict([('mismatched', []), ('missing', []), ('unindexed', [])])
+    indexed = set()
+    for row in rows:
+        ipath = row[0]
+        indexed.add(ipath)
+        if ipath not in catalog:
+            kind = 'missing'
+        elif list(row[1:]) != _index_row(imeta_dict=catalog[ipath]):
+            kind = 'mismatched'
+        else:
+            report['matched'] += 1
+            continue
+        report[kind] += 1
+        if len(ipaths[kind]) < max_failed:
+            ipaths[kind].append(ipath)
+    for ipath in catalog:
+        if ipath not in indexed:
+            report['unindexed'] += 1
+            if len(ipaths['unindexed']) < max_failed:
+                ipaths['unindexed'].append(ipath)
+    for (kind, kind_ipaths) in ipaths.items():
+        report[kind+'_ipaths'] = kind_ipaths
+    report['valid'] = (report['mismatched'] == 0) and (report['missing'] == 0)
+    if not report['valid']:
+        logger.warning("index_validate: {mm} mismatched and {mi} missing rows within {ic}".format(mm=report['mismatched'], mi=report['missing'],
+                                                                                                  ic=icollection))
+    return report
+
+
+def index_rebuild(index_file, icollection):
+    """Repopulate the local index of compression state from the catalog.
+
+    Parameters
+    ----------
+    index_file : string
+        Local path to SQLite database of the index. See `set_index`.
+    icollection : string
+        iRODS path to collection. Rows within the collection and its subcollections are replaced.
+
+    Returns
+    -------
+    report : collections.OrderedDict
+        'listed' data objects and 'compressed', 'decompressed', and 'untracked' (without 'IS_COMPRESSED') rows written.
+
+    See Also
+    --------
+    CALLS : {_index_catalog, _index_connect, _index_prefix_where, _index_row}
+    CALLED_BY : {_run_action}
+    RELATED : {index_validate, set_index}
+
+    Notes
+    -----
+    - The catalog is read with one query for data objects and one for their metadata instead of `imeta ls` per file.
+    - Rows written by `compress` and `decompress` since the rebuild started are kept. A file being (de)compressed
+      while the catalog is read may be recorded in its state from before, so rebuild while no jobs are running.
+
+    """
+    time_start = time.time()
+    catalog = _index_catalog(icollection=icollection)
+    (where, params) = _index_prefix_where(icollection=icollection)
+    report = collections.OrderedDict([('index_file', index_file), ('icollection', icollection), ('listed', len(catalog)),
+                                      ('compressed', 0), ('decompressed', 0), ('untracked', 0)])
+    conn = _index_connect(index_file=index_file)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(("DELETE FROM objects WHERE {where} AND updated < ?").format(where=where), params+(time_start, ))
+            for (ipath, imeta_dict) in catalog.items():
+                row = _index_row(imeta_dict=imeta_dict)
+                cursor = conn.execute(("INSERT OR IGNORE INTO objects (ipath, {cols}, updated) VALUES (?, {qms}, ?)").format(
+                    cols=', '.join(attr.lower() for attr in INDEX_ATTRS), qms=', '.join(['?']*len(INDEX_ATTRS))),
+                    [ipath]+row+[time_start])
+                if cursor.rowcount > 0:
+                    report[{None: 'untracked', 1: 'compressed', 0: 'decompressed'}[row[0]]] += 1
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+    logger.info("index_rebuild: {report}".format(report=json.dumps(report)))
+    return report
+
+
+# Define default file name of the access counts of data objects within `tmp_iplant`, and the options of the section
+# '[policy]' of a tiering policy file with their defaults. See `load_policy`.
+ACCESS_FILENAME = 'iplant_access.sqlite'
+POLICY_DEFAULTS = collections.OrderedDict([('min_size', '1M'), ('hot_accesses', '3'), ('half_life_seconds', str(7*24*3600)),
+                                           ('access_file', '')])
+
+# Define the tiering policy. Disabled unless set by `set_policy`.
+_policy = {'policy': None}
+
+
+def load_policy(policy_file):
+    """Read a tiering policy from an INI file.
+
+    Parameters
+    ----------
+    policy_file : string
+        Local path to INI file with a section '[policy]' and the options below. Options not given take their
+        values from `POLICY_DEFAULTS`. Comments are on their own lines, beginning with '#' or ';'.
+        'min_size': Files smaller than this stay uncompressed. Bytes with an optional suffix 'K', 'M', 'G', or 'T'.
+        'hot_accesses': Files with at least this many accesses, decayed by age, stay uncompressed.
+        'half_life_seconds': Seconds after which an access counts half.
+        'access_file': Local path to SQLite database of access counts. Default: ACCESS_FILENAME within `tmp_iplant`.
+
+    Returns
+    -------
+    policy : dict
+        'min_size' (int), 'hot_accesses' (float), 'half_life_seconds' (float), and 'access_file' (``None`` if not given).
+
+    Raises
+    ------
+    IOError
+        If `policy_file` cannot be read.
+    ValueError
+        If `policy_file` has no section '[policy]', an unknown option, or a value that is not valid.
+
+    See Also
+    --------
+    CALLS : {_parse_size}
+    CALLED_BY : {set_policy}
+    RELATED : {}
+
+    Examples
+    --------
+    An `iplant_policy.ini` that compresses files of at least 64 MiB unless opened about daily within the last week::
+
+        [policy]
+        min_size = 64M
+        hot_accesses = 5
+        half_life_seconds = 259200
+
+    """
+    config = configparser.RawConfigParser()
+    if len(config.read(policy_file)) == 0:
+        raise IOError("`policy_file` does not exist or cannot be read: {pf}".format(pf=policy_file))
+    if not config.has_section('policy'):
+        raise ValueError("`policy_file` has no section '[policy]': {pf}".format(pf=policy_file))
+    unknown = [name for name in config.options('policy') if name not in POLICY_DEFAULTS]
+    if len(unknown) > 0:
+        raise ValueError(("`policy_file` has unknown options: {pf}\n" +
+                          "unknown = {unknown}\n" +
+                          "valid = {valid}").format(pf=policy_file, unknown=unknown, valid=list(POLICY_DEFAULTS.keys())))
+    values = dict((name, (config.get('policy', name) if config.has_option('policy', name) else default).strip())
+                  for (name, default) in POLICY_DEFAULTS.items())
+    try:
+        policy = {'min_size': _parse_size(values['min_size']),
+                  'hot_accesses': float(values['hot_accesses']),
+                  'half_life_seconds': float(values['half_life_seconds']),
+                  'access_file': os.path.abspath(values['access_file']) if values['access_file'] else None}
+        if policy['half_life_seconds'] <= 0:
+            raise ValueError("'half_life_seconds' must be positive: {hls}".format(hls=values['half_life_seconds']))
+    except ValueError as err:
+        raise ValueError(("`policy_file` has a value that is not valid: {pf}\n" +
+                          "{err}").format(pf=policy_file, err=err))
+    return policy
+
+
+def set_policy(policy_file=None, access_file=None):
+    """Select the tiering policy that `compress` consults and for which `decompress` counts accesses.
+
+    Parameters
+    ----------
+    policy_file : {None}, string, optional
+        Local path to INI file of the policy. See `load_policy`. If ``None``, files are always compressed.
+    access_file : {None}, string, optional
+        Local path to SQLite database of access counts if the policy does not give 'access_file',
+        e.g. ``os.path.join(tmp_iplant, ACCESS_FILENAME)``.
+
+    Returns
+    -------
+    None
+
+    Raises
+    ------
+    ValueError
+        If a policy is given without `access_file`.
+
+    See Also
+    --------
+    CALLS : {load_policy, _access_connect}
+    CALLED_BY : {__main__}
+    RELATED : {set_index, sweep}
+
+    Notes
+    -----
+    - With a policy, each `decompress`, i.e. each open from `iplantPreprocForDataObjOpen`, counts an access to the
+      file. `compress` leaves files smaller than 'min_size' uncompressed, and leaves hot files uncompressed so that
+      they are not decompressed again on every open. `sweep` compresses files once they are cold.
+    - The count of a file decays by half every 'half_life_seconds'. A file is hot while its count is at least
+      'hot_accesses'. See `_access_score`.
+    - Like the index from `set_index`, access counts are only complete if all opens of files within `iplant`
+      run `iplant.py` with the same `access_file`, e.g. from the rules of one server.
+
+    """
+    policy = None
+    if policy_file is not None:
+        policy = load_policy(policy_file=policy_file)
+        if policy['access_file'] is None:
+            policy['access_file'] = access_file
+        if policy['access_file'] is None:
+            raise ValueError(("Tiering policy requires 'access_file' or `tmp_iplant`:\n" +
+                              "policy_file = {pf}").format(pf=policy_file))
+        _access_connect(access_file=policy['access_file']).close()
+        logger.debug("set_policy: policy = {policy}".format(policy=policy))
+    _policy['policy'] = policy
+    return None
+
+
+def _access_connect(access_file):
+    """Semi-private method to open the access counts of data objects, creating them if needed.
+
+    Parameters
+    ----------
+    access_file : string
+        Local path to SQLite database of access counts.
+
+    Returns
+    -------
+    conn : sqlite3.Connection
+        Connection in autocommit mode. Transactions are begun explicitly. Use from one thread only.
+
+    See Also
+    --------
+    CALLS : {}
+    CALLED_BY : {set_policy, _access_record, _access_scores}
+    RELATED : {_index_connect}
+
+    Notes
+    -----
+    - One row per data object. `score` is the count of accesses decayed to the time of `last_access`.
+      `accesses` is the count without decay.
+
+    """
+    access_dirname = os.path.dirname(access_file)
+    if not os.path.exists(access_dirname):
+        os.makedirs(access_dirname)
+    conn = sqlite3.connect(access_file, timeout=60.0, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(("CREATE TABLE IF NOT EXISTS accesses (" +
+                  "ipath TEXT PRIMARY KEY, " +
+                  "score REAL NOT NULL, " +
+                  "last_access REAL NOT NULL, " +
+                  "accesses INTEGER NOT NULL)"))
+    return conn
+
+
+def _access_score(score, last_access, half_life_seconds, now):
+    """Semi-private method to decay the access count `score` from the time `last_access` to the time `now`."""
+    return score * 0.5**(max(0.0, now - last_access)/half_life_seconds)
+
+
+def _access_record(ipath):
+    """Semi-private method to count an access to a data object under the policy from `set_policy`.
+
+    Returns
+    -------
+    score : {None, float}
+        Decayed access count including this access. ``None`` if no policy is set.
+
+    See Also
+    --------
+    CALLS : {_access_connect, _access_score}
+    CALLED_BY : {decompress}
+    RELATED : {_access_scores}
+
+    """
+    policy = _policy['policy']
+    if policy is None:
+        return None
+    now = time.time()
+    conn = _access_connect(access_file=policy['access_file'])
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("SELECT score, last_access, accesses FROM accesses WHERE ipath = ?", (ipath, )).fetchone()
+        (score, accesses) = (1.0, 1)
+        if row is not None:
+            score += _access_score(score=row[0], last_access=row[1], half_life_seconds=policy['half_life_seconds'], now=now)
+            accesses += row[2]
+        conn.execute("INSERT OR REPLACE INTO accesses (ipath, score, last_access, accesses) VALUES (?, ?, ?, ?)",
+                     (ipath, score, now, accesses))
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+    logger.debug("_access_record: ipath = {ipath}; score = {score:.3f}; accesses = {acc}".format(ipath=ipath, score=score, acc=accesses))
+    return score
+
+
+def _access_scores(icollection=None, ipath=None):
+    """Semi-private method to read decayed access counts under the policy from `set_policy`.
+
+    Parameters
+    ----------
+    icollection : {None}, string, optional
+        iRODS path to collection. Data objects within it and its subcollections are read.
+    ipath : {None}, string, optional
+        iRODS path to one data object, if `icollection` is ``None``.
+
+    Returns
+    -------
+    scores : dict
+        Access count decayed to now by iRODS path. Data objects that were never accessed are not included.
+
+    See Also
+    --------
+    CALLS : {_access_connect, _access_score, _index_prefix_where}
+    CALLED_BY : {compress, sweep}
+    RELATED : {_access_record}
+
+    """
+    policy = _policy['policy']
+    if policy is None:
+        return {}
+    if icollection is not None:
+        (where, params) = _index_prefix_where(icollection=icollection)
+    else:
+        (where, params) = ("ipath = ?", (ipath, ))
+    now = time.time()
+    conn = _access_connect(access_file=policy['access_file'])
+    try:
+        rows = conn.execute("SELECT ipath, score, last_access FROM accesses WHERE {where}".format(where=where), params).fetchall()
+    finally:
+        conn.close()
+    return dict((row[0], _access_score(score=row[1], last_access=row[2], half_life_seconds=policy['half_life_seconds'], now=now))
+                for row in rows)
+
+
+def _policy_reason(policy, size, score):
+    """Semi-private method to decide whether a file stays uncompressed under a policy from `load_policy`.
+
+    Returns
+    -------
+    reason : {None, 'small', 'hot'}
+        ``None`` if the file is compressed. 'small' if `size` is less than 'min_size'. 'hot' if the decayed access
+        count `score` is at least 'hot_accesses'.
+
+    """
+    if (size is not None) and (size < policy['min_size']):
+        return 'small'
+    if (score is not None) and (score >= policy['hot_accesses']):
+        return 'hot'
+    return None
+
+
+# Define attributes of a payload in the deduplication store that are copied to each data object that shares it.
+# See `compress`.
+DEDUP_ATTRS = ['COMPRESSION_METHOD', 'UNCOMPRESSED_SIZE', 'UNCOMPRESSED_HASH', 'HASH_METHOD', 'COMPRESSED_SIZE'] + SIDECAR_ATTRS
+
+
+def _dedup_lock(tmp_iplant, idedup_iplant, uncompressed_hash, lock_timeout=LOCK_TIMEOUT):
+    """Semi-private method to lock the payloads of one uncompressed file in the deduplication store.
+
+    Returns
+    -------
+    lock : _ObjectLock
+        Lock with action 'dedup', so that no stats are shared. Held while a payload of `uncompressed_hash` is looked up
+        and stored, and while its 'REFCOUNT' changes.
+
+    """
+    return _ObjectLock(tmp_iplant=tmp_iplant, ipath=idedup_iplant.rstrip('/')+'/'+uncompressed_hash, action='dedup',
+                       lock_timeout=lock_timeout)
+
+
+def _dedup_find(idedup_iplant, hash_method, uncompressed_hash, uncompressed_size, compression_method='auto'):
+    """Semi-private method to look up the compressed payload of an uncompressed file in the deduplication store.
+
+    Parameters
+    ----------
+    idedup_iplant : string
+        iRODS path to the deduplication store.
+    hash_method, uncompressed_hash, uncompressed_size :
+        'HASH_METHOD', 'UNCOMPRESSED_HASH', and 'UNCOMPRESSED_SIZE' of the file.
+    compression_method : {'auto'}, string, optional
+        Payloads must have this codec and level. 'auto' accepts any codec.
+
+    Returns
+    -------
+    ipayload : {None}, string
+        iRODS path to the payload, or ``None`` if the store has none for the file.
+    payload_imeta_dict : {None}, dict
+        Metadata of the payload from `_imeta_to_dict`.
+
+    See Also
+    --------
+    CALLS : {_get_transport, _parse_compression_method}
+    CALLED_BY : {_compress_dedup}
+    RELATED : {_dedup_link}
+
+    Notes
+    -----
+    - Payloads are listed by 'UNCOMPRESSED_HASH' with one general query. A payload whose size differs from its
+      'COMPRESSED_SIZE' is not used.
+
+    """
+    transport = _get_transport()
+    if compression_method.lower() != 'auto':
+        compression_method = _parse_compression_method(compression_method)
+    for (ipayload, size) in transport.list_data_objects(icollection=idedup_iplant, attr_name='UNCOMPRESSED_HASH',
+                                                        attr_value=uncompressed_hash):
+        logger.debug("_dedup_find: transport.meta_get({ip})".format(ip=ipayload))
+        payload_imeta_dict = transport.meta_get(ipayload)
+        values = dict((attr, payload_imeta_dict.get(attr, {}).get('value')) for attr in DEDUP_ATTRS)
+        if ((values['HASH_METHOD'] != hash_method) or (values['UNCOMPRESSED_SIZE'] != uncompressed_size) or
+            (values['COMPRESSED_SIZE'] != size)):
+            logger.debug("_dedup_find: Payload does not match: {ip}".format(ip=ipayload))
+            continue
+        try:
+            payload_compression_method = _parse_compression_method(str(values['COMPRESSION_METHOD']))
+        except ValueError:
+            logger.debug("_dedup_find: Payload 'COMPRESSION_METHOD' not valid: {ip}".format(ip=ipayload))
+            continue
+        if (compression_method != 'auto') and (payload_compression_method != compression_method):
+            logger.debug("_dedup_find: Payload has another compression method: {ip}".format(ip=ipayload))
+            continue
+        return (ipayload, payload_imeta_dict)
+    return (None, None)
+
+
+def _dedup_refcount(ipayload, increment):
+    """Semi-private method to add `increment` to 'REFCOUNT' of a payload while `_dedup_lock` is held. Returns the new count."""
+    transport = _get_transport()
+    refcount = transport.meta_get(ipayload).get('REFCOUNT', {}).get('value', 0) + increment
+    transport.meta_set(ipayload, [['REFCOUNT', str(refcount), 'COUNT']])
+    return refcount
+
+
+def _dedup_link(ipayload, ipath):
+    """Semi-private method to register `ipath` to the physical file of a payload while `_dedup_lock` is held.
+
+    Returns
+    -------
+    refcount : int
+        'REFCOUNT' of the payload including `ipath`.
+
+    See Also
+    --------
+    CALLS : {_get_transport, _dedup_refcount}
+    CALLED_BY : {_compress_publish}
+    RELATED : {_dedup_release}
+
+    Notes
+    -----
+    - 'REFCOUNT' is incremented before `ipath` is registered, so a failure leaves the count too high and the payload
+      is kept rather than removed while it is shared.
+
+    """
+    refcount = _dedup_refcount(ipayload=ipayload, increment=1)
+    logger.debug("_dedup_link: transport.link({src}, {dst})".format(src=ipayload, dst=ipath))
+    _get_transport().link(ipayload, ipath)
+    return refcount
+
+
+def _dedup_release(ipath, imeta_dict, tmp_iplant, lock_timeout=LOCK_TIMEOUT):
+    """Semi-private method to remove a data object that shares a payload of the deduplication store.
+
+    Parameters
+    ----------
+    ipath : string
+        iRODS path to data object with 'DEDUP_FILE', e.g. a compressed parent kept by `decompress`.
+    imeta_dict : dict
+        Metadata of `ipath` from `_imeta_to_dict`.
+    tmp_iplant : string
+        Scratch volumes for `_dedup_lock`.
+    lock_timeout : {LOCK_TIMEOUT}, float, optional
+        See `_ObjectLock`.
+
+    Returns
+    -------
+    refcount : int
+        'REFCOUNT' of the payload without `ipath`. The payload and its sidecars are removed once it is 0.
+
+    See Also
+    --------
+    CALLS : {_get_transport, _dedup_lock, _dedup_refcount}
+    CALLED_BY : {_remove_parent, release}
+    RELATED : {_dedup_link}
+
+    Notes
+    -----
+    - `ipath` is unregistered, not removed, so the physical file of the payload is kept for the other data objects.
+
+    """
+    transport = _get_transport()
+    ipayload = str(imeta_dict['DEDUP_FILE']['value'])
+    with _dedup_lock(tmp_iplant=tmp_iplant, idedup_iplant=os.path.dirname(ipayload),
+                     uncompressed_hash=str(imeta_dict['UNCOMPRESSED_HASH']['value']), lock_timeout=lock_timeout):
+        logger.debug("_dedup_release: transport.unlink({ipath})".format(ipath=ipath))
+        transport.unlink(ipath)
+        refcount = _dedup_refcount(ipayload=ipayload, increment=-1)
+        logger.debug("_dedup_release: refcount = {rc} for {ip}".format(rc=refcount, ip=ipayload))
+        if refcount <= 0:
+            payload_imeta_dict = transport.meta_get(ipayload)
+            isidecars = [payload_imeta_dict[attr]['value'] for attr in SIDECAR_ATTRS if attr in payload_imeta_dict]
+            for ipayload_file in [ipayload]+isidecars:
+                logger.debug("_dedup_release: transport.remove({ip})".format(ip=ipayload_file))
+                transport.remove(ipayload_file)
+    return refcount
+
+
+def _load_parent(ipath, imeta_dict):
+    """Semi-private method to read the metadata of the compressed parent kept by `decompress` and check that it is
+    a compressed version of the file that was decompressed.
+
+    Parameters
+    ----------
+    ipath : string
+        iRODS path to a file decompressed by `decompress`.
+    imeta_dict : dict
+        Metadata of `ipath` from `_imeta_to_dict`.
+
+    Returns
+    -------
+    iparent : {None}, string
+        iRODS path to the compressed parent, i.e. 'PARENT_FILE'. ``None`` if the parent is missing, changed,
+        or was not made by `decompress`.
+    parent_imeta_dict : {None}, dict
+        Metadata of the parent from `_imeta_to_dict`. ``None`` if `iparent` is ``None``.
+
+    See Also
+    --------
+    CALLS : {_get_transport, _parse_compression_method}
+    CALLED_BY : {_verify_parent, _append_parent}
+    RELATED : {decompress}
+
+    Notes
+    -----
+    - The parent keeps the metadata it had before `decompress` since `imv` moves metadata with the data object.
+      'COMPRESSED_SIZE' of the parent must match its size, so parents compressed before 'COMPRESSED_SIZE'
+      was recorded are not reused.
+
+    """
+    if any(attr not in imeta_dict for attr in ['PARENT_FILE', 'UNCOMPRESSED_SIZE', 'UNCOMPRESSED_HASH', 'HASH_METHOD']):
+        logger.debug("_load_parent: No parent recorded in imeta of {ipath}".format(ipath=ipath))
+        return (None, None)
+    iparent = imeta_dict['PARENT_FILE']['value']
+    transport = _get_transport()
+    if not transport.exists(iparent):
+        logger.debug("_load_parent: Parent does not exist: {ip}".format(ip=iparent))
+        return (None, None)
+    logger.debug("_load_parent: transport.meta_get({ip})".format(ip=iparent))
+    parent_imeta_dict = transport.meta_get(iparent)
+    # Parent must be a compressed version of the same uncompressed file.
+    checks = [('IS_COMPRESSED', True),
+              ('UNCOMPRESSED_SIZE', imeta_dict['UNCOMPRESSED_SIZE']['value']),
+              ('UNCOMPRESSED_HASH', imeta_dict['UNCOMPRESSED_HASH']['value']),
+              ('HASH_METHOD', imeta_dict['HASH_METHOD']['value'])]
+    for (attr, value) in checks:
+        parent_value = parent_imeta_dict.get(attr, {}).get('value')
+        if parent_value != value:
+            logger.debug(("_load_parent: Parent {attr} does not match.\n" +
+                          "{attr} from parent = {pv}\n" +
+                          "{attr} from ipath  = {v}").format(attr=attr, pv=parent_value, v=value))
+            return (None, None)
+    try:
+        _parse_compression_method(str(parent_imeta_dict.get('COMPRESSION_METHOD', {}).get('value')))
+    except ValueError:
+        logger.debug("_load_parent: Parent 'COMPRESSION_METHOD' not valid.")
+        return (None, None)
+    compressed_size_imeta = parent_imeta_dict.get('COMPRESSED_SIZE', {}).get('value')
+    parent_size = transport.size(iparent)
+    if (compressed_size_imeta is None) or (parent_size != compressed_size_imeta):
+        logger.debug(("_load_parent: Parent size does not match 'COMPRESSED_SIZE'.\n" +
+                      "size from catalog          = {ps}\n" +
+                      "COMPRESSED_SIZE from imeta = {cs}").format(ps=parent_size, cs=compressed_size_imeta))
+        return (None, None)
+    return (iparent, parent_imeta_dict)
+
+
+def _verify_parent(ipath, imeta_dict, size):
+    """Semi-private method to check whether a decompressed file is unchanged from its compressed parent.
+
+    Parameters
+    ----------
+    ipath : string
+        iRODS path to a file decompressed by `decompress`.
+    imeta_dict : dict
+        Metadata of `ipath` from `_imeta_to_dict`.
+    size : int
+        Size of `ipath` in bytes from the catalog.
+
+    Returns
+    -------
+    iparent : {None}, string
+        iRODS path to the compressed parent, i.e. 'PARENT_FILE', if it may replace `ipath` without compressing.
+        ``None`` if the size of `ipath` changed, or if the parent is missing, changed, or was not made by `decompress`.
+    compressed_size : {None}, int
+        'COMPRESSED_SIZE' of the parent. ``None`` if the parent cannot replace `ipath`.
+
+    See Also
+    --------
+    CALLS : {_load_parent}
+    CALLED_BY : {compress}
+    RELATED : {decompress, _append_parent, _reinstate_parent}
+
+    Notes
+    -----
+    - Only metadata of `ipath` and the parent and sizes from the catalog are checked. `ipath` is not read, since
+      reading it would call the rules for opening it, which would compress it. Its hash is checked by
+      `_reinstate_parent` once it is moved to `itmp_iplant`. See `_load_parent`.
+
+    """
+    iparent = None
+    compressed_size = None
+    (iparent_imeta, parent_imeta_dict) = _load_parent(ipath=ipath, imeta_dict=imeta_dict)
+    if iparent_imeta is None:
+        return (iparent, compressed_size)
+    compressed_size_imeta = parent_imeta_dict['COMPRESSED_SIZE']['value']
+    # File must be unchanged since it was decompressed.
+    if size != imeta_dict['UNCOMPRESSED_SIZE']['value']:
+        logger.debug(("_verify_parent: File size does not match 'UNCOMPRESSED_SIZE'. File was modified.\n" +
+                      "size from catalog           = {size}\n" +
+                      "UNCOMPRESSED_SIZE from imeta = {usize}").format(size=size, usize=imeta_dict['UNCOMPRESSED_SIZE']['value']))
+        return (iparent, compressed_size)
+    iparent = iparent_imeta
+    compressed_size = compressed_size_imeta
+    logger.debug("_verify_parent: File size is unchanged from parent {ip}".format(ip=iparent))
+    return (iparent, compressed_size)
+
+
+def _append_parent(ipath, imeta_dict, size, compression_method='GZIP', hash_method='SHA1'):
+    """Semi-private method to check whether a modified file may be compressed by appending to its compressed parent.
+
+    Parameters
+    ----------
+    ipath : string
+        iRODS path to a file decompressed by `decompress` and modified since, e.g. by `iput -f` of a file that grew.
+    imeta_dict : dict
+        Metadata of `ipath` from `_imeta_to_dict`.
+    size : int
+        Size of `ipath` in bytes.
+    compression_method : {'GZIP', 'auto', 'NAME', 'NAME:LEVEL'}, string, optional
+        Compression method requested for `ipath`. See `compress`.
+    hash_method : {'SHA1'}, string, optional
+        Hash method requested for `ipath`, normalized as by `compress`.
+
+    Returns
+    -------
+    iparent : {None}, string
+        iRODS path to the compressed parent, i.e. 'PARENT_FILE', whose data may be the start of `ipath`.
+        ``None`` if `ipath` did not grow or the parent cannot be appended to.
+    parent_imeta_dict : {None}, dict
+        Metadata of the parent from `_imeta_to_dict`. ``None`` if `iparent` is ``None``.
+
+    See Also
+    --------
+    CALLS : {_load_parent, _parse_compression_method}
+    CALLED_BY : {compress}
+    RELATED : {_verify_parent, _compress_append}
+
+    Notes
+    -----
+    - Only metadata and sizes are checked. Whether the parent's data are the start of `ipath` is checked by
+      `_compress_append` while it reads `ipath`.
+    - The codec of the parent must be appendable (see `register_codec`), and must be the codec of `compression_method`
+      unless it is 'auto'. Appended data are compressed with the parent's 'COMPRESSION_METHOD'.
+    - `hash_method` must be the parent's 'HASH_METHOD' so that the hash of the start of `ipath` can be compared with
+      the parent's 'UNCOMPRESSED_HASH' and extended to the hash of all of `ipath`.
+
+    """
+    if (size is None) or (size <= imeta_dict.get('UNCOMPRESSED_SIZE', {}).get('value', size)):
+        logger.debug("_append_parent: File did not grow: {ipath}".format(ipath=ipath))
+        return (None, None)
+    if imeta_dict.get('HASH_METHOD', {}).get('value') != hash_method:
+        logger.debug("_append_parent: 'HASH_METHOD' differs from hash_method = {hm}".format(hm=hash_method))
+        return (None, None)
+    (iparent, parent_imeta_dict) = _load_parent(ipath=ipath, imeta_dict=imeta_dict)
+    if iparent is None:
+        return (None, None)
+    (codec_name, _) = _parse_compression_method(str(parent_imeta_dict['COMPRESSION_METHOD']['value']))
+    if not _codecs[codec_name]['appendable']:
+        logger.debug("_append_parent: Codec of parent is not appendable: {cn}".format(cn=codec_name))
+        return (None, None)
+    if (compression_method.lower() != 'auto') and (_parse_compression_method(compression_method)[0] != codec_name):
+        logger.debug("_append_parent: Codec of parent differs from compression_method = {cm}".format(cm=compression_method))
+        return (None, None)
+    return (iparent, parent_imeta_dict)
+
+
+def _compress_append(ipath, iparent, parent_imeta_dict, fsrc, open_dst, workers=None, fname='', mtime=0,
+                     timed=False, blocksize=2**20):
+    """Semi-private method to compress a file that grew by copying its compressed parent and compressing only the
+    data appended to it.
+
+    Parameters
+    ----------
+    ipath : string
+        iRODS path to the file. Used for metrics.
+    iparent, parent_imeta_dict :
+        Compressed parent and its metadata from `_append_parent`.
+    fsrc : file
+        Readable file object of the uncompressed file from its start. Not closed.
+    open_dst : function
+        Function called without arguments to open a writable file object for the compressed file. It is called only
+        if the start of the file is unchanged, and the file object is closed before returning.
+    workers : {None}, int, optional
+        Number of worker threads for the codec and a tree hash. Default: number of CPUs.
+    fname, mtime : optional
+        Original file name and modification time for the appended member. See `register_codec`.
+    timed : {False, True}, bool, optional
+        Time hashing, which is excluded from the spans of reading and compressing. See `_HashingReader`.
+    blocksize : {2**20}, int, optional
+        Number of bytes to read at a time.
+
+    Returns
+    -------
+    result : {None, tuple}
+        (reader, writer, block_index) as from compressing the whole file: `reader` is the `_HashingReader` of the whole
+        file and `writer` the `_CountingWriter` of the compressed file. ``None`` if the start of the file differs from
+        the parent, in which case nothing was written.
+
+    See Also
+    --------
+    CALLS : {_get_transport, _parse_compression_method, _HashingReader, _CountingWriter}
+    CALLED_BY : {_compress_encode}
+    RELATED : {_append_parent}
+
+    Notes
+    -----
+    - The first 'UNCOMPRESSED_SIZE' bytes of the file are hashed with the parent's 'HASH_METHOD' and compared with its
+      'UNCOMPRESSED_HASH'. The same hash object then hashes the rest of the file, so the file is read once and
+      'UNCOMPRESSED_HASH' of the whole file is extended from that of the parent.
+    - The compressed file is the parent's data followed by the appended data compressed as a new member (or stream),
+      which the parent's codec decompresses as one file. Only the appended data are compressed; the parent's data
+      are copied through this process.
+
+    """
+    (codec_name, level) = _parse_compression_method(str(parent_imeta_dict['COMPRESSION_METHOD']['value']))
+    codec = _codecs[codec_name]
+    prefix_size = parent_imeta_dict['UNCOMPRESSED_SIZE']['value']
+    reader = _HashingReader(fobj=fsrc, algorithm=str(parent_imeta_dict['HASH_METHOD']['value']), workers=workers, timed=timed)
+    with _span('compress', 'verify_prefix', ipath, nbytes=prefix_size) as span:
+        while reader.size < prefix_size:
+            if len(reader.read(min(blocksize, prefix_size-reader.size))) == 0:
+                break
+        # NOTE: `hexdigest` does not finalize the hash, so the rest of the file is hashed by the same object.
+        prefix_hash = reader.hexdigest() if (reader.size == prefix_size) else None
+        span.exclude_seconds = reader.hash_seconds
+    if prefix_hash != parent_imeta_dict['UNCOMPRESSED_HASH']['value']:
+        logger.debug(("_compress_append: Start of file does not match parent. File was changed within its first {ps} bytes.\n" +
+                      "hash of start of file        = {phash}\n" +
+                      "UNCOMPRESSED_HASH of parent  = {uhash}").format(ps=prefix_size, phash=prefix_hash,
+                                                                      uhash=parent_imeta_dict['UNCOMPRESSED_HASH']['value']))
+        return None
+    logger.debug("_compress_append: Start of file matches parent {ip}".format(ip=iparent))
+    transport = _get_transport()
+    fdst = open_dst()
+    try:
+        writer = _CountingWriter(fobj=fdst)
+        logger.debug("_compress_append: transport.open_read({ip})".format(ip=iparent))
+        with _span('compress', 'iget', ipath, nbytes=parent_imeta_dict['COMPRESSED_SIZE']['value']):
+            fparent = transport.open_read(iparent)
+            try:
+                shutil.copyfileobj(fparent, writer, blocksize)
+            finally:
+                fparent.close()
+        prefix_hash_seconds = reader.hash_seconds
+        with _span('compress', 'codec', ipath) as span:
+            block_index = codec['compress'](reader, writer, level, workers, fname, mtime)
+            (span.nbytes, span.exclude_seconds) = (reader.size-prefix_size, reader.hash_seconds-prefix_hash_seconds)
+    finally:
+        fdst.close()
+    logger.debug("_compress_append: Appended {n} bytes as {cs} compressed bytes.".format(n=reader.size-prefix_size,
+                                                                                        cs=writer.size-parent_imeta_dict['COMPRESSED_SIZE']['value']))
+    # NOTE: Hashing is recorded as its own stage.
+    _record_span(action='compress', stage='hash', ipath=ipath, seconds=reader.hash_seconds, nbytes=reader.size)
+    return (reader, writer, block_index)
+
+
+def _reinstate_parent(ipath, iparent, imeta_dict, itmp_iplant, tmp_iplant, delete_itmp_files=False, kwargs=None):
+    """Semi-private method to replace a decompressed file with its compressed parent from `_verify_parent` if the file
+    is unchanged.
+
+    Parameters
+    ----------
+    ipath : string
+        iRODS path to the decompressed file.
+    iparent : string
+        iRODS path to the compressed parent from `_verify_parent`.
+    imeta_dict : dict
+        Metadata of `ipath` from `_imeta_to_dict`.
+    itmp_iplant : string
+        iRODS path to temporary directory for moving files.
+    tmp_iplant : string
+        Scratch volumes for the journal of `ipath`. See `_Journal`.
+    delete_itmp_files : {False, True}, bool, optional
+        Delete the decompressed file after it is moved to `itmp_iplant`.
+    kwargs : {None}, dict, optional
+        Arguments of `compress` other than `ipath`, journaled so that `recover` can compress the file again.
+
+    Returns
+    -------
+    reinstated : bool
+        ``True`` if the parent replaced `ipath`. ``False`` if `ipath` was modified, in which case it is moved back.
+
+    See Also
+    --------
+    CALLS : {_get_transport, _hash_data_object, _Journal}
+    CALLED_BY : {compress}
+    RELATED : {_verify_parent, _resume_reinstate}
+
+    Notes
+    -----
+    - `ipath` is moved to `itmp_iplant` before it is hashed, as by `compress`, so that reading it does not call
+      the rules for opening files within `iplant`. Reading it once is cheaper than compressing it, writing the
+      compressed file, and copying it within iRODS.
+    - Only moves are used, so no data is copied. The parent keeps its metadata from `compress`;
+      only 'PARENT_FILE' is updated.
+    - Each completed stage ('begin', 'move', 'parent') is journaled as 'reinstate' in `tmp_iplant`, and the journal
+      is removed once the metadata are set or the file is moved back. If the call does not finish, e.g. after a crash
+      or if moving the file back fails, `recover` or the next call for `ipath` sets the metadata of the reinstated
+      parent or moves the file back to `ipath`. See `_resume_reinstate`.
+
+    """
+    timestamp = datetime.datetime.now().isoformat().replace('-', '').replace(':', '')
+    itmp_path = os.path.join(itmp_iplant, timestamp+'_'+os.path.basename(ipath))
+    transport = _get_transport()
+    journal = _Journal(tmp_iplant=tmp_iplant, ipath=ipath, action='reinstate', kwargs=kwargs)
+    journal.stage('begin', itmp_path=itmp_path, iparent=iparent)
+    logger.debug("_reinstate_parent: transport.move({src}, {dst})".format(src=ipath, dst=itmp_path))
+    transport.move(ipath, itmp_path)
+    journal.stage('move')
+    # File must be unchanged since it was decompressed.
+    logger.debug("_reinstate_parent: _hash_data_object(ipath={itmp_path}, algorithm={hm})".format(itmp_path=itmp_path,
+                                                                                                  hm=imeta_dict['HASH_METHOD']['value']))
+    try:
+        (size, uncompressed_hash) = _hash_data_object(ipath=itmp_path, algorithm=imeta_dict['HASH_METHOD']['value'])
+    except Exception:
+        logger.error("_reinstate_parent: Could not hash file. Moving file back to {ipath}".format(ipath=ipath))
+        transport.move(itmp_path, ipath)
+        journal.remove()
+        raise
+    if (size != imeta_dict['UNCOMPRESSED_SIZE']['value']) or (uncompressed_hash != imeta_dict['UNCOMPRESSED_HASH']['value']):
+        logger.debug(("_reinstate_parent: File hash does not match 'UNCOMPRESSED_HASH'. File was modified.\n" +
+                      "hash from file               = {uhash}\n" +
+                      "UNCOMPRESSED_HASH from imeta = {uhash_im}").format(uhash=uncompressed_hash,
+                                                                         uhash_im=imeta_dict['UNCOMPRESSED_HASH']['value']))
+        logger.debug("_reinstate_parent: transport.move({src}, {dst})".format(src=itmp_path, dst=ipath))
+        transport.move(itmp_path, ipath)
+        journal.remove()
+        return False
+    logger.debug("_reinstate_parent: transport.move({src}, {dst})".format(src=iparent, dst=ipath))
+    try:
+        transport.move(iparent, ipath)
+    except Exception:
+        logger.error("_reinstate_parent: Could not move parent. Moving file back to {ipath}".format(ipath=ipath))
+        transport.move(itmp_path, ipath)
+        journal.remove()
+        raise
+    journal.stage('parent')
+    imeta_triplets = [['PARENT_FILE', itmp_path, 'NONE']]
+    logger.debug("_reinstate_parent: transport.meta_set(ipath={ipath}, imeta_triplets={it})".format(ipath=ipath, it=imeta_triplets))
+    transport.meta_set(ipath, imeta_triplets)
+    journal.remove()
+    if delete_itmp_files:
+        logger.debug("_reinstate_parent: transport.remove({itmp})".format(itmp=itmp_path))
+        transport.remove(itmp_path)
+    return True
+
+
+def _remove_parent(iparent, parent_imeta_dict, itmp_iplant, tmp_iplant, lock_timeout=LOCK_TIMEOUT):
+    """Semi-private method to remove a compressed parent kept by `decompress` and its sidecars.
+
+    Parameters
+    ----------
+    iparent : string
+        iRODS path to the compressed parent in `itmp_iplant`.
+    parent_imeta_dict : dict
+        Metadata of `iparent` from `_imeta_to_dict`.
+    itmp_iplant : string
+        iRODS path to temporary directory. Only sidecars within it are removed.
+    tmp_iplant : string
+        Scratch volumes for `_dedup_lock`.
+    lock_timeout : {LOCK_TIMEOUT}, float, optional
+        See `_ObjectLock`.
+
+    Returns
+    -------
+    None
+
+    See Also
+    --------
+    CALLS : {_get_transport, _dedup_release}
+    CALLED_BY : {compress, decompress, _resume_decompress, prune_parents}
+    RELATED : {_reinstate_parent}
+
+    Notes
+    -----
+    - A parent that shares a payload of the deduplication store is unregistered so that the payload is kept
+      for the other data objects. Sidecars of the payload are not within `itmp_iplant`, so they are kept too.
+    - Files that no longer exist are skipped.
+
+    """
+    transport = _get_transport()
+    itmps = []
+    if 'DEDUP_FILE' in parent_imeta_dict:
+        logger.debug("_remove_parent: _dedup_release(ipath={ip})".format(ip=iparent))
+        _dedup_release(ipath=iparent, imeta_dict=parent_imeta_dict, tmp_iplant=tmp_iplant, lock_timeout=lock_timeout)
+    else:
+        itmps.append(iparent)
+    for attr in SIDECAR_ATTRS:
+        isidecar = parent_imeta_dict.get(attr, {}).get('value')
+        if (isidecar is not None) and (os.path.dirname(str(isidecar)) == itmp_iplant):
+            itmps.append(str(isidecar))
+    for itmp in itmps:
+        if transport.exists(itmp):
+            logger.debug("_remove_parent: transport.remove({itmp})".format(itmp=itmp))
+            transport.remove(itmp)
+    return None
+
+
+def _compressed_triplets(compression_method, uncompressed_size, uncompressed_hash, hash_method, compressed_size, iparent,
+                         isidecars=()):
+    """Semi-private method to make the metadata that `compress` sets on a compressed file.
+
+    Parameters
+    ----------
+    compression_method : string
+        'NAME:LEVEL' of a registered codec.
+    uncompressed_size, uncompressed_hash, hash_method, compressed_size :
+        'UNCOMPRESSED_SIZE', 'UNCOMPRESSED_HASH', 'HASH_METHOD', and 'COMPRESSED_SIZE'.
+    iparent : string
+        iRODS path to the uncompressed file in `itmp_iplant`, recorded as 'PARENT_FILE'.
+    isidecars : {()}, list, optional
+        (attribute name, iRODS path) of sidecars, e.g. ('BLOCK_INDEX', path).
+
+    Returns
+    -------
+    imeta_triplets : list
+        [attribute name, value, units] as strings.
+
+    See Also
+    --------
+    CALLS : {}
+    CALLED_BY : {_compress_publish, _resume_compress}
+    RELATED : {_decompressed_triplets}
+
+    """
+    extension = _codecs[_parse_compression_method(compression_method)[0]]['extension']
+    comments = ("'This file is registered under the extension .fastq but is stored internally to iRODS with compression as .fastq{ext}. " +
+                "This file will be decompressed upon retrieval (e.g. with iget).'").format(ext=extension)
+    imeta_triplets = [('IS_COMPRESSED', 'TRUE', 'BOOL'),
+                      ('COMPRESSION_METHOD', compression_method, 'NONE'),
+                      ('UNCOMPRESSED_SIZE', uncompressed_size, 'BYTES'),
+                      ('UNCOMPRESSED_HASH', uncompressed_hash, 'NONE'),
+                      ('HASH_METHOD', hash_method, 'NONE'),
+                      ('COMPRESSED_SIZE', compressed_size, 'BYTES'),
+                      ('PARENT_FILE', iparent, 'NONE'),
+                      ('COMMENTS', comments, 'NONE')]
+    for (attr, isidecar) in isidecars:
+        imeta_triplets.append((attr, isidecar, 'NONE'))
+    return [[str(elt) for elt in triplet] for triplet in imeta_triplets]
+
+
+def _decompressed_triplets(uncompressed_size, uncompressed_hash, hash_method, iparent, isidecars=()):
+    """Semi-private method to make the metadata that `decompress` sets on a decompressed file.
+
+    Parameters
+    ----------
+    uncompressed_size, uncompressed_hash, hash_method :
+        'UNCOMPRESSED_SIZE', 'UNCOMPRESSED_HASH', and 'HASH_METHOD'.
+    iparent : string
+        iRODS path to the compressed parent in `itmp_iplant`, recorded as 'PARENT_FILE'.
+    isidecars : {()}, list, optional
+        (attribute name, iRODS path) of the sidecars of the parent, so that `compress` can delete them
+        if the parent is out of date.
+
+    Returns
+    -------
+    imeta_triplets : list
+        [attribute name, value, units] as strings.
+
+    See Also
+    --------
+    CALLS : {}
+    CALLED_BY : {decompress, _resume_decompress}
+    RELATED : {_compressed_triplets}
+
+    """
+    comments = "'This file is registered under the extension .fastq and is stored internally to iRODS without compression as .fastq.'"
+    imeta_triplets = [('IS_COMPRESSED', 'FALSE', 'BOOL'),
+                      ('COMPRESSION_METHOD', 'NONE', 'NONE'),
+                      ('UNCOMPRESSED_SIZE', uncompressed_size, 'BYTES'),
+                      ('UNCOMPRESSED_HASH', uncompressed_hash, 'NONE'),
+                      ('HASH_METHOD', hash_method, 'NONE'),
+                      ('PARENT_FILE', iparent, 'NONE'),
+                      ('COMMENTS', comments, 'NONE')]
+    for (attr, isidecar) in isidecars:
+        imeta_triplets.append((attr, isidecar, 'NONE'))
+    return [[str(elt) for elt in triplet] for triplet in imeta_triplets]
+
+
+def _compress_encode(ipath, itmp_path, tmp_path, tmpname, timestamp, journal, imeta_dict, stream=False,
+                     compression_method='GZIP', workers=None, auto_candidates=None, auto_sample_size=2**22, cpu_budget=60.0,
+                     cache_dir=None, cache_bytes=0, hash_method='SHA1', idedup_iplant=None, iparent_append=None,
+                     parent_append_imeta_dict=None):
+    """Semi-private method to compress a file that `compress` moved to `itmp_iplant` and put the compressed file
+    beside it, at `ipath`, or in the deduplication store.
+
+    Parameters
+    ----------
+    ipath : string
+        iRODS path to the file. The compressed file is moved here unless `idedup_iplant` is given.
+    itmp_path, tmp_path : string
+        iRODS and local paths to the uncompressed file. `tmp_path` is not used with `stream`.
+    tmpname, timestamp : string
+        Base name of the temporary files and the timestamp in it.
+    journal : _Journal
+        Journal of the call. Stages 'encode', 'put', and 'publish' are recorded.
+    imeta_dict : dict
+        Metadata of `ipath` before it was moved.
+    stream, compression_method, workers, auto_candidates, auto_sample_size, cpu_budget, cache_dir, cache_bytes,
+    hash_method, idedup_iplant :
+        See `compress`. `hash_method` is normalized.
+    iparent_append, parent_append_imeta_dict : {None}, optional
+        Compressed parent to append to and its metadata from `_append_parent`.
+
+    Returns
+    -------
+    encoded : dict
+        'result', 'compressed' or 'appended'; 'compression_method' as 'NAME:LEVEL'; 'uncompressed_size',
+        'uncompressed_hash', 'compressed_size'; 'isidecars', an OrderedDict of attribute name to iRODS path of the
+        sidecars; 'ipayload', iRODS path to the new payload in `idedup_iplant` or ``None``; 'itmp_path_gz' and
+        'tmp_path_gz', paths to the compressed temporary files.
+
+    See Also
+    --------
+    CALLS : {_get_transport, _compress_append, _auto_candidates, _read_head, _select_codec, _parse_compression_method,
+             _HashingReader, _CountingWriter, _pipe_data_objects, _cache_key, _cache_put, _pack_chunk_hashes,
+             _write_data_object}
+    CALLED_BY : {compress, _compress_dedup}
+    RELATED : {_compress_publish}
+
+    """
+    transport = _get_transport()
+    hash_chunksize = _parse_hash_method(hash_method)[1]
+    use_cache = (cache_dir is not None) and (cache_bytes > 0)
+    # Compress only the data appended to the file if its start is the parent's data.
+    # NOTE: Otherwise nothing was written and the whole file is compressed.
+    span = _span('compress', 'codec', ipath)
+    appended = None
+    if iparent_append is not None:
+        compression_method_append = str(parent_append_imeta_dict['COMPRESSION_METHOD']['value'])
+        extension_append = _codecs[_parse_compression_method(compression_method_append)[0]]['extension']
+        if stream:
+            logger.debug("_compress_encode: _compress_append(fsrc={src}, fdst={dst})".format(src=itmp_path, dst=itmp_path+extension_append))
+            (fsrc, mtime) = (transport.open_read(itmp_path), time.time())
+            open_dst = (lambda: transport.open_write(itmp_path+extension_append))
+        else:
+            logger.debug("_compress_encode: _compress_append(fsrc={src}, fdst={dst})".format(src=tmp_path, dst=tmp_path+extension_append))
+            fsrc = open(tmp_path, 'rb')
+            mtime = os.fstat(fsrc.fileno()).st_mtime
+            open_dst = (lambda: open(tmp_path+extension_append, 'wb'))
+        try:
+            appended = _compress_append(ipath=ipath, iparent=iparent_append, parent_imeta_dict=parent_append_imeta_dict,
+                                        fsrc=fsrc, open_dst=open_dst, workers=workers, fname=tmpname, mtime=mtime,
+                                        timed=(span is not _NULL_SPAN))
+        finally:
+            fsrc.close()
+        if appended is not None:
+            compression_method = compression_method_append
+    # Select compression method from a sample of the file if requested.
+    if (appended is None) and (compression_method.lower() == 'auto'):
+        if auto_candidates is None:
+            auto_candidates = _auto_candidates()
+        # Leave out codecs that are slow to decode for files that are read. Under the tiering policy,
+        # hot files are left uncompressed; otherwise a file decompressed since it was last compressed is hot.
+        if (_policy['policy'] is None) and ('IS_COMPRESSED' in imeta_dict.keys()):
+            auto_candidates = ([cm for cm in auto_candidates
+                                if _codecs[_parse_compression_method(cm)[0]]['fast_decode']] or ['GZIP:1'])
+        if stream:
+            logger.debug("_compress_encode: sample = _read_head(ipath={src}, size={size})".format(src=itmp_path, size=auto_sample_size))
+            with _span('compress', 'iget_sample', ipath) as span_sample:
+                sample = _read_head(ipath=itmp_path, size=auto_sample_size)
+                span_sample.nbytes = len(sample)
+        else:
+            logger.debug("_compress_encode: sample = open({tmp_path}).read({size})".format(tmp_path=tmp_path, size=auto_sample_size))
+            with open(tmp_path, 'rb') as fsample:
+                sample = fsample.read(auto_sample_size)
+        logger.debug(("_compress_encode: compression_method = _select_codec(sample, candidates={cands}, cpu_budget={cpub}, " +
+                      "workers={wkrs})").format(cands=auto_candidates, cpub=cpu_budget, wkrs=workers))
+        with _span('compress', 'select_codec', ipath, nbytes=len(sample)):
+            compression_method = _select_codec(sample=sample, candidates=auto_candidates, cpu_budget=cpu_budget, workers=workers)
+        logger.debug("_compress_encode: compression_method = {cm}".format(cm=compression_method))
+    (codec_name, level) = _parse_compression_method(compression_method)
+    codec = _codecs[codec_name]
+    compression_method = '{name}:{level}'.format(name=codec_name, level=level)
+    itmp_path_gz = itmp_path+codec['extension']
+    tmp_path_gz = tmp_path+codec['extension']
+    # NOTE: Read uncompressed file once to compute size and hash and to compress.
+    def _compress(fsrc, fdst, mtime):
+        reader = _HashingReader(fobj=fsrc, algorithm=hash_method, workers=workers, timed=(span is not _NULL_SPAN))
+        writer = _CountingWriter(fobj=fdst)
+        block_index = codec['compress'](reader, writer, level, workers, tmpname, mtime)
+        # NOTE: Hashing is recorded as its own stage.
+        (span.nbytes, span.exclude_seconds) = (reader.size, reader.hash_seconds)
+        _record_span(action='compress', stage='hash', ipath=ipath, seconds=reader.hash_seconds, nbytes=reader.size)
+        return (reader, writer, block_index)
+    if appended is not None:
+        (reader, writer, block_index) = appended
+    elif stream:
+        logger.debug(("_compress_encode: _pipe_data_objects(isrc={src}, idst={dst}, " +
+                      "func=compress_func(fsrc=_HashingReader(algorithm={hm}))); " +
+                      "compression_method = {cm}").format(src=itmp_path, dst=itmp_path_gz, hm=hash_method, cm=compression_method))
+        with span:
+            (reader, writer, block_index) = _pipe_data_objects(isrc=itmp_path, idst=itmp_path_gz,
+                                                               func=(lambda fsrc, fdst: _compress(fsrc=fsrc, fdst=fdst, mtime=time.time())))
+    else:
+        logger.debug(("_compress_encode: compress_func(fsrc=_HashingReader({tmp_path}, algorithm={hm}), " +
+                      "fdst={tmp_path_gz}); compression_method = {cm}").format(tmp_path=tmp_path, hm=hash_method,
+                                                                              tmp_path_gz=tmp_path_gz, cm=compression_method))
+        with span, open(tmp_path, 'rb') as fsrc:
+            with open(tmp_path_gz, 'wb') as fdst:
+                (reader, writer, block_index) = _compress(fsrc=fsrc, fdst=fdst, mtime=os.fstat(fsrc.fileno()).st_mtime)
+    uncompressed_size = reader.size
+    logger.debug("_compress_encode: uncompressed_size = {usize}".format(usize=uncompressed_size))
+    uncompressed_hash = reader.hexdigest()
+    logger.debug("_compress_encode: uncompressed_hash = {uhash}".format(uhash=uncompressed_hash))
+    compressed_size = writer.size
+    logger.debug("_compress_encode: compressed_size = {csize}".format(csize=compressed_size))
+    # NOTE: Sidecars are kept in memory until they are put, so a compressed file with sidecars is only
+    # reused by `recover` once it is put.
+    journal.stage('encode', compression_method=compression_method, hash_method=hash_method,
+                  uncompressed_size=uncompressed_size, uncompressed_hash=uncompressed_hash,
+                  compressed_size=compressed_size, itmp_path_gz=itmp_path_gz,
+                  tmp_path_gz=(None if stream else tmp_path_gz),
+                  sidecars=((block_index is not None) or (hash_chunksize is not None)))
+    if use_cache and not stream:
+        cache_key = _cache_key(hash_method=hash_method, uncompressed_hash=uncompressed_hash)
+        if cache_key is not None:
+            logger.debug("_compress_encode: _cache_put(cache_dir={cd}, key={key}, src_path={tmp_path})".format(cd=cache_dir, key=cache_key,
+                                                                                                             tmp_path=tmp_path))
+            with _span('compress', 'cache_put', ipath, nbytes=uncompressed_size):
+                _cache_put(cache_dir=cache_dir, key=cache_key, src_path=tmp_path, cache_bytes=cache_bytes)
+    if not stream:
+        logger.debug("_compress_encode: transport.put({src}, {dst})".format(src=tmp_path_gz, dst=itmp_path_gz))
+        with _span('compress', 'iput', ipath, nbytes=compressed_size):
+            transport.put(tmp_path_gz, itmp_path_gz)
+    # NOTE: The block index of a blocked format, e.g. 'BGZF', and the chunk digests of a tree hash are kept beside
+    # the compressed parent for `read_range`. They are too large for an AVU (at most 2700 bytes), so imeta records
+    # only their paths.
+    # NOTE: With a deduplication store, the compressed file is stored once as a payload beside its sidecars.
+    ipayload = None
+    if idedup_iplant is not None:
+        ipayload = os.path.join(idedup_iplant, '{uhash}_{ts}{ext}'.format(uhash=uncompressed_hash, ts=timestamp,
+                                                                         ext=codec['extension']))
+    istored = ipayload if (ipayload is not None) else itmp_path_gz
+    sidecars = collections.OrderedDict()
+    if block_index is not None:
+        sidecars['BLOCK_INDEX'] = (istored+BLOCK_INDEX_EXTENSION, block_index)
+    if hash_chunksize is not None:
+        sidecars['CHUNK_HASHES'] = (istored+CHUNK_HASHES_EXTENSION,
+                                    _pack_chunk_hashes(chunksize=hash_chunksize, digests=reader.hasher.digests()))
+    isidecars = collections.OrderedDict((attr, isidecar) for (attr, (isidecar, _)) in sidecars.items())
+    for (isidecar, data) in sidecars.values():
+        logger.debug("_compress_encode: _write_data_object(fsrc=BytesIO, idst={dst})".format(dst=isidecar))
+        with _span('compress', 'iput', ipath, nbytes=len(data)):
+            _write_data_object(fsrc=io.BytesIO(data), idst=isidecar)
+    journal.stage('put', isidecars=list(isidecars.items()))
+    itmp_path_gz_copy = itmp_path_gz+'_copy'
+    istored_final = ipayload if (ipayload is not None) else ipath
+    logger.debug("_compress_encode: transport.copy({src}, {dst})".format(src=itmp_path_gz, dst=itmp_path_gz_copy))
+    with _span('compress', 'icp', ipath, nbytes=compressed_size):
+        transport.copy(itmp_path_gz, itmp_path_gz_copy)
+    logger.debug("_compress_encode: transport.move({src}, {dst})".format(src=itmp_path_gz_copy, dst=istored_final))
+    with _span('compress', 'imv', ipath):
+        transport.move(itmp_path_gz_copy, istored_final)
+    journal.stage('publish', istored=istored_final)
+    return {'result': ('appended' if (appended is not None) else 'compressed'), 'compression_method': compression_method,
+            'uncompressed_size': uncompressed_size, 'uncompressed_hash': uncompressed_hash, 'compressed_size': compressed_size,
+            'isidecars': isidecars, 'ipayload': ipayload, 'itmp_path_gz': itmp_path_gz, 'tmp_path_gz': tmp_path_gz}
+
+
+def _compress_publish(ipath, itmp_path, encoded, journal, hash_method='SHA1'):
+    """Semi-private method to set the metadata of a compressed file and register it to its payload, if any.
+
+    Parameters
+    ----------
+    ipath : string
+        iRODS path to the compressed file.
+    itmp_path : string
+        iRODS path to the uncompressed file in `itmp_iplant`, recorded as 'PARENT_FILE'.
+    encoded : dict
+        From `_compress_encode` or `_compress_dedup`. A new payload, i.e. if 'result' is not 'deduplicated', is given
+        the metadata that later copies of the file copy from it.
+    journal : _Journal
+        Journal of the call. Stage 'payload' is recorded with a payload, and the journal is removed once the metadata
+        are set.
+    hash_method : {'SHA1'}, string, optional
+        Normalized hash method of 'UNCOMPRESSED_HASH'.
+
+    Returns
+    -------
+    imeta_triplets : list
+        [attribute name, value, units] set on `ipath`.
+
+    See Also
+    --------
+    CALLS : {_get_transport, _compressed_triplets, _dedup_link, _index_put}
+    CALLED_BY : {compress, _compress_dedup}
+    RELATED : {_compress_encode}
+
+    Notes
+    -----
+    - With a payload, the caller holds `_dedup_lock` of its hash. See `_dedup_link`.
+
+    """
+    transport = _get_transport()
+    ipayload = encoded['ipayload']
+    # Set metadata describing compression state.
+    imeta_triplets = _compressed_triplets(compression_method=encoded['compression_method'], uncompressed_size=encoded['uncompressed_size'],
+                                          uncompressed_hash=encoded['uncompressed_hash'], hash_method=hash_method,
+                                          compressed_size=encoded['compressed_size'], iparent=itmp_path,
+                                          isidecars=encoded['isidecars'].items())
+    # Register the file to the payload. A new payload holds the metadata that other files copy from it.
+    if ipayload is not None:
+        if encoded['result'] != 'deduplicated':
+            payload_triplets = [triplet for triplet in imeta_triplets if triplet[0] in DEDUP_ATTRS] + [['REFCOUNT', '0', 'COUNT']]
+            logger.debug("_compress_publish: transport.meta_set(ipath={ip}, imeta_triplets={it})".format(ip=ipayload, it=payload_triplets))
+            with _span('compress', 'imeta_set', ipath):
+                transport.meta_set(ipayload, payload_triplets)
+        journal.stage('payload', ipayload=ipayload, compression_method=encoded['compression_method'], hash_method=hash_method,
+                      uncompressed_size=encoded['uncompressed_size'], uncompressed_hash=encoded['uncompressed_hash'],
+                      compressed_size=encoded['compressed_size'], isidecars=list(encoded['isidecars'].items()))
+        logger.debug("_compress_publish: _dedup_link(ipayload={ip}, ipath={ipath})".format(ip=ipayload, ipath=ipath))
+        with _span('compress', 'ireg', ipath):
+            refcount = _dedup_link(ipayload=ipayload, ipath=ipath)
+        logger.debug("_compress_publish: refcount = {rc}".format(rc=refcount))
+        imeta_triplets.append(['DEDUP_FILE', ipayload, 'NONE'])
+    logger.debug("_compress_publish: transport.meta_set(ipath={ipath}, imeta_triplets={it})".format(ipath=ipath, it=imeta_triplets))
+    with _span('compress', 'imeta_set', ipath):
+        transport.meta_set(ipath, imeta_triplets)
+    # NOTE: The compressed data object has only the metadata just set.
+    _index_put(ipath=ipath, imeta_dict={}, imeta_triplets=imeta_triplets)
+    journal.remove()
+    return imeta_triplets
+
+
+def _compress_dedup(ipath, itmp_path, tmp_path, journal, encode, idedup_iplant, tmp_iplant, stream=False,
+                    compression_method='GZIP', hash_method='SHA1', cache_dir=None, cache_bytes=0, lock_timeout=LOCK_TIMEOUT):
+    """Semi-private method to compress a file into the deduplication store, or to share the payload of the same file
+    if the store has one.
+
+    Parameters
+    ----------
+    ipath : string
+        iRODS path to the file.
+    itmp_path, tmp_path : string
+        iRODS and local paths to the uncompressed file. `tmp_path` is not used with `stream`.
+    journal : _Journal
+        Journal of the call. Stage 'hash' is recorded.
+    encode : function
+        Compresses the file into `idedup_iplant` if the store has no payload of it. Returns `encoded` as
+        `_compress_encode`.
+    idedup_iplant, tmp_iplant, stream, compression_method, hash_method, cache_dir, cache_bytes, lock_timeout :
+        See `compress`. `hash_method` is normalized.
+
+    Returns
+    -------
+    encoded : dict
+        From `encode`, or with 'result' = 'deduplicated' and the payload's metadata if the payload was shared.
+        'itmp_path_gz' and 'tmp_path_gz' are then ``None``.
+
+    See Also
+    --------
+    CALLS : {_hash_data_object, _compute_hash, _dedup_lock, _dedup_find, _cache_key, _cache_put, _compress_publish}
+    CALLED_BY : {compress}
+    RELATED : {_compress_encode, _dedup_release}
+
+    Notes
+    -----
+    - A file that is not in the store is read twice, to hash it and to compress it.
+    - The payload is looked up, written, and registered to under `_dedup_lock` of the file's hash, so that calls for
+      copies of the same file wait and only the first compresses it.
+
+    """
+    with _span('compress', 'hash', ipath) as span:
+        if stream:
+            logger.debug("_compress_dedup: _hash_data_object(ipath={src}, algorithm={hm})".format(src=itmp_path, hm=hash_method))
+            (uncompressed_size, uncompressed_hash) = _hash_data_object(ipath=itmp_path, algorithm=hash_method)
+        else:
+            logger.debug("_compress_dedup: _compute_hash(fpath={tmp_path}, algorithm={hm})".format(tmp_path=tmp_path, hm=hash_method))
+            (uncompressed_size, uncompressed_hash) = (os.path.getsize(tmp_path),
+                                                      _compute_hash(fpath=tmp_path, algorithm=hash_method, blocksize=2**20))
+        span.nbytes = uncompressed_size
+    logger.debug("_compress_dedup: uncompressed_hash = {uhash}".format(uhash=uncompressed_hash))
+    journal.stage('hash', uncompressed_size=uncompressed_size, uncompressed_hash=uncompressed_hash)
+    with _dedup_lock(tmp_iplant=tmp_iplant, idedup_iplant=idedup_iplant, uncompressed_hash=uncompressed_hash,
+                     lock_timeout=lock_timeout):
+        logger.debug(("_compress_dedup: _dedup_find(idedup_iplant={idi}, hash_method={hm}, uncompressed_hash={uhash}, " +
+                      "uncompressed_size={usize}, compression_method={cm})").format(idi=idedup_iplant, hm=hash_method,
+                                                                                    uhash=uncompressed_hash, usize=uncompressed_size,
+                                                                                    cm=compression_method))
+        with _span('compress', 'dedup_find', ipath):
+            (ipayload, payload_imeta_dict) = _dedup_find(idedup_iplant=idedup_iplant, hash_method=hash_method,
+                                                         uncompressed_hash=uncompressed_hash, uncompressed_size=uncompressed_size,
+                                                         compression_method=compression_method)
+        # Compress the file if the store has no payload of it...
+        if ipayload is None:
+            encoded = encode()
+        # ...otherwise share the payload instead of compressing.
+        else:
+            logger.info("_compress_dedup: Sharing payload {ip} from the deduplication store".format(ip=ipayload))
+            encoded = {'result': 'deduplicated', 'compression_method': str(payload_imeta_dict['COMPRESSION_METHOD']['value']),
+                       'uncompressed_size': uncompressed_size, 'uncompressed_hash': uncompressed_hash,
+                       'compressed_size': payload_imeta_dict['COMPRESSED_SIZE']['value'],
+                       'isidecars': collections.OrderedDict((attr, payload_imeta_dict[attr]['value']) for attr in SIDECAR_ATTRS
+                                                            if attr in payload_imeta_dict),
+                       'ipayload': ipayload, 'itmp_path_gz': None, 'tmp_path_gz': None}
+            if (cache_dir is not None) and (cache_bytes > 0) and not stream:
+                cache_key = _cache_key(hash_method=hash_method, uncompressed_hash=uncompressed_hash)
+                if cache_key is not None:
+                    logger.debug("_compress_dedup: _cache_put(cache_dir={cd}, key={key}, src_path={tmp_path})".format(cd=cache_dir, key=cache_key,
+                                                                                                                   tmp_path=tmp_path))
+                    with _span('compress', 'cache_put', ipath, nbytes=uncompressed_size):
+                        _cache_put(cache_dir=cache_dir, key=cache_key, src_path=tmp_path, cache_bytes=cache_bytes)
+        _compress_publish(ipath=ipath, itmp_path=itmp_path, encoded=encoded, journal=journal, hash_method=hash_method)
+    return encoded
+
+
+def compress(ipath, itmp_iplant, tmp_iplant, delete_itmp_files=False, delete_tmp_files=False, stream=False,
+             compression_method='GZIP', workers=None, auto_candidates=None, auto_sample_size=2**22, cpu_budget=60.0,
+             cache_dir=None, cache_bytes=0, hash_method='SHA1', lock_timeout=LOCK_TIMEOUT, idedup_iplant=None, read_lease=False):
+    """Replace file in iRODS with compressed version.
+    
+    Parameters
+    ----------
+    ipath : string
+        iRODS path to .fastq file for compression.
+    itmp_iplant : string
+        iRODS path to temporary directory for moving files during compression.
+    tmp_iplant : string
+        Local path to temporary directory for moving files during compression, or several as 'DIR[=MAXSIZE],...'.
+        See `_parse_tmp_iplant`.
+    delete_itmp_files : {False, True}, bool, optional
+        Delete iRODS temporary files made during compression.
+    delete_tmp_files : {False, True}, bool, optional
+        Delete local temporary files made during compression.
+    stream : {False, True}, bool, optional
+        Stream data from the transport through compression back into the transport without local temporary files.
+    compression_method : {'GZIP', 'auto', 'NAME', 'NAME:LEVEL'}, string, optional
+        Registered codec and optional level, e.g. 'GZIP:6', 'PGZIP', 'BZ2:9', 'LZMA:6', 'FQZ'.
+        'GZIP' compresses with one core. 'PGZIP' compresses blocks in parallel into a multi-member gzip file.
+        'FQZ' compresses FASTQ headers, bases, and qualities as separate streams.
+        'BGZF' compresses 64 KiB blocks in parallel and keeps a block index for `read_range`.
+        'auto' selects from `auto_candidates` by compressing a sample of the file. Codecs registered with
+        ``fast_decode=False``, e.g. 'FQZ', are not selected for hot files: without a tiering policy, files that were
+        decompressed since they were last compressed.
+        The codec and level are recorded in imeta as 'COMPRESSION_METHOD' = 'NAME:LEVEL'.
+    workers : {None}, int, optional
+        Number of worker threads for codecs that use them, e.g. 'PGZIP'. Default: number of CPUs.
+    auto_candidates : {None}, list, optional
+        Candidate compression methods for 'auto'. Default: 'GZIP:1', 'GZIP:6', 'PGZIP:1', 'BZ2:9', 'LZMA:6', 'FQZ:6'
+        for registered codecs.
+    auto_sample_size : {2**22}, int, optional
+        Number of bytes from the start of the file to sample for 'auto'.
+    cpu_budget : {60.0}, float, optional
+        Maximum CPU time in seconds to compress 1 GiB for 'auto'. See `_select_codec`.
+    cache_dir : {None}, string, optional
+        Local path to the decompressed file cache, e.g. ``os.path.join(tmp_iplant, CACHE_DIRNAME)``.
+    cache_bytes : {0}, int, optional
+        Maximum total size of files in the cache. 0 disables the cache.
+    hash_method : {'SHA1', 'TREE_SHA1', 'ALGORITHM', 'TREE_ALGORITHM:CHUNKSIZE'}, string, optional
+        Hash of the uncompressed file recorded in imeta as 'HASH_METHOD' and 'UNCOMPRESSED_HASH'.
+        'TREE_SHA1' hashes chunks of `TREE_HASH_CHUNKSIZE` bytes in parallel and keeps their digests beside the
+        compressed file as 'CHUNK_HASHES'. See `_TreeHasher`. `decompress` verifies with the recorded method.
+    lock_timeout : {LOCK_TIMEOUT}, float, optional
+        Seconds after which the lock of `ipath` held by another call is stale. See `_ObjectLock`.
+    idedup_iplant : {None}, string, optional
+        iRODS path to a deduplication store of compressed payloads. ``None`` compresses each file separately.
+    read_lease : {False, True}, bool, optional
+        Return the oldest read lease on `ipath` taken by `decompress` with `read_lease`, e.g. from
+        `iplantPostProcForOpen`.
+
+    Returns
+    -------
+    stats : dict
+        'ipath'; 'result', one of 'compressed', 'deduplicated' if the file shares a payload of the deduplication store,
+        'appended' if only data appended to the file since it was decompressed were compressed, 'reinstated', 'skipped' if the file is already compressed, or 'kept_small' or 'kept_hot' if the tiering policy
+        leaves the file uncompressed, or 'kept_open' if other readers hold read leases on the file;
+        'uncompressed_size' and 'compressed_size' in bytes, or ``None`` if not known.
+
+    See Also
+    --------
+    CALLS : {_get_transport, _parse_compression_method, _verify_parent, _reinstate_parent, _index_put, _index_forget,
+             _scratch_reserve, _scratch_resize, _scratch_release, _ObjectLock, _access_scores, _policy_reason, _remove_parent, _append_parent,
+             _compress_encode, _compress_publish, _compress_dedup, _Journal, _resume_journal}
+    CALLED_BY : {main, recover}
+    RELATED : {decompress}
+
+    Notes
+    -----
+    - The uncompressed file is read once to compute its size and hash and to compress it.
+    - Compressing a file creates a compressed copy and an uncompressed copy in both
+      the iRODS `itmp_iplant`/ directory and the local `tmp_iplant`/ directory.
+      With `stream`, no copies are made in the local `tmp_iplant`/ directory.
+    - If the file was decompressed by `decompress` and is unchanged, the compressed parent that `decompress`
+      kept in `itmp_iplant` with `keep_parents` is moved back to `ipath` instead of compressing the file again.
+      See `_verify_parent`.
+      Otherwise the parent is out of date and is deleted with `delete_itmp_files`.
+    - If the file grew since it was decompressed and its start is unchanged, only the appended data are compressed
+      and added to a copy of the parent as a new gzip member (or stream of another appendable codec), and the hash of
+      the whole file is extended from the hash of its start. The parent's compression method is kept.
+      See `_append_parent` and `_compress_append`.
+    - With the cache and without `stream`, the local uncompressed copy is added to the cache so that decompressing
+      the file later does not read the compressed file. Least recently used files are evicted to leave room
+      for the local copies.
+    - Without `stream`, twice the size of the file is reserved in a scratch directory of `tmp_iplant` before
+      the file is moved. If no directory has room, the file is left in place. See `_scratch_reserve`.
+      The size is not queried for the reservation alone: unless the tiering policy or the compressed parent needed it,
+      the reservation is sized once the file is fetched. See `_scratch_resize`.
+    - Concurrent calls for the same `ipath`, also from other processes, wait for each other. A call that waited for
+      another `compress` returns its stats. See `_ObjectLock`.
+    - The file is left decompressed while another reader holds a read lease on it from `decompress`, so that
+      a reader that opened the file after it was decompressed does not see it replaced. Only the call that returns
+      the last lease compresses the file. Calls without `read_lease`, e.g. from `bulk` or `drain`, return no lease
+      and also leave the file decompressed while leases are held.
+    - With a tiering policy from `set_policy`, files smaller than 'min_size' and files with many recent accesses
+      are left uncompressed. A compressed parent kept by `decompress` is kept until the file is compressed.
+    - With `idedup_iplant`, the file is hashed before it is compressed. If the store has a payload with the same
+      'UNCOMPRESSED_HASH', 'HASH_METHOD', and size (and codec unless `compression_method` is 'auto'), the file is not
+      compressed: `ipath` is registered to the physical file of the payload and its metadata are copied. Otherwise the
+      compressed file is stored as a new payload with its sidecars and `ipath` is registered to it. `ipath` records the
+      payload as 'DEDUP_FILE', and the payload counts the data objects registered to it as 'REFCOUNT'.
+      A compressed parent that shares a payload is unregistered instead of deleted, and the payload is deleted
+      with the last data object registered to it. See `_dedup_release`.
+    - Each completed stage ('begin', 'move', 'fetch', 'hash', 'encode', 'put', 'publish', 'payload') is journaled with
+      its temporary files, sizes, and hash in `tmp_iplant`, and the journal is removed once the metadata are set.
+      If the call does not finish, e.g. after a crash, `recover` or the next call for `ipath` finishes it from
+      the compressed file or moves the uncompressed file back to `ipath`. See `_Journal` and `_resume_compress`.
+      Reinstating a parent is journaled as well. See `_reinstate_parent`.
+    
+    """
+    # NOTE: Input checking is handled by "if __name__ == '__main__'" section.
+    # Check compression method before moving any data.
+    if compression_method.lower() != 'auto':
+        _parse_compression_method(compression_method)
+    (hash_algorithm, hash_chunksize) = _parse_hash_method(hash_method)
+    if hash_chunksize is None:
+        hash_method = hash_algorithm.upper()
+    else:
+        hash_method = 'TREE_{alg}:{cs}'.format(alg=hash_algorithm.upper(), cs=hash_chunksize)
+    stats = {'ipath': ipath, 'result': None, 'uncompressed_size': None, 'compressed_size': None}
+    time_start = time.time()
+    # NOTE: Arguments are journaled so that `recover` can compress the file again. See `_Journal`.
+    journal_kwargs = {'itmp_iplant': itmp_iplant, 'tmp_iplant': tmp_iplant, 'delete_itmp_files': delete_itmp_files,
+                      'delete_tmp_files': delete_tmp_files, 'stream': stream, 'compression_method': compression_method,
+                      'workers': workers, 'auto_candidates': auto_candidates, 'auto_sample_size': auto_sample_size,
+                      'cpu_budget': cpu_budget, 'cache_dir': cache_dir, 'cache_bytes': cache_bytes, 'hash_method': hash_method,
+                      'lock_timeout': lock_timeout, 'idedup_iplant': idedup_iplant}
+    # Run one `compress` or `decompress` of `ipath` at a time. A call that waited for the same action reuses its stats.
+    with _ObjectLock(tmp_iplant=tmp_iplant, ipath=ipath, action='compress', lock_timeout=lock_timeout) as flight:
+        # Leave the file decompressed until the last reader that opened it returns its lease. See `decompress`.
+        if read_lease and flight.readers:
+            flight.readers.pop(0)
+        if flight.readers:
+            logger.info("compress: Leaving {ipath} decompressed for {num} other readers.".format(ipath=ipath, num=len(flight.readers)))
+            stats.update(result='kept_open')
+            return stats
+        if flight.stats is not None:
+            return flight.stats
+        # Finish or undo an earlier call for `ipath` that did not finish, e.g. after a crash. See `recover`.
+        _resume_journal(tmp_iplant=tmp_iplant, ipath=ipath)
+        # Determine if data is compressed from imeta.
+        transport = _get_transport()
+        logger.debug("compress: transport.meta_get({ipath})".format(ipath=ipath))
+        with _span('compress', 'imeta_ls', ipath):
+            imeta_dict = transport.meta_get(ipath)
+        logger.debug(("compress: imeta_dict =\n" +
+                      "{imeta_dict}").format(imeta_dict=imeta_dict))
+        do_compress = None
+        if 'IS_COMPRESSED' in imeta_dict.keys():
+            if imeta_dict['IS_COMPRESSED']['value']:
+                do_compress = False
+            else:
+                do_compress = True
+        else:
+            do_compress = True
+        if do_compress is None:
+            raise AssertionError(("Program error. 'do_compress' flag not set:\n" +
+                                  "do_compress = {tf}").format(tf=do_compress))
+        # Leave small and hot files uncompressed under the tiering policy. `sweep` compresses hot files once they are cold.
+        size = None
+        policy_reason = None
+        if do_compress and (_policy['policy'] is not None):
+            with _span('compress', 'ils', ipath):
+                size = transport.size(ipath)
+            score = _access_scores(ipath=ipath).get(ipath)
+            policy_reason = _policy_reason(policy=_policy['policy'], size=size, score=score)
+            logger.debug("compress: size = {size}; score = {score}; policy_reason = {pr}".format(size=size, score=score, pr=policy_reason))
+            if policy_reason is not None:
+                logger.info("compress: Leaving {ipath} uncompressed by policy: {pr}".format(ipath=ipath, pr=policy_reason))
+                do_compress = False
+        # NOTE: A file that will change is left out of the index until its metadata are set.
+        if do_compress:
+            _index_forget(ipath=ipath)
+        else:
+            _index_put(ipath=ipath, imeta_dict=imeta_dict)
+        # Reinstate the compressed parent kept by `decompress` instead of compressing if the file is unchanged,
+        # e.g. after a read-only open.
+        # NOTE: Only parents within `itmp_iplant` are reinstated or deleted.
+        iparent_stale = None
+        (iparent_append, parent_append_imeta_dict) = (None, None)
+        if (do_compress and ('PARENT_FILE' in imeta_dict.keys()) and ('IS_COMPRESSED' in imeta_dict.keys()) and
+            (os.path.dirname(str(imeta_dict['PARENT_FILE']['value'])) == itmp_iplant)):
+            if size is None:
+                with _span('compress', 'ils', ipath):
+                    size = transport.size(ipath)
+            logger.debug("compress: _verify_parent(ipath={ipath}, size={size})".format(ipath=ipath, size=size))
+            with _span('compress', 'verify_parent', ipath):
+                (iparent, iparent_size) = _verify_parent(ipath=ipath, imeta_dict=imeta_dict, size=size)
+            reinstated = False
+            if iparent is not None:
+                logger.debug(("compress: _reinstate_parent(ipath={ipath}, iparent={ip}, itmp_iplant={itip}, " +
+                              "delete_itmp_files={ditf})").format(ipath=ipath, ip=iparent, itip=itmp_iplant, ditf=delete_itmp_files))
+                with _span('compress', 'reinstate', ipath):
+                    reinstated = _reinstate_parent(ipath=ipath, iparent=iparent, imeta_dict=imeta_dict, itmp_iplant=itmp_iplant,
+                                                   tmp_iplant=tmp_iplant, delete_itmp_files=delete_itmp_files, kwargs=journal_kwargs)
+            if reinstated:
+                stats.update(result='reinstated', uncompressed_size=imeta_dict['UNCOMPRESSED_SIZE']['value'],
+                             compressed_size=iparent_size)
+                do_compress = False
+            else:
+                iparent_stale = imeta_dict['PARENT_FILE']['value']
+                # A file that grew may be compressed by appending to the parent, e.g. a file that is written while it is
+                # uploaded and is put again.
+                logger.debug("compress: _append_parent(ipath={ipath}, size={size})".format(ipath=ipath, size=size))
+                (iparent_append, parent_append_imeta_dict) = _append_parent(ipath=ipath, imeta_dict=imeta_dict, size=size,
+                                                                            compression_method=compression_method,
+                                                                            hash_method=hash_method)
+        # Compress data...
+        if do_compress:
+            # TODO: get isysmeta
+            logger.debug("compress: do_compress = {tf}".format(tf=do_compress))
+            # Define temporary file paths.
+            timestamp = datetime.datetime.now().isoformat().replace('-', '').replace(':', '')
+            basename = os.path.basename(ipath)
+            tmpname = timestamp+'_'+basename
+            itmp_path = os.path.join(itmp_iplant, tmpname)
+            use_cache = (cache_dir is not None) and (cache_bytes > 0)
+            # Reserve local space on a scratch volume of `tmp_iplant` before the file is moved, so that a file
+            # without room is left in place.
+            # NOTE: Local copies of the uncompressed and compressed files are at most twice the uncompressed size.
+            # NOTE: The size is not queried only for the reservation. Without a size from the checks above, a volume is
+            # chosen now and the reservation is sized from the local copy once it is fetched.
+            if stream:
+                tmp_path = os.path.join(_parse_tmp_iplant(tmp_iplant)[0][0], tmpname)
+            else:
+                nbytes = 2*size if size is not None else 0
+                logger.debug("compress: _scratch_reserve(tmp_iplant={tip}, tmpname={tn}, nbytes={nb})".format(tip=tmp_iplant, tn=tmpname,
+                                                                                                            nb=nbytes))
+                tmp_path = _scratch_reserve(tmp_iplant=tmp_iplant, tmpname=tmpname, nbytes=nbytes, cache_dir=(cache_dir if use_cache else None))
+            # Journal each stage once it is complete so that `recover` can finish or undo the call after a crash.
+            journal = _Journal(tmp_iplant=tmp_iplant, ipath=ipath, action='compress', kwargs=journal_kwargs)
+            journal.stage('begin', itmp_path=itmp_path, tmp_path=tmp_path)
+            try:
+                # Move data to temporary files, record metadata on uncompressed version, then compress.
+                # NOTE: Use imv instead of icp to move data from/to `ipath` since icp will invoke acPreprocForDataObjOpen/acPostProcForCopy.
+                # NOTE: Copy compressed file within `itmp_path` to leave trace of files for debugging.
+                # TODO: Remove "copy compressed file" step for optimization when robustly tested.
+                logger.debug("compress: transport.move({src}, {dst})".format(src=ipath, dst=itmp_path))
+                with _span('compress', 'imv', ipath):
+                    transport.move(ipath, itmp_path)
+                journal.stage('move')
+                if not stream:
+                    logger.debug("compress: transport.get({src}, {dst})".format(src=itmp_path, dst=tmp_path))
+                    with _span('compress', 'iget', ipath) as span:
+                        transport.get(itmp_path, tmp_path)
+                        span.nbytes = os.path.getsize(tmp_path)
+                    journal.stage('fetch')
+                    if size is None:
+                        nbytes = 2*os.path.getsize(tmp_path)
+                        logger.debug("compress: _scratch_resize(tmp_iplant={tip}, tmp_path={tp}, nbytes={nb})".format(tip=tmp_iplant, tp=tmp_path,
+                                                                                                                      nb=nbytes))
+                        _scratch_resize(tmp_iplant=tmp_iplant, tmp_path=tmp_path, nbytes=nbytes)
+                # Compress the file, or with a deduplication store, hash the file first and share the payload of the same
+                # file if the store has one. See `_compress_encode` and `_compress_dedup`.
+                encode = (lambda: _compress_encode(ipath=ipath, itmp_path=itmp_path, tmp_path=tmp_path, tmpname=tmpname, timestamp=timestamp,
+                                                   journal=journal, imeta_dict=imeta_dict, stream=stream,
+                                                   compression_method=compression_method, workers=workers, auto_candidates=auto_candidates,
+                                                   auto_sample_size=auto_sample_size, cpu_budget=cpu_budget, cache_dir=cache_dir,
+                                                   cache_bytes=cache_bytes, hash_method=hash_method, idedup_iplant=idedup_iplant,
+                                                   iparent_append=iparent_append, parent_append_imeta_dict=parent_append_imeta_dict))
+                if idedup_iplant is None:
+                    encoded = encode()
+                    logger.debug("compress: _compress_publish(ipath={ipath}, itmp_path={itmp_path})".format(ipath=ipath, itmp_path=itmp_path))
+                    _compress_publish(ipath=ipath, itmp_path=itmp_path, encoded=encoded, journal=journal, hash_method=hash_method)
+                else:
+                    logger.debug("compress: _compress_dedup(ipath={ipath}, idedup_iplant={idi})".format(ipath=ipath, idi=idedup_iplant))
+                    encoded = _compress_dedup(ipath=ipath, itmp_path=itmp_path, tmp_path=tmp_path, journal=journal, encode=encode,
+                                              idedup_iplant=idedup_iplant, tmp_iplant=tmp_iplant, stream=stream,
+                                              compression_method=compression_method, hash_method=hash_method, cache_dir=cache_dir,
+                                              cache_bytes=cache_bytes, lock_timeout=lock_timeout)
+                stats.update(result=encoded['result'], uncompressed_size=encoded['uncompressed_size'],
+                             compressed_size=encoded['compressed_size'])
+                # NOTE: A shared payload made no compressed temporary files.
+                itmp_paths = [itmp_path] + ([encoded['itmp_path_gz']] if (encoded['itmp_path_gz'] is not None) else [])
+                tmp_paths = [tmp_path] + ([encoded['tmp_path_gz']] if (encoded['tmp_path_gz'] is not None) else [])
+                # Delete temporary files if requested.
+                if delete_itmp_files:
+                    logger.debug("compress: delete_itmp_files = {tf}".format(tf=delete_itmp_files))
+                    itmps = list(itmp_paths)
+                    # NOTE: The compressed parent kept by `decompress` is out of date since the file was modified.
+                    # It may already have been deleted, e.g. by `decompress` with `delete_itmp_files`.
+                    # A parent that shares a payload of the deduplication store is unregistered so that the payload is kept.
+                    if (iparent_stale is not None) and transport.exists(iparent_stale):
+                        logger.debug("compress: _remove_parent(iparent={ip})".format(ip=iparent_stale))
+                        with _span('compress', 'irm', ipath):
+                            _remove_parent(iparent=iparent_stale, parent_imeta_dict=transport.meta_get(iparent_stale),
+                                           itmp_iplant=itmp_iplant, tmp_iplant=tmp_iplant, lock_timeout=lock_timeout)
+                    # NOTE: Likewise the sidecars of the parent, e.g. its block index, if the parent is gone.
+                    # New sidecars are kept with the compressed file.
+                    for attr in SIDECAR_ATTRS:
+                        isidecar_stale = imeta_dict.get(attr, {}).get('value')
+                        if ((iparent_stale is not None) and (isidecar_stale is not None) and
+                            (os.path.dirname(str(isidecar_stale)) == itmp_iplant) and transport.exists(isidecar_stale)):
+                            itmps.append(isidecar_stale)
+                    for itmp in itmps:
+                        logger.debug("compress: transport.remove({itmp})".format(itmp=itmp))
+                        with _span('compress', 'irm', ipath):
+                            transport.remove(itmp)
+                if delete_tmp_files and not stream:
+                    logger.debug("compress: delete_tmp_files = {tf}".format(tf=delete_tmp_files))
+                    for tmp in tmp_paths:
+                        logger.debug("compress: os.remove({tmp})".format(tmp=tmp))
+                        os.remove(tmp)
+            finally:
+                if not stream:
+                    _scratch_release(tmp_iplant=tmp_iplant, tmp_path=tmp_path)
+        # ...otherwise do nothing.
+        else:
+            logger.debug("compress: do_compress = {tf}".format(tf=do_compress))
+            if policy_reason is not None:
+                stats.update(result='kept_'+policy_reason, uncompressed_size=size)
+            elif stats['result'] is None:
+                stats.update(result='skipped', uncompressed_size=imeta_dict.get('UNCOMPRESSED_SIZE', {}).get('value'),
+                             compressed_size=imeta_dict.get('COMPRESSED_SIZE', {}).get('value'))
+        _record_span(action='compress', stage='total', ipath=ipath, seconds=time.time()-time_start, nbytes=stats['uncompressed_size'])
+        flight.stats = stats
+    return stats
+
+
+def decompress(ipath, itmp_iplant, tmp_iplant, delete_itmp_files=False, delete_tmp_files=False, stream=False,
+               workers=None, cache_dir=None, cache_bytes=0, verify='full', verify_fraction=0.1, queue_file=None,
+               queue_max_depth=10000, lock_timeout=LOCK_TIMEOUT, keep_parents=False, read_lease=False):
+    """Replace file in iRODS with decompressed version.
+    
+    Parameters
+    ----------
+    ipath : string
+        iRODS path to .fastq file for compression.
+    itmp_iplant : string
+        iRODS path to temporary directory for moving files during compression.
+    tmp_iplant : string
+        Local path to temporary directory for moving files during compression, or several as 'DIR[=MAXSIZE],...'.
+        See `_parse_tmp_iplant`.
+    delete_itmp_files : {False, True}, bool, optional
+        Delete iRODS temporary files made during decompression, including the compressed file unless `keep_parents`.
+    delete_tmp_files : {False, True}, bool, optional
+        Delete local temporary files made during decompression.
+    stream : {False, True}, bool, optional
+        Stream data from the transport through decompression back into the transport without local temporary files.
+    workers : {None}, int, optional
+        Number of worker threads for codecs that use them, e.g. to decompress 'PGZIP' members in parallel.
+        Default: number of CPUs.
+    cache_dir : {None}, string, optional
+        Local path to the decompressed file cache, e.g. ``os.path.join(tmp_iplant, CACHE_DIRNAME)``.
+    cache_bytes : {0}, int, optional
+        Maximum total size of files in the cache. 0 disables the cache.
+    verify : {'full', 'trailer', 'sampled', 'deferred'}, string, optional
+        How to verify the decompressed file against 'UNCOMPRESSED_HASH'. 'full' hashes the file while decompressing it.
+        'trailer' checks only the checksum of the codec and 'UNCOMPRESSED_SIZE'. 'sampled' is 'full' for a random
+        `verify_fraction` of calls and 'trailer' otherwise. 'deferred' keeps a local copy of the file and adds it to
+        the queue in `queue_file`, so that `drain` hashes it after this call returns. See `verify_file`.
+    verify_fraction : {0.1}, float, optional
+        Fraction of calls that hash the file with ``verify='sampled'``.
+    queue_file : {None}, string, optional
+        Local path to SQLite database of the queue for ``verify='deferred'``. If ``None``, the file is hashed now.
+    queue_max_depth : {10000}, int, optional
+        Maximum number of queued jobs. Beyond this, the file is hashed now.
+    lock_timeout : {LOCK_TIMEOUT}, float, optional
+        Seconds after which the lock of `ipath` held by another call is stale. See `_ObjectLock`.
+    keep_parents : {False, True}, bool, optional
+        Keep the compressed file in `itmp_iplant` as 'PARENT_FILE' even with `delete_itmp_files`, so that `compress`
+        can reinstate it or append to it. Kept parents are removed by `prune_parents`.
+    read_lease : {False, True}, bool, optional
+        Take a read lease on `ipath` that `compress` with `read_lease` returns, e.g. from `iplantPreprocForDataObjOpen`,
+        also if the file is not compressed. See `compress`.
+
+    Returns
+    -------
+    stats : dict
+        'ipath'; 'result', one of 'decompressed', 'skipped' if the file is not compressed, or 'not_decompressed'
+        if 'COMPRESSION_METHOD' is not valid; 'uncompressed_size' and 'compressed_size' in bytes, or ``None`` if not known;
+        'verify', how the hash was verified, one of 'full', 'trailer', 'deferred', 'cached', or ``None`` if not decompressed.
+
+    See Also
+    --------
+    CALLS : {_get_transport, _index_get, _index_put, _index_forget, _parse_compression_method, _HashingWriter,
+             _CountingWriter, _TeeWriter, _pipe_data_objects, _write_data_object, _cache_key, _cache_make_room, _cache_get,
+             _cache_put, enqueue_verify, verify_file, _scratch_reserve, _scratch_release, _scratch_defer, _ObjectLock, _access_record,
+             _decompressed_triplets, _Journal, _resume_journal, _remove_parent}
+    CALLED_BY : {main}
+    RELATED : {compress, prune_parents}
+
+    Notes
+    -----
+    - The codec is dispatched from 'COMPRESSION_METHOD' in imeta through the codec registry. See `register_codec`.
+    - The uncompressed size and hash are computed in the same pass that decompresses the file.
+    - With `keep_parents`, the compressed file is kept in `itmp_iplant` as 'PARENT_FILE' even with
+      `delete_itmp_files`, so that `compress` can move it back instead of compressing again if the file is not
+      modified, or compress only the data appended to it. `compress` deletes it otherwise, and `prune_parents`
+      deletes parents that expired or that no file refers to.
+    - With the cache, decompressed files are kept in `cache_dir` by 'HASH_METHOD' and 'UNCOMPRESSED_HASH'.
+      If the file is cached, it is written to iRODS without reading the compressed file or decompressing.
+      Otherwise the decompressed file is added to the cache once its size and hash match imeta.
+      Least recently used files are evicted to stay within `cache_bytes` and to leave room for temporary files.
+      Only files that were hashed are added to the cache.
+    - With a local index from `set_index`, the metadata of an indexed file are read from the index instead of imeta.
+    - Codecs without a checksum (see `register_codec`) are always hashed with ``verify='trailer'``.
+    - Space for the local copies is reserved in a scratch directory of `tmp_iplant` before the file is moved.
+      See `_scratch_reserve`.
+      With ``verify='deferred'``, corruption is only logged by `verify_file` after the file was read.
+    - Concurrent calls for the same `ipath`, e.g. from several jobs opening the file at once, wait for each other.
+      A call that waited for another `decompress` returns its stats instead of moving the file again. See `_ObjectLock`.
+    - With `read_lease`, each call that returns stats takes a lease, including calls that found the file decompressed
+      or reused stats. `compress` leaves the file decompressed until the last lease is returned or has expired after
+      `lock_timeout`.
+    - With a tiering policy from `set_policy`, each call counts an access to `ipath`, so that `compress` leaves
+      hot files uncompressed. A compressed file is always decompressed.
+    - Each completed stage ('begin', 'move', 'fetch', 'decode', 'put', 'publish') is journaled in `tmp_iplant` as by
+      `compress`. If the call does not finish, `recover` or the next call for `ipath` finishes it from the decompressed
+      file or moves the compressed file back to `ipath`. See `_resume_decompress`.
+    
+    """
+    # NOTE: Input checking is handled by "if __name__ == '__main__'" section and main() function.
+    stats = {'ipath': ipath, 'result': None, 'uncompressed_size': None, 'compressed_size': None, 'verify': None}
+    time_start = time.time()
+    # Count the access for the tiering policy, whether or not the file is compressed.
+    _access_record(ipath=ipath)
+    # Run one `compress` or `decompress` of `ipath` at a time. A call that waited for the same action reuses its stats.
+    with _ObjectLock(tmp_iplant=tmp_iplant, ipath=ipath, action='decompress', lock_timeout=lock_timeout) as flight:
+        if flight.stats is not None:
+            if read_lease and (flight.stats['result'] != 'not_decompressed'):
+                flight.readers.append(time.time())
+            return flight.stats
+        # Finish or undo an earlier call for `ipath` that did not finish, e.g. after a crash. See `recover`.
+        _resume_journal(tmp_iplant=tmp_iplant, ipath=ipath)
+        # Determine if data is decompressed from the local index, otherwise from imeta.
+        transport = _get_transport()
+        imeta_dict = _index_get(ipath=ipath)
+        indexed = (imeta_dict is not None)
+        if not indexed:
+            logger.debug("decompress: transport.meta_get({ipath})".format(ipath=ipath))
+            with _span('decompress', 'imeta_ls', ipath):
+                imeta_dict = transport.meta_get(ipath)
+        logger.debug(("decompress: indexed = {tf}; imeta_dict =\n" +
+                      "{imeta_dict}").format(tf=indexed, imeta_dict=imeta_dict))
+        do_decompress = None
+        if 'IS_COMPRESSED' in imeta_dict.keys():
+            if imeta_dict['IS_COMPRESSED']['value']:
+                do_decompress = True
+            else:
+                do_decompress = False
+        else:
+            do_decompress = False
+        if do_decompress is None:
+            raise AssertionError(("Program error. 'do_decompress' flag not set:\n" +
+                                  "do_decompress = {tf}").format(tf=do_decompress))
+        # NOTE: A file that will change is left out of the index until its metadata are set.
+        if do_decompress:
+            _index_forget(ipath=ipath)
+        elif not indexed:
+            _index_put(ipath=ipath, imeta_dict=imeta_dict)
+        # Decompress data...
+        if do_decompress:
+            logger.debug("decompress: do_decompress = {tf}".format(tf=do_decompress))
+            # Define temporary file paths.
+            timestamp = datetime.datetime.now().isoformat().replace('-', '').replace(':', '')
+            basename = os.path.basename(ipath)
+            tmpname = timestamp+'_'+basename
+            itmp_path = os.path.join(itmp_iplant, tmpname)
+            tmp_path = os.path.join(_parse_tmp_iplant(tmp_iplant)[0][0], tmpname)
+            compression_method_imeta = imeta_dict['COMPRESSION_METHOD']['value']
+            valid_compression_methods = list(_codecs.keys())
+            try:
+                (codec_name, _) = _parse_compression_method(compression_method_imeta)
+            except ValueError:
+                codec_name = None
+            hash_method_imeta = imeta_dict['HASH_METHOD']['value']
+            uncompressed_size_imeta = imeta_dict['UNCOMPRESSED_SIZE']['value']
+            uncompressed_hash_imeta = imeta_dict['UNCOMPRESSED_HASH']['value']
+            # NOTE: Keep the sidecars of the parent so that `compress` can delete them if the parent is out of date.
+            isidecars = [(attr, imeta_dict[attr]['value']) for attr in SIDECAR_ATTRS if attr in imeta_dict]
+            use_cache = (cache_dir is not None) and (cache_bytes > 0)
+            cache_key = _cache_key(hash_method=hash_method_imeta, uncompressed_hash=uncompressed_hash_imeta) if use_cache else None
+            cache_hit = False
+            decompressed = False
+            # Move data to temporary files then decompress.
+            # NOTE: Use imv instead of icp to move data from/to `ipath` since icp will invoke acPreprocForDataObjOpen/acPostProcForCopy.
+            # NOTE: Copy compressed file within `itmp_path` to leave trace of files for debugging.
+            # NOTE: File is already compressed, so rename with compressed extension (e.g. '.gz') when moving to temporary location.
+            # TODO: Remove "copy compressed file" step for optimization when robustly tested.
+            tmp_path_reserved = None
+            try:
+                if codec_name is not None:
+                    codec = _codecs[codec_name]
+                    verify_mode = verify
+                    if verify_mode == 'sampled':
+                        verify_mode = 'full' if random.random() < verify_fraction else 'trailer'
+                    if (verify_mode == 'trailer') and not codec['checksum']:
+                        logger.debug("decompress: Codec {cn} has no checksum. Hashing file.".format(cn=codec_name))
+                        verify_mode = 'full'
+                    if (verify_mode == 'deferred') and (queue_file is None):
+                        logger.warning("decompress: No `queue_file` to defer the hash to. Hashing file.")
+                        verify_mode = 'full'
+                    logger.debug("decompress: verify = {vfy}; verify_mode = {vm}".format(vfy=verify, vm=verify_mode))
+                    # Reserve local space on a scratch volume of `tmp_iplant` before the file is moved, so that a file
+                    # without room is left in place.
+                    # NOTE: Local copies are the compressed and uncompressed files, or with `stream` only the copy to hash later.
+                    if (not stream) or (verify_mode == 'deferred'):
+                        nbytes = uncompressed_size_imeta
+                        if not stream:
+                            nbytes += imeta_dict.get('COMPRESSED_SIZE', {}).get('value', uncompressed_size_imeta)
+                        logger.debug("decompress: _scratch_reserve(tmp_iplant={tip}, tmpname={tn}, nbytes={nb})".format(tip=tmp_iplant, tn=tmpname,
+                                                                                                                      nb=nbytes))
+                        tmp_path = tmp_path_reserved = _scratch_reserve(tmp_iplant=tmp_iplant, tmpname=tmpname, nbytes=nbytes,
+                                                                        cache_dir=(cache_dir if use_cache else None))
+                    tmpname_gz = tmpname+codec['extension']
+                    itmp_path_gz = itmp_path+codec['extension']
+                    tmp_path_gz = tmp_path+codec['extension']
+                    # Journal each stage once it is complete so that `recover` can finish or undo the call after a crash.
+                    journal = _Journal(tmp_iplant=tmp_iplant, ipath=ipath, action='decompress',
+                                       kwargs={'delete_itmp_files': delete_itmp_files, 'delete_tmp_files': delete_tmp_files,
+                                               'stream': stream, 'keep_parents': keep_parents, 'lock_timeout': lock_timeout})
+                    journal.stage('begin', itmp_path=itmp_path, itmp_path_gz=itmp_path_gz, tmp_path=tmp_path, tmp_path_gz=tmp_path_gz,
+                                  hash_method=hash_method_imeta, isidecars=isidecars)
+                    logger.debug("decompress: transport.move({src}, {dst})".format(src=ipath, dst=itmp_path_gz))
+                    with _span('decompress', 'imv', ipath):
+                        transport.move(ipath, itmp_path_gz)
+                    journal.stage('move')
+                    # NOTE: A cached file was verified against its hash when it was added, so neither the compressed file
+                    # nor decompression is needed.
+                    if cache_key is not None:
+                        # NOTE: With `stream`, the file is copied into the cache. Otherwise the reservation made room.
+                        if stream:
+                            logger.debug("decompress: _cache_make_room(cache_dir={cd}, nbytes={nb})".format(cd=cache_dir, nb=uncompressed_size_imeta))
+                            _cache_make_room(cache_dir=cache_dir, nbytes=uncompressed_size_imeta)
+                        logger.debug("decompress: _cache_get(cache_dir={cd}, key={key}, dst_path={tmp_path})".format(cd=cache_dir, key=cache_key,
+                                                                                                                  tmp_path=tmp_path))
+                        with _span('decompress', 'cache_get', ipath):
+                            cache_hit = _cache_get(cache_dir=cache_dir, key=cache_key, dst_path=tmp_path)
+                        logger.debug("decompress: cache_hit = {tf}".format(tf=cache_hit))
+                    if cache_hit:
+                        if stream:
+                            logger.debug("decompress: _write_data_object(fsrc={tmp_path}, idst={dst})".format(tmp_path=tmp_path, dst=itmp_path))
+                            with _span('decompress', 'iput', ipath, nbytes=uncompressed_size_imeta), open(tmp_path, 'rb') as fsrc:
+                                uncompressed_size = _write_data_object(fsrc=fsrc, idst=itmp_path)
+                            # NOTE: With `stream`, the link from the cache is the only local file, so it is always removed.
+                            os.remove(tmp_path)
+                        else:
+                            uncompressed_size = os.path.getsize(tmp_path)
+                        uncompressed_hash = uncompressed_hash_imeta
+                        verify_mode = 'cached'
+                        decompressed = True
+                    else:
+                        def _decompress(fsrc, fdst):
+                            if verify_mode != 'full':
+                                writer = _CountingWriter(fobj=fdst)
+                                codec['decompress'](fsrc, writer, workers)
+                                span.nbytes = writer.size
+                                return writer
+                            writer = _HashingWriter(fobj=fdst, algorithm=hash_method_imeta, workers=workers, timed=(span is not _NULL_SPAN))
+                            codec['decompress'](fsrc, writer, workers)
+                            # NOTE: Hashing is recorded as its own stage.
+                            (span.nbytes, span.exclude_seconds) = (writer.size, writer.hash_seconds)
+                            _record_span(action='decompress', stage='hash', ipath=ipath, seconds=writer.hash_seconds, nbytes=writer.size)
+                            return writer
+                        span = _span('decompress', 'codec', ipath)
+                        if stream:
+                            logger.debug(("decompress: _pipe_data_objects(isrc={src}, idst={dst}, " +
+                                          "func=decompress_func(fdst=_HashingWriter(algorithm={hmi}))); " +
+                                          "compression_method = {cm}").format(src=itmp_path_gz, dst=itmp_path, hmi=hash_method_imeta,
+                                                                              cm=compression_method_imeta))
+                            # NOTE: Keep a copy of the stream to add to the cache once its hash is verified, or to hash later.
+                            tmp_path_copy = None
+                            if (cache_key is not None) and (verify_mode == 'full'):
+                                tmp_path_copy = tmp_path_cache = os.path.join(cache_dir, 'tmp', tmpname)
+                            elif verify_mode == 'deferred':
+                                tmp_path_copy = tmp_path
+                            if tmp_path_copy is not None:
+                                logger.debug("decompress: Copying stream to {tpc}".format(tpc=tmp_path_copy))
+                                with span, open(tmp_path_copy, 'wb') as fcopy:
+                                    writer = _pipe_data_objects(isrc=itmp_path_gz, idst=itmp_path,
+                                                                func=(lambda fsrc, fdst: _decompress(fsrc=fsrc, fdst=_TeeWriter(fobjs=[fdst, fcopy]))))
+                            else:
+                                with span:
+                                    writer = _pipe_data_objects(isrc=itmp_path_gz, idst=itmp_path, func=_decompress)
+                        else:
+                            logger.debug("decompress: transport.get({src}, {dst})".format(src=itmp_path_gz, dst=tmp_path_gz))
+                            with _span('decompress', 'iget', ipath) as iget_span:
+                                transport.get(itmp_path_gz, tmp_path_gz)
+                                iget_span.nbytes = os.path.getsize(tmp_path_gz)
+                            journal.stage('fetch')
+                            logger.debug(("decompress: decompress_func(fsrc={tmp_path_gz}, fdst=_HashingWriter({tmp_path}, " +
+                                          "algorithm={hmi})); compression_method = {cm}").format(tmp_path_gz=tmp_path_gz, tmp_path=tmp_path,
+                                                                                                hmi=hash_method_imeta, cm=compression_method_imeta))
+                            with span, open(tmp_path_gz, 'rb') as fsrc:
+                                with open(tmp_path, 'wb') as fdst:
+                                    writer = _decompress(fsrc=fsrc, fdst=fdst)
+                        uncompressed_size = writer.size
+                        # NOTE: Without the hash, the file is written with the hash from imeta, as from the cache.
+                        uncompressed_hash = writer.hexdigest() if (verify_mode == 'full') else uncompressed_hash_imeta
+                        decompressed = True
+                else:
+                    logger.error(("decompress: 'COMPRESSION_METHOD' not valid. Skipping decompression.\n" +
+                                  "COMPRESSION_METHOD = {cm}\n" +
+                                  "valid_compression_methods = {vcm}").format(cm=compression_method_imeta, vcm=valid_compression_methods))
+                # If file was successfully decompressed, check metadata against uncompressed version then move to ipath..
+                if decompressed:
+                    logger.debug("decompress: uncompressed_size = {usize}".format(usize=uncompressed_size))
+                    size_matches = (uncompressed_size == uncompressed_size_imeta)
+                    if size_matches:
+                        logger.debug("decompress: Uncompressed file size matches 'UNCOMPRESSED_SIZE' from imeta.")
+                    else:
+                        logger.error(("decompress: Uncompressed file size does not match 'UNCOMPRESSED_SIZE' from imeta.\n" +
+                                      "uncompressed_size from file  (bytes) = {usize}\n" +
+                                      "UNCOMPRESSED_SIZE from imeta (bytes) = {usize_im}").format(usize=uncompressed_size,
+                                                                                                  usize_im=uncompressed_size_imeta))
+                    logger.debug("decompress: uncompressed_hash = {uhash}".format(uhash=uncompressed_hash))
+                    hash_matches = (uncompressed_hash == uncompressed_hash_imeta)
+                    if verify_mode in ['trailer', 'deferred']:
+                        logger.debug("decompress: Uncompressed hash not computed. verify_mode = {vm}".format(vm=verify_mode))
+                    elif hash_matches:
+                        logger.debug("decompress: Uncompressed hash matches 'UNCOMPRESSED_HASH' from imeta.")
+                    else:
+                        logger.error(("decompress: Uncompressed hash does not match 'UNCOMPRESSED_HASH' from imeta.\n" +
+                                      "HASH_METHOD from file and imeta = {hmeth_im}\n" +
+                                      "uncompressed_hash from file     = {uhash}\n" +
+                                      "UNCOMPRESSED_HASH from imeta    = {uhash_im}").format(hmeth_im=hash_method_imeta,
+                                                                                             uhash=uncompressed_hash,
+                                                                                             uhash_im=uncompressed_hash_imeta))
+                        if (not cache_hit) and isinstance(writer.hasher, _TreeHasher) and ('CHUNK_HASHES' in imeta_dict):
+                            _log_corrupt_chunks(ipath=ipath, ichunk_hashes=imeta_dict['CHUNK_HASHES']['value'], digests=writer.hasher.digests())
+                    # Add the decompressed file to the cache only if it matches imeta.
+                    if (cache_key is not None) and (verify_mode == 'full'):
+                        cache_src = tmp_path_cache if stream else tmp_path
+                        if size_matches and hash_matches:
+                            logger.debug("decompress: _cache_put(cache_dir={cd}, key={key}, src_path={src})".format(cd=cache_dir, key=cache_key,
+                                                                                                                 src=cache_src))
+                            with _span('decompress', 'cache_put', ipath, nbytes=uncompressed_size):
+                                _cache_put(cache_dir=cache_dir, key=cache_key, src_path=cache_src, cache_bytes=cache_bytes)
+                        if stream:
+                            os.remove(tmp_path_cache)
+                    # NOTE: With `stream`, the decompressed file is already in `itmp_iplant`.
+                    journal.stage('decode', uncompressed_size=uncompressed_size, uncompressed_hash=uncompressed_hash)
+                    if not stream:
+                        logger.debug("decompress: transport.put({src}, {dst})".format(src=tmp_path, dst=itmp_path))
+                        with _span('decompress', 'iput', ipath, nbytes=uncompressed_size):
+                            transport.put(tmp_path, itmp_path)
+                    journal.stage('put')
+                    itmp_path_copy = itmp_path+'_copy'
+                    logger.debug("decompress: transport.copy({src}, {dst})".format(src=itmp_path, dst=itmp_path_copy))
+                    with _span('decompress', 'icp', ipath, nbytes=uncompressed_size):
+                        transport.copy(itmp_path, itmp_path_copy)
+                    logger.debug("decompress: transport.move({src}, {dst})".format(src=itmp_path_copy, dst=ipath))
+                    with _span('decompress', 'imv', ipath):
+                        transport.move(itmp_path_copy, ipath)
+                    journal.stage('publish')
+                    # Set metadata describing compression state.
+                    imeta_triplets = _decompressed_triplets(uncompressed_size=uncompressed_size, uncompressed_hash=uncompressed_hash,
+                                                            hash_method=hash_method_imeta, iparent=itmp_path_gz, isidecars=isidecars)
+                    logger.debug("decompress: transport.meta_set(ipath={ipath}, imeta_triplets={it})".format(ipath=ipath, it=imeta_triplets))
+                    with _span('decompress', 'imeta_set', ipath):
+                        transport.meta_set(ipath, imeta_triplets)
+                    # NOTE: The decompressed data object has only the metadata just set.
+                    _index_put(ipath=ipath, imeta_dict={}, imeta_triplets=imeta_triplets)
+                    journal.remove()
+                    stats.update(result='decompressed', uncompressed_size=uncompressed_size,
+                                 compressed_size=imeta_dict.get('COMPRESSED_SIZE', {}).get('value'), verify=verify_mode)
+                    # Delete temporary files if requested.
+                    if delete_itmp_files:
+                        logger.debug("decompress: delete_itmp_files = {tf}; keep_parents = {kp}".format(tf=delete_itmp_files,
+                                                                                                       kp=keep_parents))
+                        for itmp in [itmp_path]:
+                            logger.debug("decompress: transport.remove({itmp})".format(itmp=itmp))
+                            with _span('decompress', 'irm', ipath):
+                                transport.remove(itmp)
+                        # NOTE: Metadata of the parent are read again since the index does not record 'DEDUP_FILE'.
+                        if not keep_parents:
+                            logger.debug("decompress: _remove_parent(iparent={ip})".format(ip=itmp_path_gz))
+                            with _span('decompress', 'irm', ipath):
+                                _remove_parent(iparent=itmp_path_gz, parent_imeta_dict=transport.meta_get(itmp_path_gz),
+                                               itmp_iplant=itmp_iplant, tmp_iplant=tmp_iplant, lock_timeout=lock_timeout)
+                    if delete_tmp_files and not stream:
+                        logger.debug("decompress: delete_tmp_files = {tf}".format(tf=delete_tmp_files))
+                        # NOTE: With a cache hit, the compressed file was not copied to `tmp_iplant`.
+                        # NOTE: With 'deferred', the uncompressed file is deleted once it is hashed.
+                        tmps = [tmp_path] if cache_hit else [tmp_path, tmp_path_gz]
+                        for tmp in (tmps[1:] if verify_mode == 'deferred' else tmps):
+                            logger.debug("decompress: os.remove({tmp})".format(tmp=tmp))
+                            os.remove(tmp)
+                    # Hash the local copy after this call returns, or now if the queue is full.
+                    # NOTE: The copy keeps its scratch reservation until `verify_file` has hashed it.
+                    if verify_mode == 'deferred':
+                        logger.debug("decompress: _scratch_defer(tmp_iplant={tip}, tmp_path={tp}, nbytes={nb})".format(tip=tmp_iplant, tp=tmp_path_reserved,
+                                                                                                                      nb=uncompressed_size_imeta))
+                        _scratch_defer(tmp_iplant=tmp_iplant, tmp_path=tmp_path_reserved, nbytes=uncompressed_size_imeta)
+                        tmp_path_reserved = None
+                        kwargs = {'ipath': ipath, 'path': tmp_path, 'hash_method': hash_method_imeta,
+                                  'uncompressed_hash': uncompressed_hash_imeta, 'uncompressed_size': uncompressed_size_imeta,
+                                  'workers': workers, 'delete_tmp_files': (delete_tmp_files or stream),
+                                  'ichunk_hashes': imeta_dict.get('CHUNK_HASHES', {}).get('value'), 'tmp_iplant': tmp_iplant}
+                        logger.debug("decompress: enqueue_verify(queue_file={qf}, kwargs={kw})".format(qf=queue_file, kw=kwargs))
+                        if not enqueue_verify(queue_file=queue_file, max_depth=queue_max_depth, **kwargs):
+                            logger.info("decompress: Queue is full. Hashing file now.")
+                            try:
+                                verify_file(**kwargs)
+                            except IOError:
+                                # NOTE: The file is already decompressed, and `verify_file` logged the mismatch.
+                                pass
+                else:
+                    logger.error(("decompress: File was not decompressed.\n" +
+                                  "itmp_path = {itmp_path}\n").format(itmp_path=itmp_path))
+                    stats.update(result='not_decompressed')
+            finally:
+                if tmp_path_reserved is not None:
+                    _scratch_release(tmp_iplant=tmp_iplant, tmp_path=tmp_path_reserved)
+        # ...otherwise do nothing.
+        else:
+            logger.debug("decompress: do_decompress = {tf}".format(tf=do_decompress))
+            stats.update(result='skipped')
+        _record_span(action='decompress', stage='total', ipath=ipath, seconds=time.time()-time_start, nbytes=stats['uncompressed_size'],
+                     status=('error' if stats['result'] == 'not_decompressed' else 'ok'))
+        if read_lease and (stats['result'] != 'not_decompressed'):
+            flight.readers.append(time.time())
+        flight.stats = stats
+    return stats
+
+
+def _has_size(ipath, size):
+    """Semi-private method to check that data object `ipath` exists and has `size` bytes, e.g. a temporary file
+    that was written completely."""
+    transport = _get_transport()
+    return transport.exists(ipath) and (transport.size(ipath) == size)
+
+
+def _remove_leftovers(ipaths=(), paths=()):
+    """Semi-private method to remove the data objects `ipaths` and local files `paths` that exist, e.g. temporary files of
+    a call that did not finish."""
+    transport = _get_transport()
+    for ipath in ipaths:
+        if (ipath is not None) and transport.exists(ipath):
+            logger.debug("_remove_leftovers: transport.remove({ipath})".format(ipath=ipath))
+            transport.remove(ipath)
+    for path in paths:
+        if (path is not None) and os.path.exists(path):
+            logger.debug("_remove_leftovers: os.remove({path})".format(path=path))
+            os.remove(path)
+    return None
+
+
+def _resume_compress(journal):
+    """Semi-private method to finish or undo a `compress` that did not finish from its journal.
+
+    Parameters
+    ----------
+    journal : _Journal
+        Journal of the call from `_Journal.load`.
+
+    Returns
+    -------
+    result : string
+        'resumed' if the compressed file is at `ipath` with its metadata, 'rolled_back' if the uncompressed file was
+        moved back to `ipath`, or 'cleared' if `ipath` was in place and only temporary files were removed.
+
+    Raises
+    ------
+    IOError
+        If neither `ipath` nor the uncompressed file in `itmp_iplant` exist.
+
+    See Also
+    --------
+    CALLS : {_get_transport, _has_size, _remove_leftovers, _compressed_triplets, _index_put}
+    CALLED_BY : {_resume_journal}
+    RELATED : {_resume_decompress, compress}
+
+    Notes
+    -----
+    - The compressed file is reused from the last durable stage: at `ipath` once published, in `itmp_iplant` once put,
+      or in `tmp_iplant` once encoded. The sizes and hash journaled at 'encode' are set as metadata, so the file is
+      neither compressed nor hashed again.
+    - A local compressed file is not reused if the codec made a block index or the hash method chunk digests, since
+      they were not journaled. The file is rolled back instead.
+    - With a deduplication store, the file is resumed only once `ipath` is registered to its payload. Otherwise it is
+      rolled back, which may leave a payload without data objects or with 'REFCOUNT' too high. See `_dedup_link`.
+    - A stale compressed parent is not deleted.
+
+    """
+    transport = _get_transport()
+    (ipath, kwargs, artifacts) = (journal.ipath, journal.record['kwargs'], journal.record['artifacts'])
+    (itmp_path, tmp_path) = (artifacts['itmp_path'], artifacts['tmp_path'])
+    (itmp_path_gz, tmp_path_gz) = (artifacts.get('itmp_path_gz'), artifacts.get('tmp_path_gz'))
+    ipath_exists = transport.exists(ipath)
+    imeta_triplets = None
+    if kwargs.get('idedup_iplant') is not None:
+        if journal.done('payload') and ipath_exists:
+            imeta_triplets = _compressed_triplets(compression_method=artifacts['compression_method'],
+                                                  uncompressed_size=artifacts['uncompressed_size'],
+                                                  uncompressed_hash=artifacts['uncompressed_hash'],
+                                                  hash_method=artifacts['hash_method'], compressed_size=artifacts['compressed_size'],
+                                                  iparent=itmp_path, isidecars=artifacts['isidecars'])
+            imeta_triplets.append(['DEDUP_FILE', artifacts['ipayload'], 'NONE'])
+    elif journal.done('encode'):
+        compressed_size = artifacts['compressed_size']
+        # Put the local compressed file, then publish the compressed file in `itmp_iplant`, as `compress` does.
+        if not ipath_exists:
+            reusable = journal.done('put') or (not artifacts['sidecars'])
+            if (reusable and (not _has_size(itmp_path_gz, compressed_size)) and (tmp_path_gz is not None) and
+                os.path.exists(tmp_path_gz) and (os.path.getsize(tmp_path_gz) == compressed_size)):
+                _remove_leftovers(ipaths=[itmp_path_gz])
+                logger.debug("_resume_compress: transport.put({src}, {dst})".format(src=tmp_path_gz, dst=itmp_path_gz))
+                transport.put(tmp_path_gz, itmp_path_gz)
+            if reusable and _has_size(itmp_path_gz, compressed_size):
+                _remove_leftovers(ipaths=[itmp_path_gz+'_copy'])
+                logger.debug("_resume_compress: transport.copy({src}, {dst})".format(src=itmp_path_gz, dst=itmp_path_gz+'_copy'))
+                transport.copy(itmp_path_gz, itmp_path_gz+'_copy')
+                logger.debug("_resume_compress: transport.move({src}, {dst})".format(src=itmp_path_gz+'_copy', dst=ipath))
+                transport.move(itmp_path_gz+'_copy', ipath)
+                ipath_exists = True
+        if ipath_exists and (transport.size(ipath) == compressed_size):
+            imeta_triplets = _compressed_triplets(compression_method=artifacts['compression_method'],
+                                                  uncompressed_size=artifacts['uncompressed_size'],
+                                                  uncompressed_hash=artifacts['uncompressed_hash'],
+                                                  hash_method=artifacts['hash_method'], compressed_size=compressed_size,
+                                                  iparent=itmp_path, isidecars=artifacts.get('isidecars', []))
+    if imeta_triplets is not None:
+        logger.info("_resume_compress: Resuming compress of {ipath} after stage {stage}".format(ipath=ipath, stage=journal.record['stages'][-1]))
+        logger.debug("_resume_compress: transport.meta_set(ipath={ipath}, imeta_triplets={it})".format(ipath=ipath, it=imeta_triplets))
+        transport.meta_set(ipath, imeta_triplets)
+        _index_put(ipath=ipath, imeta_dict={}, imeta_triplets=imeta_triplets)
+        result = 'resumed'
+        if kwargs.get('delete_itmp_files'):
+            _remove_leftovers(ipaths=[itmp_path, itmp_path_gz])
+        if kwargs.get('delete_tmp_files'):
+            _remove_leftovers(paths=[tmp_path, tmp_path_gz])
+    elif ipath_exists:
+        # NOTE: The file was not moved, or the call was rolled back already. The uncompressed file in `itmp_iplant`,
+        # if any, is kept.
+        logger.warning("_resume_compress: {ipath} is in place. Clearing journal after stage {stage}".format(ipath=ipath,
+                                                                                                             stage=journal.record['stages'][-1]))
+        result = 'cleared'
+        _remove_leftovers(ipaths=[itmp_path_gz], paths=[tmp_path, tmp_path_gz])
+    elif transport.exists(itmp_path):
+        logger.warning("_resume_compress: Rolling back compress of {ipath} after stage {stage}".format(ipath=ipath,
+                                                                                                        stage=journal.record['stages'][-1]))
+        logger.debug("_resume_compress: transport.move({src}, {dst})".format(src=itmp_path, dst=ipath))
+        transport.move(itmp_path, ipath)
+        result = 'rolled_back'
+        # NOTE: A compressed file without a journaled path, e.g. from a crash while encoding, is left in `itmp_iplant`.
+        isidecars = [isidecar for (_, isidecar) in artifacts.get('isidecars', []) if os.path.dirname(isidecar) == os.path.dirname(itmp_path)]
+        _remove_leftovers(ipaths=[itmp_path_gz, (itmp_path_gz+'_copy' if (itmp_path_gz is not None) else None)]+isidecars,
+                          paths=[tmp_path, tmp_path_gz])
+    else:
+        raise IOError(("Neither `ipath` nor the file moved from it exist. Keeping journal {jf}\n" +
+                       "ipath = {ipath}\n" +
+                       "itmp_path = {itmp_path}").format(jf=journal.journal_file, ipath=ipath, itmp_path=itmp_path))
+    return result
+
+
+def _resume_decompress(journal):
+    """Semi-private method to finish or undo a `decompress` that did not finish from its journal.
+
+    Parameters
+    ----------
+    journal : _Journal
+        Journal of the call from `_Journal.load`.
+
+    Returns
+    -------
+    result : string
+        'resumed' if the decompressed file is at `ipath` with its metadata, 'rolled_back' if the compressed file was
+        moved back to `ipath`, or 'cleared' if `ipath` was in place and only temporary files were removed.
+
+    Raises
+    ------
+    IOError
+        If neither `ipath` nor the compressed file in `itmp_iplant` exist.
+
+    See Also
+    --------
+    CALLS : {_get_transport, _has_size, _remove_leftovers, _decompressed_triplets, _index_put, _remove_parent}
+    CALLED_BY : {_resume_journal}
+    RELATED : {_resume_compress, decompress}
+
+    Notes
+    -----
+    - The decompressed file is reused from the last durable stage: at `ipath` once published, in `itmp_iplant`
+      once put, or in `tmp_iplant` once decoded. The size and hash journaled at 'decode' are set as metadata.
+    - A rolled back file is still compressed, so the next open decompresses it again. A deferred hash is not queued.
+
+    """
+    transport = _get_transport()
+    (ipath, kwargs, artifacts) = (journal.ipath, journal.record['kwargs'], journal.record['artifacts'])
+    (itmp_path, tmp_path, itmp_path_gz, tmp_path_gz) = (artifacts['itmp_path'], artifacts['tmp_path'],
+                                                        artifacts['itmp_path_gz'], artifacts['tmp_path_gz'])
+    ipath_exists = transport.exists(ipath)
+    imeta_triplets = None
+    if journal.done('decode'):
+        uncompressed_size = artifacts['uncompressed_size']
+        # Put the local decompressed file, then publish the decompressed file in `itmp_iplant`, as `decompress` does.
+        if not ipath_exists:
+            if ((not _has_size(itmp_path, uncompressed_size)) and (not kwargs.get('stream')) and
+                os.path.exists(tmp_path) and (os.path.getsize(tmp_path) == uncompressed_size)):
+                _remove_leftovers(ipaths=[itmp_path])
+                logger.debug("_resume_decompress: transport.put({src}, {dst})".format(src=tmp_path, dst=itmp_path))
+                transport.put(tmp_path, itmp_path)
+            if _has_size(itmp_path, uncompressed_size):
+                _remove_leftovers(ipaths=[itmp_path+'_copy'])
+                logger.debug("_resume_decompress: transport.copy({src}, {dst})".format(src=itmp_path, dst=itmp_path+'_copy'))
+                transport.copy(itmp_path, itmp_path+'_copy')
+                logger.debug("_resume_decompress: transport.move({src}, {dst})".format(src=itmp_path+'_copy', dst=ipath))
+                transport.move(itmp_path+'_copy', ipath)
+                ipath_exists = True
+        if ipath_exists and (transport.size(ipath) == uncompressed_size):
+            imeta_triplets = _decompressed_triplets(uncompressed_size=uncompressed_size, uncompressed_hash=artifacts['uncompressed_hash'],
+                                                    hash_method=artifacts['hash_method'], iparent=itmp_path_gz,
+                                                    isidecars=artifacts['isidecars'])
+    if imeta_triplets is not None:
+        logger.info("_resume_decompress: Resuming decompress of {ipath} after stage {stage}".format(ipath=ipath,
+                                                                                                     stage=journal.record['stages'][-1]))
+        logger.debug("_resume_decompress: transport.meta_set(ipath={ipath}, imeta_triplets={it})".format(ipath=ipath, it=imeta_triplets))
+        transport.meta_set(ipath, imeta_triplets)
+        _index_put(ipath=ipath, imeta_dict={}, imeta_triplets=imeta_triplets)
+        result = 'resumed'
+        if kwargs.get('delete_itmp_files'):
+            _remove_leftovers(ipaths=[itmp_path])
+            if (not kwargs.get('keep_parents')) and transport.exists(itmp_path_gz):
+                _remove_parent(iparent=itmp_path_gz, parent_imeta_dict=transport.meta_get(itmp_path_gz),
+                               itmp_iplant=os.path.dirname(itmp_path_gz), tmp_iplant=journal.tmp_iplant,
+                               lock_timeout=kwargs.get('lock_timeout', LOCK_TIMEOUT))
+        if kwargs.get('delete_tmp_files'):
+            _remove_leftovers(paths=[tmp_path, tmp_path_gz])
+    elif ipath_exists:
+        logger.warning("_resume_decompress: {ipath} is in place. Clearing journal after stage {stage}".format(ipath=ipath,
+                                                                                                               stage=journal.record['stages'][-1]))
+        result = 'cleared'
+        _remove_leftovers(ipaths=[itmp_path], paths=[tmp_path, tmp_path_gz])
+    elif transport.exists(itmp_path_gz):
+        logger.warning("_resume_decompress: Rolling back decompress of {ipath} after stage {stage}".format(ipath=ipath,
+                                                                                                            stage=journal.record['stages'][-1]))
+        logger.debug("_resume_decompress: transport.move({src}, {dst})".format(src=itmp_path_gz, dst=ipath))
+        transport.move(itmp_path_gz, ipath)
+        result = 'rolled_back'
+        _remove_leftovers(ipaths=[itmp_path, itmp_path+'_copy'], paths=[tmp_path, tmp_path_gz])
+    else:
+        raise IOError(("Neither `ipath` nor the file moved from it exist. Keeping journal {jf}\n" +
+                       "ipath = {ipath}\n" +
+                       "itmp_path_gz = {itmp_path_gz}").format(jf=journal.journal_file, ipath=ipath, itmp_path_gz=itmp_path_gz))
+    return result
+
+
+def _resume_sample(journal):
+    """Semi-private method to move back a data object that `_sample_head` moved into `itmp_iplant` but did not move back.
+
+    Returns
+    -------
+    result : string
+        'rolled_back' if the data object was moved back to `ipath`, or 'cleared' if `ipath` was in place.
+
+    Raises
+    ------
+    IOError
+        If neither `ipath` nor the data object moved from it exist.
+
+    See Also
+    --------
+    CALLS : {_get_transport}
+    CALLED_BY : {_resume_journal}
+    RELATED : {_sample_head}
+
+    """
+    transport = _get_transport()
+    (ipath, itmp_path) = (journal.ipath, journal.record['artifacts']['itmp_path'])
+    if transport.exists(ipath):
+        result = 'cleared'
+    elif transport.exists(itmp_path):
+        logger.warning("_resume_sample: Moving {itmp_path} back to {ipath}".format(itmp_path=itmp_path, ipath=ipath))
+        logger.debug("_resume_sample: transport.move({src}, {dst})".format(src=itmp_path, dst=ipath))
+        transport.move(itmp_path, ipath)
+        result = 'rolled_back'
+    else:
+        raise IOError(("Neither `ipath` nor the file moved from it exist. Keeping journal {jf}\n" +
+                       "ipath = {ipath}\n" +
+                       "itmp_path = {itmp_path}").format(jf=journal.journal_file, ipath=ipath, itmp_path=itmp_path))
+    return result
+
+
+def _resume_reinstate(journal):
+    """Semi-private method to finish or undo a `_reinstate_parent` that did not finish from its journal.
+
+    Parameters
+    ----------
+    journal : _Journal
+        Journal of the call from `_Journal.load`.
+
+    Returns
+    -------
+    result : string
+        'resumed' if the parent is at `ipath` and its 'PARENT_FILE' was set, 'rolled_back' if the decompressed file
+        was moved back to `ipath`, or 'cleared' if the decompressed file was in place.
+
+    Raises
+    ------
+    IOError
+        If neither `ipath` nor the decompressed file moved from it exist.
+
+    See Also
+    --------
+    CALLS : {_get_transport}
+    CALLED_BY : {_resume_journal}
+    RELATED : {_reinstate_parent, _resume_compress}
+
+    Notes
+    -----
+    - What is at `ipath` is told by whether the parent is still in `itmp_iplant`, so a move that completed but was
+      not journaled before a crash is also found.
+    - A rolled back file is still decompressed. `recover` compresses it again, which reinstates the parent.
+
+    """
+    transport = _get_transport()
+    (ipath, kwargs, artifacts) = (journal.ipath, journal.record['kwargs'], journal.record['artifacts'])
+    (itmp_path, iparent) = (artifacts['itmp_path'], artifacts['iparent'])
+    if transport.exists(ipath) and (not transport.exists(iparent)):
+        logger.info("_resume_reinstate: Resuming reinstate of {ipath} after stage {stage}".format(ipath=ipath,
+                                                                                                   stage=journal.record['stages'][-1]))
+        imeta_triplets = [['PARENT_FILE', itmp_path, 'NONE']]
+        logger.debug("_resume_reinstate: transport.meta_set(ipath={ipath}, imeta_triplets={it})".format(ipath=ipath, it=imeta_triplets))
+        transport.meta_set(ipath, imeta_triplets)
+        result = 'resumed'
+        if kwargs.get('delete_itmp_files'):
+            _remove_leftovers(ipaths=[itmp_path])
+    elif transport.exists(ipath):
+        logger.warning("_resume_reinstate: {ipath} is in place. Clearing journal after stage {stage}".format(ipath=ipath,
+                                                                                                              stage=journal.record['stages'][-1]))
+        result = 'cleared'
+    elif transport.exists(itmp_path):
+        logger.warning("_resume_reinstate: Rolling back reinstate of {ipath} after stage {stage}".format(ipath=ipath,
+                                                                                                          stage=journal.record['stages'][-1]))
+        logger.debug("_resume_reinstate: transport.move({src}, {dst})".format(src=itmp_path, dst=ipath))
+        transport.move(itmp_path, ipath)
+        result = 'rolled_back'
+    else:
+        raise IOError(("Neither `ipath` nor the file moved from it exist. Keeping journal {jf}\n" +
+                       "ipath = {ipath}\n" +
+                       "itmp_path = {itmp_path}").format(jf=journal.journal_file, ipath=ipath, itmp_path=itmp_path))
+    return result
+
+
+def _resume_journal(tmp_iplant, ipath):
+    """Semi-private method to finish or undo the `compress`, `decompress`, `_reinstate_parent`, or `_sample_head` of
+    `ipath` that did not finish, if any, while the lock of `ipath` is held.
+
+    Returns
+    -------
+    result : {None, string}
+        ``None`` if `ipath` has no journal. Otherwise the result of `_resume_compress`, `_resume_decompress`,
+        `_resume_reinstate`, or `_resume_sample`, and the journal is removed.
+
+    See Also
+    --------
+    CALLS : {_Journal, _resume_compress, _resume_decompress, _resume_reinstate, _resume_sample}
+    CALLED_BY : {compress, decompress, recover, _sample_head}
+    RELATED : {_ObjectLock}
+
+    """
+    journal = _Journal.load(tmp_iplant=tmp_iplant, ipath=ipath)
+    if journal is None:
+        return None
+    logger.debug("_resume_journal: {action} of {ipath} did not finish. stages = {stages}".format(action=journal.action, ipath=ipath,
+                                                                                                  stages=journal.record['stages']))
+    if journal.action == 'compress':
+        result = _resume_compress(journal=journal)
+    elif journal.action == 'reinstate':
+        result = _resume_reinstate(journal=journal)
+    elif journal.action == 'sample':
+        result = _resume_sample(journal=journal)
+    else:
+        result = _resume_decompress(journal=journal)
+    journal.remove()
+    return result
+
+
+def recover(tmp_iplant, lock_timeout=LOCK_TIMEOUT, max_failed=20):
+    """Finish or undo the calls of `compress` and `decompress` that did not finish, e.g. after a crash, from their journals.
+
+    Parameters
+    ----------
+    tmp_iplant : string
+        Scratch volumes of the calls. Journals are kept in JOURNAL_DIRNAME within the first directory.
+        See `_parse_tmp_iplant`.
+    lock_timeout : {LOCK_TIMEOUT}, float, optional
+        Seconds after which the lock of a file held by another call is stale. See `_ObjectLock`.
+    max_failed : {20}, int, optional
+        Maximum number of failed files to list in the report.
+
+    Returns
+    -------
+    report : dict
+        'journals', the number of journals found; 'resumed', 'rolled_back', and 'cleared', the number of calls
+        with each result from `_resume_journal`; 'recompressed', the number of rolled back
+        files compressed again; 'failed', the number of files that could not be recovered; and 'failures', up to
+        `max_failed` {'ipath', 'action', 'error'}.
+
+    See Also
+    --------
+    CALLS : {_parse_tmp_iplant, _Journal, _ObjectLock, _resume_journal, compress}
+    CALLED_BY : {_run_action}
+    RELATED : {_resume_compress, _resume_decompress}
+
+    Notes
+    -----
+    - Each file is recovered under its lock, so a running call is not disturbed and a call that finished meanwhile
+      is skipped.
+    - A rolled back `compress`, or reinstate of a compressed parent by `compress`, is run again with its journaled
+      arguments. A rolled back `decompress` is not,
+      since the file is decompressed on its next open. A file that `sweep` moved to read a sample is moved back.
+    - A journal that cannot be recovered is kept and listed in 'failures'. `compress` and `decompress` also recover
+      the journal of their file before they start.
+
+    """
+    journal_dir = os.path.join(_parse_tmp_iplant(tmp_iplant)[0][0], JOURNAL_DIRNAME)
+    report = {'journals': 0, 'resumed': 0, 'rolled_back': 0, 'cleared': 0, 'recompressed': 0, 'failed': 0, 'failures': []}
+    names = sorted(os.listdir(journal_dir)) if os.path.isdir(journal_dir) else []
+    for name in names:
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(journal_dir, name)) as fobj:
+                record = json.load(fobj)
+        except (IOError, OSError, ValueError):
+            # NOTE: The journal was removed since it was listed.
+            continue
+        (ipath, action) = (record['ipath'], record['action'])
+        report['journals'] += 1
+        try:
+            with _ObjectLock(tmp_iplant=tmp_iplant, ipath=ipath, action='recover', lock_timeout=lock_timeout):
+                result = _resume_journal(tmp_iplant=tmp_iplant, ipath=ipath)
+            logger.info("recover: {action} of {ipath}: {result}".format(action=action, ipath=ipath, result=result))
+            if result is None:
+                continue
+            report[result] += 1
+            if (result == 'rolled_back') and (action in ['compress', 'reinstate']):
+                # NOTE: The lock of `ipath` is released first since `compress` takes it.
+                logger.debug("recover: compress(ipath={ipath}, **{kw})".format(ipath=ipath, kw=record['kwargs']))
+                compress(ipath=ipath, **record['kwargs'])
+                report['recompressed'] += 1
+        except Exception as err:
+            logger.error("recover: Could not recover {action} of {ipath}: {err}".format(action=action, ipath=ipath, err=err))
+            report['failed'] += 1
+            if len(report['failures']) < max_failed:
+                report['failures'].append({'ipath': ipath, 'action': action, 'error': str(err)})
+    return report
+
+
+# Define default seconds after which `prune_parents` removes a compressed parent kept by `decompress`.
+PARENT_TTL = 7*24*3600
+
+
+def _parent_age(iparent, now=None):
+    """Semi-private method to return the seconds since the compressed parent `iparent` was made by `decompress`,
+    from the timestamp that prefixes its name, or ``None`` if its name has no timestamp."""
+    timestamp = os.path.basename(iparent).split('_', 1)[0].split('.', 1)[0]
+    try:
+        made = datetime.datetime.strptime(timestamp, '%Y%m%dT%H%M%S')
+    except ValueError:
+        return None
+    return ((now if (now is not None) else datetime.datetime.now()) - made).total_seconds()
+
+
+def prune_parents(icollection, itmp_iplant, tmp_iplant, parent_ttl=PARENT_TTL, dry_run=False, lock_timeout=LOCK_TIMEOUT,
+                  max_failed=20):
+    """Remove the compressed parents kept by `decompress` that expired or that no file refers to.
+
+    Parameters
+    ----------
+    icollection : string
+        iRODS path to collection of the decompressed files. Subcollections are included.
+    itmp_iplant : string
+        iRODS path to temporary directory where `decompress` keeps compressed parents.
+    tmp_iplant : string
+        Scratch volumes of the calls of `decompress`, for their journals and locks. See `_parse_tmp_iplant`.
+    parent_ttl : {PARENT_TTL}, float, optional
+        Seconds after which a parent is removed even if a file in `icollection` refers to it.
+    dry_run : {False, True}, bool, optional
+        Report the parents that would be removed without removing them.
+    lock_timeout : {LOCK_TIMEOUT}, float, optional
+        See `_ObjectLock`.
+    max_failed : {20}, int, optional
+        Maximum number of failures listed in the report.
+
+    Returns
+    -------
+    report : dict
+        Number of 'parents' in `itmp_iplant`; 'unreferenced' and 'expired' with the number of parents to remove;
+        'journaled', the number of parents kept since a call that did not finish may need them; 'removed' and
+        'removed_bytes' unless `dry_run`; 'failed' and 'failures'.
+
+    See Also
+    --------
+    CALLS : {_get_transport, _parent_age, _ObjectLock, _remove_parent}
+    CALLED_BY : {_run_action, sweep}
+    RELATED : {decompress, recover}
+
+    Notes
+    -----
+    - Parents are the compressed data objects directly within `itmp_iplant`, i.e. with 'IS_COMPRESSED' = 'TRUE'
+      and without 'REFCOUNT'. A file refers to a parent if it is decompressed and its 'PARENT_FILE' is the parent.
+      A parent loses its last reference once its file is deleted, renamed out of `icollection`, or put again.
+    - Parents and references are listed with two general queries. Parents named in a journal in `tmp_iplant`
+      are kept, e.g. a parent that `decompress` moved but has not yet recorded as 'PARENT_FILE', so run
+      `prune_parents` on the host that runs `decompress`, with the same `tmp_iplant`.
+    - An expired parent is removed under the lock of the file that refers to it, so that `compress` does not
+      reinstate it meanwhile. A parent that shares a payload of the deduplication store is unregistered.
+      See `_remove_parent`.
+
+    """
+    transport = _get_transport()
+    time_start = time.time()
+    parents = dict((iparent, imeta_dict) for (iparent, imeta_dict)
+                   in transport.list_metadata(icollection=itmp_iplant, attr_names=['IS_COMPRESSED', 'REFCOUNT']).items()
+                   if ((os.path.dirname(iparent) == itmp_iplant) and imeta_dict.get('IS_COMPRESSED', {}).get('value') and
+                       ('REFCOUNT' not in imeta_dict)))
+    sizes = dict(transport.list_data_objects(icollection=itmp_iplant)) if len(parents) > 0 else {}
+    referrers = {}
+    for (ipath, imeta_dict) in transport.list_metadata(icollection=icollection, attr_names=['IS_COMPRESSED', 'PARENT_FILE']).items():
+        if (imeta_dict.get('IS_COMPRESSED', {}).get('value') is False) and ('PARENT_FILE' in imeta_dict):
+            referrers[str(imeta_dict['PARENT_FILE']['value'])] = ipath
+    # NOTE: Keep the files of calls that did not finish for `recover`.
+    journaled = set()
+    journal_dir = os.path.join(_parse_tmp_iplant(tmp_iplant)[0][0], JOURNAL_DIRNAME)
+    for name in (sorted(os.listdir(journal_dir)) if os.path.isdir(journal_dir) else []):
+        try:
+            with open(os.path.join(journal_dir, name)) as fobj:
+                journaled.update(value for value in json.load(fobj)['artifacts'].values() if not isinstance(value, (list, dict)))
+        except (IOError, OSError, ValueError, KeyError):
+            continue
+    report = {'action': 'prune_parents', 'dry_run': dry_run, 'parents': len(parents), 'unreferenced': 0, 'expired': 0,
+              'journaled': 0, 'removed': 0, 'removed_bytes': 0, 'failed': 0, 'failures': []}
+    now = datetime.datetime.now()
+    for iparent in sorted(parents.keys()):
+        if iparent in journaled:
+            report['journaled'] += 1
+            continue
+        ipath = referrers.get(iparent)
+        if ipath is None:
+            report['unreferenced'] += 1
+        else:
+            age = _parent_age(iparent=iparent, now=now)
+            if (age is None) or (age < parent_ttl):
+                continue
+            report['expired'] += 1
+        logger.debug("prune_parents: iparent = {ip}; ipath = {ipath}".format(ip=iparent, ipath=ipath))
+        if dry_run:
+            continue
+        try:
+            if ipath is None:
+                _remove_parent(iparent=iparent, parent_imeta_dict=transport.meta_get(iparent), itmp_iplant=itmp_iplant,
+                               tmp_iplant=tmp_iplant, lock_timeout=lock_timeout)
+            else:
+                with _ObjectLock(tmp_iplant=tmp_iplant, ipath=ipath, action='prune_parents', lock_timeout=lock_timeout):
+                    # NOTE: `compress` may have reinstated the parent while this call waited for the lock.
+                    if not transport.exists(iparent):
+                        continue
+                    _remove_parent(iparent=iparent, parent_imeta_dict=transport.meta_get(iparent), itmp_iplant=itmp_iplant,
+                                   tmp_iplant=tmp_iplant, lock_timeout=lock_timeout)
+            report['removed'] += 1
+            report['removed_bytes'] += sizes.get(iparent, 0)
+        except Exception as err:
+            logger.error("prune_parents: Could not remove {ip}: {err}".format(ip=iparent, err=err))
+            report['failed'] += 1
+            if len(report['failures']) < max_failed:
+                report['failures'].append({'iparent': iparent, 'ipath': ipath, 'error': str(err)})
+    report['elapsed_seconds'] = time.time() - time_start
+    logger.info("prune_parents: report = {report}".format(report=json.dumps(report)))
+    return report
+
+
+def release(ipath, tmp_iplant, lock_timeout=LOCK_TIMEOUT):
+    """Remove a file that shares a payload of the deduplication store without removing the data of the other files.
+
+    Parameters
+    ----------
+    ipath : string
+        iRODS path to data object.
+    tmp_iplant : string
+        Scratch volumes for the locks. See `_parse_tmp_iplant`.
+    lock_timeout : {LOCK_TIMEOUT}, float, optional
+        See `_ObjectLock`.
+
+    Returns
+    -------
+    stats : collections.OrderedDict
+        'ipath'; 'result', 'released' if `ipath` was unregistered from its payload or 'not_shared' if it has no
+        'DEDUP_FILE' and was left in place; 'dedup_file'; 'refcount', the 'REFCOUNT' of the payload without `ipath`.
+
+    See Also
+    --------
+    CALLS : {_get_transport, _ObjectLock, _dedup_release, _index_forget}
+    CALLED_BY : {_run_action}
+    RELATED : {_dedup_link, prune_parents}
+
+    Notes
+    -----
+    - `irm` of a file that shares a payload removes the physical file of every file registered to it, and `irm -U`
+      leaves 'REFCOUNT' too high. The rules in `iplant.re` disallow deleting such files except by `iplantAdmin`,
+      who removes them with this action. The payload is removed with the last file registered to it.
+
+    """
+    stats = collections.OrderedDict([('ipath', ipath), ('result', None), ('dedup_file', None), ('refcount', None)])
+    transport = _get_transport()
+    with _ObjectLock(tmp_iplant=tmp_iplant, ipath=ipath, action='release', lock_timeout=lock_timeout):
+        logger.debug("release: transport.meta_get({ipath})".format(ipath=ipath))
+        imeta_dict = transport.meta_get(ipath)
+        if 'DEDUP_FILE' not in imeta_dict:
+            logger.warning("release: {ipath} does not share a payload. Leaving it in place.".format(ipath=ipath))
+            stats['result'] = 'not_shared'
+            return stats
+        stats['dedup_file'] = str(imeta_dict['DEDUP_FILE']['value'])
+        logger.debug("release: _dedup_release(ipath={ipath}, dedup_file={df})".format(ipath=ipath, df=stats['dedup_file']))
+        stats['refcount'] = _dedup_release(ipath=ipath, imeta_dict=imeta_dict, tmp_iplant=tmp_iplant, lock_timeout=lock_timeout)
+        _index_forget(ipath=ipath)
+        stats['result'] = 'released'
+    logger.info("release: stats = {stats}".format(stats=json.dumps(stats)))
+    return stats
+
+
+def verify_file(ipath, path, hash_method, uncompressed_hash, uncompressed_size, workers=None, delete_tmp_files=False,
+                ichunk_hashes=None, tmp_iplant=None):
+    """Hash a local copy of a decompressed file and compare it to imeta, e.g. after `decompress` returned.
+
+    Parameters
+    ----------
+    ipath : string
+        iRODS path to the decompressed file. Only for logging.
+    path : string
+        Local path to the copy of the decompressed file.
+    hash_method, uncompressed_hash, uncompressed_size : string, string, int
+        'HASH_METHOD', 'UNCOMPRESSED_HASH', and 'UNCOMPRESSED_SIZE' from imeta of the compressed file.
+    workers : {None}, int, optional
+        Number of worker threads for a tree hash. Default: number of CPUs.
+    delete_tmp_files : {False, True}, bool, optional
+        Delete `path` if it matches.
+    ichunk_hashes : {None}, string, optional
+        'CHUNK_HASHES' from imeta of the compressed file, to log the chunks that do not match a tree hash.
+    tmp_iplant : {None}, string, optional
+        Scratch volumes of `decompress`. The reservation of `path` kept by `_scratch_defer` is released once `path`
+        is hashed, whether or not it matches.
+
+    Returns
+    -------
+    stats : dict
+        'ipath', 'path', 'uncompressed_size', and 'seconds'.
+
+    Raises
+    ------
+    IOError
+        If the size or hash of `path` does not match. `path` is kept.
+
+    See Also
+    --------
+    CALLS : {_new_hasher, _log_corrupt_chunks, _scratch_release}
+    CALLED_BY : {drain, decompress}
+    RELATED : {enqueue_verify}
+
+    Notes
+    -----
+    - The data object may have been read already, so a mismatch is only logged. The compressed parent
+      from 'PARENT_FILE' of `ipath` is corrupted and must be restored, e.g. from a replica.
+
+    """
+    time_start = time.time()
+    try:
+        hasher = _new_hasher(algorithm=hash_method, workers=workers)
+        size = 0
+        with _span('verify', 'hash', ipath) as span, open(path, 'rb') as fobj:
+            buf = fobj.read(2**20)
+            while len(buf) > 0:
+                hasher.update(buf)
+                size += len(buf)
+                buf = fobj.read(2**20)
+            span.nbytes = size
+        uncompressed_hash_file = hasher.hexdigest()
+        if (size != uncompressed_size) or (uncompressed_hash_file != uncompressed_hash):
+            logger.error(("verify_file: Decompressed file does not match 'UNCOMPRESSED_SIZE' and 'UNCOMPRESSED_HASH' from imeta.\n" +
+                          "ipath = {ipath}\n" +
+                          "path = {path}\n" +
+                          "uncompressed_size from file  (bytes) = {usize}\n" +
+                          "UNCOMPRESSED_SIZE from imeta (bytes) = {usize_im}\n" +
+                          "HASH_METHOD from imeta       = {hmeth_im}\n" +
+                          "uncompressed_hash from file  = {uhash}\n" +
+                          "UNCOMPRESSED_HASH from imeta = {uhash_im}").format(ipath=ipath, path=path, usize=size,
+                                                                              usize_im=uncompressed_size, hmeth_im=hash_method,
+                                                                              uhash=uncompressed_hash_file, uhash_im=uncompressed_hash))
+            if isinstance(hasher, _TreeHasher) and (ichunk_hashes is not None):
+                _log_corrupt_chunks(ipath=ipath, ichunk_hashes=ichunk_hashes, digests=hasher.digests())
+            _record_span(action='verify', stage='total', ipath=ipath, seconds=time.time()-time_start, nbytes=size, status='error')
+            raise IOError("Decompressed file does not match imeta: {ipath}".format(ipath=ipath))
+        logger.debug("verify_file: Decompressed file matches imeta: {ipath}".format(ipath=ipath))
+        if delete_tmp_files:
+            logger.debug("verify_file: os.remove({path})".format(path=path))
+            os.remove(path)
+        seconds = time.time() - time_start
+        _record_span(action='verify', stage='total', ipath=ipath, seconds=seconds, nbytes=size)
+        return {'ipath': ipath, 'path': path, 'uncompressed_size': size, 'seconds': seconds}
+    finally:
+        if tmp_iplant is not None:
+            _scratch_release(tmp_iplant=tmp_iplant, tmp_path=path)
+
+
+class _RangeComplete(Exception):
+    """Semi-private exception raised by `_RangeWriter` once the end of its range is written, to stop decompressing."""
+    pass
+
+
+class _RangeWriter(object):
+    """Semi-private class for a writable file object that writes only a range of bytes or lines to another.
+
+    Parameters
+    ----------
+    fobj : file
+        Writable file object for the range.
+    start : int
+        First byte or line of the range, 0-based.
+    end : {None}, int
+        Byte or line after the range. ``None`` for the end of the data.
+    unit : {'bytes', 'lines'}, string
+        Unit of `start`, `end`, and `position`.
+    position : {0}, int, optional
+        Byte or line of the data at the first byte written, e.g. of the first BGZF block read.
+        For 'lines', the number of newlines before the first byte written.
+
+    Raises
+    ------
+    _RangeComplete
+        From `write` once the range has been written.
+
+    See Also
+    --------
+    CALLS : {}
+    CALLED_BY : {read_range}
+    RELATED : {_CountingWriter}
+
+    """
+
+    def __init__(self, fobj, start, end, unit, position=0):
+        self.fobj = fobj
+        (self.start, self.end, self.unit, self.position) = (start, end, unit, position)
+        self.size = 0
+
+    def _line_offset(self, buf, nlines):
+        """Return the offset in `buf` after its `nlines`-th newline, or ``None`` if `buf` has fewer newlines."""
+        offset = 0
+        for _ in range(nlines):
+            idx = buf.find(b'\n', offset)
+            if idx < 0:
+                return None
+            offset = idx+1
+        return offset
+
+    def write(self, buf):
+        """Write the part of `buf` within the range."""
+        if self.unit == 'bytes':
+            begin = max(self.start-self.position, 0)
+            stop = len(buf) if self.end is None else min(max(self.end-self.position, 0), len(buf))
+            self.position += len(buf)
+        else:
+            begin = 0 if self.position >= self.start else self._line_offset(buf, self.start-self.position)
+            stop = None if self.end is None else self._line_offset(buf, self.end-self.position)
+            if begin is None:
+                begin = len(buf)
+            if stop is None:
+                stop = len(buf)
+            self.position += buf.count(b'\n')
+        if stop > begin:
+            self.fobj.write(buf[begin:stop])
+            self.size += stop-begin
+        if (self.end is not None) and (self.position >= self.end):
+            raise _RangeComplete()
+        return None
+
+
+class _ChunkVerifier(object):
+    """Semi-private class for a writable file object that checks chunks of a tree hash before passing them on.
+
+    Parameters
+    ----------
+    fobj : file
+        Writable file object, e.g. a `_RangeWriter`.
+    algorithm : string
+        `hashlib` algorithm name of the tree hash.
+    chunksize : int
+        Bytes per chunk of the tree hash.
+    digests : list
+        Digest of each chunk from `_unpack_chunk_hashes`.
+    offset : int
+        Byte of the file at the first byte written.
+    size : int
+        Size of the file in bytes, i.e. the end of the last chunk.
+
+    Attributes
+    ----------
+    chunks_verified : int
+        Number of chunks checked so far.
+
+    Raises
+    ------
+    IOError
+        From `write` if a chunk does not match its digest, and from `close` if the data end within a chunk.
+
+    See Also
+    --------
+    CALLS : {_tree_leaf}
+    CALLED_BY : {read_range}
+    RELATED : {_TreeHasher}
+
+    Notes
+    -----
+    - Bytes before the first chunk boundary at or after `offset` are passed on without being checked.
+      Each chunk is passed on only once it is complete and matches, so the bytes of a range are checked if
+      the data cover the chunks that hold it.
+
+    """
+
+    def __init__(self, fobj, algorithm, chunksize, digests, offset, size):
+        self.fobj = fobj
+        (self.algorithm, self.chunksize, self.digests, self.size) = (algorithm, chunksize, digests, size)
+        self.offset = offset
+        self.chunk_start = -(-offset//chunksize)*chunksize
+        self.bufs = []
+        self.chunks_verified = 0
+
+    def write(self, buf):
+        """Buffer `buf` by chunk, then check and pass on each complete chunk."""
+        while len(buf) > 0:
+            if self.offset < self.chunk_start:
+                nbytes = min(len(buf), self.chunk_start-self.offset)
+                self.fobj.write(buf[:nbytes])
+            else:
+                chunk_end = min(self.chunk_start+self.chunksize, self.size)
+                nbytes = min(len(buf), chunk_end-self.offset)
+                if nbytes <= 0:
+                    raise IOError("Data continue after the end of the file from 'UNCOMPRESSED_SIZE': {size}".format(size=self.size))
+                self.bufs.append(buf[:nbytes])
+            self.offset += nbytes
+            buf = buf[nbytes:]
+            if (len(self.bufs) > 0) and (self.offset == min(self.chunk_start+self.chunksize, self.size)):
+                self._check_chunk()
+        return None
+
+    def _check_chunk(self):
+        """Check the buffered chunk against its digest, then pass it on."""
+        idx = self.chunk_start//self.chunksize
+        chunk = b''.join(self.bufs)
+        if (idx >= len(self.digests)) or (_tree_leaf(self.algorithm, chunk) != self.digests[idx]):
+            raise IOError(("Chunk {idx} (bytes {lo}-{hi}) does not match 'CHUNK_HASHES'.").format(idx=idx, lo=self.chunk_start,
+                                                                                                 hi=self.chunk_start+len(chunk)))
+        self.chunks_verified += 1
+        (self.bufs, self.chunk_start) = ([], self.chunk_start+len(chunk))
+        self.fobj.write(chunk)
+        return None
+
+    def close(self):
+        """Raise ``IOError`` if the data ended within a chunk, e.g. if the compressed data were truncated."""
+        if len(self.bufs) > 0:
+            raise IOError("Data ended within chunk {idx}.".format(idx=self.chunk_start//self.chunksize))
+        return None
+
+
+def _read_sidecar(ipath, isidecar, action='read_range'):
+    """Semi-private method to read a sidecar data object of `ipath` from `compress`, e.g. its 'BLOCK_INDEX'.
+
+    Returns
+    -------
+    data : bytes
+        Contents of `isidecar`.
+
+    See Also
+    --------
+    CALLS : {_get_transport}
+    CALLED_BY : {read_range, _log_corrupt_chunks}
+    RELATED : {SIDECAR_ATTRS}
+
+    """
+    logger.debug("_read_sidecar: transport.open_read({isc})".format(isc=isidecar))
+    with _span(action, 'iget_sidecar', ipath) as span:
+        fsrc = _get_transport().open_read(isidecar)
+        try:
+            data = fsrc.read()
+        finally:
+            fsrc.close()
+        span.nbytes = len(data)
+    return data
+
+
+def _log_corrupt_chunks(ipath, ichunk_hashes, digests, max_chunks=20):
+    """Semi-private method to log which chunks of a file do not match the chunk digests of its tree hash.
+
+    Parameters
+    ----------
+    ipath : string
+        iRODS path to the file, for logging.
+    ichunk_hashes : string
+        iRODS path to the chunk digests from `compress`, i.e. 'CHUNK_HASHES'.
+    digests : list
+        Chunk digests of the file as read, from `_TreeHasher.digests`.
+    max_chunks : {20}, int, optional
+        Maximum number of chunks to list.
+
+    Returns
+    -------
+    corrupt_chunks : {None}, list
+        Indexes of chunks that do not match. ``None`` if the chunk digests cannot be read.
+
+    See Also
+    --------
+    CALLS : {_read_sidecar, _unpack_chunk_hashes}
+    CALLED_BY : {decompress}
+    RELATED : {_TreeHasher}
+
+    """
+    try:
+        (chunksize, digests_imeta) = _unpack_chunk_hashes(_read_sidecar(ipath=ipath, isidecar=ichunk_hashes, action='decompress'))
+    except Exception as err:
+        logger.warning("_log_corrupt_chunks: Could not read chunk hashes {ich}: {err}".format(ich=ichunk_hashes, err=err))
+        return None
+    corrupt_chunks = [idx for idx in range(max(len(digests), len(digests_imeta)))
+                      if (idx >= len(digests)) or (idx >= len(digests_imeta)) or (digests[idx] != digests_imeta[idx])]
+    logger.error(("_log_corrupt_chunks: {nc} of {nt} chunks of {ipath} do not match 'CHUNK_HASHES'.\n" +
+                  "Byte ranges of chunks (first {mc}) = {ranges}").format(nc=len(corrupt_chunks), nt=len(digests_imeta), ipath=ipath,
+                                                                           mc=max_chunks,
+                                                                           ranges=['{lo}-{hi}'.format(lo=idx*chunksize, hi=(idx+1)*chunksize)
+                                                                                   for idx in corrupt_chunks[:max_chunks]]))
+    return corrupt_chunks
+
+
+def read_range(ipath, path, byte_range=None, record_range=None, workers=None, verify=True):
+    """Write a range of bytes or FASTQ records of a file in iRODS to a local file without decompressing all of it.
+
+    Parameters
+    ----------
+    ipath : string
+        iRODS path to .fastq file, compressed or not.
+    path : string
+        Local path to write the range to. Overwritten if it exists.
+    byte_range : {None}, tuple, optional
+        (start, end) of uncompressed bytes, 0-based with `end` excluded. `end` ``None`` reads to the end of the file.
+    record_range : {None}, tuple, optional
+        (start, end) of FASTQ records like `byte_range`. Records are 4 lines each.
+    workers : {None}, int, optional
+        Number of worker threads to decompress blocks. Default: number of CPUs.
+    verify : {True, False}, bool, optional
+        Check the chunks that hold the range against 'CHUNK_HASHES' of a compressed file with a tree hash.
+
+    Returns
+    -------
+    stats : collections.OrderedDict
+        'ipath'; 'method', one of 'block_index' for blocks read by the block index of a 'BGZF' file,
+        'ranged_read' for bytes of a file that is not compressed, or 'sequential' if the file is read from its start;
+        'bytes_read' from iRODS; 'bytes_written' to `path`; 'chunks_verified'; 'seconds'.
+
+    Raises
+    ------
+    ValueError
+        If not exactly one of `byte_range` and `record_range` is given, or if 'COMPRESSION_METHOD' is not valid.
+    IOError
+        If a chunk that holds the range does not match 'CHUNK_HASHES'.
+
+    See Also
+    --------
+    CALLS : {_get_transport, _index_get, _read_sidecar, _unpack_block_index, _unpack_chunk_hashes, _parse_compression_method,
+             _parse_hash_method, _RangeWriter, _ChunkVerifier, _CountingReader, _pgzip_decompress}
+    CALLED_BY : {main}
+    RELATED : {decompress, _bgzf_compress}
+
+    Notes
+    -----
+    - The file in iRODS is not changed, and its compressed data are read with `Transport.open_read`.
+      With 'BGZF' and a 'BLOCK_INDEX', only the blocks that hold the range are read and they are decompressed in parallel.
+      Other compressed files are decompressed from their start until the end of the range.
+    - Lines are counted by newlines, so record ranges are correct only for FASTQ files with 4 lines per record.
+    - With `verify`, the range is widened to whole chunks of the tree hash, e.g. 4 MiB, which are decompressed
+      and checked before the range is written. Files that are not compressed may have changed since their tree hash
+      was computed, so they are not checked.
+    - With a local index from `set_index`, the metadata of an indexed file are read from the index instead of imeta.
+
+    """
+    if (byte_range is None) == (record_range is None):
+        raise ValueError("Exactly one of `byte_range` and `record_range` must be given.")
+    if byte_range is not None:
+        (unit, (start, end)) = ('bytes', byte_range)
+    else:
+        (unit, start, end) = ('lines', 4*record_range[0], (None if record_range[1] is None else 4*record_range[1]))
+    stats = collections.OrderedDict([('ipath', ipath), ('method', None), ('bytes_read', 0), ('bytes_written', 0),
+                                     ('chunks_verified', 0), ('seconds', None)])
+    time_start = time.time()
+    transport = _get_transport()
+    imeta_dict = _index_get(ipath=ipath)
+    if imeta_dict is None:
+        logger.debug("read_range: transport.meta_get({ipath})".format(ipath=ipath))
+        with _span('read_range', 'imeta_ls', ipath):
+            imeta_dict = transport.meta_get(ipath)
+    is_compressed = imeta_dict.get('IS_COMPRESSED', {}).get('value', False)
+    codec_name = None
+    if is_compressed:
+        (codec_name, _) = _parse_compression_method(str(imeta_dict.get('COMPRESSION_METHOD', {}).get('value')))
+    iblock_index = imeta_dict.get('BLOCK_INDEX', {}).get('value') if codec_name == 'BGZF' else None
+    if (iblock_index is not None) and not transport.exists(iblock_index):
+        logger.warning("read_range: Block index does not exist: {ibi}. Reading sequentially.".format(ibi=iblock_index))
+        iblock_index = None
+    (hash_algorithm, hash_chunksize) = (None, None)
+    ichunk_hashes = imeta_dict.get('CHUNK_HASHES', {}).get('value') if (verify and is_compressed) else None
+    if ichunk_hashes is not None:
+        (hash_algorithm, hash_chunksize) = _parse_hash_method(str(imeta_dict.get('HASH_METHOD', {}).get('value')))
+        if (hash_chunksize is None) or not transport.exists(ichunk_hashes):
+            logger.warning("read_range: Chunk hashes do not exist: {ich}. Range is not verified.".format(ich=ichunk_hashes))
+            ichunk_hashes = None
+    if ichunk_hashes is not None:
+        (hash_chunksize, digests) = _unpack_chunk_hashes(_read_sidecar(ipath=ipath, isidecar=ichunk_hashes))
+        size = imeta_dict['UNCOMPRESSED_SIZE']['value']
+    with open(path, 'wb') as fdst:
+        offset_uncompressed = 0
+        if iblock_index is not None:
+            (blocksize, block_offsets, line_offsets) = _unpack_block_index(_read_sidecar(ipath=ipath, isidecar=iblock_index))
+            nblocks = len(block_offsets)-1
+            # NOTE: For lines, start from the last block that begins before the start of line `start`, i.e. after at most
+            # `start`-1 newlines. The partial line at the start of the block is skipped by `_RangeWriter`.
+            if unit == 'bytes':
+                first = min(start//blocksize, nblocks)
+                last = nblocks if end is None else min(-(-end//blocksize), nblocks)
+            else:
+                first = max(bisect.bisect_left(line_offsets, start, 0, nblocks)-1, 0)
+                last = nblocks if end is None else min(bisect.bisect_left(line_offsets, end, 0, nblocks+1), nblocks)
+            # NOTE: Widen the blocks to whole chunks of the tree hash so that the chunks can be checked.
+            if ichunk_hashes is not None:
+                chunk_lo = (first*blocksize//hash_chunksize)*hash_chunksize
+                chunk_hi = min(-(-min(last*blocksize, size)//hash_chunksize)*hash_chunksize, size)
+                (first, last) = (chunk_lo//blocksize, max(min(-(-chunk_hi//blocksize), nblocks), chunk_lo//blocksize))
+            offset_uncompressed = first*blocksize
+            position = offset_uncompressed if unit == 'bytes' else line_offsets[first]
+            (offset, length) = (block_offsets[first], block_offsets[max(last, first)]-block_offsets[first])
+            logger.debug(("read_range: Reading blocks {first} to {last} of {nblocks}: transport.open_read({ipath}, offset={offset}, " +
+                          "length={length})").format(first=first, last=last, nblocks=nblocks, ipath=ipath, offset=offset, length=length))
+            reader = _CountingReader(fobj=transport.open_read(ipath, offset=offset, length=length))
+            writer = _RangeWriter(fobj=fdst, start=start, end=end, unit=unit, position=position)
+            decompress_func = (lambda fsrc, fdst: _pgzip_decompress(fsrc=fsrc, fdst=fdst, workers=workers))
+            stats['method'] = 'block_index'
+        elif (not is_compressed) and (unit == 'bytes'):
+            length = None if end is None else max(end-start, 0)
+            logger.debug("read_range: transport.open_read({ipath}, offset={offset}, length={length})".format(ipath=ipath, offset=start,
+                                                                                                           length=length))
+            reader = _CountingReader(fobj=transport.open_read(ipath, offset=start, length=length))
+            writer = _RangeWriter(fobj=fdst, start=start, end=end, unit=unit, position=start)
+            decompress_func = (lambda fsrc, fdst: shutil.copyfileobj(fsrc, fdst, 2**20))
+            stats['method'] = 'ranged_read'
+        else:
+            logger.debug("read_range: transport.open_read({ipath}); codec = {codec}".format(ipath=ipath, codec=codec_name))
+            reader = _CountingReader(fobj=transport.open_read(ipath))
+            writer = _RangeWriter(fobj=fdst, start=start, end=end, unit=unit)
+            if is_compressed:
+                decompress_func = (lambda fsrc, fdst: _codecs[codec_name]['decompress'](fsrc, fdst, workers))
+            else:
+                decompress_func = (lambda fsrc, fdst: shutil.copyfileobj(fsrc, fdst, 2**20))
+            stats['method'] = 'sequential'
+        verifier = None
+        if ichunk_hashes is not None:
+            verifier = _ChunkVerifier(fobj=writer, algorithm=hash_algorithm, chunksize=hash_chunksize, digests=digests,
+                                      offset=offset_uncompressed, size=size)
+        try:
+            with _span('read_range', 'codec', ipath) as span:
+                try:
+                    decompress_func(reader, writer if verifier is None else verifier)
+                    if verifier is not None:
+                        verifier.close()
+                except _RangeComplete:
+                    logger.debug("read_range: End of range reached.")
+                span.nbytes = writer.size
+        finally:
+            reader.close()
+    stats.update(bytes_read=reader.size, bytes_written=writer.size, seconds=time.time()-time_start,
+                 chunks_verified=(0 if verifier is None else verifier.chunks_verified))
+    _record_span(action='read_range', stage='total', ipath=ipath, seconds=stats['seconds'], nbytes=writer.size)
+    return stats
+
+
+def _queue_connect(queue_file):
+    """Semi-private method to open the compression queue, creating it if needed.
+
+    Parameters
+    ----------
+    queue_file : string
+        Local path to SQLite database of the queue, e.g. ``os.path.join(tmp_iplant, QUEUE_FILENAME)``.
+
+    Returns
+    -------
+    conn : sqlite3.Connection
+        Connection in autocommit mode. Transactions are begun explicitly. Use from one thread only.
+
+    See Also
+    --------
+    CALLS : {}
+    CALLED_BY : {_queue_put, drain, queue_status}
+    RELATED : {}
+
+    Notes
+    -----
+    - One row per `ipath`, so repeated paths are deduplicated by the primary key. For jobs from `enqueue_verify`,
+      `ipath` is the local path of the file to hash, since the iRODS path may be enqueued for compression at the same time.
+    - `state` is 'queued', 'running', or 'failed'. Finished jobs are deleted.
+    - `kwargs` holds the JSON keyword arguments for `compress`, or for `verify_file` if 'action' is 'verify'.
+    - `requeue` marks a 'running' job whose `ipath` was enqueued again, e.g. by another iput, so that it runs once more.
+
+    """
+    queue_dirname = os.path.dirname(queue_file)
+    if not os.path.exists(queue_dirname):
+        os.makedirs(queue_dirname)
+    conn = sqlite3.connect(queue_file, timeout=60.0, isolation_level=None)
+    # NOTE: WAL lets `queue_status` read while workers write. `queue_file` must be on a local file system.
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(("CREATE TABLE IF NOT EXISTS queue (" +
+                  "ipath TEXT PRIMARY KEY, " +
+                  "kwargs TEXT NOT NULL, " +
+                  "state TEXT NOT NULL, " +
+                  "attempts INTEGER NOT NULL DEFAULT 0, " +
+                  "not_before REAL NOT NULL, " +
+                  "lease_until REAL, " +
+                  "enqueued REAL NOT NULL, " +
+                  "requeue INTEGER NOT NULL DEFAULT 0, " +
+                  "last_error TEXT)"))
+    conn.execute("CREATE INDEX IF NOT EXISTS queue_state_not_before ON queue (state, not_before)")
+    return conn
+
+
+def enqueue(queue_file, ipath, itmp_iplant, tmp_iplant, delete_itmp_files=False, delete_tmp_files=False, stream=False,
+            compression_method='GZIP', workers=None, auto_candidates=None, auto_sample_size=2**22, cpu_budget=60.0,
+            cache_dir=None, cache_bytes=0, hash_method='SHA1', lock_timeout=LOCK_TIMEOUT, idedup_iplant=None, max_depth=10000):
+    """Add a file to the compression queue instead of compressing it now.
+
+    Parameters
+    ----------
+    queue_file : string
+        Local path to SQLite database of the queue.
+    ipath, itmp_iplant, tmp_iplant, delete_itmp_files, delete_tmp_files, stream, compression_method, workers,
+    auto_candidates, auto_sample_size, cpu_budget, cache_dir, cache_bytes, hash_method, lock_timeout, idedup_iplant :
+        Arguments for `compress` when the job is drained. See `compress`.
+    max_depth : {10000}, int, optional
+        Maximum number of 'queued' and 'running' jobs. Beyond this the file is not enqueued.
+
+    Returns
+    -------
+    enqueued : bool
+        ``True`` if the file is in the queue. ``False`` if the queue is full and the caller should compress now.
+
+    See Also
+    --------
+    CALLS : {_queue_put}
+    CALLED_BY : {_run_action}
+    RELATED : {drain, queue_status, enqueue_verify}
+
+    Notes
+    -----
+    - An `ipath` that is already 'queued' is not added again. An `ipath` that is 'running' is queued again once
+      it finishes. An `ipath` that 'failed' is queued again with its attempts reset.
+
+    """
+    kwargs = {'ipath': ipath, 'itmp_iplant': itmp_iplant, 'tmp_iplant': tmp_iplant,
+              'delete_itmp_files': delete_itmp_files, 'delete_tmp_files': delete_tmp_files, 'stream': stream,
+              'compression_method': compression_method, 'workers': workers, 'auto_candidates': auto_candidates,
+              'auto_sample_size': auto_sample_size, 'cpu_budget': cpu_budget,
+              'cache_dir': cache_dir, 'cache_bytes': cache_bytes, 'hash_method': hash_method, 'lock_timeout': lock_timeout,
+              'idedup_iplant': idedup_iplant}
+    return _queue_put(queue_file=queue_file, key=ipath, kwargs=kwargs, max_depth=max_depth)
+
+
+def enqueue_verify(queue_file, ipath, path, hash_method, uncompressed_hash, uncompressed_size, workers=None,
+                   delete_tmp_files=False, ichunk_hashes=None, tmp_iplant=None, max_depth=10000):
+    """Add a decompressed file to the queue to be hashed by `drain`. See `verify_file`.
+
+    Parameters
+    ----------
+    queue_file : string
+        Local path to SQLite database of the queue.
+    ipath, path, hash_method, uncompressed_hash, uncompressed_size, workers, delete_tmp_files, ichunk_hashes, tmp_iplant :
+        Arguments for `verify_file` when the job is drained. See `verify_file`.
+    max_depth : {10000}, int, optional
+        Maximum number of 'queued' and 'running' jobs. Beyond this the file is not enqueued.
+
+    Returns
+    -------
+    enqueued : bool
+        ``True`` if the file is in the queue. ``False`` if the queue is full and the caller should hash the file now.
+
+    See Also
+    --------
+    CALLS : {_queue_put}
+    CALLED_BY : {decompress}
+    RELATED : {enqueue, verify_file}
+
+    """
+    kwargs = {'action': 'verify', 'ipath': ipath, 'path': path, 'hash_method': hash_method,
+              'uncompressed_hash': uncompressed_hash, 'uncompressed_size': uncompressed_size, 'workers': workers,
+              'delete_tmp_files': delete_tmp_files, 'ichunk_hashes': ichunk_hashes, 'tmp_iplant': tmp_iplant}
+    return _queue_put(queue_file=queue_file, key=path, kwargs=kwargs, max_depth=max_depth)
+
+
+def _queue_put(queue_file, key, kwargs, max_depth=10000):
+    """Semi-private method to add a job to the queue.
+
+    Parameters
+    ----------
+    queue_file : string
+        Local path to SQLite database of the queue.
+    key : string
+        `ipath` of the job in the queue. See `_queue_connect`.
+    kwargs : dict
+        Keyword arguments of the job.
+    max_depth : {10000}, int, optional
+        Maximum number of 'queued' and 'running' jobs. Beyond this the job is not enqueued.
+
+    Returns
+    -------
+    enqueued : bool
+        ``True`` if the job is in the queue. ``False`` if the queue is full.
+
+    See Also
+    --------
+    CALLS : {_queue_connect}
+    CALLED_BY : {enqueue, enqueue_verify}
+    RELATED : {_queue_claim}
+
+    """
+    now = time.time()
+    conn = _queue_connect(queue_file=queue_file)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT state FROM queue WHERE ipath = ?", (key, )).fetchone()
+            if (row is not None) and (row[0] == 'queued'):
+                logger.debug("_queue_put: Already queued: {key}".format(key=key))
+                enqueued = True
+            elif (row is not None) and (row[0] == 'running'):
+                logger.debug("_queue_put: Running. Queue again when finished: {key}".format(key=key))
+                conn.execute("UPDATE queue SET requeue = 1, kwargs = ? WHERE ipath = ?", (json.dumps(kwargs), key))
+                enqueued = True
+            else:
+                (depth, ) = conn.execute("SELECT COUNT(*) FROM queue WHERE state IN ('queued', 'running')").fetchone()
+                if depth >= max_depth:
+                    logger.warning(("_queue_put: Queue is full. Not enqueued: {key}\n" +
+                                    "depth = {depth}\n" +
+                                    "max_depth = {md}").format(key=key, depth=depth, md=max_depth))
+                    enqueued = False
+                else:
+                    conn.execute(("INSERT OR REPLACE INTO queue (ipath, kwargs, state, attempts, not_before, lease_until, enqueued, requeue, last_error) " +
+                                  "VALUES (?, ?, 'queued', 0, ?, NULL, ?, 0, NULL)"), (key, json.dumps(kwargs), now, now))
+                    logger.debug("_queue_put: Enqueued {key}; depth = {depth}".format(key=key, depth=depth+1))
+                    enqueued = True
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+    return enqueued
+
+
+def _queue_claim(conn, lease_seconds):
+    """Semi-private method to claim the next ready job from the queue.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+        Connection from `_queue_connect`.
+    lease_seconds : float
+        Seconds until a claimed job that was not finished (e.g. its worker was killed) may be claimed again.
+
+    Returns
+    -------
+    job : {None}, tuple
+        (ipath, kwargs) of the claimed job. ``None`` if no job is ready.
+
+    See Also
+    --------
+    CALLS : {}
+    CALLED_BY : {drain}
+    RELATED : {_queue_finish}
+
+    """
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(("SELECT ipath, kwargs FROM queue " +
+                            "WHERE (state = 'queued' AND not_before <= ?) OR (state = 'running' AND lease_until <= ?) " +
+                            "ORDER BY not_before LIMIT 1"), (now, now)).fetchone()
+        if row is None:
+            job = None
+        else:
+            conn.execute("UPDATE queue SET state = 'running', lease_until = ? WHERE ipath = ?", (now+lease_seconds, row[0]))
+            job = (row[0], json.loads(row[1]))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return job
+
+
+def _queue_finish(conn, ipath, error=None, max_attempts=3, retry_delay=60.0):
+    """Semi-private method to delete a finished job or schedule a failed job for retry.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+        Connection from `_queue_connect`.
+    ipath : string
+        `ipath` of the job from `_queue_claim`.
+    error : {None}, string, optional
+        Error message if the job failed.
+    max_attempts : {3}, int, optional
+        Attempts before a job is left in state 'failed'.
+    retry_delay : {60.0}, float, optional
+        Seconds before the first retry. The delay doubles with each attempt.
+
+    Returns
+    -------
+    None
+
+    See Also
+    --------
+    CALLS : {}
+    CALLED_BY : {drain}
+    RELATED : {_queue_claim}
+
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if error is None:
+            conn.execute("DELETE FROM queue WHERE ipath = ? AND state = 'running' AND requeue = 0", (ipath, ))
+            conn.execute(("UPDATE queue SET state = 'queued', attempts = 0, not_before = ?, lease_until = NULL, requeue = 0, " +
+                          "last_error = NULL WHERE ipath = ? AND requeue = 1"), (time.time(), ipath))
+        else:
+            row = conn.execute("SELECT attempts, requeue FROM queue WHERE ipath = ?", (ipath, )).fetchone()
+            (attempts, requeue) = row if row is not None else (0, 0)
+            if requeue:
+                # A new version of `ipath` was enqueued while running, so retry it from the first attempt.
+                (attempts, state, not_before) = (0, 'queued', time.time())
+            else:
+                attempts += 1
+                state = 'failed' if attempts >= max_attempts else 'queued'
+                not_before = time.time() + retry_delay*2**(attempts-1)
+            conn.execute(("UPDATE queue SET state = ?, attempts = ?, not_before = ?, lease_until = NULL, requeue = 0, last_error = ? " +
+                          "WHERE ipath = ?"), (state, attempts, not_before, error, ipath))
+            logger.warning(("_queue_finish: Job failed: {ipath}\n" +
+                            "attempts = {att}\n" +
+                            "state = {state}\n" +
+                            "error = {err}").format(ipath=ipath, att=attempts, state=state, err=error))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return None
+
+
+def drain(queue_file, queue_workers=1, max_attempts=3, retry_delay=60.0, lease_seconds=6*3600,
+          poll_interval=None, stop_event=None):
+    """Compress files from the queue with a pool of worker threads. Files from `enqueue_verify` are hashed instead.
+
+    Parameters
+    ----------
+    queue_file : string
+        Local path to SQLite database of the queue.
+    queue_workers : {1}, int, optional
+        Number of jobs to run at the same time.
+    max_attempts : {3}, int, optional
+        Attempts before a job is left in state 'failed'.
+    retry_delay : {60.0}, float, optional
+        Seconds before the first retry of a failed job. The delay doubles with each attempt.
+    lease_seconds : {21600}, float, optional
+        Seconds until a 'running' job whose worker died is claimed again.
+    poll_interval : {None}, float, optional
+        If ``None``, return when no job is ready. Otherwise wait `poll_interval` seconds for new jobs
+        until `stop_event` is set.
+    stop_event : {None}, threading.Event, optional
+        Event to stop polling. Running jobs finish first.
+
+    Returns
+    -------
+    counts : dict
+        ``dict`` with the number of jobs 'completed' and 'failed' by this call.
+
+    See Also
+    --------
+    CALLS : {_queue_connect, _queue_claim, compress, verify_file, _queue_finish}
+    CALLED_BY : {_run_action, serve}
+    RELATED : {enqueue, queue_status}
+
+    """
+    if stop_event is None:
+        stop_event = threading.Event()
+    counts = {'completed': 0, 'failed': 0}
+    counts_lock = threading.Lock()
+    def _worker():
+        conn = _queue_connect(queue_file=queue_file)
+        try:
+            while not stop_event.is_set():
+                job = _queue_claim(conn=conn, lease_seconds=lease_seconds)
+                if job is None:
+                    if poll_interval is None:
+                        break
+                    stop_event.wait(poll_interval)
+                    continue
+                (ipath, kwargs) = job
+                action = kwargs.pop('action', 'compress')
+                logger.info("drain: {action}({ipath})".format(action=action, ipath=ipath))
+                try:
+                    if action == 'verify':
+                        verify_file(**kwargs)
+                    else:
+                        compress(**kwargs)
+                except Exception as err:
+                    logger.exception("drain: {action}({ipath}) failed.".format(action=action, ipath=ipath))
+                    _queue_finish(conn=conn, ipath=ipath, error="{name}: {err}".format(name=type(err).__name__, err=err), max_attempts=max_attempts, retry_delay=retry_delay)
+                    key = 'failed'
+                else:
+                    _queue_finish(conn=conn, ipath=ipath)
+                    key = 'completed'
+                with counts_lock:
+                    counts[key] += 1
+        finally:
+            conn.close()
+    threads = [threading.Thread(target=_worker, name="drain-{idx}".format(idx=idx)) for idx in range(queue_workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    logger.info("drain: counts = {counts}".format(counts=counts))
+    return counts
+
+
+def queue_status(queue_file, max_failed=20):
+    """Report the depth of the compression queue.
+
+    Parameters
+    ----------
+    queue_file : string
+        Local path to SQLite database of the queue.
+    max_failed : {20}, int, optional
+        Maximum number of failed jobs to list.
+
+    Returns
+    -------
+    status : collections.OrderedDict
+        Number of jobs by state ('depth' is 'queued' plus 'running'), number of 'queued' jobs that are 'ready',
+        age in seconds of the oldest 'queued' or 'running' job, and the most recently enqueued 'failed' jobs.
+
+    See Also
+    --------
+    CALLS : {_queue_connect}
+    CALLED_BY : {__main__}
+    RELATED : {enqueue, drain}
+
+    """
+    now = time.time()
+    conn = _queue_connect(queue_file=queue_file)
+    try:
+        # NOTE: Read in one transaction for a consistent snapshot while workers update the queue.
+        conn.execute("BEGIN")
+        counts = dict(conn.execute("SELECT state, COUNT(*) FROM queue GROUP BY state").fetchall())
+        (ready, ) = conn.execute("SELECT COUNT(*) FROM queue WHERE state = 'queued' AND not_before <= ?", (now, )).fetchone()
+        (oldest, ) = conn.execute("SELECT MIN(enqueued) FROM queue WHERE state IN ('queued', 'running')").fetchone()
+        failed = conn.execute(("SELECT ipath, attempts, last_error FROM queue WHERE state = 'failed' " +
+                               "ORDER BY enqueued DESC LIMIT ?"), (max_failed, )).fetchall()
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+    status = collections.OrderedDict()
+    status['queue_file'] = queue_file
+    status['depth'] = counts.get('queued', 0) + counts.get('running', 0)
+    for state in ['queued', 'running', 'failed']:
+        status[state] = counts.get(state, 0)
+    status['ready'] = ready
+    status['oldest_age_seconds'] = (now - oldest) if oldest is not None else None
+    status['failed_jobs'] = [collections.OrderedDict([('ipath', ipath), ('attempts', attempts), ('last_error', last_error)])
+                             for (ipath, attempts, last_error) in failed]
+    return status
+
+
+def _bulk_list(icollection, action):
+    """Semi-private method to list data objects to (de)compress within a collection and its subcollections.
+
+    Parameters
+    ----------
+    icollection : string
+        iRODS path to collection.
+    action : {'compress', 'decompress'}, string
+        'compress' lists objects not marked 'IS_COMPRESSED'; 'decompress' lists objects marked 'IS_COMPRESSED'.
+
+    Returns
+    -------
+    objects : collections.OrderedDict
+        iRODS paths to data objects sorted by path, with their sizes in bytes from the catalog.
+    listed : int
+        Number of data objects within `icollection` before filtering.
+
+    See Also
+    --------
+    CALLS : {_get_transport}
+    CALLED_BY : {bulk}
+    RELATED : {}
+
+    Notes
+    -----
+    - Two queries are made regardless of the number of objects: one for all objects, one for objects with
+      'IS_COMPRESSED' = 'TRUE'. The catalog is not queried per object. See `Transport.list_data_objects`.
+
+    """
+    transport = _get_transport()
+    sizes = dict(transport.list_data_objects(icollection))
+    compressed = set(ipath for (ipath, _) in transport.list_data_objects(icollection, attr_name='IS_COMPRESSED',
+                                                                         attr_value='TRUE'))
+    objects = collections.OrderedDict()
+    for ipath in sorted(sizes):
+        if (ipath in compressed) == (action == 'decompress'):
+            objects[ipath] = sizes[ipath]
+    logger.debug(("_bulk_list: {listed} objects in {coll}; {comp} compressed; " +
+                  "{sel} to {action}").format(listed=len(sizes), coll=icollection, comp=len(compressed), sel=len(objects), action=action))
+    return (objects, len(sizes))
+
+
+def _bulk_init():
+    """Semi-private method to initialize `bulk` worker processes. Interrupts are handled by the parent process."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    return None
+
+
+def _bulk_job(job):
+    """Semi-private method to (de)compress one data object in a `bulk` worker process.
+
+    Parameters
+    ----------
+    job : tuple
+        (action, kwargs) with `action` 'compress' or 'decompress' and `kwargs` for that function.
+
+    Returns
+    -------
+    record : dict
+        Stats from `compress` or `decompress` with 'status' 'ok' or 'failed', 'error', and 'seconds'.
+        Exceptions are caught so that one object does not stop the others.
+
+    See Also
+    --------
+    CALLS : {compress, decompress}
+    CALLED_BY : {bulk}
+    RELATED : {drain}
+
+    """
+    (action, kwargs) = job
+    time_start = time.time()
+    record = {'ipath': kwargs['ipath'], 'result': None, 'uncompressed_size': None, 'compressed_size': None}
+    try:
+        if action == 'compress':
+            record.update(compress(**kwargs))
+        else:
+            record.update(decompress(**kwargs))
+    except Exception as err:
+        logger.exception("_bulk_job: {action}({ipath}) failed.".format(action=action, ipath=kwargs['ipath']))
+        record.update(status='failed', error="{name}: {err}".format(name=type(err).__name__, err=err))
+    else:
+        if record['result'] == 'not_decompressed':
+            record.update(status='failed', error="'COMPRESSION_METHOD' not valid")
+        else:
+            record.update(status='ok', error=None)
+    record['seconds'] = time.time() - time_start
+    return record
+
+
+def bulk(action, icollection, itmp_iplant, tmp_iplant, checkpoint_file, bulk_workers=None, max_failed=20, ipaths=None, **kwargs):
+    """Compress or decompress all data objects within a collection in parallel processes.
+
+    Parameters
+    ----------
+    action : {'compress', 'decompress'}, string
+        Action to take on each data object.
+    icollection : string
+        iRODS path to collection. Subcollections are included.
+    itmp_iplant, tmp_iplant :
+        Arguments for `compress` and `decompress`.
+    checkpoint_file : string
+        Local path to checkpoint of finished objects, one JSON line per object. Objects finished with
+        status 'ok' in an earlier run are skipped, so an interrupted run resumes where it stopped.
+    bulk_workers : {None}, int, optional
+        Number of worker processes. Default: number of CPUs.
+    max_failed : {20}, int, optional
+        Maximum number of failed objects to list in the report.
+    ipaths : {None}, list, optional
+        iRODS paths to data objects. If given, only the listed objects among these are selected, e.g. by `sweep`.
+    **kwargs :
+        Other arguments for `compress` or `decompress`, e.g. `delete_itmp_files`, `stream`, `compression_method`.
+
+    Returns
+    -------
+    report : collections.OrderedDict
+        Number of objects listed, selected, skipped from the checkpoint, 'ok', 'failed', and 'deduplicated';
+        bytes before and after for objects (de)compressed by this run; elapsed seconds and throughput; the first failed objects.
+
+    See Also
+    --------
+    CALLS : {_bulk_list, _bulk_init, _bulk_job}
+    CALLED_BY : {_run_action, sweep}
+    RELATED : {drain}
+
+    Notes
+    -----
+    - Objects are listed and filtered by 'IS_COMPRESSED' with two general queries. See `_bulk_list`.
+    - Each object is (de)compressed by `compress` or `decompress` in a worker process, so a failed object
+      is recorded in `checkpoint_file` and does not stop the run. Failed objects are tried again by the next run.
+    - The checkpoint is written only by this process and flushed after each object. It is removed when
+      no object failed, so only an interrupted or partly failed run is resumed.
+    - Each worker process creates its own transport on first use, so with `--transport session` a worker
+      reuses one session for all of its objects. See `_get_transport`.
+    - 'bytes_saved' is 'uncompressed_bytes' minus 'compressed_bytes' for objects with both sizes known.
+      Objects linked to an existing deduplicated file add no 'compressed_bytes'. See `compress`.
+
+    """
+    time_start = time.time()
+    (objects, listed) = _bulk_list(icollection=icollection, action=action)
+    if ipaths is not None:
+        ipaths = set(ipaths)
+        objects = collections.OrderedDict((ipath, size) for (ipath, size) in objects.items() if ipath in ipaths)
+    done = set()
+    if os.path.exists(checkpoint_file):
+        with open(checkpoint_file) as fcheckpoint:
+            for line in fcheckpoint:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # NOTE: The last line may be partial if the run was killed while writing it.
+                    continue
+                if record.get('status') == 'ok':
+                    done.add(record['ipath'])
+    else:
+        checkpoint_dirname = os.path.dirname(checkpoint_file)
+        if not os.path.exists(checkpoint_dirname):
+            os.makedirs(checkpoint_dirname)
+    ipaths = [ipath for ipath in objects if ipath not in done]
+    logger.info(("bulk: {action} {n} objects in {coll} with {wkrs} processes; {skip} already finished " +
+                 "in {cf}").format(action=action, n=len(ipaths), coll=icollection, wkrs=bulk_workers,
+                                   skip=len(objects)-len(ipaths), cf=checkpoint_file))
+    jobs = [(action, dict(kwargs, ipath=ipath, itmp_iplant=itmp_iplant, tmp_iplant=tmp_iplant)) for ipath in ipaths]
+    counts = {'ok': 0, 'failed': 0}
+    deduplicated = 0
+    uncompressed_bytes = 0
+    compressed_bytes = 0
+    failed = []
+    pool = multiprocessing.Pool(processes=bulk_workers, initializer=_bulk_init)
+    try:
+        with open(checkpoint_file, 'a') as fcheckpoint:
+            results = pool.imap_unordered(_bulk_job, jobs)
+            while True:
+                # NOTE: Wait with a timeout so that KeyboardInterrupt is raised in Python 2.
+                try:
+                    record = results.next(timeout=1.0)
+                except multiprocessing.TimeoutError:
+                    continue
+                except StopIteration:
+                    break
+                fcheckpoint.write(json.dumps(record)+'\n')
+                fcheckpoint.flush()
+                counts[record['status']] += 1
+                if record['status'] == 'failed':
+                    if len(failed) < max_failed:
+                        failed.append(collections.OrderedDict([('ipath', record['ipath']), ('error', record['error'])]))
+                elif (record['uncompressed_size'] is not None) and (record['compressed_size'] is not None):
+                    uncompressed_bytes += record['uncompressed_size']
+                    # NOTE: A deduplicated object stores no new compressed bytes.
+                    if record['result'] == 'deduplicated':
+                        deduplicated += 1
+                    else:
+                        compressed_bytes += record['compressed_size']
+                finished = counts['ok'] + counts['failed']
+                if finished % 100 == 0:
+                    logger.info("bulk: {fin}/{n} objects finished; {failed} failed".format(fin=finished, n=len(jobs),
+                                                                                          failed=counts['failed']))
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    # NOTE: Remove the checkpoint once every object is finished so that the next run lists the collection afresh.
+    if counts['failed'] == 0:
+        logger.debug("bulk: os.remove({cf})".format(cf=checkpoint_file))
+        os.remove(checkpoint_file)
+    elapsed_seconds = time.time() - time_start
+    report = collections.OrderedDict()
+    report['action'] = action
+    report['icollection'] = icollection
+    report['checkpoint_file'] = checkpoint_file
+    report['listed'] = listed
+    report['selected'] = len(objects)
+    report['skipped_checkpoint'] = len(objects) - len(ipaths)
+    report['ok'] = counts['ok']
+    report['failed'] = counts['failed']
+    report['deduplicated'] = deduplicated
+    report['uncompressed_bytes'] = uncompressed_bytes
+    report['compressed_bytes'] = compressed_bytes
+    report['bytes_saved'] = uncompressed_bytes - compressed_bytes
+    report['elapsed_seconds'] = elapsed_seconds
+    report['objects_per_second'] = (counts['ok']+counts['failed'])/elapsed_seconds if elapsed_seconds > 0 else None
+    report['uncompressed_mb_per_second'] = uncompressed_bytes/2**20/elapsed_seconds if elapsed_seconds > 0 else None
+    report['failed_objects'] = failed
+    logger.info("bulk: report = {report}".format(report=json.dumps(report)))
+    return report
+
+
+def _sample_head(ipath, itmp_iplant, tmp_iplant, size, lock_timeout=LOCK_TIMEOUT):
+    """Semi-private method to read the first bytes of a data object from a copy moved into `itmp_iplant`, so that
+    reading it does not call the rules for opening files within `iplant`.
+
+    Parameters
+    ----------
+    ipath : string
+        iRODS path to data object to read.
+    itmp_iplant : string
+        iRODS path to temporary directory to move the data object to while it is read.
     tmp_iplant : string
-        Local path to temporary directory for moving files during (de)compression.
-    delete_itmp_files : {False, True}, bool, optional
-        Delete iRODS temporary files made during (de)compression.
-    delete_tmp_files : {False, True}, bool, optional
-        Delete local temporary files made during (de)compression.
+        Scratch volumes for the lock and journal of `ipath`. See `_parse_tmp_iplant`.
+    size : int
+        Number of bytes to read.
+    lock_timeout : {LOCK_TIMEOUT}, float, optional
+        See `_ObjectLock`.
+
+    Returns
+    -------
+    buf : {None, bytes}
+        First `size` bytes of the data object, or ``None`` if it is open by a reader or no longer exists.
+
+    See Also
+    --------
+    CALLS : {_get_transport, _ObjectLock, _Journal, _resume_journal, _read_head}
+    CALLED_BY : {sweep}
+    RELATED : {_resume_sample}
+
+    Notes
+    -----
+    - The data object is moved and moved back under its lock, so no `compress` or `decompress` of it runs meanwhile,
+      and files with read leases are not moved. See `compress` with `read_lease`.
+    - The move is journaled, so `recover` or the next call for `ipath` moves the copy back after a crash.
+      See `_resume_sample`.
+
+    """
+    with _ObjectLock(tmp_iplant=tmp_iplant, ipath=ipath, action='sample', lock_timeout=lock_timeout) as flight:
+        if flight.readers:
+            logger.info("_sample_head: Not sampling {ipath} while {num} readers have it open.".format(ipath=ipath, num=len(flight.readers)))
+            return None
+        _resume_journal(tmp_iplant=tmp_iplant, ipath=ipath)
+        transport = _get_transport()
+        if not transport.exists(ipath):
+            return None
+        timestamp = datetime.datetime.now().isoformat().replace('-', '').replace(':', '')
+        itmp_path = os.path.join(itmp_iplant, timestamp+'_'+os.path.basename(ipath))
+        journal = _Journal(tmp_iplant=tmp_iplant, ipath=ipath, action='sample')
+        journal.stage('begin', itmp_path=itmp_path)
+        logger.debug("_sample_head: transport.move({src}, {dst})".format(src=ipath, dst=itmp_path))
+        transport.move(ipath, itmp_path)
+        journal.stage('move')
+        try:
+            buf = _read_head(ipath=itmp_path, size=size)
+        finally:
+            logger.debug("_sample_head: transport.move({src}, {dst})".format(src=itmp_path, dst=ipath))
+            transport.move(itmp_path, ipath)
+        journal.remove()
+    return buf
+
+
+def sweep(icollection, itmp_iplant, tmp_iplant, checkpoint_file, bulk_workers=None, dry_run=False, max_samples=5,
+          max_failed=20, parent_ttl=PARENT_TTL, **kwargs):
+    """Compress the cold data objects within a collection under the tiering policy, or project the impact.
+
+    Parameters
+    ----------
+    icollection : string
+        iRODS path to collection. Subcollections are included.
+    itmp_iplant, tmp_iplant, checkpoint_file, bulk_workers, max_failed :
+        Arguments for `bulk`.
+    dry_run : {False, True}, bool, optional
+        Report the objects that would be compressed and the projected impact without compressing.
+    max_samples : {5}, int, optional
+        Number of cold objects whose first `auto_sample_size` bytes are compressed to project the compression ratio
+        and CPU time. Not used with `dry_run`.
+    parent_ttl : {PARENT_TTL}, float, optional
+        Seconds after which a compressed parent kept by `decompress` is removed. See `prune_parents`.
+    **kwargs :
+        Other arguments for `compress`, e.g. `compression_method`, `auto_sample_size`, `hash_method`, `workers`.
+
+    Returns
+    -------
+    report : collections.OrderedDict
+        Number of objects listed and not compressed; 'small', 'hot', and 'cold' with the number of 'objects' and their
+        'bytes'; 'projection' with the compression method, the 'source' of the samples, 'samples' or 'metadata',
+        the sampled objects and bytes, the compression ratio and CPU seconds per GiB of the samples, and the projected
+        'compressed_bytes', 'bytes_saved', and 'cpu_seconds' to compress the cold objects and 'bytes_forgone' by
+        leaving the hot objects uncompressed, or ``None`` if nothing was sampled. CPU seconds are ``None`` for
+        'metadata'; elapsed seconds; 'bulk', the report of `bulk` for the cold objects unless `dry_run`;
+        'prune_parents', the report of `prune_parents` with `delete_itmp_files`, otherwise ``None``.
+
+    Raises
+    ------
+    ValueError
+        If no tiering policy is set. See `set_policy`.
+
+    See Also
+    --------
+    CALLS : {_get_transport, _bulk_list, _access_scores, _policy_reason, _sample_head, _select_codec, _measure_codec,
+             _new_hasher, _CpuMeter, bulk, prune_parents}
+    CALLED_BY : {_run_action}
+    RELATED : {set_policy, compress}
+
+    Notes
+    -----
+    - Run periodically, e.g. from cron, to compress files that were left uncompressed while they were hot.
+    - Objects are listed with two general queries as by `bulk`, and access counts are read from the local
+      'access_file' of the policy.
+    - A dry run reads no data and makes no query per object. The compression ratio is projected from 'UNCOMPRESSED_SIZE'
+      and 'COMPRESSED_SIZE' of the objects within `icollection` that are compressed, listed with one general query,
+      and CPU time is not projected.
+    - Otherwise the first bytes of a few cold objects are read from copies moved into `itmp_iplant`, so that reading
+      them does not call the rules for opening files within `iplant`, which would decompress or compress them.
+      See `_sample_head`. Projected CPU time is that of the codec and the hash on this host, without transfers to
+      and from iRODS.
+    - `compress` applies the policy again to each cold object, so an object that became hot since it was
+      listed is left uncompressed.
+    - With `delete_itmp_files`, compressed parents kept by `decompress` with `keep_parents` are removed once they
+      expired or no file in `icollection` refers to them.
+
+    """
+    policy = _policy['policy']
+    if policy is None:
+        raise ValueError("`sweep` requires a tiering policy. See `set_policy`.")
+    time_start = time.time()
+    (objects, listed) = _bulk_list(icollection=icollection, action='compress')
+    scores = _access_scores(icollection=icollection)
+    groups = collections.OrderedDict((name, collections.OrderedDict()) for name in ['small', 'hot', 'cold'])
+    for (ipath, size) in objects.items():
+        groups[_policy_reason(policy=policy, size=size, score=scores.get(ipath)) or 'cold'][ipath] = size
+    logger.info(("sweep: {listed} objects in {coll}; {n} not compressed; {small} small; {hot} hot; " +
+                 "{cold} cold").format(listed=listed, coll=icollection, n=len(objects), small=len(groups['small']),
+                                       hot=len(groups['hot']), cold=len(groups['cold'])))
+    compression_method = kwargs.get('compression_method', 'GZIP')
+    hash_method = kwargs.get('hash_method', 'SHA1')
+    workers = kwargs.get('workers')
+    (sampled, sample_bytes, sample_compressed_bytes, sample_cpu_time) = (0, 0, 0, 0.0)
+    if dry_run:
+        # Project the compression ratio from the metadata of the compressed objects without reading data.
+        source = 'metadata'
+        transport = _get_transport()
+        logger.debug("sweep: transport.list_metadata(icollection={ic}, attr_names=...)".format(ic=icollection))
+        for imeta_dict in transport.list_metadata(icollection=icollection,
+                                                  attr_names=['IS_COMPRESSED', 'UNCOMPRESSED_SIZE', 'COMPRESSED_SIZE']).values():
+            if (imeta_dict.get('IS_COMPRESSED', {}).get('value') and ('UNCOMPRESSED_SIZE' in imeta_dict) and
+                ('COMPRESSED_SIZE' in imeta_dict)):
+                sampled += 1
+                sample_bytes += int(imeta_dict['UNCOMPRESSED_SIZE']['value'])
+                sample_compressed_bytes += int(imeta_dict['COMPRESSED_SIZE']['value'])
+        sample_cpu_time = None
+    else:
+        # Project the compression ratio and CPU time from samples spread over the cold objects.
+        source = 'samples'
+        candidates = list(groups['cold'].keys())
+        nsamples = min(max_samples, len(candidates))
+        for ipath in [candidates[idx*len(candidates)//nsamples] for idx in range(nsamples)]:
+            logger.debug("sweep: sample = _sample_head(ipath={ipath}, size={size})".format(ipath=ipath, size=kwargs.get('auto_sample_size', 2**22)))
+            sample = _sample_head(ipath=ipath, itmp_iplant=itmp_iplant, tmp_iplant=tmp_iplant, size=kwargs.get('auto_sample_size', 2**22),
+                                  lock_timeout=kwargs.get('lock_timeout', LOCK_TIMEOUT))
+            if not sample:
+                continue
+            if compression_method.lower() == 'auto':
+                compression_method = _select_codec(sample=sample, candidates=(kwargs.get('auto_candidates') or _auto_candidates()),
+                                                   cpu_budget=kwargs.get('cpu_budget', 60.0), workers=workers)
+            (compressed_size, cpu_time, _) = _measure_codec(sample=sample, compression_method=compression_method, workers=workers)
+            with _CpuMeter() as meter:
+                hasher = _new_hasher(algorithm=hash_method, workers=workers)
+                hasher.update(sample)
+                hasher.hexdigest()
+            sampled += 1
+            sample_bytes += len(sample)
+            sample_compressed_bytes += compressed_size
+            sample_cpu_time += cpu_time + meter.cpu_time
+    report = collections.OrderedDict()
+    report['action'] = 'sweep'
+    report['icollection'] = icollection
+    report['dry_run'] = dry_run
+    report['listed'] = listed
+    report['uncompressed'] = len(objects)
+    for (name, group) in groups.items():
+        report[name] = collections.OrderedDict([('objects', len(group)), ('bytes', sum(group.values()))])
+    projection = None
+    if sample_bytes > 0:
+        ratio = sample_bytes / max(sample_compressed_bytes, 1)
+        projection = collections.OrderedDict()
+        projection['compression_method'] = compression_method
+        projection['source'] = source
+        projection['sampled_objects'] = sampled
+        projection['sampled_bytes'] = sample_bytes
+        projection['ratio'] = ratio
+        projection['cpu_seconds_per_gib'] = (sample_cpu_time * 2**30 / sample_bytes) if (sample_cpu_time is not None) else None
+        projection['compressed_bytes'] = int(report['cold']['bytes'] / ratio)
+        projection['bytes_saved'] = report['cold']['bytes'] - projection['compressed_bytes']
+        projection['cpu_seconds'] = (sample_cpu_time * report['cold']['bytes'] / sample_bytes) if (sample_cpu_time is not None) else None
+        projection['bytes_forgone'] = report['hot']['bytes'] - int(report['hot']['bytes'] / ratio)
+    report['projection'] = projection
+    if (not dry_run) and (len(groups['cold']) > 0):
+        report['bulk'] = bulk(action='compress', icollection=icollection, itmp_iplant=itmp_iplant, tmp_iplant=tmp_iplant,
+                              checkpoint_file=checkpoint_file, bulk_workers=bulk_workers, max_failed=max_failed,
+                              ipaths=list(groups['cold'].keys()), **kwargs)
+    else:
+        report['bulk'] = None
+    if kwargs.get('delete_itmp_files'):
+        report['prune_parents'] = prune_parents(icollection=icollection, itmp_iplant=itmp_iplant, tmp_iplant=tmp_iplant,
+                                                parent_ttl=parent_ttl, dry_run=dry_run,
+                                                lock_timeout=kwargs.get('lock_timeout', LOCK_TIMEOUT))
+    else:
+        report['prune_parents'] = None
+    report['elapsed_seconds'] = time.time() - time_start
+    logger.info("sweep: report = {report}".format(report=json.dumps(report)))
+    return report
+
+
+def _add_logging_handlers(logging_level='INFO', log_file=None):
+    """Semi-private method to set logging level, format logging, and add handlers to `logger`.
+
+    Parameters
+    ----------
     logging_level : {'DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'}, string, optional
         Verbosity of logging level. 'DEBUG' is the most verbose; 'CRITICAL' is the least.
-        Default: 'INFO'
     log_file : {None}, string, optional
         Local path for writing log in addition to stdout.
-        Use to debug while executing module with iRODS icommands.
-    
+
     Returns
     -------
-    None
-    
+    handlers : list
+        ``list`` of handlers added to `logger`. Remove with `_remove_logging_handlers`.
+
     See Also
     --------
-    CALLS : {compress, decompress}
-    CALLED_BY : {__main__}
-    RELATED : {}
-    
+    CALLS : {}
+    CALLED_BY : {main, serve}
+    RELATED : {_remove_logging_handlers}
+
     """
-    # NOTE: Input checking is handled by "if __name__ == '__main__'" section.
-    # Set logging level, format logging, and add handlers.
     logger.setLevel(level=logging_level)
     fmt = '"%(asctime)s","%(name)s","%(levelname)s","%(message)s"'
     formatter = logging.Formatter(fmt=fmt)
@@ -520,63 +8854,694 @@ def main(ipath, action, itmp_iplant, tmp_iplant,
     shandler = logging.StreamHandler(sys.stdout)
     shandler.setFormatter(formatter)
     logger.addHandler(shandler)
+    handlers = [shandler]
     if log_file is not None:
-        fhandler = logging.FileHandler(filename=log_file, mode='ab')
+        fhandler = logging.FileHandler(filename=log_file, mode='a')
         fhandler.setFormatter(formatter)
         logger.addHandler(fhandler)
-    logger.info("main: BEGIN_LOGGING")
-    logger.info("main: Log format: {fmt}".format(fmt=fmt.replace('\"', '\'')))
-    logger.info("main: Log date format: default ISO 8601, UTC")
-    # Perform action on file.
+        handlers.append(fhandler)
+    logger.info("_add_logging_handlers: BEGIN_LOGGING")
+    logger.info("_add_logging_handlers: Log format: {fmt}".format(fmt=fmt.replace('\"', '\'')))
+    logger.info("_add_logging_handlers: Log date format: default ISO 8601, UTC")
+    return handlers
+
+
+def _remove_logging_handlers(handlers):
+    """Semi-private method to remove handlers from `_add_logging_handlers`.
+
+    Parameters
+    ----------
+    handlers : list
+        ``list`` of handlers returned by `_add_logging_handlers`.
+
+    Returns
+    -------
+    None
+
+    See Also
+    --------
+    CALLS : {}
+    CALLED_BY : {main, serve}
+    RELATED : {_add_logging_handlers}
+
+    """
+    logger.info("_remove_logging_handlers: END_LOGGING")
+    for handler in handlers:
+        logger.removeHandler(handler)
+        handler.close()
+    return None
+
+
+def _run_action(ipath, action, itmp_iplant, tmp_iplant,
+                delete_itmp_files=False, delete_tmp_files=False, stream=False,
+                compression_method='GZIP', workers=None,
+                auto_candidates=None, auto_sample_size=2**22, cpu_budget=60.0,
+                cache_dir=None, cache_bytes=0,
+                queue_file=None, queue_workers=1, queue_max_depth=10000, queue_max_attempts=3, queue_retry_delay=60.0,
+                icollection=None, checkpoint_file=None, bulk_workers=None, index_file=None,
+                output=None, byte_range=None, record_range=None, hash_method='SHA1', verify='full', verify_fraction=0.1,
+                lock_timeout=LOCK_TIMEOUT, idedup_iplant=None, dry_run=False, keep_parents=False, parent_ttl=PARENT_TTL,
+                read_lease=False):
+    """Semi-private method to perform an action on a file without changing logging handlers.
+
+    Parameters
+    ----------
+    See `main`.
+
+    Returns
+    -------
+    result : {bool, dict}
+        Stats from `compress` and `decompress` for 'compress' and 'decompress'. ``True`` for 'enqueue' if the file
+        was enqueued, ``False`` if it was compressed now since the queue was full. Counts of jobs from `drain` for 'drain'.
+        Status from `queue_status` for 'queue_status'. Status from `cache_status` for 'cache_status'.
+        Status from `scratch_status` for 'scratch_status'.
+        Report from `bulk` for 'bulk_compress' and 'bulk_decompress'. Report from `sweep` for 'sweep'.
+        Report from `recover` for 'recover'. Report from `prune_parents` for 'prune_parents'. Stats from `release` for 'release'.
+        Report from `index_validate` for 'index_validate'
+        and from `index_rebuild` for 'index_rebuild'. Stats from `read_range` for 'read_range'.
+
+    See Also
+    --------
+    CALLS : {compress, decompress, enqueue, drain, queue_status, cache_status, scratch_status, bulk, sweep, recover,
+             prune_parents, release, index_validate, index_rebuild, read_range}
+    CALLED_BY : {main, _JobHandler}
+    RELATED : {}
+
+    """
+    result = None
     if action == 'compress':
-        logger.info("main: Compressing file.")
-        logger.debug(("main: compress(ipath={ip}, itmp_iplant={itip}, tmp_iplant={tip}, " +
-                      "delete_itmp_files={ditf}, delete_tmp_files={dtf})").format(ip=ipath, itip=itmp_iplant, tip=tmp_iplant,
-                                                                                  ditf=delete_itmp_files, dtf=delete_tmp_files))
-        compress(ipath=ipath, itmp_iplant=itmp_iplant, tmp_iplant=tmp_iplant, delete_itmp_files=delete_itmp_files, delete_tmp_files=delete_tmp_files)
+        logger.info("_run_action: Compressing file.")
+        logger.debug(("_run_action: compress(ipath={ip}, itmp_iplant={itip}, tmp_iplant={tip}, " +
+                      "delete_itmp_files={ditf}, delete_tmp_files={dtf}, stream={strm}, " +
+                      "compression_method={cm}, workers={wkrs}, auto_candidates={ac}, auto_sample_size={ass}, " +
+                      "cpu_budget={cb}, cache_dir={cd}, cache_bytes={cby}, hash_method={hm}, lock_timeout={lt}, " +
+                      "idedup_iplant={idi}, read_lease={rl})").format(ip=ipath, itip=itmp_iplant, tip=tmp_iplant,
+                                                                                                      ditf=delete_itmp_files, dtf=delete_tmp_files,
+                                                                                                      strm=stream, cm=compression_method, wkrs=workers,
+                                                                                                      ac=auto_candidates, ass=auto_sample_size,
+                                                                                                      cb=cpu_budget, cd=cache_dir, cby=cache_bytes,
+                                                                                                      hm=hash_method, lt=lock_timeout,
+                                                                                                      idi=idedup_iplant, rl=read_lease))
+        result = compress(ipath=ipath, itmp_iplant=itmp_iplant, tmp_iplant=tmp_iplant, delete_itmp_files=delete_itmp_files,
+                          delete_tmp_files=delete_tmp_files, stream=stream, compression_method=compression_method, workers=workers,
+                          auto_candidates=auto_candidates, auto_sample_size=auto_sample_size, cpu_budget=cpu_budget,
+                          cache_dir=cache_dir, cache_bytes=cache_bytes, hash_method=hash_method, lock_timeout=lock_timeout,
+                          idedup_iplant=idedup_iplant, read_lease=read_lease)
     elif action == 'decompress':
-        logger.info("main: Decompressing file.")
-        logger.debug(("main: decompress(ipath={ip}, itmp_iplant={itip}, tmp_iplant={tip}, " +
-                      "delete_itmp_files={ditf}, delete_tmp_files={dtf})").format(ip=ipath, itip=itmp_iplant, tip=tmp_iplant,
-                                                                                  ditf=delete_itmp_files, dtf=delete_tmp_files))
-        decompress(ipath=ipath, itmp_iplant=itmp_iplant, tmp_iplant=tmp_iplant, delete_itmp_files=delete_itmp_files, delete_tmp_files=delete_tmp_files)
-    # Remove logging handlers.
-    logger.info("main: END_LOGGING")
-    logger.removeHandler(shandler)
-    if log_file is not None:
-        logger.removeHandler(fhandler)
-    return None
+        logger.info("_run_action: Decompressing file.")
+        logger.debug(("_run_action: decompress(ipath={ip}, itmp_iplant={itip}, tmp_iplant={tip}, " +
+                      "delete_itmp_files={ditf}, delete_tmp_files={dtf}, stream={strm}, " +
+                      "workers={wkrs}, cache_dir={cd}, cache_bytes={cby}, verify={vfy}, " +
+                      "verify_fraction={vf}, lock_timeout={lt}, keep_parents={kp}, read_lease={rl})").format(ip=ipath, itip=itmp_iplant, tip=tmp_iplant,
+                                                                                            ditf=delete_itmp_files, dtf=delete_tmp_files,
+                                                                                            strm=stream, wkrs=workers, cd=cache_dir,
+                                                                                            cby=cache_bytes, vfy=verify, vf=verify_fraction,
+                                                                                            lt=lock_timeout, kp=keep_parents, rl=read_lease))
+        result = decompress(ipath=ipath, itmp_iplant=itmp_iplant, tmp_iplant=tmp_iplant, delete_itmp_files=delete_itmp_files,
+                            delete_tmp_files=delete_tmp_files, stream=stream, workers=workers, cache_dir=cache_dir, cache_bytes=cache_bytes,
+                            verify=verify, verify_fraction=verify_fraction, queue_file=queue_file, queue_max_depth=queue_max_depth,
+                            lock_timeout=lock_timeout, keep_parents=keep_parents, read_lease=read_lease)
+    elif action == 'enqueue':
+        logger.info("_run_action: Enqueueing file for compression.")
+        logger.debug("_run_action: enqueue(queue_file={qf}, ipath={ip}, max_depth={md})".format(qf=queue_file, ip=ipath, md=queue_max_depth))
+        result = enqueue(queue_file=queue_file, ipath=ipath, itmp_iplant=itmp_iplant, tmp_iplant=tmp_iplant,
+                         delete_itmp_files=delete_itmp_files, delete_tmp_files=delete_tmp_files, stream=stream,
+                         compression_method=compression_method, workers=workers, auto_candidates=auto_candidates,
+                         auto_sample_size=auto_sample_size, cpu_budget=cpu_budget, cache_dir=cache_dir, cache_bytes=cache_bytes,
+                         hash_method=hash_method, lock_timeout=lock_timeout, idedup_iplant=idedup_iplant,
+                         max_depth=queue_max_depth)
+        # NOTE: When the queue is full, compress now so that ingest slows down instead of the queue growing without bound.
+        if not result:
+            logger.info("_run_action: Queue is full. Compressing file now.")
+            compress(ipath=ipath, itmp_iplant=itmp_iplant, tmp_iplant=tmp_iplant, delete_itmp_files=delete_itmp_files, delete_tmp_files=delete_tmp_files,
+                     stream=stream, compression_method=compression_method, workers=workers,
+                     auto_candidates=auto_candidates, auto_sample_size=auto_sample_size, cpu_budget=cpu_budget,
+                     cache_dir=cache_dir, cache_bytes=cache_bytes, hash_method=hash_method, lock_timeout=lock_timeout,
+                     idedup_iplant=idedup_iplant)
+    elif action == 'drain':
+        logger.info("_run_action: Draining compression queue.")
+        logger.debug(("_run_action: drain(queue_file={qf}, queue_workers={qw}, max_attempts={ma}, " +
+                      "retry_delay={rd})").format(qf=queue_file, qw=queue_workers, ma=queue_max_attempts, rd=queue_retry_delay))
+        result = drain(queue_file=queue_file, queue_workers=queue_workers, max_attempts=queue_max_attempts,
+                       retry_delay=queue_retry_delay)
+    elif action == 'queue_status':
+        result = queue_status(queue_file=queue_file)
+    elif action == 'cache_status':
+        result = cache_status(cache_dir=cache_dir)
+    elif action == 'scratch_status':
+        result = scratch_status(tmp_iplant=tmp_iplant)
+    elif action in ['bulk_compress', 'bulk_decompress']:
+        bulk_action = action.split('_', 1)[1]
+        logger.info("_run_action: Bulk {ba} of collection.".format(ba=bulk_action))
+        logger.debug(("_run_action: bulk(action={ba}, icollection={ic}, checkpoint_file={cf}, " +
+                      "bulk_workers={bw})").format(ba=bulk_action, ic=icollection, cf=checkpoint_file, bw=bulk_workers))
+        kwargs = {'delete_itmp_files': delete_itmp_files, 'delete_tmp_files': delete_tmp_files, 'stream': stream,
+                  'workers': workers, 'cache_dir': cache_dir, 'cache_bytes': cache_bytes, 'lock_timeout': lock_timeout}
+        if bulk_action == 'compress':
+            kwargs.update(compression_method=compression_method, auto_candidates=auto_candidates,
+                          auto_sample_size=auto_sample_size, cpu_budget=cpu_budget, hash_method=hash_method,
+                          idedup_iplant=idedup_iplant)
+        else:
+            kwargs.update(verify=verify, verify_fraction=verify_fraction, queue_file=queue_file, queue_max_depth=queue_max_depth,
+                          keep_parents=keep_parents)
+        result = bulk(action=bulk_action, icollection=icollection, itmp_iplant=itmp_iplant, tmp_iplant=tmp_iplant,
+                      checkpoint_file=checkpoint_file, bulk_workers=bulk_workers, **kwargs)
+    elif action == 'sweep':
+        logger.info("_run_action: Sweeping collection for cold files.")
+        logger.debug(("_run_action: sweep(icollection={ic}, checkpoint_file={cf}, bulk_workers={bw}, " +
+                      "dry_run={dr})").format(ic=icollection, cf=checkpoint_file, bw=bulk_workers, dr=dry_run))
+        result = sweep(icollection=icollection, itmp_iplant=itmp_iplant, tmp_iplant=tmp_iplant, checkpoint_file=checkpoint_file,
+                       bulk_workers=bulk_workers, dry_run=dry_run, delete_itmp_files=delete_itmp_files,
+                       delete_tmp_files=delete_tmp_files, stream=stream, workers=workers, cache_dir=cache_dir,
+                       cache_bytes=cache_bytes, lock_timeout=lock_timeout, compression_method=compression_method,
+                       auto_candidates=auto_candidates, auto_sample_size=auto_sample_size, cpu_budget=cpu_budget,
+                       hash_method=hash_method, idedup_iplant=idedup_iplant, parent_ttl=parent_ttl)
+    elif action == 'recover':
+        logger.info("_run_action: Recovering calls that did not finish.")
+        logger.debug("_run_action: recover(tmp_iplant={tip}, lock_timeout={lt})".format(tip=tmp_iplant, lt=lock_timeout))
+        result = recover(tmp_iplant=tmp_iplant, lock_timeout=lock_timeout)
+    elif action == 'prune_parents':
+        logger.info("_run_action: Removing compressed parents that expired or that no file refers to.")
+        logger.debug(("_run_action: prune_parents(icollection={ic}, itmp_iplant={itip}, tmp_iplant={tip}, parent_ttl={pt}, " +
+                      "dry_run={dr}, lock_timeout={lt})").format(ic=icollection, itip=itmp_iplant, tip=tmp_iplant, pt=parent_ttl,
+                                                                 dr=dry_run, lt=lock_timeout))
+        result = prune_parents(icollection=icollection, itmp_iplant=itmp_iplant, tmp_iplant=tmp_iplant, parent_ttl=parent_ttl,
+                               dry_run=dry_run, lock_timeout=lock_timeout)
+    elif action == 'release':
+        logger.info("_run_action: Removing file that shares a payload of the deduplication store.")
+        logger.debug("_run_action: release(ipath={ipath}, tmp_iplant={tip}, lock_timeout={lt})".format(ipath=ipath, tip=tmp_iplant,
+                                                                                                      lt=lock_timeout))
+        result = release(ipath=ipath, tmp_iplant=tmp_iplant, lock_timeout=lock_timeout)
+    elif action == 'index_validate':
+        logger.info("_run_action: Validating index against imeta.")
+        logger.debug("_run_action: index_validate(index_file={xf}, icollection={ic})".format(xf=index_file, ic=icollection))
+        result = index_validate(index_file=index_file, icollection=icollection)
+    elif action == 'index_rebuild':
+        logger.info("_run_action: Rebuilding index from imeta.")
+        logger.debug("_run_action: index_rebuild(index_file={xf}, icollection={ic})".format(xf=index_file, ic=icollection))
+        result = index_rebuild(index_file=index_file, icollection=icollection)
+    elif action == 'read_range':
+        logger.info("_run_action: Reading range of file.")
+        logger.debug(("_run_action: read_range(ipath={ip}, path={out}, byte_range={br}, record_range={rr}, " +
+                      "workers={wkrs})").format(ip=ipath, out=output, br=byte_range, rr=record_range, wkrs=workers))
+        result = read_range(ipath=ipath, path=output, byte_range=byte_range, record_range=record_range, workers=workers)
+    else:
+        raise ValueError(("`action` not valid:\n" +
+                          "action = {action}").format(action=action))
+    return result
 
 
-if __name__ == '__main__':
+def main(ipath, action, itmp_iplant, tmp_iplant,
+         delete_itmp_files=False, delete_tmp_files=False, stream=False,
+         compression_method='GZIP', workers=None,
+         auto_candidates=None, auto_sample_size=2**22, cpu_budget=60.0,
+         cache_dir=None, cache_bytes=0,
+         queue_file=None, queue_workers=1, queue_max_depth=10000, queue_max_attempts=3, queue_retry_delay=60.0,
+         icollection=None, checkpoint_file=None, bulk_workers=None, index_file=None,
+         output=None, byte_range=None, record_range=None, hash_method='SHA1', verify='full', verify_fraction=0.1,
+         lock_timeout=LOCK_TIMEOUT, idedup_iplant=None, dry_run=False, keep_parents=False, parent_ttl=PARENT_TTL,
+         read_lease=False, logging_level='INFO', log_file=None):
+    """Top-level function for iPlant iRODS operations.
+
+    Parameters
+    ----------
+    ipath : string
+        iRODS path to .fastq file for (de)compression.
+    action : {'compress', 'decompress', 'enqueue', 'drain', 'queue_status', 'cache_status', 'scratch_status',
+              'bulk_compress', 'bulk_decompress', 'sweep', 'recover', 'prune_parents', 'release', 'index_validate',
+              'index_rebuild', 'read_range'}, string
+        Action to take on file from `ipath`. 'enqueue' adds the file to the compression queue in `queue_file`;
+        'drain' compresses files from the queue. 'bulk_compress' and 'bulk_decompress' take the action on all files
+        within `icollection`. 'sweep' compresses the cold files within `icollection` under the tiering policy from
+        `set_policy`. 'recover' finishes or undoes the (de)compressions that did not finish from their journals in
+        `tmp_iplant`. 'prune_parents' removes the compressed parents in `itmp_iplant` that expired or that no file
+        within `icollection` refers to. 'release' removes a file that shares a payload of the deduplication store.
+        'index_validate' and 'index_rebuild' check and repopulate `index_file` for all files
+        within `icollection`. 'read_range' writes a range of the file to `output`.
+        Only 'compress', 'decompress', 'enqueue', 'release', and 'read_range' use `ipath`.
+    itmp_iplant : string
+        iRODS path to temporary directory for moving files during (de)compression.
+    tmp_iplant : string
+        Local path to temporary directory for moving files during (de)compression, or several as 'DIR[=MAXSIZE],...'.
+        See `_parse_tmp_iplant`. Required for 'scratch_status', 'recover', and 'release'.
+    delete_itmp_files : {False, True}, bool, optional
+        Delete iRODS temporary files made during (de)compression.
+    delete_tmp_files : {False, True}, bool, optional
+        Delete local temporary files made during (de)compression.
+    stream : {False, True}, bool, optional
+        Stream data through (de)compression between iRODS data objects without local temporary files.
+    keep_parents : {False, True}, bool, optional
+        For 'decompress' and 'bulk_decompress', keep compressed files in `itmp_iplant` with `delete_itmp_files`
+        so that 'compress' can reinstate them. See `decompress`.
+    parent_ttl : {PARENT_TTL}, float, optional
+        Seconds after which 'prune_parents' and 'sweep' remove a kept compressed parent. See `prune_parents`.
+    compression_method : {'GZIP'}, string, optional
+        Compression method for 'compress' as 'NAME' or 'NAME:LEVEL' from the codec registry, or 'auto'.
+        Decompression uses the method recorded in imeta.
+    workers : {None}, int, optional
+        Number of worker threads for block-parallel (de)compression. Default: number of CPUs.
+    auto_candidates : {None}, list, optional
+        'NAME' or 'NAME:LEVEL' codecs to try when `compression_method` is 'auto'. Default: all registered codecs.
+    auto_sample_size : {4194304}, int, optional
+        Bytes from the start of the file to compress with each candidate when `compression_method` is 'auto'.
+    cpu_budget : {60.0}, float, optional
+        Maximum CPU seconds per GiB for a candidate to be chosen when `compression_method` is 'auto'.
+    cache_dir : {None}, string, optional
+        Local path to the cache of decompressed files. Required for 'cache_status'.
+    cache_bytes : {0}, int, optional
+        Maximum total size of files in the cache. 0 disables the cache.
+    queue_file : {None}, string, optional
+        Local path to SQLite database of the compression queue. Required for 'enqueue', 'drain', 'queue_status'.
+    queue_workers : {1}, int, optional
+        Number of files that 'drain' compresses at the same time.
+    queue_max_depth : {10000}, int, optional
+        Maximum number of queued files. Beyond this, 'enqueue' compresses the file now.
+    queue_max_attempts : {3}, int, optional
+        Attempts to compress a queued file before it is left as failed.
+    queue_retry_delay : {60.0}, float, optional
+        Seconds before the first retry of a queued file. The delay doubles with each attempt.
+    icollection : {None}, string, optional
+        iRODS path to collection for 'bulk_compress', 'bulk_decompress', 'sweep', and 'prune_parents'.
+    checkpoint_file : {None}, string, optional
+        Local path to checkpoint for 'bulk_compress', 'bulk_decompress', and 'sweep'. See `bulk`.
+    bulk_workers : {None}, int, optional
+        Number of worker processes for 'bulk_compress' and 'bulk_decompress'. Default: number of CPUs.
+    index_file : {None}, string, optional
+        Local path to SQLite index of compression state for 'index_validate' and 'index_rebuild'.
+        'compress' and 'decompress' use the index from `set_index`.
+    output : {None}, string, optional
+        Local path to write the range to for 'read_range'.
+    byte_range : {None}, tuple, optional
+        (start, end) of uncompressed bytes for 'read_range'. See `read_range`.
+    record_range : {None}, tuple, optional
+        (start, end) of FASTQ records for 'read_range'. See `read_range`.
+    hash_method : {'SHA1'}, string, optional
+        Hash method for 'compress' as 'ALGORITHM' or 'TREE_ALGORITHM:CHUNKSIZE'. See `compress`.
+        Decompression verifies with the method recorded in imeta.
+    verify : {'full', 'trailer', 'sampled', 'deferred'}, string, optional
+        How 'decompress' and 'bulk_decompress' verify the hash of decompressed files. See `decompress`.
+    verify_fraction : {0.1}, float, optional
+        Fraction of files that are hashed with `verify` 'sampled'.
+    lock_timeout : {LOCK_TIMEOUT}, float, optional
+        Seconds after which the lock of a file held by another (de)compression is stale. See `_ObjectLock`.
+    idedup_iplant : {None}, string, optional
+        iRODS path to collection of deduplicated compressed files for 'compress', 'enqueue', 'bulk_compress',
+        and 'sweep'. Default: no deduplication. See `compress`.
+    dry_run : {False, True}, bool, optional
+        Only report the projected impact of 'sweep' or the parents that 'prune_parents' would remove.
+    read_lease : {False, True}, bool, optional
+        For 'decompress', take a read lease on the file, and for 'compress', return one, so that the file is
+        compressed only after the last reader that opened it. Passed by the open rules. See `compress`.
+    logging_level : {'DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'}, string, optional
+        Verbosity of logging level. 'DEBUG' is the most verbose; 'CRITICAL' is the least.
+        Default: 'INFO'
+    log_file : {None}, string, optional
+        Local path for writing log in addition to stdout.
+        Use to debug while executing module with iRODS icommands.
+    
+    Returns
+    -------
+    result : {bool, dict}
+        Result of the action. See `_run_action`.
+    
+    See Also
+    --------
+    CALLS : {_add_logging_handlers, _run_action, _remove_logging_handlers}
+    CALLED_BY : {__main__}
+    RELATED : {serve}
+    
+    """
+    # NOTE: Input checking is handled by "if __name__ == '__main__'" section.
+    handlers = _add_logging_handlers(logging_level=logging_level, log_file=log_file)
+    try:
+        result = _run_action(ipath=ipath, action=action, itmp_iplant=itmp_iplant, tmp_iplant=tmp_iplant,
+                             delete_itmp_files=delete_itmp_files, delete_tmp_files=delete_tmp_files, stream=stream,
+                             compression_method=compression_method, workers=workers,
+                             auto_candidates=auto_candidates, auto_sample_size=auto_sample_size, cpu_budget=cpu_budget,
+                             cache_dir=cache_dir, cache_bytes=cache_bytes,
+                             queue_file=queue_file, queue_workers=queue_workers, queue_max_depth=queue_max_depth,
+                             queue_max_attempts=queue_max_attempts, queue_retry_delay=queue_retry_delay,
+                             icollection=icollection, checkpoint_file=checkpoint_file, bulk_workers=bulk_workers,
+                             index_file=index_file, output=output, byte_range=byte_range, record_range=record_range,
+                             hash_method=hash_method, verify=verify, verify_fraction=verify_fraction, lock_timeout=lock_timeout,
+                             idedup_iplant=idedup_iplant, dry_run=dry_run, keep_parents=keep_parents, parent_ttl=parent_ttl,
+                             read_lease=read_lease)
+    finally:
+        _remove_logging_handlers(handlers=handlers)
+    return result
+
+
+def _compression_method_type(cm):
+    """Semi-private method to check `--compression_method` against the codec registry for `argparse`."""
+    if cm.lower() == 'auto':
+        return 'auto'
+    try:
+        (name, level) = _parse_compression_method(cm)
+    except ValueError as err:
+        raise argparse.ArgumentTypeError(str(err))
+    return "{name}:{level}".format(name=name, level=level)
+
+
+def _auto_candidates_type(acs):
+    """Semi-private method to split and check comma-separated `--auto_candidates` for `argparse`."""
+    return [_compression_method_type(cm) for cm in acs.split(',') if cm]
+
+
+def _hash_method_type(hm):
+    """Semi-private method to check `--hash_method` for `argparse`. Tree hashes are given their chunk size."""
+    try:
+        (algorithm, chunksize) = _parse_hash_method(hm)
+    except IOError as err:
+        raise argparse.ArgumentTypeError(str(err))
+    if chunksize is None:
+        return algorithm.upper()
+    return "TREE_{alg}:{cs}".format(alg=algorithm.upper(), cs=chunksize)
+
+
+def _fraction_type(frac):
+    """Semi-private method to check `--verify_fraction` from 0 to 1 for `argparse`."""
+    try:
+        frac = float(frac)
+    except ValueError:
+        frac = None
+    if (frac is None) or not (0.0 <= frac <= 1.0):
+        raise argparse.ArgumentTypeError("must be a number from 0 to 1")
+    return frac
+
+
+def _tmp_iplant_type(tip):
+    """Semi-private method to check `--tmp_iplant` for `argparse` and make its directories absolute paths."""
+    try:
+        volumes = _parse_tmp_iplant(tip)
+    except ValueError as err:
+        raise argparse.ArgumentTypeError(str(err))
+    return ','.join(os.path.abspath(path)+('' if max_bytes is None else '={mb}'.format(mb=max_bytes)) for (path, max_bytes) in volumes)
+
+
+def _range_type(rng):
+    """Semi-private method to parse `--byte_range` and `--record_range` as 'START-END' or 'START-' into (start, end)
+    for `argparse`. `end` is ``None`` for 'START-'."""
+    match = re.match(r'^(\d+)-(\d*)$', rng.strip())
+    if match is None:
+        raise argparse.ArgumentTypeError("Range must be 'START-END' or 'START-': {rng}".format(rng=rng))
+    (start, end) = (int(match.group(1)), (int(match.group(2)) if match.group(2) else None))
+    if (end is not None) and (end < start):
+        raise argparse.ArgumentTypeError("Range must not end before it starts: {rng}".format(rng=rng))
+    return (start, end)
+
+
+class _JobArgumentParser(argparse.ArgumentParser):
+    """Semi-private parser for jobs sent to `serve` that raises ``ValueError`` instead of exiting.
+
+    See Also
+    --------
+    CALLS : {}
+    CALLED_BY : {serve}
+    RELATED : {_build_parser}
+
+    """
+
+    def error(self, message):
+        raise ValueError(message)
+
+
+def _build_parser(parser_class=argparse.ArgumentParser):
+    """Semi-private method to define command-line arguments of `iplant.py`.
+
+    Parameters
+    ----------
+    parser_class : {argparse.ArgumentParser}, class, optional
+        Class of parser to build, e.g. `_JobArgumentParser` to parse jobs sent to `serve`.
+
+    Returns
+    -------
+    parser : argparse.ArgumentParser
+        Parser for the arguments of `iplant.py`. Check the parsed arguments with `_check_args`.
+
+    See Also
+    --------
+    CALLS : {}
+    CALLED_BY : {__main__, serve}
+    RELATED : {_check_args}
+
+    """
     # Define defaults.
     defaults = {}
+    defaults['compression_method'] = 'GZIP'
+    defaults['workers'] = multiprocessing.cpu_count()
+    defaults['hash_method'] = 'SHA1'
+    defaults['verify'] = 'full'
+    defaults['verify_fraction'] = 0.1
+    defaults['lock_timeout'] = LOCK_TIMEOUT
+    defaults['parent_ttl'] = PARENT_TTL
+    defaults['auto_candidates'] = None
+    defaults['auto_sample_size'] = 2**22
+    defaults['cpu_budget'] = 60.0
+    defaults['socket'] = SOCKET_PATH
+    defaults['cache_dir'] = None
+    defaults['cache_bytes'] = 0
+    defaults['queue_file'] = None
+    defaults['queue_workers'] = 1
+    defaults['queue_max_depth'] = 10000
+    defaults['queue_max_attempts'] = 3
+    defaults['queue_retry_delay'] = 60.0
+    defaults['checkpoint_file'] = None
+    defaults['bulk_workers'] = multiprocessing.cpu_count()
+    defaults['transport'] = 'icommands'
+    defaults['index_file'] = None
+    defaults['policy_file'] = None
+    defaults['output'] = None
+    defaults['byte_range'] = None
+    defaults['record_range'] = None
+    defaults['metrics_file'] = None
+    defaults['prom_file'] = None
     defaults['logging_level'] = 'INFO'
     defaults['log_file'] = None
-    # Parse input arguments and check choices.
-    parser = argparse.ArgumentParser(description="Compress or decompress .fastq file in iPlant collection.")
+    # NOTE: Arguments required by each action are checked by `_check_args`.
+    parser = parser_class(description="Compress or decompress .fastq file in iPlant collection.")
     parser.add_argument('--ipath',
-                        required=True, type=os.path.abspath,
-                        help=("iRODS path to .fastq file for (de)compression."))
+                        type=os.path.abspath,
+                        help=("iRODS path to .fastq file for (de)compression. Required for 'compress', 'decompress', 'enqueue', 'release', 'read_range'."))
+    parser.add_argument('--icollection',
+                        type=os.path.abspath,
+                        help=("iRODS path to collection for 'bulk_compress', 'bulk_decompress', 'sweep', 'prune_parents', 'index_validate', and 'index_rebuild'. " +
+                              "All files within the collection and its subcollections are included. " +
+                              "For bulk actions and 'sweep', must be within `--iplant`."))
     parser.add_argument('--iplant',
-                        required=True, type=os.path.abspath,
-                        help=("iRODS path to iplant root directory. Only files within this directory will be (de)compressed."))
+                        type=os.path.abspath,
+                        help=("iRODS path to iplant root directory. Only files within this directory will be (de)compressed. " +
+                              "Required for 'compress', 'decompress', 'enqueue', 'bulk_compress', 'bulk_decompress', 'sweep'."))
     parser.add_argument('--action',
-                        choices=['compress', 'decompress'],
+                        choices=['compress', 'decompress', 'enqueue', 'drain', 'queue_status', 'cache_status', 'scratch_status',
+                                 'bulk_compress', 'bulk_decompress', 'sweep', 'recover', 'prune_parents', 'release',
+                                 'index_validate', 'index_rebuild', 'read_range', 'serve'],
                         required=True,
-                        help=("Action to take on the file from `ipath`."))
+                        help=("Action to take on the file from `ipath`. " +
+                              "'enqueue' adds the file to the compression queue and returns without compressing it. " +
+                              "'drain' compresses files from the queue until none are ready. " +
+                              "'queue_status' prints the depth of the queue as JSON. " +
+                              "'cache_status' prints the size and hit/miss/eviction counters of the decompressed file cache as JSON. " +
+                              "'scratch_status' prints the available and reserved space of each directory of `--tmp_iplant` as JSON. " +
+                              "'bulk_compress' and 'bulk_decompress' (de)compress all files within `--icollection` " +
+                              "with `--bulk_workers` processes, then print a report as JSON. " +
+                              "'sweep' compresses the files within `--icollection` that are cold under `--policy_file` as " +
+                              "'bulk_compress' does, or with `--dry_run` only projects the impact, then prints a report as JSON. " +
+                              "'recover' finishes or undoes the (de)compressions that did not finish, e.g. after a crash, from their " +
+                              "journals in `--tmp_iplant`, then prints a report as JSON. " +
+                              "'prune_parents' removes the compressed parents kept in `--itmp_iplant` by `--keep_parents` that are " +
+                              "older than `--parent_ttl` or that no file within `--icollection` refers to, then prints a report as JSON. " +
+                              "'release' removes a file that shares a compressed file of `--idedup_iplant` by unregistering it, " +
+                              "and removes the shared file with the last file registered to it, then prints stats as JSON. " +
+                              "'index_validate' compares `--index_file` with imeta of all files within `--icollection` " +
+                              "and 'index_rebuild' repopulates it from imeta, then print a report as JSON. " +
+                              "'read_range' writes `--byte_range` or `--record_range` of the file to `--output` without " +
+                              "decompressing the whole file, then prints stats as JSON. " +
+                              "'serve' runs a daemon that takes jobs from `iplant_client.py` through `--socket` " +
+                              "and drains the queue in the background if `--tmp_iplant` or `--queue_file` is given."))
     parser.add_argument('--itmp_iplant',
-                        required=True, type=os.path.abspath,
-                        help=("iRODS path to temporary directory for moving files during (de)compression."))
+                        type=os.path.abspath,
+                        help=("iRODS path to temporary directory for moving files during (de)compression. " +
+                              "Required for 'compress', 'decompress', 'enqueue', 'bulk_compress', 'bulk_decompress', 'sweep', " +
+                              "'prune_parents'."))
     parser.add_argument('--tmp_iplant',
-                        required=True, type=os.path.abspath,
-                        help=("Local path to temporary directory for moving files during (de)compression."))
+                        type=_tmp_iplant_type,
+                        help=("Local path to temporary directory for moving files during (de)compression. " +
+                              "Required for 'compress', 'decompress', 'enqueue', 'bulk_compress', 'bulk_decompress', 'sweep', " +
+                              "'scratch_status', 'recover', 'prune_parents', 'release'. " +
+                              "Several scratch directories are given as 'DIR[=MAXSIZE],DIR[=MAXSIZE],...', e.g. " +
+                              "'/dev/shm/iplant=2G,/scratch/iplant', where MAXSIZE is the most bytes a file may need in the directory " +
+                              "(suffix K, M, G, T). Each file is given the directory with room for it and the fewest running files, " +
+                              "and its space is reserved before it is moved. The compression queue and the decompressed file cache " +
+                              "are kept in the first directory unless `--queue_file` and `--cache_dir` are given."))
     parser.add_argument('--delete_itmp_files',
                         action='store_true',
-                        help=("Delete iRODS temporary files made during (de)compression."))
+                        help=("Delete iRODS temporary files made during (de)compression, including the compressed file " +
+                              "after decompression unless `--keep_parents` is given."))
+    parser.add_argument('--keep_parents',
+                        action='store_true',
+                        help=("With `--delete_itmp_files`, keep the compressed file in `--itmp_iplant` after decompression " +
+                              "so that 'compress' moves it back if the file is unchanged, or compresses only data appended to it. " +
+                              "Remove kept files with 'prune_parents' or 'sweep'."))
+    parser.add_argument('--read_lease',
+                        action='store_true',
+                        help=("For 'decompress', take a read lease on the file, and for 'compress', return the oldest one. " +
+                              "The file is left decompressed while other leases are held, and leases expire after " +
+                              "`--lock_timeout`. Passed by the open rules in iplant.re so that a file opened by several " +
+                              "readers is compressed after the last one."))
+    parser.add_argument('--parent_ttl',
+                        default=defaults['parent_ttl'], type=float,
+                        help=(("Seconds after which 'prune_parents' and 'sweep' remove a compressed file kept by `--keep_parents` " +
+                               "even if a file refers to it. Default: {dflt}").format(dflt=defaults['parent_ttl'])))
     parser.add_argument('--delete_tmp_files',
                         action='store_true',
                         help=("Delete local temporary files made during (de)compression."))
+    parser.add_argument('--stream',
+                        action='store_true',
+                        help=("Stream data from iRODS through (de)compression back into iRODS without local temporary files. " +
+                              "With `--transport icommands`, data are read with `iget` and written with `{istream}`. " +
+                              "Local temporary files are not made, so `--tmp_iplant` is unused.").format(istream=' '.join(ISTREAM_WRITE)))
+    parser.add_argument('--compression_method',
+                        default=defaults['compression_method'], type=_compression_method_type,
+                        help=(("Compression method for `--action compress` as 'NAME' or 'NAME:LEVEL', e.g. 'GZIP:6'. " +
+                               "Registered codecs: {codecs}. 'GZIP' compresses with one core. " +
+                               "'PGZIP' compresses blocks in parallel into a multi-member gzip file that gunzip can read. " +
+                               "'BGZF' compresses 64 KiB blocks in parallel into a BGZF file with a block index for 'read_range'. " +
+                               "'FQZ' compresses FASTQ headers, bases, and qualities as separate streams. " +
+                               "'auto' compresses a sample with each of `--auto_candidates` and chooses the best ratio " +
+                               "within `--cpu_budget`. Decompression uses the method recorded in imeta. " +
+                               "Default: {dflt}").format(codecs=', '.join(_codecs.keys()), dflt=defaults['compression_method'])))
+    parser.add_argument('--workers',
+                        default=defaults['workers'], type=int,
+                        help=(("Number of worker threads for 'PGZIP' compression and decompression. " +
+                               "Default: number of CPUs, {dflt}").format(dflt=defaults['workers'])))
+    parser.add_argument('--hash_method',
+                        default=defaults['hash_method'], type=_hash_method_type,
+                        help=(("Hash of the uncompressed file for `--action compress`, recorded in imeta as 'HASH_METHOD'. " +
+                               "'TREE_SHA1' or 'TREE_SHA1:CHUNKSIZE' hashes chunks of CHUNKSIZE bytes (default {cs}) on " +
+                               "`--workers` threads into a tree hash and keeps the chunk digests in `--itmp_iplant` to locate " +
+                               "corrupted chunks and to verify 'read_range'. Decompression verifies with the method recorded " +
+                               "in imeta. Default: {dflt}").format(cs=TREE_HASH_CHUNKSIZE, dflt=defaults['hash_method'])))
+    parser.add_argument('--verify',
+                        default=defaults['verify'], choices=VERIFY_MODES,
+                        help=(("How `--action decompress` verifies the decompressed file against 'UNCOMPRESSED_HASH' in imeta. " +
+                               "'full' hashes the file while decompressing it. 'trailer' checks only the checksum of the codec " +
+                               "(e.g. the CRC32 and size of gzip) and 'UNCOMPRESSED_SIZE'; codecs without a checksum are hashed. " +
+                               "'sampled' hashes `--verify_fraction` of files and is 'trailer' otherwise. 'deferred' adds a " +
+                               "local copy of the file to the queue in `--queue_file` to be hashed by 'drain' or 'serve' " +
+                               "after the file is opened. Default: {dflt}").format(dflt=defaults['verify'])))
+    parser.add_argument('--verify_fraction',
+                        default=defaults['verify_fraction'], type=_fraction_type,
+                        help=(("Fraction of files hashed with `--verify sampled`, from 0 to 1. " +
+                               "Default: {dflt}").format(dflt=defaults['verify_fraction'])))
+    parser.add_argument('--lock_timeout',
+                        default=defaults['lock_timeout'], type=float,
+                        help=(("Seconds without a heartbeat after which the lock of a file held by another compress or decompress " +
+                               "is stale and is broken. Holders refresh their lock every {hb} seconds (at most a quarter of the timeout) " +
+                               "however long they run. Locks of processes that exited are released at once. " +
+                               "Default: {dflt}").format(hb=LOCK_HEARTBEAT_INTERVAL, dflt=defaults['lock_timeout'])))
+    parser.add_argument('--idedup_iplant',
+                        type=os.path.abspath,
+                        help=("iRODS path to collection of deduplicated compressed files for 'compress', 'enqueue', " +
+                              "'bulk_compress', 'sweep'. A file with the same content as a compressed file in the collection " +
+                              "is registered to it instead of being compressed again. Must not be within `--iplant`. " +
+                              "Requires a rodsadmin account to register files. Default: no deduplication"))
+    parser.add_argument('--auto_candidates',
+                        default=defaults['auto_candidates'], type=_auto_candidates_type,
+                        help=(("Comma-separated 'NAME' or 'NAME:LEVEL' codecs to try for `--compression_method auto`, " +
+                               "e.g. 'GZIP:1,BZ2:9,FQZ'. Default: all registered codecs at their default levels.")))
+    parser.add_argument('--auto_sample_size',
+                        default=defaults['auto_sample_size'], type=int,
+                        help=(("Bytes from the start of the file to compress with each candidate " +
+                               "for `--compression_method auto`. Default: {dflt}").format(dflt=defaults['auto_sample_size'])))
+    parser.add_argument('--cpu_budget',
+                        default=defaults['cpu_budget'], type=float,
+                        help=(("Maximum CPU seconds per GiB of input for a candidate to be chosen by " +
+                               "`--compression_method auto`. Default: {dflt}").format(dflt=defaults['cpu_budget'])))
+    parser.add_argument('--socket',
+                        default=defaults['socket'], type=os.path.abspath,
+                        help=(("Local path to UNIX socket on which `--action serve` takes jobs from `iplant_client.py`. " +
+                               "Default: {dflt}").format(dflt=defaults['socket'])))
+    parser.add_argument('--cache_dir',
+                        default=defaults['cache_dir'], type=os.path.abspath,
+                        help=(("Local path to the cache of decompressed files, kept by 'UNCOMPRESSED_HASH'. " +
+                               "Should be on the same file system as `--tmp_iplant` so that files are linked instead of copied. " +
+                               "Default: {dn} within `--tmp_iplant`").format(dn=CACHE_DIRNAME)))
+    parser.add_argument('--cache_bytes',
+                        default=defaults['cache_bytes'], type=int,
+                        help=(("Maximum total size in bytes of the cache of decompressed files. " +
+                               "Least recently used files are evicted beyond this. The cache is not used if 0. " +
+                               "Default: {dflt}").format(dflt=defaults['cache_bytes'])))
+    parser.add_argument('--queue_file',
+                        default=defaults['queue_file'], type=os.path.abspath,
+                        help=(("Local path to SQLite database of the compression queue. Must be on a local file system. " +
+                               "Default: {fn} within `--tmp_iplant`").format(fn=QUEUE_FILENAME)))
+    parser.add_argument('--queue_workers',
+                        default=defaults['queue_workers'], type=int,
+                        help=(("Number of files that 'drain' or 'serve' compress from the queue at the same time. " +
+                               "'serve' does not drain the queue if 0. Default: {dflt}").format(dflt=defaults['queue_workers'])))
+    parser.add_argument('--queue_max_depth',
+                        default=defaults['queue_max_depth'], type=int,
+                        help=(("Maximum number of queued files. Beyond this, 'enqueue' compresses the file before returning. " +
+                               "Default: {dflt}").format(dflt=defaults['queue_max_depth'])))
+    parser.add_argument('--queue_max_attempts',
+                        default=defaults['queue_max_attempts'], type=int,
+                        help=(("Attempts to compress a queued file before it is left as failed in 'queue_status'. " +
+                               "Enqueue the file again to retry. Default: {dflt}").format(dflt=defaults['queue_max_attempts'])))
+    parser.add_argument('--queue_retry_delay',
+                        default=defaults['queue_retry_delay'], type=float,
+                        help=(("Seconds before the first retry of a queued file. The delay doubles with each attempt. " +
+                               "Default: {dflt}").format(dflt=defaults['queue_retry_delay'])))
+    parser.add_argument('--checkpoint_file',
+                        default=defaults['checkpoint_file'], type=os.path.abspath,
+                        help=(("Local path to checkpoint of 'bulk_compress' and 'bulk_decompress', one JSON line per finished file. " +
+                               "Files finished in an earlier run are skipped, so an interrupted run resumes where it stopped. " +
+                               "Default: {fn} within `--tmp_iplant`").format(fn=BULK_CHECKPOINT_FILENAME)))
+    parser.add_argument('--bulk_workers',
+                        default=defaults['bulk_workers'], type=int,
+                        help=(("Number of worker processes for 'bulk_compress' and 'bulk_decompress'. " +
+                               "Default: number of CPUs, {dflt}").format(dflt=defaults['bulk_workers'])))
+    parser.add_argument('--transport',
+                        default=defaults['transport'], choices=list(TRANSPORTS.keys()),
+                        help=(("Connection to iRODS. 'icommands' runs one icommand per operation. " +
+                               "'session' reuses authenticated connections from python-irodsclient within each process. " +
+                               "For 'serve', the daemon's transport is used by all jobs. Default: {dflt}").format(dflt=defaults['transport'])))
+    parser.add_argument('--index_file',
+                        default=defaults['index_file'], type=os.path.abspath,
+                        help=("Local path to SQLite index of the compression state of files. 'decompress' reads the index " +
+                              "instead of imeta for files that 'compress' and 'decompress' recorded in it. Use only if all " +
+                              "(de)compression within `--iplant` uses this index. For 'serve', the daemon's index is used by " +
+                              "all jobs. Required for 'index_validate' and 'index_rebuild'. Default: no index"))
+    parser.add_argument('--policy_file',
+                        default=defaults['policy_file'], type=os.path.abspath,
+                        help=("Local path to INI file of a tiering policy with section '[policy]' and options 'min_size', " +
+                              "'hot_accesses', 'half_life_seconds', and 'access_file'. 'decompress' counts accesses to files, " +
+                              "and 'compress' leaves small files and files with many recent accesses uncompressed. " +
+                              "For 'serve', the daemon's policy is used by all jobs. Required for 'sweep'. Default: compress all files"))
+    parser.add_argument('--dry_run',
+                        action='store_true',
+                        help=("For 'sweep', report the files that would be compressed and the bytes saved as projected from " +
+                              "the metadata of compressed files, without compressing or reading any file. " +
+                              "For 'prune_parents', report the files that would be removed."))
+    parser.add_argument('--output',
+                        default=defaults['output'], type=os.path.abspath,
+                        help=("Local path to write the range to for 'read_range'. Overwritten if it exists."))
+    parser.add_argument('--byte_range',
+                        default=defaults['byte_range'], type=_range_type,
+                        help=("Uncompressed bytes for 'read_range' as 'START-END' (0-based, END excluded) or 'START-' " +
+                              "to the end of the file, e.g. '0-1048576'."))
+    parser.add_argument('--record_range',
+                        default=defaults['record_range'], type=_range_type,
+                        help=("FASTQ records of 4 lines for 'read_range' as 'START-END' (0-based, END excluded) or 'START-' " +
+                              "to the end of the file, e.g. '1000000-1001000'."))
+    parser.add_argument('--metrics_file',
+                        default=defaults['metrics_file'], type=os.path.abspath,
+                        help=("Local path for appending the duration and bytes of each stage of 'compress' and 'decompress' " +
+                              "(e.g. iget, codec, iput) as one JSON line per stage. Default: no metrics"))
+    parser.add_argument('--prom_file',
+                        default=defaults['prom_file'], type=os.path.abspath,
+                        help=("Local path to a Prometheus textfile, e.g. within the directory of node_exporter's " +
+                              "textfile collector. Histograms of stage durations and counters of bytes and errors are " +
+                              "accumulated across calls. Default: no metrics"))
     parser.add_argument('--logging_level',
                         default=defaults['logging_level'],
                         choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
@@ -590,40 +9555,406 @@ if __name__ == '__main__':
                         action='store_true',
                         help=("Test that module is being called correctly. Checks input then prints message to stdout. " +
                               "No actions are taken."))
-    args = parser.parse_args()
-    # Check input then call main function.
-    print("INFO: Arguments:\n{args}".format(args=args))
-    if os.path.commonprefix([args.ipath, args.iplant]) == args.iplant:
-        print(("INFO: --ipath is contained within --iplant.\n" +
-               "--ipath {ipath}\n" +
-               "--iplant {iplant}").format(ipath=args.ipath, iplant=args.iplant))
+    return parser
+
+
+def _check_args(args, parser, checked_paths=None):
+    """Semi-private method to check arguments from `_build_parser` and create missing temporary directories.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Arguments parsed by `parser`. `args.queue_file`, `args.cache_dir`, and `args.checkpoint_file` are set from
+        `args.tmp_iplant` if not given.
+    parser : argparse.ArgumentParser
+        Parser from `_build_parser`. Errors are reported through `parser.error`.
+    checked_paths : {None}, set, optional
+        Paths already checked by an earlier call, e.g. from `serve`. Updated in place.
+        If given, `ipath` is not probed since `compress` and `decompress` fail on a missing `ipath`
+        when they first read its metadata.
+
+    Returns
+    -------
+    do_action : bool
+        ``True`` if the action should be taken, i.e. `ipath` (or `icollection` for bulk actions) is contained
+        within `iplant` or the action does not use `ipath`.
+
+    See Also
+    --------
+    CALLS : {_get_transport}
+    CALLED_BY : {__main__, _JobHandler}
+    RELATED : {_build_parser}
+
+    """
+    if checked_paths is None:
+        check_ipath = True
+        checked_paths = set()
+    else:
+        check_ipath = False
+    # NOTE: Collections are listed with general queries, whose literals cannot escape a single quote.
+    # The rules in iplant.re skip such paths likewise.
+    for arg in ['icollection', 'itmp_iplant', 'idedup_iplant']:
+        if (getattr(args, arg) is not None) and ("'" in getattr(args, arg)):
+            parser.error("argument --{arg}: must not contain a single quote: {path}".format(arg=arg, path=getattr(args, arg)))
+    # NOTE: Files other than temporary files are kept in the first scratch directory.
+    tmp_home = _parse_tmp_iplant(args.tmp_iplant)[0][0] if (args.tmp_iplant is not None) else None
+    if (args.queue_file is None) and (tmp_home is not None):
+        args.queue_file = os.path.join(tmp_home, QUEUE_FILENAME)
+    if (args.cache_dir is None) and (tmp_home is not None):
+        args.cache_dir = os.path.join(tmp_home, CACHE_DIRNAME)
+    if args.action in ['compress', 'decompress', 'enqueue', 'bulk_compress', 'bulk_decompress', 'sweep']:
+        # NOTE: Bulk actions and 'sweep' check `icollection` as the other actions check `ipath`.
+        ipath_arg = 'icollection' if (args.action.startswith('bulk_') or (args.action == 'sweep')) else 'ipath'
+        missing = ['--'+arg for arg in [ipath_arg, 'iplant', 'itmp_iplant', 'tmp_iplant'] if getattr(args, arg) is None]
+        if (args.action == 'sweep') and (args.policy_file is None):
+            missing.append('--policy_file')
+        if len(missing) > 0:
+            parser.error("argument --action {action}: requires {missing}".format(action=args.action, missing=', '.join(missing)))
+        # NOTE: Payloads within `iplant` would be compressed and decompressed by the rules like other files.
+        if (args.idedup_iplant is not None) and (args.idedup_iplant+'/').startswith(args.iplant.rstrip('/')+'/'):
+            parser.error("argument --idedup_iplant: must not be within --iplant {iplant}".format(iplant=args.iplant))
+        ipath = getattr(args, ipath_arg)
+        if os.path.commonprefix([ipath, args.iplant]) == args.iplant:
+            print(("INFO: --{arg} is contained within --iplant.\n" +
+                   "--{arg} {ipath}\n" +
+                   "--iplant {iplant}").format(arg=ipath_arg, ipath=ipath, iplant=args.iplant))
+            do_action = True
+        else:
+            print(("INFO: --{arg} is not contained within --iplant. Skipping call to main function.\n" +
+                   "--{arg} {ipath}\n" +
+                   "--iplant {iplant}").format(arg=ipath_arg, ipath=ipath, iplant=args.iplant))
+            do_action = False
+        if (ipath_arg == 'icollection') and (args.checkpoint_file is None):
+            key = hashlib.sha1(args.icollection.encode('utf-8')).hexdigest()[:12]
+            args.checkpoint_file = os.path.join(tmp_home, BULK_CHECKPOINT_FILENAME.format(action=args.action.split('_', 1)[-1], key=key))
+        if do_action:
+            transport = _get_transport()
+            if check_ipath and (ipath_arg == 'ipath'):
+                # NOTE: A file moved by a call that did not finish is moved back or finished from its journal by
+                # `compress` and `decompress`. See `_resume_journal`.
+                if (not transport.exists(args.ipath)) and (_Journal.load(tmp_iplant=args.tmp_iplant, ipath=args.ipath) is None):
+                    raise IOError(("`ipath` does not exist or user lacks access permission:\n" +
+                                   "--ipath {ipath}").format(ipath=args.ipath))
+            if ('itmp', args.itmp_iplant) not in checked_paths:
+                if not transport.exists(args.itmp_iplant):
+                    print("INFO: Creating --itmp_iplant {itip}".format(itip=args.itmp_iplant))
+                    transport.mkdir(args.itmp_iplant)
+                checked_paths.add(('itmp', args.itmp_iplant))
+            if (args.idedup_iplant is not None) and (('idedup', args.idedup_iplant) not in checked_paths):
+                if not transport.exists(args.idedup_iplant):
+                    print("INFO: Creating --idedup_iplant {idi}".format(idi=args.idedup_iplant))
+                    transport.mkdir(args.idedup_iplant)
+                checked_paths.add(('idedup', args.idedup_iplant))
+            if ('tmp', args.tmp_iplant) not in checked_paths:
+                for (tmp_dir, _) in _parse_tmp_iplant(args.tmp_iplant):
+                    if not os.path.exists(tmp_dir):
+                        print("INFO: Creating --tmp_iplant {tip}".format(tip=tmp_dir))
+                        os.makedirs(tmp_dir)
+                checked_paths.add(('tmp', args.tmp_iplant))
+    else:
+        if (args.action in ['drain', 'queue_status']) and (args.queue_file is None):
+            parser.error("argument --action {action}: requires --tmp_iplant or --queue_file".format(action=args.action))
+        if (args.action == 'cache_status') and (args.cache_dir is None):
+            parser.error("argument --action {action}: requires --tmp_iplant or --cache_dir".format(action=args.action))
+        if (args.action in ['scratch_status', 'recover']) and (args.tmp_iplant is None):
+            parser.error("argument --action {action}: requires --tmp_iplant".format(action=args.action))
+        if args.action in ['prune_parents', 'release']:
+            required = ['icollection', 'itmp_iplant', 'tmp_iplant'] if (args.action == 'prune_parents') else ['ipath', 'tmp_iplant']
+            missing = ['--'+arg for arg in required if getattr(args, arg) is None]
+            if len(missing) > 0:
+                parser.error("argument --action {action}: requires {missing}".format(action=args.action, missing=', '.join(missing)))
+        if args.action in ['index_validate', 'index_rebuild']:
+            missing = ['--'+arg for arg in ['icollection', 'index_file'] if getattr(args, arg) is None]
+            if len(missing) > 0:
+                parser.error("argument --action {action}: requires {missing}".format(action=args.action, missing=', '.join(missing)))
+        if args.action == 'read_range':
+            missing = ['--'+arg for arg in ['ipath', 'output'] if getattr(args, arg) is None]
+            if (args.byte_range is None) == (args.record_range is None):
+                missing.append('one of --byte_range, --record_range')
+            if len(missing) > 0:
+                parser.error("argument --action {action}: requires {missing}".format(action=args.action, missing=', '.join(missing)))
+        do_action = True
+    if do_action and (args.log_file is not None) and (not os.path.exists(args.log_file)):
+        print("INFO: Creating --log_file {lf}".format(lf=args.log_file))
+        log_file_dirname = os.path.dirname(args.log_file)
+        if not os.path.exists(log_file_dirname):
+            os.makedirs(log_file_dirname)
+        open(args.log_file, 'ab').close()
+    return do_action
+
+
+class _JobHandler(socketserver.StreamRequestHandler):
+    """Semi-private handler for one job sent to `serve`.
+
+    A job is one JSON line ``{"argv": [...]}`` with the same arguments as `iplant.py`, e.g. `--action compress`.
+    The reply is one JSON line ``{"status": int, "message": string, "result": object, "latency_seconds": float}``.
+    Status 0 is success, 1 is a failed action, 2 is invalid arguments. `result` is from `_run_action`.
+
+    See Also
+    --------
+    CALLS : {_check_args, _run_action}
+    CALLED_BY : {serve}
+    RELATED : {iplant_client.py}
+
+    """
+
+    def handle(self):
+        time_start = time.time()
+        job_id = next(self.server.job_ids)
+        argv = None
+        action = None
+        ipath = None
+        status = None
+        result = None
         try:
-            subprocess.check_output(["ils", args.ipath])
-        except subprocess.CalledProcessError:
-            raise IOError(("`ipath` does not exist or user lacks access permission:\n" +
-                           "--ipath {ipath}").format(ipath=args.ipath))
+            job = json.loads(self.rfile.readline().decode('utf-8'))
+            argv = [str(arg) for arg in job['argv']]
+            args = self.server.parser.parse_args(argv)
+            (action, ipath) = (args.action, args.ipath)
+            # NOTE: Bulk actions start worker processes, which must not be forked from the threads of the daemon.
+            if args.action in ['serve', 'bulk_compress', 'bulk_decompress', 'sweep']:
+                raise ValueError("argument --action: '{action}' is not a job".format(action=args.action))
+            with self.server.checked_paths_lock:
+                do_action = _check_args(args=args, parser=self.server.parser, checked_paths=self.server.checked_paths)
+        except (ValueError, KeyError, TypeError) as err:
+            message = "Invalid job: {err}".format(err=err)
+            status = 2
+        # NOTE: `_check_args` also creates missing directories, e.g. `itmp_iplant` in iRODS, which may fail.
+        except Exception as err:
+            logger.exception("_JobHandler: job_id={jid} failed.".format(jid=job_id))
+            message = "Failed: {err}".format(err=err)
+            status = 1
+        if status is None:
+            try:
+                self.server.add_log_file(log_file=args.log_file)
+                if do_action and not args.test:
+                    result = _run_action(ipath=args.ipath, action=args.action, itmp_iplant=args.itmp_iplant, tmp_iplant=args.tmp_iplant,
+                                         delete_itmp_files=args.delete_itmp_files, delete_tmp_files=args.delete_tmp_files, stream=args.stream,
+                                         compression_method=args.compression_method, workers=args.workers,
+                                         auto_candidates=args.auto_candidates, auto_sample_size=args.auto_sample_size,
+                                         cpu_budget=args.cpu_budget, cache_dir=args.cache_dir, cache_bytes=args.cache_bytes,
+                                         queue_file=args.queue_file, queue_workers=args.queue_workers,
+                                         queue_max_depth=args.queue_max_depth, queue_max_attempts=args.queue_max_attempts,
+                                         queue_retry_delay=args.queue_retry_delay, icollection=args.icollection,
+                                         index_file=args.index_file, output=args.output, byte_range=args.byte_range,
+                                         record_range=args.record_range, hash_method=args.hash_method, verify=args.verify,
+                                         verify_fraction=args.verify_fraction, lock_timeout=args.lock_timeout,
+                                         idedup_iplant=args.idedup_iplant, keep_parents=args.keep_parents, parent_ttl=args.parent_ttl,
+                                         read_lease=args.read_lease)
+                    message = "Completed {action}".format(action=args.action)
+                else:
+                    message = "Skipped {action}".format(action=args.action)
+                if args.ipath is not None:
+                    message += " of {ipath}".format(ipath=args.ipath)
+                status = 0
+            except Exception as err:
+                logger.exception("_JobHandler: job_id={jid} failed.".format(jid=job_id))
+                message = "Failed: {err}".format(err=err)
+                status = 1
+        latency_seconds = time.time() - time_start
+        logger.info(("_JobHandler: job_id={jid} action={action} ipath={ipath} status={status} " +
+                     "latency_seconds={lat:.3f}").format(jid=job_id, action=action, ipath=ipath, status=status,
+                                                         lat=latency_seconds))
+        if status != 0:
+            logger.error("_JobHandler: job_id={jid} argv={argv} message={msg}".format(jid=job_id, argv=argv, msg=message))
+        reply = {'status': status, 'message': message, 'result': result, 'latency_seconds': latency_seconds}
+        self.wfile.write((json.dumps(reply)+'\n').encode('utf-8'))
+        return None
+
+
+class _JobServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Semi-private threaded server on a UNIX socket that keeps state warm across jobs.
+
+    See Also
+    --------
+    CALLS : {_JobHandler}
+    CALLED_BY : {serve}
+    RELATED : {}
+
+    """
+
+    def __init__(self, socket_path, formatter):
+        # NOTE: Finish running jobs before the interpreter exits.
+        self.daemon_threads = False
+        self.parser = _build_parser(parser_class=_JobArgumentParser)
+        self.checked_paths = set()
+        self.checked_paths_lock = threading.Lock()
+        self.log_files = {}
+        self.log_files_lock = threading.Lock()
+        self.formatter = formatter
+        # NOTE: next() of itertools.count is atomic in CPython.
+        self.job_ids = itertools.count(1)
+        socketserver.UnixStreamServer.__init__(self, socket_path, _JobHandler)
+
+    def add_log_file(self, log_file):
+        """Open a log file requested by a job once and keep it open for later jobs."""
+        if log_file is not None:
+            with self.log_files_lock:
+                if log_file not in self.log_files:
+                    log_file_dirname = os.path.dirname(log_file)
+                    if not os.path.exists(log_file_dirname):
+                        os.makedirs(log_file_dirname)
+                    fhandler = logging.FileHandler(filename=log_file, mode='a')
+                    fhandler.setFormatter(self.formatter)
+                    logger.addHandler(fhandler)
+                    self.log_files[log_file] = fhandler
+        return None
+
+
+def serve(socket_path=SOCKET_PATH, logging_level='INFO', log_file=None,
+          queue_file=None, queue_workers=1, queue_max_attempts=3, queue_retry_delay=60.0, queue_poll_interval=5.0):
+    """Run a daemon that takes (de)compression jobs on a local UNIX socket and drains the compression queue.
+
+    Parameters
+    ----------
+    socket_path : {SOCKET_PATH}, string, optional
+        Local path to UNIX socket. Jobs are sent by `iplant_client.py`.
+    logging_level : {'DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'}, string, optional
+        Verbosity of logging level for all jobs. 'DEBUG' is the most verbose; 'CRITICAL' is the least.
+    log_file : {None}, string, optional
+        Local path for writing log in addition to stdout.
+    queue_file : {None}, string, optional
+        Local path to SQLite database of the compression queue. If ``None``, the queue is not drained.
+    queue_workers : {1}, int, optional
+        Number of files to compress from the queue at the same time. If 0, the queue is not drained.
+    queue_max_attempts : {3}, int, optional
+        Attempts to compress a queued file before it is left as failed.
+    queue_retry_delay : {60.0}, float, optional
+        Seconds before the first retry of a queued file. The delay doubles with each attempt.
+    queue_poll_interval : {5.0}, float, optional
+        Seconds between checks for new files when the queue is empty.
+
+    Returns
+    -------
+    None
+
+    See Also
+    --------
+    CALLS : {_add_logging_handlers, _JobServer, drain, _remove_logging_handlers}
+    CALLED_BY : {__main__}
+    RELATED : {main, iplant_client.py}
+
+    Notes
+    -----
+    - Jobs run in threads of one interpreter, so interpreter startup, imports, codec thread pools, log handlers,
+      and checks of temporary directories are paid once instead of per call from `iplant.re`.
+    - Each job's latency is logged and returned to the client.
+    - `--logging_level`, `--transport`, `--metrics_file`, and `--prom_file` of a job are ignored; the daemon's apply.
+      `--index_file` of a job is used only by 'index_validate' and 'index_rebuild'; 'compress' and 'decompress' use
+      the daemon's. `--log_file` of a job is opened once
+      and kept open.
+    - With `--transport session`, jobs and `drain` threads share the connection pool of one session.
+    - Paths in jobs should be absolute. Relative paths are resolved against the working directory of the daemon.
+    - The daemon stops on SIGTERM or SIGINT after running jobs finish and removes `socket_path`.
+    - Files from 'enqueue' jobs are compressed, and files from 'decompress' jobs with `--verify deferred` are hashed,
+      by `drain` in background threads of the daemon.
+
+    """
+    handlers = _add_logging_handlers(logging_level=logging_level, log_file=log_file)
+    try:
+        # Remove a socket left by a daemon that did not exit cleanly, but not one that is still listening.
+        if os.path.exists(socket_path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(socket_path)
+            except socket.error:
+                logger.info("serve: Removing stale socket {sp}".format(sp=socket_path))
+                os.remove(socket_path)
+            else:
+                raise IOError(("Another daemon is listening on `socket_path`:\n" +
+                               "socket_path = {sp}").format(sp=socket_path))
+            finally:
+                probe.close()
+        socket_dirname = os.path.dirname(socket_path)
+        if not os.path.exists(socket_dirname):
+            os.makedirs(socket_dirname)
+        # NOTE: Only the user running the daemon (i.e. the iRODS service account) may send jobs.
+        umask = os.umask(0o177)
         try:
-            subprocess.check_output(["ils", args.itmp_iplant])
-        except subprocess.CalledProcessError:
-            print("INFO: Creating --itmp_iplant {itip}".format(itip=args.itmp_iplant))
-            subprocess.check_output("imkdir -p {itip}".format(itip=args.itmp_iplant))
-        if not os.path.exists(args.tmp_iplant):
-            print("INFO: Creating --tmp_iplant {tip}".format(tip=args.tmp_iplant))
-            os.makedirs(args.tmp_iplant)
-        if (args.log_file is not None) and (not os.path.exists(args.log_file)):
-            print("INFO: Creating --log_file {lf}".format(lf=args.log_file))
-            log_file_dirname = os.path.dirname(args.log_file)
-            if not os.path.exists(log_file_dirname):
-                os.makedirs(log_file_dirname)
-            open(args.log_file, 'ab').close()
-        if args.test:
-            print("INFO: --test flag given. Skipping call to main function.")
+            server = _JobServer(socket_path=socket_path, formatter=handlers[0].formatter)
+        finally:
+            os.umask(umask)
+        # NOTE: Jobs that request the daemon's own log file reuse its handler.
+        if log_file is not None:
+            server.log_files[log_file] = handlers[-1]
+        # NOTE: Stop from another thread since `shutdown` waits for `serve_forever` to return, and an exception
+        # raised in a signal handler can be caught by the server while it is handling a request.
+        def _stop(signum, frame):
+            logger.info("serve: Stopping on signal {signum}.".format(signum=signum))
+            threading.Thread(target=server.shutdown, name='shutdown').start()
+        signal.signal(signal.SIGTERM, _stop)
+        signal.signal(signal.SIGINT, _stop)
+        stop_event = threading.Event()
+        if (queue_file is not None) and (queue_workers > 0):
+            logger.info("serve: Draining {qf} with {qw} workers.".format(qf=queue_file, qw=queue_workers))
+            drain_thread = threading.Thread(target=drain, name='drain',
+                                            kwargs={'queue_file': queue_file, 'queue_workers': queue_workers,
+                                                    'max_attempts': queue_max_attempts, 'retry_delay': queue_retry_delay,
+                                                    'poll_interval': queue_poll_interval, 'stop_event': stop_event})
+            drain_thread.start()
         else:
-            main(ipath=args.ipath, action=args.action,
-                 itmp_iplant=args.itmp_iplant, tmp_iplant=args.tmp_iplant,
-                 delete_itmp_files=args.delete_itmp_files, delete_tmp_files=args.delete_tmp_files,
-                 logging_level=args.logging_level, log_file=args.log_file)
+            drain_thread = None
+        logger.info("serve: Listening on {sp} with pid {pid}".format(sp=socket_path, pid=os.getpid()))
+        try:
+            server.serve_forever()
+        finally:
+            stop_event.set()
+            if drain_thread is not None:
+                drain_thread.join()
+            server.server_close()
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+            for fhandler in server.log_files.values():
+                if fhandler not in handlers:
+                    logger.removeHandler(fhandler)
+                    fhandler.close()
+    finally:
+        _remove_logging_handlers(handlers=handlers)
+    return None
+
+
+if __name__ == '__main__':
+    # Parse input arguments and check choices.
+    parser = _build_parser()
+    args = parser.parse_args()
+    set_transport(args.transport)
+    set_metrics(metrics_file=args.metrics_file, prom_file=args.prom_file)
+    set_index(index_file=args.index_file)
+    set_policy(policy_file=args.policy_file,
+               access_file=(os.path.join(_parse_tmp_iplant(args.tmp_iplant)[0][0], ACCESS_FILENAME) if (args.tmp_iplant is not None) else None))
+    # NOTE: 'queue_status', 'cache_status', and 'scratch_status' print only JSON to stdout.
+    if args.action not in ['queue_status', 'cache_status', 'scratch_status']:
+        print("INFO: Arguments:\n{args}".format(args=args))
+    # Check input then call main function.
+    if not _check_args(args=args, parser=parser):
+        pass
+    elif args.test:
+        print("INFO: --test flag given. Skipping call to main function.")
+    elif args.action == 'serve':
+        serve(socket_path=args.socket, logging_level=args.logging_level, log_file=args.log_file,
+              queue_file=args.queue_file, queue_workers=args.queue_workers, queue_max_attempts=args.queue_max_attempts,
+              queue_retry_delay=args.queue_retry_delay)
+    elif args.action == 'queue_status':
+        print(json.dumps(queue_status(queue_file=args.queue_file), indent=1))
+    elif args.action == 'cache_status':
+        print(json.dumps(cache_status(cache_dir=args.cache_dir), indent=1))
+    elif args.action == 'scratch_status':
+        print(json.dumps(scratch_status(tmp_iplant=args.tmp_iplant), indent=1))
     else:
-        print(("INFO: --ipath is not contained within --iplant. Skipping call to main function.\n" +
-               "--ipath {ipath}\n" +
-               "--iplant {iplant}").format(ipath=args.ipath, iplant=args.iplant))
+        result = main(ipath=args.ipath, action=args.action,
+                      itmp_iplant=args.itmp_iplant, tmp_iplant=args.tmp_iplant,
+                      delete_itmp_files=args.delete_itmp_files, delete_tmp_files=args.delete_tmp_files, stream=args.stream,
+                      compression_method=args.compression_method, workers=args.workers,
+                      auto_candidates=args.auto_candidates, auto_sample_size=args.auto_sample_size, cpu_budget=args.cpu_budget,
+                      cache_dir=args.cache_dir, cache_bytes=args.cache_bytes,
+                      queue_file=args.queue_file, queue_workers=args.queue_workers, queue_max_depth=args.queue_max_depth,
+                      queue_max_attempts=args.queue_max_attempts, queue_retry_delay=args.queue_retry_delay,
+                      icollection=args.icollection, checkpoint_file=args.checkpoint_file, bulk_workers=args.bulk_workers,
+                      index_file=args.index_file, output=args.output, byte_range=args.byte_range, record_range=args.record_range,
+                      hash_method=args.hash_method, verify=args.verify, verify_fraction=args.verify_fraction,
+                      lock_timeout=args.lock_timeout, idedup_iplant=args.idedup_iplant, dry_run=args.dry_run,
+                      keep_parents=args.keep_parents, parent_ttl=args.parent_ttl, read_lease=args.read_lease,
+                      logging_level=args.logging_level, log_file=args.log_file)
+        if args.action in ['bulk_compress', 'bulk_decompress', 'sweep', 'recover', 'prune_parents', 'release', 'index_validate',
+                           'index_rebuild', 'read_range']:
+            print(json.dumps(result, indent=1))
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""Thin client that sends iPlant iRODS jobs to `iplant.py --action serve`.
+
+Takes the same arguments as `iplant.py --action compress` and `iplant.py --action decompress`. The arguments are
+sent to the daemon listening on `--socket` (default from `iplant.SOCKET_PATH`), and the reply is printed to stdout.
+If no daemon is listening, `iplant.py` is executed with the same arguments from the directory of this file.
+
+See Also
+--------
+CALLS : {iplant.py}
+CALLED_BY : {iplant.re}
+RELATED : {}
+
+Notes
+-----
+- Only standard libraries that are fast to import are used so that calls from `iplant.re` start quickly.
+- Exit status is the job status from the daemon: 0 is success, 1 is a failed action, 2 is invalid arguments.
+
+"""
+
+
+# Import only standard libraries.
+from __future__ import absolute_import, division, print_function
+import os
+import sys
+import json
+import socket
+
+
+# Define default local path to UNIX socket. Must match `iplant.SOCKET_PATH`.
+SOCKET_PATH = '/tmp/iplant/iplant.sock'
+
+
+def _socket_path(argv):
+    """Semi-private method to get the value of `--socket` from `argv`, or `SOCKET_PATH` if not given."""
+    socket_path = SOCKET_PATH
+    for (idx, arg) in enumerate(argv):
+        if arg == '--socket' and idx+1 < len(argv):
+            socket_path = argv[idx+1]
+        elif arg.startswith('--socket='):
+            socket_path = arg.split('=', 1)[1]
+    return socket_path
+
+
+def _exec_iplant(argv):
+    """Semi-private method to replace this process with `iplant.py` when no daemon is listening."""
+    iplant_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'iplant.py')
+    print("INFO: No daemon is listening. Executing {ip}".format(ip=iplant_path))
+    sys.stdout.flush()
+    os.execv(sys.executable, [sys.executable, iplant_path]+argv)
+
+
+def main(argv):
+    """Send `argv` as one job to the daemon and return the job status.
+
+    Parameters
+    ----------
+    argv : list
+        Arguments for `iplant.py`, without the program name.
+
+    Returns
+    -------
+    status : int
+        Job status from the daemon.
+
+    See Also
+    --------
+    CALLS : {_socket_path, _exec_iplant}
+    CALLED_BY : {__main__}
+    RELATED : {iplant.serve}
+
+    """
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(_socket_path(argv=argv))
+    except socket.error:
+        client.close()
+        _exec_iplant(argv=argv)
+    try:
+        client.sendall((json.dumps({'argv': argv})+'\n').encode('utf-8'))
+        # NOTE: Wait for the job to finish. The rule in `iplant.re` must not return before the file is (de)compressed.
+        reply = b''
+        while not reply.endswith(b'\n'):
+            buf = client.recv(2**16)
+            if not buf:
+                break
+            reply += buf
+    finally:
+        client.close()
+    if not reply:
+        print("ERROR: Daemon closed the connection without a reply.", file=sys.stderr)
+        status = 1
+    else:
+        reply = json.loads(reply.decode('utf-8'))
+        status = reply['status']
+        print("INFO: status={status} latency_seconds={lat:.3f} message={msg}".format(status=status,
+                                                                                    lat=reply['latency_seconds'],
+                                                                                    msg=reply['message']))
+        if reply.get('result') is not None:
+            print(json.dumps(reply['result'], indent=1))
+        if status != 0:
+            print("ERROR: {msg}".format(msg=reply['message']), file=sys.stderr)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main(argv=sys.argv[1:]))
@@ -0,0 +1,496 @@
+#!/usr/bin/env python
+"""Benchmark `iplant.py --action compress` and `--action decompress` end to end without iRODS.
+
+Each case generates a synthetic FASTQ file with `make_fastq.py`, puts it into a local stand-in for iRODS
+from `fake_icommands.py`, then runs `iplant.py` as the rules in `iplant.re` do: compress, then decompress.
+Each run is measured and appended as one JSON line to `--results`, so versions can be compared with `--compare`.
+
+Examples
+--------
+    python benchmark.py --sizes 1K,10M,1G --read_lengths 100,50-300 --compression_methods GZIP,PGZIP --modes file,stream
+    python benchmark.py --compare
+
+See Also
+--------
+CALLS : {make_fastq.py, fake_icommands.py, iplant.py}
+CALLED_BY : {}
+RELATED : {TESTING.md}
+
+Notes
+-----
+- Measures per action: wall time; user and system CPU time; peak RSS; bytes read and written through system calls
+  ('rchar', 'wchar') and by storage ('read_bytes', 'write_bytes') from `/proc/self/io`; and the compression ratio.
+- CPU time, peak RSS, and bytes include the stand-in icommands called by `iplant.py`, since Linux adds
+  the usage of a child process to its parent when the child is reaped. Peak RSS is the largest of the processes.
+- Bytes through system calls count each copy, e.g. through a pipe with `--stream`. Bytes by storage
+  exclude reads from the page cache. `/proc/self/io` is only on Linux; otherwise the bytes are ``null``.
+- Generated FASTQ files are kept in `--work_dir` and reused by later runs with the same size, read length, and seed.
+
+"""
+
+
+# Import only standard libraries.
+from __future__ import absolute_import, division, print_function
+import os
+import sys
+import json
+import time
+import shlex
+import shutil
+import socket
+import hashlib
+import argparse
+import platform
+import datetime
+import itertools
+import subprocess
+import collections
+# Import local packages.
+import make_fastq
+
+
+# Define paths to `iplant.py` and the stand-in icommands.
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+IPLANT_PY = os.path.join(os.path.dirname(TEST_DIR), 'rules', 'iplant.py')
+FAKE_ICOMMANDS_PY = os.path.join(TEST_DIR, 'fake_icommands.py')
+ICOMMANDS = ['imeta', 'ils', 'imkdir', 'imv', 'icp', 'irm', 'iget', 'iput', 'iquest', 'istream']
+
+# Define iRODS paths within the stand-in.
+IPLANT = '/benchZone/home/iplant'
+ITMP_IPLANT = '/benchZone/tmp/iplant'
+
+# Define keys of a case, used to compare runs of different versions under the same Python.
+CASE_KEYS = ['size', 'read_length', 'compression_method', 'mode', 'action', 'python']
+
+# Define metrics compared by `compare`. A ratio above `1+threshold` is a regression.
+COMPARE_METRICS = ['wall_seconds', 'cpu_seconds', 'peak_rss_bytes', 'rchar']
+
+
+def _read_proc_io():
+    """Semi-private method to read I/O counters of this process and its reaped children from `/proc/self/io`.
+
+    Returns
+    -------
+    counters : dict
+        'rchar', 'wchar', 'read_bytes', 'write_bytes' in bytes. Empty if `/proc/self/io` is not available.
+
+    """
+    counters = {}
+    try:
+        with open('/proc/self/io') as fobj:
+            for line in fobj:
+                (name, value) = line.split(':')
+                counters[name.strip()] = int(value)
+    except (IOError, OSError):
+        pass
+    return counters
+
+
+def _version():
+    """Semi-private method to get the version of `iplant.py` as the abbreviated git commit, with '-dirty' if modified.
+    Returns ``None`` if git is not available."""
+    try:
+        with open(os.devnull, 'wb') as devnull:
+            version = subprocess.check_output(["git", "describe", "--always", "--dirty"], cwd=TEST_DIR, stderr=devnull)
+        version = version.decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        version = None
+    return version
+
+
+def _sha1(path, blocksize=2**20):
+    """Semi-private method to compute the SHA1 hash of a local file."""
+    hasher = hashlib.sha1()
+    with open(path, 'rb') as fobj:
+        for buf in iter(lambda: fobj.read(blocksize), b''):
+            hasher.update(buf)
+    return hasher.hexdigest()
+
+
+def _setup_fake_icommands(work_dir):
+    """Semi-private method to link the stand-in icommands into `work_dir` and reset its state.
+
+    Returns
+    -------
+    env : dict
+        Environment for `iplant.py` with the stand-in icommands first in 'PATH'.
+    fake_root : string
+        Local path to state of the stand-in, i.e. 'FAKE_ICOMMANDS_ROOT'.
+
+    """
+    bin_dir = os.path.join(work_dir, 'bin')
+    fake_root = os.path.join(work_dir, 'fake_icommands')
+    if not os.path.isdir(bin_dir):
+        os.makedirs(bin_dir)
+    for icommand in ICOMMANDS:
+        link = os.path.join(bin_dir, icommand)
+        if not os.path.lexists(link):
+            os.symlink(FAKE_ICOMMANDS_PY, link)
+    if os.path.isdir(fake_root):
+        shutil.rmtree(fake_root)
+    os.makedirs(os.path.join(fake_root, 'data'+ITMP_IPLANT))
+    os.makedirs(os.path.join(fake_root, 'data'+IPLANT))
+    env = dict(os.environ)
+    env['PATH'] = bin_dir+os.pathsep+env.get('PATH', '')
+    env['FAKE_ICOMMANDS_ROOT'] = fake_root
+    return (env, fake_root)
+
+
+def _get_fastq(work_dir, size, read_length, seed):
+    """Semi-private method to get a generated FASTQ file from `work_dir`, generating it if needed.
+
+    Returns
+    -------
+    path : string
+        Local path to FASTQ file.
+    sha1 : string
+        SHA1 hash of the file.
+
+    """
+    fastq_dir = os.path.join(work_dir, 'fastq')
+    if not os.path.isdir(fastq_dir):
+        os.makedirs(fastq_dir)
+    path = os.path.join(fastq_dir, 'sim_{size}_{rl}_{seed}.fastq'.format(size=size, rl=read_length, seed=seed))
+    sha1_path = path+'.sha1'
+    if not (os.path.exists(path) and os.path.exists(sha1_path)):
+        print("INFO: Generating {path}".format(path=path))
+        make_fastq.make_fastq(path=path+'.part', size=size, read_length=read_length, seed=seed)
+        os.rename(path+'.part', path)
+        with open(sha1_path, 'w') as fobj:
+            fobj.write(_sha1(path))
+    with open(sha1_path) as fobj:
+        sha1 = fobj.read().strip()
+    return (path, sha1)
+
+
+def _run_measured(args, env, log_path):
+    """Semi-private method to run a command and measure it with its children.
+
+    Parameters
+    ----------
+    args : list
+        Command line.
+    env : dict
+        Environment of the command.
+    log_path : string
+        Local path to append stdout and stderr of the command.
+
+    Returns
+    -------
+    metrics : collections.OrderedDict
+        'status', 'wall_seconds', 'user_seconds', 'system_seconds', 'cpu_seconds', 'peak_rss_bytes', 'rchar',
+        'wchar', 'read_bytes', 'write_bytes'.
+
+    Notes
+    -----
+    - The command is reaped with `os.wait4` to get its resource usage, which includes its reaped children.
+      The I/O counters of this process also include the command once it is reaped.
+
+    """
+    with open(log_path, 'ab') as flog:
+        io_start = _read_proc_io()
+        time_start = time.time()
+        proc = subprocess.Popen(args, env=env, stdout=flog, stderr=subprocess.STDOUT)
+        (_, status, rusage) = os.wait4(proc.pid, 0)
+        wall_seconds = time.time() - time_start
+        io_stop = _read_proc_io()
+    # NOTE: The command was reaped by `os.wait4`, so tell `proc` not to wait for it.
+    proc.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+    # NOTE: `ru_maxrss` is in kilobytes on Linux and in bytes on macOS.
+    rss_scale = 1 if sys.platform == 'darwin' else 1024
+    metrics = collections.OrderedDict()
+    metrics['status'] = proc.returncode
+    metrics['wall_seconds'] = wall_seconds
+    metrics['user_seconds'] = rusage.ru_utime
+    metrics['system_seconds'] = rusage.ru_stime
+    metrics['cpu_seconds'] = rusage.ru_utime + rusage.ru_stime
+    metrics['peak_rss_bytes'] = rusage.ru_maxrss*rss_scale
+    for counter in ['rchar', 'wchar', 'read_bytes', 'write_bytes']:
+        if (counter in io_start) and (counter in io_stop):
+            metrics[counter] = io_stop[counter] - io_start[counter]
+        else:
+            metrics[counter] = None
+    return metrics
+
+
+def run_case(work_dir, size, read_length, compression_method, mode, seed=0, iplant_args=None):
+    """Compress then decompress one generated FASTQ file with `iplant.py` and the stand-in icommands.
+
+    Parameters
+    ----------
+    work_dir : string
+        Local path to working directory for generated files, the stand-in, and logs.
+    size : string
+        Size of FASTQ file. See `make_fastq.parse_size`.
+    read_length : string
+        Read length 'N' or range 'MIN-MAX'.
+    compression_method : string
+        `--compression_method` of `iplant.py`, e.g. 'GZIP:6' or 'auto'.
+    mode : {'file', 'stream'}, string
+        'stream' runs `iplant.py` with `--stream`.
+    seed : {0}, int, optional
+        Seed of the generated file.
+    iplant_args : {None}, list, optional
+        Other arguments for `iplant.py`, e.g. ``['--workers', '4']``.
+
+    Returns
+    -------
+    records : list
+        One `collections.OrderedDict` per action, 'compress' then 'decompress', with the case, the metrics
+        from `_run_measured`, sizes from imeta, 'compression_ratio', 'throughput_mb_per_second', and for
+        'decompress' 'roundtrip_ok'.
+
+    See Also
+    --------
+    CALLS : {_get_fastq, _setup_fake_icommands, _run_measured}
+    CALLED_BY : {main}
+    RELATED : {}
+
+    """
+    (fastq_path, fastq_sha1) = _get_fastq(work_dir=work_dir, size=size, read_length=read_length, seed=seed)
+    (env, fake_root) = _setup_fake_icommands(work_dir=work_dir)
+    ipath = IPLANT+'/bench.fastq'
+    local_ipath = os.path.join(fake_root, 'data'+ipath)
+    # NOTE: `iplant.py` moves and replaces data objects but does not write into them, so a hard link is safe.
+    try:
+        os.link(fastq_path, local_ipath)
+    except OSError:
+        shutil.copyfile(fastq_path, local_ipath)
+    tmp_iplant = os.path.join(work_dir, 'tmp_iplant')
+    if os.path.isdir(tmp_iplant):
+        shutil.rmtree(tmp_iplant)
+    log_path = os.path.join(work_dir, 'iplant.log')
+    records = []
+    for action in ['compress', 'decompress']:
+        args = [sys.executable, IPLANT_PY, '--action', action, '--ipath', ipath, '--iplant', IPLANT,
+                '--itmp_iplant', ITMP_IPLANT, '--tmp_iplant', tmp_iplant, '--delete_itmp_files', '--delete_tmp_files',
+                '--compression_method', compression_method, '--logging_level', 'WARNING']
+        if mode == 'stream':
+            args.append('--stream')
+        args.extend(iplant_args or [])
+        metrics = _run_measured(args=args, env=env, log_path=log_path)
+        with open(os.path.join(fake_root, 'meta.json')) as fobj:
+            imeta = json.load(fobj).get(ipath, {})
+        record = collections.OrderedDict()
+        record['size'] = size
+        record['read_length'] = read_length
+        record['compression_method'] = compression_method
+        record['mode'] = mode
+        record['action'] = action
+        record.update(metrics)
+        record['uncompressed_size'] = int(imeta['UNCOMPRESSED_SIZE'][0]) if 'UNCOMPRESSED_SIZE' in imeta else None
+        # NOTE: 'COMPRESSED_SIZE' is kept from the compressed parent after `decompress`.
+        record['compressed_size'] = records[0]['compressed_size'] if records else (
+            int(imeta['COMPRESSED_SIZE'][0]) if 'COMPRESSED_SIZE' in imeta else None)
+        record['compression_method_used'] = imeta.get('COMPRESSION_METHOD', [None])[0] if action == 'compress' else None
+        if record['uncompressed_size'] and record['compressed_size']:
+            record['compression_ratio'] = record['uncompressed_size']/record['compressed_size']
+        else:
+            record['compression_ratio'] = None
+        if record['uncompressed_size'] and record['wall_seconds'] > 0:
+            record['throughput_mb_per_second'] = record['uncompressed_size']/2**20/record['wall_seconds']
+        else:
+            record['throughput_mb_per_second'] = None
+        if action == 'decompress':
+            record['roundtrip_ok'] = os.path.exists(local_ipath) and (_sha1(local_ipath) == fastq_sha1)
+        records.append(record)
+        if metrics['status'] != 0:
+            print("WARNING: iplant.py --action {action} failed with status {status}. See {log}".format(action=action, status=metrics['status'],
+                                                                                                   log=log_path))
+            break
+    return records
+
+
+def _load_records(results_file):
+    """Semi-private method to load records from `results_file`, skipping partial lines."""
+    records = []
+    if os.path.exists(results_file):
+        with open(results_file) as fobj:
+            for line in fobj:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+    return records
+
+
+def _median(values):
+    """Semi-private method to compute the median of a non-empty list."""
+    values = sorted(values)
+    mid = len(values)//2
+    return values[mid] if len(values) % 2 == 1 else (values[mid-1]+values[mid])/2
+
+
+def compare(records, baseline=None, candidate=None, threshold=0.10):
+    """Compare medians of metrics per case between two versions.
+
+    Parameters
+    ----------
+    records : list
+        Records from `--results`.
+    baseline : {None}, string, optional
+        Version to compare against. Default: the version before `candidate` in `records`.
+    candidate : {None}, string, optional
+        Version to compare. Default: the last version in `records`.
+    threshold : {0.10}, float, optional
+        Fraction by which a metric must increase to be reported as a regression.
+
+    Returns
+    -------
+    rows : list
+        One `collections.OrderedDict` per case in both versions and metric in `COMPARE_METRICS`, with the
+        baseline and candidate medians, their ratio, and 'regression'.
+
+    See Also
+    --------
+    CALLS : {_median}
+    CALLED_BY : {main}
+    RELATED : {}
+
+    """
+    versions = []
+    for record in records:
+        if record.get('version') not in versions:
+            versions.append(record.get('version'))
+    if candidate is None:
+        candidate = versions[-1] if versions else None
+    if baseline is None:
+        before = versions[:versions.index(candidate)] if candidate in versions else []
+        baseline = before[-1] if before else None
+    values = collections.defaultdict(list)
+    for record in records:
+        if (record.get('status') == 0) and (record.get('version') in [baseline, candidate]):
+            case = tuple(record.get(key) for key in CASE_KEYS)
+            for metric in COMPARE_METRICS:
+                if record.get(metric) is not None:
+                    values[(record['version'], case, metric)].append(record[metric])
+    cases = []
+    for record in records:
+        case = tuple(record.get(key) for key in CASE_KEYS)
+        if case not in cases:
+            cases.append(case)
+    rows = []
+    for (case, metric) in itertools.product(cases, COMPARE_METRICS):
+        if (baseline, case, metric) in values and (candidate, case, metric) in values:
+            baseline_median = _median(values[(baseline, case, metric)])
+            candidate_median = _median(values[(candidate, case, metric)])
+            ratio = candidate_median/baseline_median if baseline_median else None
+            row = collections.OrderedDict(zip(CASE_KEYS, case))
+            row.update([('metric', metric), ('baseline', baseline), ('candidate', candidate),
+                        ('baseline_median', baseline_median), ('candidate_median', candidate_median), ('ratio', ratio),
+                        ('regression', (ratio is not None) and (ratio > 1+threshold))])
+            rows.append(row)
+    return rows
+
+
+def main(sizes, read_lengths, compression_methods, modes, repeat, work_dir, results_file, seed=0, iplant_args=None):
+    """Run all combinations of cases and append their records to `results_file`.
+
+    Parameters
+    ----------
+    sizes, read_lengths, compression_methods, modes : list
+        Values of each case. See `run_case`.
+    repeat : int
+        Number of runs of each case.
+    work_dir : string
+        Local path to working directory.
+    results_file : string
+        Local path to append one JSON line per action and run.
+    seed, iplant_args :
+        See `run_case`.
+
+    Returns
+    -------
+    failed : int
+        Number of runs that failed or did not reproduce the original file.
+
+    See Also
+    --------
+    CALLS : {run_case}
+    CALLED_BY : {__main__}
+    RELATED : {compare}
+
+    """
+    environment = collections.OrderedDict([('version', _version()),
+                                           ('timestamp', datetime.datetime.now().isoformat()),
+                                           ('python', platform.python_version()),
+                                           ('platform', platform.platform()),
+                                           ('hostname', socket.gethostname()),
+                                           ('cpu_count', os.cpu_count() if hasattr(os, 'cpu_count') else None),
+                                           ('iplant_args', iplant_args or [])])
+    failed = 0
+    header = "{:>8} {:>8} {:>10} {:>6} {:>10} {:>8} {:>8} {:>10} {:>7} {:>8}".format(
+        'size', 'length', 'method', 'mode', 'action', 'wall_s', 'cpu_s', 'rss_MB', 'ratio', 'MB/s')
+    print(header)
+    for (size, read_length, compression_method, mode) in itertools.product(sizes, read_lengths, compression_methods, modes):
+        for run in range(repeat):
+            records = run_case(work_dir=work_dir, size=size, read_length=read_length, compression_method=compression_method,
+                               mode=mode, seed=seed, iplant_args=iplant_args)
+            if (len(records) != 2) or any(record['status'] != 0 for record in records) or not records[-1].get('roundtrip_ok'):
+                failed += 1
+            with open(results_file, 'a') as fresults:
+                for record in records:
+                    record.update(environment)
+                    record['run'] = run
+                    fresults.write(json.dumps(record)+'\n')
+                    print("{:>8} {:>8} {:>10} {:>6} {:>10} {:>8.2f} {:>8.2f} {:>10.1f} {:>7} {:>8}".format(
+                        size, read_length, compression_method, mode, record['action'], record['wall_seconds'],
+                        record['cpu_seconds'], record['peak_rss_bytes']/2**20,
+                        '{:.2f}'.format(record['compression_ratio']) if record['compression_ratio'] else '-',
+                        '{:.1f}'.format(record['throughput_mb_per_second']) if record['throughput_mb_per_second'] else '-'))
+    return failed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=("Benchmark `iplant.py` compress and decompress with stand-in icommands."))
+    parser.add_argument('--sizes', default='1K,1M,100M',
+                        help=("Comma-separated sizes of generated FASTQ files, e.g. '1K,10M,1G,20G'. Default: 1K,1M,100M"))
+    parser.add_argument('--read_lengths', default='100,50-300',
+                        help=("Comma-separated read lengths 'N' or ranges 'MIN-MAX'. Default: 100,50-300"))
+    parser.add_argument('--compression_methods', default='GZIP',
+                        help=("Comma-separated `--compression_method` values for `iplant.py`. Default: GZIP"))
+    parser.add_argument('--modes', default='file,stream',
+                        help=("Comma-separated modes: 'file' uses local temporary files, 'stream' uses `--stream`. " +
+                              "Default: file,stream"))
+    parser.add_argument('--repeat', default=1, type=int,
+                        help=("Number of runs of each case. Default: 1"))
+    parser.add_argument('--seed', default=0, type=int,
+                        help=("Seed of generated FASTQ files. Default: 0"))
+    parser.add_argument('--iplant_args', default='',
+                        help=("Other arguments for `iplant.py` as one string, e.g. '--workers 4 --transport icommands'."))
+    parser.add_argument('--work_dir', default='/tmp/iplant_benchmark', type=os.path.abspath,
+                        help=("Local path to working directory. Generated files are kept for later runs. " +
+                              "Default: /tmp/iplant_benchmark"))
+    parser.add_argument('--results', default='benchmark_results.jsonl', type=os.path.abspath,
+                        help=("Local path to append results as JSON lines. Default: benchmark_results.jsonl"))
+    parser.add_argument('--compare', action='store_true',
+                        help=("Compare the last two versions in `--results` instead of running cases. " +
+                              "Use `--baseline` and `--candidate` to choose versions."))
+    parser.add_argument('--baseline', default=None,
+                        help=("Version for `--compare` to compare against. Default: the version before `--candidate`."))
+    parser.add_argument('--candidate', default=None,
+                        help=("Version for `--compare` to compare. Default: the last version in `--results`."))
+    parser.add_argument('--threshold', default=0.10, type=float,
+                        help=("Increase of a median metric reported as a regression by `--compare`. Default: 0.10"))
+    args = parser.parse_args()
+    if args.compare:
+        rows = compare(records=_load_records(args.results), baseline=args.baseline, candidate=args.candidate,
+                       threshold=args.threshold)
+        for row in rows:
+            print(json.dumps(row))
+        sys.exit(1 if any(row['regression'] for row in rows) else 0)
+    sizes = args.sizes.split(',')
+    for size in sizes:
+        make_fastq.parse_size(size)
+    read_lengths = args.read_lengths.split(',')
+    for read_length in read_lengths:
+        make_fastq.parse_read_length(read_length)
+    modes = args.modes.split(',')
+    if any(mode not in ['file', 'stream'] for mode in modes):
+        parser.error("argument --modes: invalid mode: {modes}".format(modes=args.modes))
+    if not os.path.isdir(args.work_dir):
+        os.makedirs(args.work_dir)
+    failed = main(sizes=sizes, read_lengths=read_lengths, compression_methods=args.compression_methods.split(','),
+                  modes=modes, repeat=args.repeat, work_dir=args.work_dir, results_file=args.results, seed=args.seed,
+                  iplant_args=shlex.split(args.iplant_args))
+    sys.exit(1 if failed > 0 else 0)
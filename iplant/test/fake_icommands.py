@@ -0,0 +1,417 @@
+#!/usr/bin/env python
+"""Stand-in for iRODS icommands that records calls for testing `iplant.py` without iRODS.
+
+Link this file under the name of each icommand in a directory that precedes the iRODS icommands in `PATH`, e.g.:
+
+    mkdir -p /tmp/fake_icommands/bin
+    for icmd in imeta ils imkdir imv icp irm iget iput ireg iquest istream; do
+        ln -s $REPO/iplant/test/fake_icommands.py /tmp/fake_icommands/bin/$icmd
+    done
+    export PATH=/tmp/fake_icommands/bin:$PATH
+
+Icommands are dispatched by the name the file is called as. Supported: imeta ('ls', 'set', 'add', 'rm', and
+interactive commands from stdin), ils ('-l'), imkdir ('-p'), imv, icp, irm ('-f', '-U'), iget ('-f', '-T', and '-' for
+stdout), iput ('-f', '-T'), ireg ('-R'), iquest (queries made by `iplant.py`), and istream ('write' from stdin,
+and 'read' to stdout with '--offset' and '--count').
+
+See Also
+--------
+CALLED_BY : {iplant.py, benchmark.py}
+RELATED : {TESTING.md}
+
+Notes
+-----
+- State is kept under the directory from environment variable `FAKE_ICOMMANDS_ROOT`
+  (default: /tmp/fake_icommands): metadata in `meta.json`, one JSON line per call in `calls.jsonl`,
+  and data objects as files under `data/`, e.g. iRODS path '/tempZone/a.fastq' is 'data/tempZone/a.fastq'.
+- Calls hold an exclusive lock on `lock` while reading and writing state, so concurrent calls
+  (e.g. jobs of `iplant.py --action serve`) do not overwrite each other. Data are copied outside the lock
+  into `tmp/`, then renamed into `data/` under the lock, so that `iget -` and `istream write` can stream
+  through `iplant.py --stream` at the same time.
+- Each line of `calls.jsonl` has the icommand name, its arguments, the commands read from stdin (if any),
+  and the exit status, e.g. to count `imeta` processes per (de)compressed file.
+- `ireg` registers a data object to the file of another data object as a hard link, and its 'DATA_PATH' is
+  the file under `data/`. `irm -U` removes only that link, as `irm -f` does, so removing a registered data object
+  does not delete the data of the others as with iRODS.
+- Errors are printed to stderr with exit status 4, as by the icommands.
+- Faults are injected with environment variable `FAKE_ICOMMANDS_FAIL` as 'ICOMMAND[:N[:MODE]]', e.g. 'imv:2' or
+  'iput:1:kill'. The Nth call of ICOMMAND (default: the first) fails with exit status 4 without changing state
+  (MODE 'fail', the default), or completes and then kills its parent process with SIGKILL (MODE 'kill'), e.g. to
+  test `iplant.py --action recover` after a crash. Calls are counted in `fault_counts.json`.
+
+"""
+
+
+# Import only standard libraries.
+from __future__ import absolute_import, division, print_function
+import os
+import re
+import sys
+import json
+import fcntl
+import shlex
+import shutil
+import signal
+import tempfile
+
+
+# Define paths to state from environment.
+ROOT = os.environ.get('FAKE_ICOMMANDS_ROOT', '/tmp/fake_icommands')
+META = os.path.join(ROOT, 'meta.json')
+CALLS = os.path.join(ROOT, 'calls.jsonl')
+LOCK = os.path.join(ROOT, 'lock')
+DATA = os.path.join(ROOT, 'data')
+TMP = os.path.join(ROOT, 'tmp')
+FAULT_COUNTS = os.path.join(ROOT, 'fault_counts.json')
+
+# Define fault to inject from environment. See `_fault`.
+FAIL = os.environ.get('FAKE_ICOMMANDS_FAIL', '')
+
+# Define number of bytes to copy at a time.
+BLOCKSIZE = 2**20
+
+
+def _load_meta():
+    """Load metadata as ``dict`` of iRODS path to ``dict`` of attribute name to [value, units]."""
+    if os.path.isfile(META):
+        with open(META) as fobj:
+            meta = json.load(fobj)
+    else:
+        meta = {}
+    return meta
+
+
+def _save_meta(meta):
+    """Save metadata from `_load_meta`."""
+    with open(META, 'w') as fobj:
+        json.dump(meta, fobj, indent=1, sort_keys=True)
+    return None
+
+
+def _record_call(name, args, stdin_commands, status):
+    """Append one call as a JSON line to `CALLS`."""
+    call = {'name': name, 'args': args, 'stdin': stdin_commands, 'status': status}
+    with open(CALLS, 'a') as fobj:
+        fobj.write(json.dumps(call)+'\n')
+    return None
+
+
+def _fault(name):
+    """Count this call of icommand `name` and return the fault to inject from `FAIL`: ``None``, 'fail', or 'kill'."""
+    parts = FAIL.split(':')
+    (fail_name, nth, mode) = (parts + ['1', 'fail'][len(parts)-1:])[:3]
+    if fail_name != name:
+        return None
+    if not os.path.isdir(ROOT):
+        try:
+            os.makedirs(ROOT)
+        except OSError:
+            # NOTE: Another call may have made the directory.
+            if not os.path.isdir(ROOT):
+                raise
+    with open(LOCK, 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        counts = {}
+        if os.path.isfile(FAULT_COUNTS):
+            with open(FAULT_COUNTS) as fobj:
+                counts = json.load(fobj)
+        counts[name] = counts.get(name, 0) + 1
+        with open(FAULT_COUNTS, 'w') as fobj:
+            json.dump(counts, fobj)
+    return mode if (counts[name] == int(nth or 1)) else None
+
+
+def _local_path(ipath):
+    """Return the local path under `DATA` of iRODS path `ipath`."""
+    return os.path.join(DATA, ipath.lstrip('/'))
+
+
+def _error(message):
+    """Print `message` to stderr as an icommand error. Returns exit status."""
+    print("ERROR: {msg}".format(msg=message), file=sys.stderr)
+    return 4
+
+
+def _split_args(args):
+    """Split `args` into (flags, positional arguments). '-' is positional, e.g. `iget ipath -`."""
+    flags = [arg for arg in args if arg.startswith('-') and arg != '-']
+    positional = [arg for arg in args if not (arg.startswith('-') and arg != '-')]
+    return (flags, positional)
+
+
+def istream_read(args):
+    """Write a range of a data object to stdout as `istream read [--offset N] [--count N] ipath`. Returns exit status."""
+    (offset, count, positional) = (0, None, [])
+    args = list(args)
+    while len(args) > 0:
+        arg = args.pop(0)
+        if arg in ['-o', '--offset']:
+            offset = int(args.pop(0))
+        elif arg in ['-c', '--count']:
+            count = int(args.pop(0))
+        else:
+            positional.append(arg)
+    (ipath, ) = positional
+    if not os.path.isfile(_local_path(ipath)):
+        return _error("istream: data object does not exist: {ipath}".format(ipath=ipath))
+    fdst = getattr(sys.stdout, 'buffer', sys.stdout)
+    with open(_local_path(ipath), 'rb') as fsrc:
+        fsrc.seek(offset)
+        while (count is None) or (count > 0):
+            buf = fsrc.read(BLOCKSIZE if count is None else min(BLOCKSIZE, count))
+            if len(buf) == 0:
+                break
+            fdst.write(buf)
+            if count is not None:
+                count -= len(buf)
+    return 0
+
+
+def _copy_to_tmp(fsrc):
+    """Copy readable binary file object `fsrc` to a new file in `TMP` outside the lock. Returns its path."""
+    (fd, tmp_path) = tempfile.mkstemp(dir=TMP)
+    with os.fdopen(fd, 'wb') as fdst:
+        shutil.copyfileobj(fsrc, fdst, BLOCKSIZE)
+    return tmp_path
+
+
+def imeta(args, meta):
+    """Run one `imeta` command on `meta` in place. Returns exit status."""
+    if len(args) >= 3 and args[0] == 'ls' and args[1] == '-d':
+        ipath = args[2]
+        print("AVUs defined for dataObj {ipath}:".format(ipath=ipath))
+        avus = meta.get(ipath, {})
+        if len(avus) == 0:
+            print("None")
+        for (idx, attr_name) in enumerate(sorted(avus)):
+            if idx > 0:
+                print("----")
+            (attr_value, attr_units) = avus[attr_name]
+            print("attribute: {an}\nvalue: {av}\nunits: {au}".format(an=attr_name, av=attr_value, au=attr_units))
+        status = 0
+    elif len(args) in [5, 6] and args[0] in ['set', 'add'] and args[1] == '-d':
+        (ipath, attr_name, attr_value) = args[2:5]
+        attr_units = args[5] if len(args) == 6 else ''
+        meta.setdefault(ipath, {})[attr_name] = [attr_value, attr_units]
+        status = 0
+    elif len(args) >= 4 and args[0] == 'rm' and args[1] == '-d':
+        meta.get(args[2], {}).pop(args[3], None)
+        status = 0
+    else:
+        # NOTE: Like interactive `imeta`, errors are printed but do not stop the session.
+        status = _error("imeta: unsupported command: {args}".format(args=args))
+    return status
+
+
+def ils(args):
+    """List a data object or collection. With '-l', print the size of a data object as `ils -l`. Returns exit status."""
+    (flags, (ipath, )) = _split_args(args)
+    path = _local_path(ipath)
+    if not os.path.exists(path):
+        return _error("ils: does not exist or user lacks access permission: {ipath}".format(ipath=ipath))
+    if ('-l' in flags) and os.path.isfile(path):
+        # Lines of `ils -l` are '  OWNER REPLICA_NUMBER RESOURCE SIZE DATE & NAME'.
+        print("  rods 0 demoResc {size} 2014-12-01.00:00 & {name}".format(size=os.path.getsize(path), name=os.path.basename(ipath)))
+    else:
+        print(ipath)
+    return 0
+
+
+def iquest(args, meta):
+    """Run a general query of `iplant.py` on data objects under a collection. Returns exit status.
+
+    Supported: "SELECT COLL_NAME, DATA_NAME, DATA_SIZE WHERE COLL_NAME like 'COLL%'" with optional
+    "AND META_DATA_ATTR_NAME = 'NAME' AND META_DATA_ATTR_VALUE = 'VALUE'", and
+    "SELECT COLL_NAME, DATA_NAME, META_DATA_ATTR_NAME, META_DATA_ATTR_VALUE, META_DATA_ATTR_UNITS
+    WHERE COLL_NAME like 'COLL%' AND META_DATA_ATTR_NAME in ('NAME', ...)" with one row per attribute, and
+    "SELECT DATA_PATH, RESC_NAME WHERE COLL_NAME = 'COLL' AND DATA_NAME = 'NAME'" for `ireg`.
+
+    """
+    (_, (fmt, query)) = _split_args(args)
+    match = re.search(r"^SELECT DATA_PATH, RESC_NAME WHERE COLL_NAME = '([^']*)' AND DATA_NAME = '([^']*)'$", query)
+    if match is not None:
+        path = _local_path(match.group(1).rstrip('/')+'/'+match.group(2))
+        if not os.path.isfile(path):
+            print("CAT_NO_ROWS_FOUND: Nothing was found matching your query")
+            return 1
+        print(fmt.replace('%s', '{}').format(path, 'demoResc'))
+        return 0
+    match = re.search(r"^SELECT (.+) WHERE COLL_NAME like '([^']*)%'(?: AND META_DATA_ATTR_NAME = '([^']*)' " +
+                      r"AND META_DATA_ATTR_VALUE = '([^']*)'| AND META_DATA_ATTR_NAME in \(([^)]*)\))?$", query)
+    if match is None:
+        return _error("iquest: unsupported query: {query}".format(query=query))
+    (columns, like, attr_name, attr_value, attr_names) = match.groups()
+    columns = [column.strip() for column in columns.split(',')]
+    if attr_names is not None:
+        attr_names = [name.strip().strip("'") for name in attr_names.split(',')]
+    rows = []
+    for (dirpath, dirnames, filenames) in os.walk(DATA):
+        dirnames.sort()
+        relpath = os.path.relpath(dirpath, DATA)
+        coll_name = '/' if relpath == os.curdir else '/'+relpath.replace(os.sep, '/')
+        if not coll_name.startswith(like):
+            continue
+        for data_name in sorted(filenames):
+            ipath = coll_name.rstrip('/')+'/'+data_name
+            if (attr_name is not None) and (meta.get(ipath, {}).get(attr_name, [None])[0] != attr_value):
+                continue
+            values = {'COLL_NAME': coll_name, 'DATA_NAME': data_name,
+                      'DATA_SIZE': str(os.path.getsize(os.path.join(dirpath, data_name)))}
+            if attr_names is None:
+                rows.append(fmt.replace('%s', '{}').format(*[values[column] for column in columns]))
+                continue
+            for name in sorted(meta.get(ipath, {})):
+                if name in attr_names:
+                    values.update(META_DATA_ATTR_NAME=name, META_DATA_ATTR_VALUE=meta[ipath][name][0],
+                                  META_DATA_ATTR_UNITS=meta[ipath][name][1])
+                    rows.append(fmt.replace('%s', '{}').format(*[values[column] for column in columns]))
+    if len(rows) == 0:
+        print("CAT_NO_ROWS_FOUND: Nothing was found matching your query")
+        return 1
+    for row in rows:
+        print(row)
+    return 0
+
+
+def main(name, args):
+    """Dispatch icommand `name` with `args`. Returns exit status."""
+    for dirname in [ROOT, DATA, TMP]:
+        if not os.path.isdir(dirname):
+            try:
+                os.makedirs(dirname)
+            except OSError:
+                # NOTE: Another call may have made the directory.
+                if not os.path.isdir(dirname):
+                    raise
+    tmp_path = None
+    if (name == 'istream') and (args[:1] == ['read']):
+        # NOTE: Reads do not change state, so the data object is read outside the lock as by `iget`.
+        status = istream_read(args=args[1:])
+        _record_call(name=name, args=args, stdin_commands=None, status=status)
+        return status
+    (flags, positional) = _split_args(args)
+    # Copy data outside the lock so that streams do not block each other.
+    if (name == 'iput') and (len(positional) == 2):
+        with open(positional[0], 'rb') as fsrc:
+            tmp_path = _copy_to_tmp(fsrc=fsrc)
+    elif (name == 'istream') and (len(positional) == 2) and (positional[0] == 'write'):
+        tmp_path = _copy_to_tmp(fsrc=getattr(sys.stdin, 'buffer', sys.stdin))
+    elif (name == 'iget') and (len(positional) == 2):
+        (ipath, path) = positional
+        if not os.path.isfile(_local_path(ipath)):
+            status = _error("iget: data object does not exist: {ipath}".format(ipath=ipath))
+        elif path == '-':
+            with open(_local_path(ipath), 'rb') as fsrc:
+                shutil.copyfileobj(fsrc, getattr(sys.stdout, 'buffer', sys.stdout), BLOCKSIZE)
+            status = 0
+        elif os.path.exists(path) and ('-f' not in flags):
+            status = _error("iget: local file exists: {path}".format(path=path))
+        else:
+            shutil.copyfile(_local_path(ipath), path)
+            status = 0
+        _record_call(name=name, args=args, stdin_commands=None, status=status)
+        return status
+    with open(LOCK, 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        status = _locked_main(name=name, args=args, tmp_path=tmp_path)
+    if (tmp_path is not None) and os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    return status
+
+
+def _locked_main(name, args, tmp_path=None):
+    """Dispatch icommand `name` with `args` while `main` holds the lock. Returns exit status.
+    `tmp_path` is the data copied by `main` for `iput` and `istream`."""
+    meta = _load_meta()
+    stdin_commands = None
+    (flags, positional) = _split_args(args)
+    if name == 'imeta':
+        if len(args) == 0:
+            # Interactive session: one command per line until 'quit'.
+            stdin_commands = []
+            status = 0
+            for line in sys.stdin:
+                cmd = shlex.split(line)
+                if len(cmd) == 0:
+                    continue
+                if cmd[0] in ['quit', 'q']:
+                    break
+                stdin_commands.append(cmd)
+                status = max(status, imeta(cmd, meta))
+            # NOTE: Interactive `imeta` exits with status 0 even if a command failed.
+            status = 0
+        else:
+            status = imeta(args, meta)
+    elif name == 'ils':
+        status = ils(args)
+    elif name == 'iquest':
+        status = iquest(args, meta)
+    elif name == 'imkdir':
+        path = _local_path(positional[0])
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        status = 0
+    elif name in ['imv', 'icp']:
+        (isrc, idst) = positional
+        if not os.path.isfile(_local_path(isrc)):
+            status = _error("{name}: data object does not exist: {ipath}".format(name=name, ipath=isrc))
+        elif os.path.exists(_local_path(idst)):
+            status = _error("{name}: data object exists: {ipath}".format(name=name, ipath=idst))
+        elif not os.path.isdir(os.path.dirname(_local_path(idst))):
+            status = _error("{name}: collection does not exist: {ipath}".format(name=name, ipath=os.path.dirname(idst)))
+        elif name == 'imv':
+            # NOTE: `imv` moves metadata with the data object. `icp` does not copy metadata.
+            os.rename(_local_path(isrc), _local_path(idst))
+            if isrc in meta:
+                meta[idst] = meta.pop(isrc)
+            status = 0
+        else:
+            shutil.copyfile(_local_path(isrc), _local_path(idst))
+            status = 0
+    elif name == 'ireg':
+        (path, ipath) = positional[-2:]
+        if not os.path.isfile(path):
+            status = _error("ireg: file does not exist: {path}".format(path=path))
+        elif os.path.exists(_local_path(ipath)):
+            status = _error("ireg: data object exists: {ipath}".format(ipath=ipath))
+        elif not os.path.isdir(os.path.dirname(_local_path(ipath))):
+            status = _error("ireg: collection does not exist: {ipath}".format(ipath=os.path.dirname(ipath)))
+        else:
+            os.link(path, _local_path(ipath))
+            status = 0
+    elif name == 'irm':
+        status = 0
+        for ipath in positional:
+            if os.path.isfile(_local_path(ipath)):
+                os.remove(_local_path(ipath))
+                meta.pop(ipath, None)
+            else:
+                status = _error("irm: data object does not exist: {ipath}".format(ipath=ipath))
+    elif (name in ['iput', 'istream']) and (tmp_path is not None):
+        ipath = positional[1]
+        if not os.path.isdir(os.path.dirname(_local_path(ipath))):
+            status = _error("{name}: collection does not exist: {ipath}".format(name=name, ipath=os.path.dirname(ipath)))
+        elif (name == 'iput') and os.path.exists(_local_path(ipath)) and ('-f' not in flags):
+            status = _error("iput: data object exists: {ipath}".format(ipath=ipath))
+        else:
+            os.rename(tmp_path, _local_path(ipath))
+            status = 0
+    else:
+        status = _error("fake_icommands: unsupported icommand: {name} {args}".format(name=name, args=args))
+    _save_meta(meta)
+    _record_call(name=name, args=args, stdin_commands=stdin_commands, status=status)
+    return status
+
+
+if __name__ == '__main__':
+    (name, args) = (os.path.basename(sys.argv[0]), sys.argv[1:])
+    fault = _fault(name=name)
+    if fault == 'fail':
+        status = _error("fake_icommands: injected fault: {name} {args}".format(name=name, args=args))
+        _record_call(name=name, args=args, stdin_commands=None, status=status)
+        sys.exit(status)
+    status = main(name=name, args=args)
+    if fault == 'kill':
+        # NOTE: The call completed, but its caller stops before it sees the exit status, as after a crash.
+        os.kill(os.getppid(), signal.SIGKILL)
+    sys.exit(status)
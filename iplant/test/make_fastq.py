@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+"""Write synthetic FASTQ files of a given size for benchmarking `iplant.py`.
+
+Reads look like Illumina reads from CASAVA 1.8 and later: '@INSTRUMENT:RUN:FLOWCELL:LANE:TILE:X:Y READ:N:0:INDEX'
+headers with increasing tile coordinates, uniformly random bases with rare 'N's, and qualities that are high
+at the start of a read and fall toward its end. Read lengths are fixed or uniform within a range.
+
+Examples
+--------
+    python make_fastq.py --path sim.fastq --size 1G --read_length 50-300
+
+See Also
+--------
+CALLED_BY : {benchmark.py}
+RELATED : {fake_icommands.py}
+
+Notes
+-----
+- Output depends only on `size`, `read_length`, and `seed`, also across Python 2 and 3, so benchmarks of
+  different versions compress the same data. Only `random.getrandbits` is used since `random.randint` differs.
+- Bases and qualities are drawn in blocks with `random.getrandbits` and mapped with ``bytes.translate``, so
+  files of tens of GB are written at tens of MB per second.
+- Bases are not repeated across reads, so compression ratios of bases are those of random sequence,
+  i.e. about 4:1 at best. Real libraries compress somewhat better.
+
+"""
+
+
+# Import only standard libraries.
+from __future__ import absolute_import, division, print_function
+import sys
+import random
+import argparse
+import binascii
+
+
+# Define suffixes of sizes as powers of 1024.
+SIZE_SUFFIXES = {'': 1, 'K': 2**10, 'M': 2**20, 'G': 2**30, 'T': 2**40}
+
+# Define number of random bytes drawn at a time.
+BLOCKSIZE = 2**20
+
+
+def parse_size(size):
+    """Parse a size in bytes with an optional suffix 'K', 'M', 'G', or 'T' (powers of 1024), e.g. '10G'.
+
+    Parameters
+    ----------
+    size : {string, int}
+        Size, e.g. '1K', '512M', '10G', or 4096.
+
+    Returns
+    -------
+    nbytes : int
+        Size in bytes.
+
+    Raises
+    ------
+    ValueError
+        If `size` is not a positive number with a valid suffix.
+
+    """
+    size_str = str(size).strip().upper().rstrip('B')
+    suffix = size_str[-1:] if size_str[-1:] in SIZE_SUFFIXES else ''
+    try:
+        nbytes = int(float(size_str[:len(size_str)-len(suffix)])*SIZE_SUFFIXES[suffix])
+    except ValueError:
+        raise ValueError("`size` not valid: {size}".format(size=size))
+    if nbytes <= 0:
+        raise ValueError("`size` must be positive: {size}".format(size=size))
+    return nbytes
+
+
+def parse_read_length(read_length):
+    """Parse a read length 'N' or a range 'MIN-MAX' into (MIN, MAX).
+
+    Raises
+    ------
+    ValueError
+        If `read_length` is not valid.
+
+    """
+    try:
+        (min_length, _, max_length) = str(read_length).partition('-')
+        min_length = int(min_length)
+        max_length = int(max_length) if max_length else min_length
+    except ValueError:
+        raise ValueError("`read_length` not valid: {rl}".format(rl=read_length))
+    if not (0 < min_length <= max_length):
+        raise ValueError("`read_length` not valid: {rl}".format(rl=read_length))
+    return (min_length, max_length)
+
+
+def _translation(weights):
+    """Semi-private method to make a table for ``bytes.translate`` that maps random bytes to characters.
+
+    Parameters
+    ----------
+    weights : list
+        (character, weight) pairs. Weights are relative and together map all 256 byte values.
+
+    Returns
+    -------
+    table : bytes
+        256 characters.
+
+    """
+    total = sum(weight for (_, weight) in weights)
+    table = []
+    for (char, weight) in weights:
+        table.extend([char]*int(round(256*weight/total)))
+    # NOTE: Rounding may leave the table a few characters short or long.
+    table = (table + [weights[0][0]]*256)[:256]
+    return ''.join(table).encode('ascii')
+
+
+# Define tables from random bytes to bases, and to qualities (Phred+33) at the start and end of reads.
+BASES = _translation([('A', 63.75), ('C', 63.75), ('G', 63.75), ('T', 63.75), ('N', 1.0)])
+QUALITIES_HEAD = _translation([('I', 40), ('H', 25), ('G', 12), ('F', 8), ('E', 5), ('D', 3), ('@', 3), ('<', 2), ('5', 1), ('#', 1)])
+QUALITIES_TAIL = _translation([('I', 8), ('H', 10), ('G', 10), ('F', 10), ('E', 10), ('D', 10), ('@', 12), ('<', 10), ('5', 10), ('#', 10)])
+
+
+class _RandomStream(object):
+    """Semi-private class to draw random characters from a table in blocks.
+
+    Parameters
+    ----------
+    rng : random.Random
+        Seeded random number generator.
+    table : bytes
+        Table from `_translation`.
+
+    """
+
+    def __init__(self, rng, table):
+        self.rng = rng
+        self.table = table
+        self.buf = b''
+        self.pos = 0
+
+    def read(self, size):
+        """Return `size` random characters from the table."""
+        if self.pos + size > len(self.buf):
+            nbytes = max(BLOCKSIZE, size)
+            # NOTE: `getrandbits` draws all bits in C. Hex is used since `int.to_bytes` is not in Python 2.
+            raw = binascii.unhexlify('{0:0{1}x}'.format(self.rng.getrandbits(8*nbytes), 2*nbytes))
+            self.buf = self.buf[self.pos:] + raw.translate(self.table)
+            self.pos = 0
+        chars = self.buf[self.pos:self.pos+size]
+        self.pos += size
+        return chars
+
+
+def write_fastq(fobj, size, read_length='100', seed=0):
+    """Write synthetic FASTQ records to a file object until at least `size` bytes are written.
+
+    Parameters
+    ----------
+    fobj : file
+        Writable binary file object.
+    size : {string, int}
+        Minimum number of bytes to write. See `parse_size`. The last record is written whole.
+    read_length : {'100'}, string, optional
+        Read length 'N' or uniform range 'MIN-MAX', e.g. '50-300'.
+    seed : {0}, int, optional
+        Seed for the random number generator.
+
+    Returns
+    -------
+    nreads : int
+        Number of records written.
+    nbytes : int
+        Number of bytes written.
+
+    See Also
+    --------
+    CALLS : {parse_size, parse_read_length, _RandomStream}
+    CALLED_BY : {make_fastq}
+    RELATED : {}
+
+    """
+    size = parse_size(size)
+    (min_length, max_length) = parse_read_length(read_length)
+    rng = random.Random(seed)
+    bases = _RandomStream(rng=random.Random(rng.getrandbits(64)), table=BASES)
+    qualities_head = _RandomStream(rng=random.Random(rng.getrandbits(64)), table=QUALITIES_HEAD)
+    qualities_tail = _RandomStream(rng=random.Random(rng.getrandbits(64)), table=QUALITIES_TAIL)
+    header_fmt = '@SIM{seed}:1:FC{seed}XX:{{lane}}:{{tile}}:{{x}}:{{y}} 1:N:0:ACGTAC\n'.format(seed=seed)
+    (nreads, nbytes) = (0, 0)
+    (lane, tile, x, y) = (1, 1101, 1000, 1000)
+    chunk = []
+    chunk_bytes = 0
+    while nbytes + chunk_bytes < size:
+        length = min_length + rng.getrandbits(32) % (max_length-min_length+1)
+        # Coordinates increase within a tile as from an Illumina flow cell.
+        y += 1 + rng.getrandbits(32) % 200
+        if y > 100000:
+            (x, y) = (x + 1 + rng.getrandbits(32) % 200, 1000)
+            if x > 30000:
+                (tile, x) = (tile + 1, 1000)
+        # Qualities fall over the last third of a read.
+        head_length = length - length//3
+        record = (header_fmt.format(lane=lane, tile=tile, x=x, y=y).encode('ascii') + bases.read(length) + b'\n+\n' +
+                  qualities_head.read(head_length) + qualities_tail.read(length-head_length) + b'\n')
+        chunk.append(record)
+        chunk_bytes += len(record)
+        nreads += 1
+        if chunk_bytes >= BLOCKSIZE:
+            fobj.write(b''.join(chunk))
+            nbytes += chunk_bytes
+            (chunk, chunk_bytes) = ([], 0)
+    fobj.write(b''.join(chunk))
+    nbytes += chunk_bytes
+    return (nreads, nbytes)
+
+
+def make_fastq(path, size, read_length='100', seed=0):
+    """Write a synthetic FASTQ file. See `write_fastq`.
+
+    Returns
+    -------
+    nreads : int
+        Number of records written.
+    nbytes : int
+        Number of bytes written.
+
+    """
+    with open(path, 'wb') as fobj:
+        (nreads, nbytes) = write_fastq(fobj=fobj, size=size, read_length=read_length, seed=seed)
+    return (nreads, nbytes)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=("Write a synthetic FASTQ file of at least `--size` bytes."))
+    parser.add_argument('--path', required=True,
+                        help=("Local path to FASTQ file to write. '-' writes to stdout."))
+    parser.add_argument('--size', required=True, type=parse_size,
+                        help=("Minimum size of file with optional suffix K, M, G, T (powers of 1024), e.g. '10G'."))
+    parser.add_argument('--read_length', default='100', type=str,
+                        help=("Read length 'N' or uniform range 'MIN-MAX', e.g. '50-300'. Default: 100"))
+    parser.add_argument('--seed', default=0, type=int,
+                        help=("Seed for the random number generator. Default: 0"))
+    args = parser.parse_args()
+    parse_read_length(args.read_length)
+    if args.path == '-':
+        (nreads, nbytes) = write_fastq(fobj=getattr(sys.stdout, 'buffer', sys.stdout), size=args.size,
+                                       read_length=args.read_length, seed=args.seed)
+    else:
+        (nreads, nbytes) = make_fastq(path=args.path, size=args.size, read_length=args.read_length, seed=args.seed)
+    print("INFO: Wrote {nreads} reads, {nbytes} bytes.".format(nreads=nreads, nbytes=nbytes), file=sys.stderr)